@@ -0,0 +1,327 @@
+"""Синтетические бенчмарки слоя базы данных и сборки отчетов.
+
+Запуск: python bench.py <сценарий> [параметры]
+Каждый сценарий работает на временной копии базы и не трогает timesheet.db.
+"""
+import os
+import sys
+import asyncio
+import argparse
+import random
+import tempfile
+import time
+from functools import partial
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+# База для бенчмарка создается до импорта db, т.к. пул читает DB_PATH при импорте
+_tmpdir = tempfile.mkdtemp(prefix='timesheet-bench-')
+os.environ['DB_PATH'] = os.path.join(_tmpdir, 'bench.db')
+
+import db
+from templates import Grouped, RowTemplate, join_limited
+
+STORES = [f"Магазин №{i}" for i in range(1, 11)]
+
+
+def fresh_database(profile: str) -> str:
+    """Переключить пул на новый файл базы с заданным профилем настроек"""
+    db.pool.close_all()
+    path = os.path.join(_tmpdir, f'{profile}-{time.monotonic_ns()}.db')
+    db.pool = db.ConnectionPool(path, db.DB_POOL_SIZE, db.load_tuning(profile))
+    return path
+
+
+def seed(employees: int, shifts: int):
+    """Заполнить базу сотрудниками и завершенными сменами"""
+    db.init_database()
+    today = date.today()
+    rows = []
+    for i in range(shifts):
+        user_id = i % employees + 1
+        day = today - timedelta(days=i // employees)
+        check_in = int(datetime.combine(day, datetime.min.time()).replace(hour=7).timestamp())
+        rows.append((
+            user_id, 'completed', check_in, check_in + 8 * 3600, 8 * 60, random.randint(0, 1)
+        ))
+    with db.pool.transaction() as conn:
+        conn.execute(
+            "INSERT INTO positions (id, name, created_by, created_date) VALUES (1, 'Продавец', 0, ?)",
+            (today.isoformat(),)
+        )
+        conn.executemany(
+            "INSERT INTO stores (id, name, address, created_by, created_date) VALUES (?, ?, '', 0, ?)",
+            [(i, name, today.isoformat()) for i, name in enumerate(STORES, 1)]
+        )
+        conn.executemany('''
+            INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date)
+            VALUES (?, ?, 1, ?, ?)
+        ''', [(i, f"Сотрудник {i}", i % len(STORES) + 1, today.isoformat())
+              for i in range(1, employees + 1)])
+        conn.executemany('''
+            INSERT INTO timesheet (user_id, status, check_in, check_out, minutes, confirmed)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+    # Как в работающем боте: история уже перенесена из WAL в основной файл
+    with db.pool.connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(title: str, latencies: List[float]):
+    """Вывести p50/p99/max в миллисекундах"""
+    print(f"{title:<12} n={len(latencies):<5} "
+          f"p50={percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p99={percentile(latencies, 99) * 1000:7.2f} ms  "
+          f"max={max(latencies) * 1000:7.2f} ms")
+
+
+# Сценарий: латентность открытия смены во время большого экспорта
+async def _checkin_during_export(run: Callable, employees: int, checkins: int,
+                                 interval: float) -> List[float]:
+    stop = asyncio.Event()
+    today = db.local_date(int(time.time()))
+
+    async def export_loop():
+        while not stop.is_set():
+            await run('read', db.get_export_rows, '2000-01-01', today, False)
+            await asyncio.sleep(0)
+
+    async def checkin_loop() -> List[float]:
+        # Отметки идут с фиксированным шагом: задержка считается от запланированного
+        # момента, чтобы в нее попадало время, пока event loop был занят
+        latencies = []
+        first = time.perf_counter()
+        for i in range(checkins):
+            started = first + i * interval
+            await asyncio.sleep(max(0.0, started - time.perf_counter()))
+            user_id = random.randint(1, employees)
+            await run('read', db.get_user, user_id)
+            if not await run('read', db.get_active_shift, user_id, today):
+                shift_id = await run('write', db.open_shift, user_id, int(time.time()))
+                await run('write', db.close_shift, shift_id, int(time.time()))
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    exporter = asyncio.create_task(export_loop())
+    latencies = await checkin_loop()
+    stop.set()
+    await exporter
+    return latencies
+
+
+def bench_checkin_export(args):
+    """p99 открытия смены, пока в фоне идет экспорт за весь период"""
+    fresh_database(args.profile)
+    seed(args.employees, args.shifts)
+
+    async def blocking(kind, func, *a):
+        return func(*a)
+
+    storage = db.AsyncDatabase()
+    report('на loop', asyncio.run(_checkin_during_export(blocking, args.employees, args.checkins, args.interval)))
+    report('executor', asyncio.run(_checkin_during_export(storage.run, args.employees, args.checkins, args.interval)))
+    storage.shutdown()
+
+
+# Сценарий: шторм отметок в начале смены
+async def _checkin_storm(storage: db.AsyncDatabase, employees: int) -> Tuple[float, int]:
+    today = db.local_date(int(time.time()))
+    errors = 0
+
+    async def checkin(user_id: int):
+        nonlocal errors
+        try:
+            await storage.get_user(user_id)
+            if not await storage.get_active_shift(user_id, today):
+                await storage.open_shift(user_id, int(time.time()))
+            # Параллельно администраторы смотрят отчеты
+            if user_id % 10 == 0:
+                await storage.get_unconfirmed_counts_by_store()
+        except Exception:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(checkin(user_id) for user_id in range(1, employees + 1)))
+    return time.perf_counter() - started, errors
+
+
+def bench_checkin_storm(args):
+    """Пропускная способность отметок для каждого профиля SQLite"""
+    for profile in sorted(db.TUNING_PROFILES):
+        fresh_database(profile)
+        seed(args.employees, args.shifts)
+        storage = db.AsyncDatabase()
+        elapsed, errors = asyncio.run(_checkin_storm(storage, args.employees))
+        storage.shutdown()
+        print(f"{profile:<8} {args.employees} отметок за {elapsed:6.2f} с  "
+              f"{args.employees / elapsed:8.1f} отметок/с  ошибок: {errors}")
+
+
+# Сценарий: групповая запись отметок против отдельных транзакций
+async def _checkin_burst(open_shift: Callable, employees: int) -> Tuple[float, int, int]:
+    opened = duplicates = 0
+
+    async def checkin(user_id: int):
+        nonlocal opened, duplicates
+        try:
+            await open_shift(user_id, int(time.time()))
+            opened += 1
+        except db.ActiveShiftExists:
+            duplicates += 1
+
+    # Каждый десятый сотрудник нажимает кнопку дважды
+    user_ids = list(range(1, employees + 1)) + list(range(10, employees + 1, 10))
+    started = time.perf_counter()
+    await asyncio.gather(*(checkin(user_id) for user_id in user_ids))
+    return time.perf_counter() - started, opened, duplicates
+
+
+def bench_checkin_batch(args):
+    """Пропускная способность открытия смен с групповой записью и без нее"""
+    for profile in sorted(db.TUNING_PROFILES):
+        for mode in ('по одной', 'пакетами'):
+            fresh_database(profile)
+            seed(args.employees, args.shifts)
+            storage = db.AsyncDatabase()
+            if mode == 'пакетами':
+                open_shift = storage.open_shift
+            else:
+                open_shift = partial(storage.run, 'write', db.open_shift)
+            elapsed, opened, duplicates = asyncio.run(_checkin_burst(open_shift, args.employees))
+            storage.shutdown()
+            print(f"{profile:<8} {mode:<9} {opened / elapsed:8.1f} отметок/с  "
+                  f"открыто: {opened}  повторов: {duplicates}")
+            if mode == 'пакетами':
+                metrics = storage.batcher.metrics.snapshot()
+                print(f"         пакетов: {metrics['batches']}  средний размер: {metrics['avg_size']:.1f}  "
+                      f"фиксация: средн. {metrics['avg_commit_ms']:.2f} мс, макс. {metrics['max_commit_ms']:.2f} мс")
+
+
+# Сценарий: сборка текстового отчета из строк базы (форматирование - как в bot.py)
+CLOCK_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)]
+
+def _clock(timestamp) -> str:
+    if timestamp is None:
+        return "-"
+    return CLOCK_LABELS[(timestamp + db.UTC_OFFSET) // 60 % 1440]
+
+def _hours(minutes: int) -> str:
+    return f"{minutes / 60:.2f}"
+
+def _timesheet_concat(records) -> str:
+    """Табель в прежнем виде: report += в цикле"""
+    report = "📋 ТАБЕЛЬ\n\n"
+    for date_str, checkin, checkout, minutes, confirmed, notes in records:
+        confirmed_mark = "✅" if confirmed else "❌"
+        report += f"📅 {date_str}\n"
+        report += f"   Начало: {_clock(checkin)}\n"
+        report += f"   Конец: {_clock(checkout)}\n"
+        report += f"   Часов: {_hours(minutes)}\n"
+        report += f"   Подтверждено: {confirmed_mark}\n"
+        if notes:
+            report += f"   📝 {notes}\n"
+        report += "\n"
+    return report
+
+def _unconfirmed_concat(shifts) -> str:
+    """Неподтвержденные смены по датам в прежнем виде"""
+    text = "📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ\n\n"
+    previous = None
+    for shift_id, full_name, store, date_str, checkin, checkout, minutes in shifts:
+        if previous != date_str:
+            text += f"📅 {date_str}\n"
+            previous = date_str
+        text += f"  🆔 {shift_id} | {full_name} | {store}\n"
+        text += f"  ⏱ {_clock(checkin)} - {_clock(checkout)} ({_hours(minutes)} ч)\n\n"
+    return text
+
+TIMESHEET_ROW = RowTemplate(
+    "date checkin checkout minutes confirmed notes",
+    "📅 {date}\n   Начало: {checkin}\n   Конец: {checkout}\n   Часов: {minutes}\n"
+    "   Подтверждено: {confirmed}\n{notes}\n",
+    checkin=_clock, checkout=_clock, minutes=_hours,
+    confirmed=lambda confirmed: "✅" if confirmed else "❌",
+    notes=lambda notes: f"   📝 {notes}\n" if notes else "",
+)
+UNCONFIRMED = Grouped(
+    lambda shift: shift[3],
+    RowTemplate("shift_id full_name store date", "📅 {date}\n"),
+    RowTemplate(
+        "shift_id full_name store date checkin checkout minutes",
+        "  🆔 {shift_id} | {full_name} | {store}\n  ⏱ {checkin} - {checkout} ({minutes} ч)\n\n",
+        checkin=_clock, checkout=_clock, minutes=_hours,
+    ),
+)
+
+def _best_of(run: Callable, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def bench_render_report(args):
+    """Время сборки отчета на args.rows строк: text += против шаблонов и join"""
+    rng = random.Random(1)
+    day = date.today()
+    base = int(time.time())
+    records = [
+        ((day - timedelta(days=i)).isoformat(), base - i * 86400, base - i * 86400 + 28800,
+         480, rng.random() < 0.5, "опоздание" if rng.random() < 0.1 else None)
+        for i in range(args.rows)
+    ]
+    shifts = [
+        (i, f"Сотрудник {i % 300}", rng.choice(STORES), (day - timedelta(days=i // 50)).isoformat(),
+         base - i * 600, base - i * 600 + 28800, 480)
+        for i in range(args.rows)
+    ]
+    assert _timesheet_concat(records) == "📋 ТАБЕЛЬ\n\n" + TIMESHEET_ROW.render_all(records)
+    assert _unconfirmed_concat(shifts) == "📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ\n\n" + UNCONFIRMED.render_all(shifts)
+
+    cases = [
+        ('табель: text +=', lambda: _timesheet_concat(records)),
+        ('табель: шаблон + join', lambda: "📋 ТАБЕЛЬ\n\n" + TIMESHEET_ROW.render_all(records)),
+        ('табель: до 4000 символов', lambda: join_limited(map(TIMESHEET_ROW, records), 4000, count=len(records))),
+        ('по датам: text +=', lambda: _unconfirmed_concat(shifts)),
+        ('по датам: шаблон + join', lambda: "📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ\n\n" + UNCONFIRMED.render_all(shifts)),
+    ]
+    for title, run in cases:
+        elapsed = _best_of(run)
+        print(f"{title:<26} {args.rows} строк за {elapsed * 1000:8.2f} мс  "
+              f"{elapsed / args.rows * 1e6:6.2f} мкс/строка")
+
+
+SCENARIOS: Dict[str, Callable] = {
+    'checkin-export': bench_checkin_export,
+    'checkin-storm': bench_checkin_storm,
+    'checkin-batch': bench_checkin_batch,
+    'render-report': bench_render_report,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--employees', type=int, default=300)
+    parser.add_argument('--shifts', type=int, default=200_000)
+    parser.add_argument('--checkins', type=int, default=300)
+    parser.add_argument('--rows', type=int, default=10_000, help='строк в отчете render-report')
+    parser.add_argument('--interval', type=float, default=0.02, help='шаг между отметками, с')
+    parser.add_argument('--profile', choices=sorted(db.TUNING_PROFILES), default=db.DB_PROFILE)
+    args = parser.parse_args()
+
+    print(f"Каталог баз: {_tmpdir}")
+    SCENARIOS[args.scenario](args)
+    db.pool.close_all()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
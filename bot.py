@@ -1,11 +1,9 @@
 import os
 import logging
-import sqlite3
 import csv
 import io
 import asyncio
 import sys
-import random
 from datetime import datetime, timedelta, date
 from functools import wraps
 from typing import Dict, List, Tuple, Optional, Any
@@ -32,6 +30,17 @@ nest_asyncio.apply()
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# Модуль базы читает настройки из окружения при импорте
+import db
+from db import storage
+from router import CallbackRouter, RouteCall, TextRouter, ints
+from pages import PAGE_TEXT_LIMIT, Page, fetch_page, from_list
+from templates import Grouped, RowTemplate, join_limited
+from updates import LANE_BULK, SequencedUpdateProcessor
+from jobs import RUNNING, JobLimitError, JobRunner
+from outbound import PRIORITY_BULK, PRIORITY_NOTIFY, OutboundScheduler
+from notifications import NOTIFY_RETRY_INTERVAL, Notifier
+
 # Настройка часового пояса UTC+8
 TIMEZONE = pytz.timezone('Asia/Singapore')
 
@@ -46,6 +55,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Уведомления пользователям рассылаются в фоне через очередь в базе
+notifier = Notifier(storage)
+
 # Состояния для ConversationHandler
 (
     SELECT_POSITION, SELECT_STORE, ENTER_FULL_NAME, CREATE_POSITION_NAME,
@@ -58,10 +70,13 @@ logger = logging.getLogger(__name__)
 ) = range(22)
 
 # Константы
-MAX_MESSAGE_LENGTH = 4000
 MIN_WORK_HOURS = 2
 MAX_WORK_HOURS = 12
 WORK_START_HOUR = 7
+MAX_STATS_DAYS = 365
+# «Весь период» в выгрузке и подтверждении, дней
+ALL_PERIOD_DAYS = 36500
+WEEKDAY_NAMES = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
 
 # Вспомогательные функции для работы с временем UTC+8
 def get_now_utc8() -> datetime:
@@ -97,94 +112,209 @@ def format_time_utc8(dt: datetime) -> str:
         dt = dt.astimezone(TIMEZONE)
     return dt.strftime('%H:%M')
 
-# Инициализация базы данных
-def init_database():
-    """Создание всех необходимых таблиц в базе данных"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    # Таблица сотрудников
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employees (
-            user_id INTEGER PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            position TEXT NOT NULL,
-            store TEXT NOT NULL,
-            reg_date TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0,
-            is_super_admin INTEGER DEFAULT 0,
-            can_request_admin INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Таблица табеля
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS timesheet (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            status TEXT DEFAULT 'working',
-            check_in TEXT,
-            check_out TEXT,
-            hours REAL DEFAULT 0,
-            notes TEXT,
-            confirmed INTEGER DEFAULT 0,
-            created_by_admin INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES employees (user_id)
-        )
-    ''')
-    
-    # Таблица должностей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS positions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_date TEXT NOT NULL
-        )
-    ''')
-    
-    # Таблица магазинов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS stores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            address TEXT,
-            created_by INTEGER NOT NULL,
-            created_date TEXT NOT NULL
-        )
-    ''')
-    
-    # Таблица запросов на удаление
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS delete_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            request_date TEXT NOT NULL,
-            requester_id INTEGER NOT NULL,
-            requester_name TEXT NOT NULL,
-            target_type TEXT NOT NULL,
-            target_id TEXT NOT NULL,
-            target_name TEXT NOT NULL,
-            status TEXT DEFAULT 'pending'
-        )
-    ''')
-    
-    # Таблица запросов на админа
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            request_date TEXT NOT NULL,
-            user_id INTEGER NOT NULL,
-            user_name TEXT NOT NULL,
-            user_position TEXT,
-            user_store TEXT,
-            status TEXT DEFAULT 'pending'
-        )
-    ''')
+# Подписи ЧЧ:ММ для каждой минуты суток: время смен из базы форматируется без datetime
+CLOCK_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)]
+
+def format_clock(timestamp: Optional[int], empty: str = "-") -> str:
+    """ЧЧ:ММ UTC+8 для метки времени смены (секунды эпохи)"""
+    if timestamp is None:
+        return empty
+    return CLOCK_LABELS[(timestamp + db.UTC_OFFSET) // 60 % 1440]
+
+def format_hours(minutes: int) -> str:
+    """Длительность в часах с двумя знаками"""
+    return f"{minutes / 60:.2f}"
+
+def format_confirmed(confirmed: int) -> str:
+    """Отметка подтверждения смены"""
+    return "✅" if confirmed else "❌"
+
+def more_rows(count: int) -> str:
+    """Подпись под отчетом, который не поместился в сообщение целиком"""
+    return f"… не поместилось записей: {count}\n\n"
+
+# Шаблоны строк отчетов: формат разбирается один раз, при загрузке модуля
+STATUS_EMOJI = {'pending': '⏳', 'approved': '✅', 'rejected': '❌'}
+DELETE_REQUEST_STATUS = {'pending': 'Ожидает', 'approved': 'Одобрен', 'rejected': 'Отклонен'}
+ADMIN_REQUEST_STATUS = {'pending': 'Ожидает', 'approved': 'Одобрена', 'rejected': 'Отклонена'}
+# Столбцы списков сотрудников (get_deletable_employees и подобные)
+EMPLOYEE_FIELDS = "user_id full_name position store"
+
+def employee_role_mark(emp: Tuple) -> str:
+    """Значок роли для строки get_employees_with_shifts"""
+    is_admin, is_super_admin = emp[4], emp[5]
+    return "⭐" if is_super_admin else "👑" if is_admin else "👤"
+
+def employee_request_mark(emp: Tuple) -> str:
+    """Значок «может запросить админку» для строки get_employees_with_shifts"""
+    is_admin, is_super_admin, can_request_admin = emp[4:7]
+    return " 📝" if can_request_admin and not (is_admin or is_super_admin) else ""
+
+def employee_shift_status(emp: Tuple) -> str:
+    """Статус смены сотрудника сегодня для строки get_employees_with_shifts"""
+    status, check_in, check_out = emp[7:10]
+    if status == "working":
+        return f" 🔓 Смена открыта в {format_clock(check_in, '')}"
+    if status == "completed":
+        return f" ✅ Смена завершена ({format_clock(check_in, '')} - {format_clock(check_out, '')})"
+    return " ⏳ Смена не открыта"
+
+def all_employees_role(emp: Tuple) -> str:
+    """Роль для строки get_all_employees"""
+    is_admin, is_super_admin = emp[3], emp[4]
+    return "⭐ Супер-админ" if is_super_admin else "👑 Админ" if is_admin else "👤 Сотрудник"
+
+def all_employees_request(emp: Tuple) -> str:
+    """Пометка «может запросить админку» для строки get_all_employees"""
+    is_admin, is_super_admin, can_request_admin = emp[3:6]
+    return " ✅ может запросить админку" if can_request_admin and not (is_admin or is_super_admin) else ""
+
+def store_confirm_percent(row: Tuple) -> str:
+    """Процент подтвержденных смен магазина"""
+    store, store_total, store_confirmed = row
+    if store_total > 0:
+        return f"{(store_confirmed or 0) / store_total * 100:.1f}%"
+    return "0%"
+
+TIMESHEET_ROW = RowTemplate(
+    "date checkin checkout minutes confirmed notes",
+    "📅 {date}\n"
+    "   Начало: {checkin}\n"
+    "   Конец: {checkout}\n"
+    "   Часов: {minutes}\n"
+    "   Подтверждено: {confirmed}\n"
+    "{notes}\n",
+    checkin=format_clock, checkout=format_clock, minutes=format_hours, confirmed=format_confirmed,
+    notes=lambda notes: f"   📝 {notes}\n" if notes else "",
+)
+OPEN_SHIFT_ROW = RowTemplate(
+    "full_name store position check_in user_id",
+    "👤 {full_name}\n"
+    "   🏪 {store} | 📋 {position}\n"
+    "   ⏱ Открыта в {check_in}\n\n",
+    check_in=lambda check_in: format_clock(check_in, ''),
+)
+SHIFT_TO_DELETE_ROW = RowTemplate(
+    "date minutes confirmed shift_id",
+    "🆔 {shift_id} | 📅 {date} | ⏱ {minutes} ч | {confirmed}\n",
+    minutes=format_hours, confirmed=format_confirmed,
+)
+UNCONFIRMED_PERIOD = Grouped(
+    lambda shift: shift[3],
+    RowTemplate("shift_id full_name store date", "📅 {date}\n"),
+    RowTemplate(
+        "shift_id full_name store date checkin checkout minutes",
+        "  🆔 {shift_id} | {full_name} | {store}\n"
+        "  ⏱ {checkin} - {checkout} ({minutes} ч)\n\n",
+        checkin=format_clock, checkout=format_clock, minutes=format_hours,
+    ),
+)
+UNCONFIRMED_TODAY_ROW = RowTemplate(
+    "shift_id full_name store checkin checkout minutes",
+    "🆔 {shift_id}\n"
+    "👤 {full_name}\n"
+    "🏪 {store}\n"
+    "⏱ {checkin} - {checkout} ({minutes} ч)\n\n",
+    checkin=format_clock, checkout=format_clock, minutes=format_hours,
+)
+UNCONFIRMED_STORE_ROW = RowTemplate(
+    "shift_id full_name date checkin checkout minutes",
+    "🆔 {shift_id} | {full_name}\n"
+    "📅 {date}\n"
+    "⏱ {checkin} - {checkout} ({minutes} ч)\n\n",
+    checkin=format_clock, checkout=format_clock, minutes=format_hours,
+)
+EMPLOYEE_SHIFT_ROW = RowTemplate(
+    "store user_id full_name position is_admin is_super_admin can_request_admin status check_in check_out",
+    "{role} {full_name} - {position}{request_mark}{shift_status}",
+    role=employee_role_mark, request_mark=employee_request_mark, shift_status=employee_shift_status,
+)
+EMPLOYEES_BY_STORE = Grouped(
+    lambda line: line[0],
+    RowTemplate("store employee", "🏪 {store}\n"),
+    RowTemplate("store employee", "  {employee}\n"),
+    gap="\n",
+)
+ALL_EMPLOYEES_ROW = RowTemplate(
+    "full_name position store is_admin is_super_admin can_request_admin",
+    "• {full_name}\n  {role} | {position} | {store}{request_status}\n\n",
+    role=all_employees_role, request_status=all_employees_request,
+)
+STORE_STATS_ROW = RowTemplate(
+    "store_name emp_count open_shifts closed_shifts shifts total_minutes active_employees",
+    "🏪 {store_name}\n"
+    "   👥 Сотрудников: {emp_count}\n"
+    "   📊 Активных (30 дн): {active_employees}\n"
+    "   📅 Смен (30 дн): {shifts}\n"
+    "   ⏱ Часов (30 дн): {total_minutes}\n"
+    "   🔓 Открытых смен сегодня: {open_shifts}\n"
+    "   ✅ Закрытых смен сегодня: {closed_shifts}\n\n",
+    total_minutes=format_hours,
+)
+STORE_CONFIRM_ROW = RowTemplate(
+    "store store_total store_confirmed",
+    "🏪 {store}: {store_confirmed}/{store_total} ({percent})\n",
+    store_confirmed=lambda store_confirmed: store_confirmed or 0, percent=store_confirm_percent,
+)
+DELETE_EMPLOYEE = Grouped(
+    lambda emp: emp[3],
+    RowTemplate(EMPLOYEE_FIELDS, "🏪 {store}\n"),
+    RowTemplate(EMPLOYEE_FIELDS, "  👤 {full_name} - {position}\n"),
+    gap="\n",
+)
+# Ожидающие запросы идут первыми, перед завершенными - заголовок
+DELETE_REQUEST = Grouped(
+    lambda req: req[5] == 'pending',
+    lambda req: "" if req[5] == 'pending' else "📋 ЗАВЕРШЕННЫЕ ЗАПРОСЫ:\n\n",
+    RowTemplate(
+        "req_id req_date requester target_type target_name status",
+        "{emoji} Запрос #{req_id}\n"
+        "📅 {req_date}\n"
+        "👤 От: {requester}\n"
+        "🎯 Тип: {target_type}\n"
+        "📌 Цель: {target_name}\n"
+        "📊 Статус: {status}\n\n",
+        emoji=lambda req: STATUS_EMOJI.get(req[5], '❓'),
+        target_type=lambda target_type: "сотрудника" if target_type == "employee" else "магазин",
+        status=lambda status: DELETE_REQUEST_STATUS.get(status, 'Неизвестно'),
+    ),
+)
+ADMIN_REQUEST = Grouped(
+    lambda req: req[6] == 'pending',
+    lambda req: "" if req[6] == 'pending' else "📋 ЗАВЕРШЕННЫЕ ЗАЯВКИ:\n\n",
+    RowTemplate(
+        "req_id req_date user_name user_position user_store user_id status",
+        "{emoji} Заявка #{req_id}\n"
+        "📅 {req_date}\n"
+        "👤 {user_name}\n"
+        "📋 Должность: {user_position}\n"
+        "🏪 Магазин: {user_store}\n"
+        "🆔 ID: {user_id}\n"
+        "📊 Статус: {status}\n\n",
+        emoji=lambda req: STATUS_EMOJI.get(req[6], '❓'),
+        status=lambda status: ADMIN_REQUEST_STATUS.get(status, 'Неизвестно'),
+    ),
+)
+PROMOTION_ROW = RowTemplate(
+    EMPLOYEE_FIELDS,
+    "👑 {full_name}\n"
+    "   Должность: {position}\n"
+    "   Магазин: {store}\n\n",
+)
+REGULAR_EMPLOYEE_ROW = RowTemplate(EMPLOYEE_FIELDS, "👤 {full_name}\n   {position} | {store}\n\n")
+
+# Постраничный вывод: длинный список - одна страница в одном сообщении
+def page_buttons(page: Page, route: str, *args: int) -> List[List[InlineKeyboardButton]]:
+    """Ряд кнопок ◀️/▶️ страницы; маршрут route получает args и смещение соседней страницы"""
+    def data(offset: int) -> str:
+        return callbacks.data(route, (*args, offset) if args else offset)
     
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully")
+    row = []
+    if page.prev_offset is not None:
+        row.append(InlineKeyboardButton(f"◀️ Стр. {page.prev_name}", callback_data=data(page.prev_offset)))
+    if page.next_offset is not None:
+        row.append(InlineKeyboardButton(f"Стр. {page.next_name} ▶️", callback_data=data(page.next_offset)))
+    return [row] if row else []
 
 # Декоратор для проверки прав
 def require_auth(admin_only=False, super_admin_only=False):
@@ -195,22 +325,15 @@ def require_auth(admin_only=False, super_admin_only=False):
             user_id = update.effective_user.id
             
             # Проверка зарегистрирован ли пользователь
-            conn = sqlite3.connect('timesheet.db')
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT is_admin, is_super_admin FROM employees WHERE user_id = ?",
-                (user_id,)
-            )
-            result = cursor.fetchone()
-            conn.close()
-            
+            result = await storage.get_user(user_id)
+
             if not result:
                 await update.effective_message.reply_text(
                     "❌ Вы не зарегистрированы. Используйте /start для регистрации."
                 )
                 return
-            
-            is_admin, is_super_admin = result
+
+            is_admin, is_super_admin = result[3], result[4]
             
             # Проверка прав
             if super_admin_only and not is_super_admin:
@@ -229,109 +352,6 @@ def require_auth(admin_only=False, super_admin_only=False):
         return wrapper
     return decorator
 
-# Функции для работы с БД
-def get_user(user_id: int) -> Optional[Tuple]:
-    """Получить информацию о пользователе"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT full_name, position, store, is_admin, is_super_admin, can_request_admin FROM employees WHERE user_id = ?",
-        (user_id,)
-    )
-    result = cursor.fetchone()
-    conn.close()
-    return result
-
-def get_active_shift(user_id: int) -> Optional[Tuple]:
-    """Получить активную смену пользователя"""
-    today = get_today_date_utc8()
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, check_in FROM timesheet WHERE user_id = ? AND date = ? AND status = 'working'",
-        (user_id, today)
-    )
-    result = cursor.fetchone()
-    conn.close()
-    return result
-
-def get_positions() -> List[str]:
-    """Получить список всех должностей"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM positions ORDER BY name")
-    result = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return result
-
-def get_stores() -> List[Tuple[str, str]]:
-    """Получить список всех магазинов (название, адрес)"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, address FROM stores ORDER BY name")
-    result = cursor.fetchall()
-    conn.close()
-    return result
-
-def get_super_admins() -> List[Tuple[int, str]]:
-    """Получить список супер-администраторов"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_id, full_name FROM employees WHERE is_super_admin = 1 ORDER BY full_name"
-    )
-    result = cursor.fetchall()
-    conn.close()
-    return result
-
-def get_employees_by_store(store_name: str = None) -> List[Tuple]:
-    """Получить список сотрудников по магазину"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    if store_name:
-        cursor.execute('''
-            SELECT user_id, full_name, position 
-            FROM employees 
-            WHERE store = ?
-            ORDER BY full_name
-        ''', (store_name,))
-    else:
-        cursor.execute('''
-            SELECT user_id, full_name, position, store 
-            FROM employees 
-            ORDER BY store, full_name
-        ''')
-    
-    result = cursor.fetchall()
-    conn.close()
-    return result
-
-def get_shifts_by_date(user_id: int, date_str: str) -> List[Tuple]:
-    """Получить смены сотрудника за указанную дату"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, check_in, check_out, hours, confirmed, status
-        FROM timesheet 
-        WHERE user_id = ? AND date = ?
-        ORDER BY check_in
-    ''', (user_id, date_str))
-    
-    result = cursor.fetchall()
-    conn.close()
-    return result
-
-def delete_shift(shift_id: int) -> bool:
-    """Удалить смену по ID"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM timesheet WHERE id = ?", (shift_id,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return deleted
-
 # Функция для создания клавиатуры обычного пользователя
 def get_user_keyboard(can_request_admin: bool = False) -> ReplyKeyboardMarkup:
     """Создать клавиатуру для обычного пользователя"""
@@ -396,7 +416,7 @@ async def enter_full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"✅ Имя сохранено в user_data: {context.user_data['full_name']}")
     
     # Показываем должности
-    positions = get_positions()
+    positions = await storage.get_positions()
     logger.info(f"Получен список должностей: {positions}")
     
     if not positions:
@@ -407,10 +427,10 @@ async def enter_full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Создаем клавиатуру с должностями
     keyboard = []
-    for pos in positions:
-        keyboard.append([InlineKeyboardButton(pos, callback_data=f"reg_pos_{pos}")])
+    for position_id, pos in positions:
+        keyboard.append([InlineKeyboardButton(pos, callback_data=callbacks.data("reg_pos_", position_id))])
     
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel_registration")])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.data("cancel_registration"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
@@ -446,19 +466,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"🔥 Команда /start от пользователя {user_id} ({full_name})")
     
     # Проверяем, зарегистрирован ли пользователь
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT is_admin, is_super_admin, can_request_admin FROM employees WHERE user_id = ?",
-        (user_id,)
-    )
-    employee = cursor.fetchone()
+    employee = await storage.get_user(user_id)
     
     if employee:
         # Пользователь уже зарегистрирован
-        is_admin, is_super_admin, can_request_admin = employee
-        stored_name = get_user(user_id)[0]
-        conn.close()
+        stored_name, _, _, is_admin, is_super_admin, can_request_admin = employee
         
         logger.info(f"Пользователь уже зарегистрирован: is_admin={is_admin}, is_super_admin={is_super_admin}")
         
@@ -490,19 +502,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Пользователь не зарегистрирован, проверяем наличие супер-админов")
     
     # Проверяем, есть ли в системе супер-администраторы
-    cursor.execute("SELECT COUNT(*) FROM employees WHERE is_super_admin = 1")
-    super_admin_count = cursor.fetchone()[0]
+    super_admin_count, positions_count, stores_count = await storage.get_registration_counts()
     
     if super_admin_count == 0:
         # Первый пользователь становится супер-администратором
         logger.info("Первый пользователь - назначаем супер-админом")
-        cursor.execute('''
-            INSERT INTO employees (user_id, full_name, position, store, reg_date, is_admin, is_super_admin, can_request_admin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, full_name, "Администратор", "Главный офис", 
-              get_today_date_utc8(), 1, 1, 0))
-        conn.commit()
-        conn.close()
+        await storage.add_first_super_admin(user_id, full_name, get_today_date_utc8())
         
         keyboard = get_admin_keyboard(is_super_admin=True)
         await update.message.reply_text(
@@ -516,19 +521,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     else:
         # Проверяем наличие должностей и магазинов
-        cursor.execute("SELECT COUNT(*) FROM positions")
-        positions_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM stores")
-        stores_count = cursor.fetchone()[0]
-        conn.close()
-        
         logger.info(f"Должностей: {positions_count}, Магазинов: {stores_count}")
         
         if positions_count == 0 or stores_count == 0:
             # Нет должностей или магазинов - предлагаем стать администратором
             logger.info("Нет должностей или магазинов - предлагаем стать админом")
             keyboard = [
-                [InlineKeyboardButton("👑 Стать администратором", callback_data="request_admin")]
+                [InlineKeyboardButton("👑 Стать администратором", callback_data=callbacks.data("request_admin"))]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -553,7 +552,7 @@ async def checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отметка начала рабочего дня"""
     user_id = update.effective_user.id
     
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     if not user:
         if update.callback_query:
             await update.callback_query.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
@@ -561,9 +560,14 @@ async def checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
         return
     
-    active_shift = get_active_shift(user_id)
-    if active_shift:
-        checkin_time = format_time_utc8(datetime.fromisoformat(active_shift[1]))
+    now = get_now_utc8()
+    today = now.date().isoformat()
+    
+    # Проверка на уже открытую смену выполняется в той же транзакции, что и запись
+    try:
+        await storage.open_shift(user_id, int(now.timestamp()))
+    except db.ActiveShiftExists as e:
+        checkin_time = format_clock(e.check_in)
         if update.callback_query:
             await update.callback_query.message.reply_text(
                 f"❌ У вас уже есть активная смена, начатая в {checkin_time}"
@@ -574,19 +578,6 @@ async def checkin(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         return
     
-    now = get_now_utc8()
-    today = now.date().isoformat()
-    checkin_time = now.isoformat()
-    
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO timesheet (user_id, date, status, check_in)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, today, 'working', checkin_time))
-    conn.commit()
-    conn.close()
-    
     result_message = f"✅ Начало смены отмечено в {format_time_utc8(now)}\n📅 Дата: {today}\nНе забудьте закрыть смену"
     
     if update.callback_query:
@@ -598,7 +589,7 @@ async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отметка конца рабочего дня"""
     user_id = update.effective_user.id
     
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     if not user:
         if update.callback_query:
             await update.callback_query.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
@@ -606,7 +597,7 @@ async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
         return
     
-    active_shift = get_active_shift(user_id)
+    active_shift = await storage.get_active_shift(user_id, get_today_date_utc8())
     if not active_shift:
         if update.callback_query:
             await update.callback_query.message.reply_text(
@@ -618,23 +609,20 @@ async def checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         return
     
-    shift_id, checkin_time_str = active_shift
-    checkin_time = datetime.fromisoformat(checkin_time_str)
+    shift_id, _ = active_shift
     checkout_time = get_now_utc8()
     
-    hours_worked = (checkout_time - checkin_time).total_seconds() / 3600
-    
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE timesheet 
-        SET status = 'completed', check_out = ?, hours = ?
-        WHERE id = ?
-    ''', (checkout_time.isoformat(), round(hours_worked, 2), shift_id))
-    conn.commit()
-    conn.close()
+    try:
+        minutes_worked = await storage.close_shift(shift_id, int(checkout_time.timestamp()))
+    except db.ShiftNotActive:
+        # Повторное нажатие: смена уже закрыта параллельным запросом
+        if update.callback_query:
+            await update.callback_query.message.reply_text("❌ Смена уже закрыта")
+        else:
+            await update.message.reply_text("❌ Смена уже закрыта")
+        return
     
-    result_message = f"✅ Конец смены отмечен в {format_time_utc8(checkout_time)}\n⏱ Отработано часов: {hours_worked:.2f}"
+    result_message = f"✅ Конец смены отмечен в {format_time_utc8(checkout_time)}\n⏱ Отработано часов: {format_hours(minutes_worked)}"
     
     if update.callback_query:
         await update.callback_query.message.reply_text(result_message)
@@ -645,7 +633,7 @@ async def timesheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Просмотр табеля за указанный период"""
     user_id = update.effective_user.id
     
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     if not user:
         if update.callback_query:
             await update.callback_query.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
@@ -662,16 +650,7 @@ async def timesheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     end_date = get_today_date_utc8()
     start_date = (datetime.now(TIMEZONE) - timedelta(days=days-1)).date().isoformat()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT date, check_in, check_out, hours, confirmed, notes
-        FROM timesheet
-        WHERE user_id = ? AND date BETWEEN ? AND ? AND status = 'completed'
-        ORDER BY date DESC
-    ''', (user_id, start_date, end_date))
-    records = cursor.fetchall()
-    conn.close()
+    records = await storage.get_user_timesheet(user_id, start_date, end_date)
     
     if not records:
         if update.callback_query:
@@ -680,28 +659,14 @@ async def timesheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"📊 Нет записей за последние {days} дней")
         return
     
-    report = f"📋 ТАБЕЛЬ ЗА {days} ДНЕЙ\n\n"
-    total_hours = 0
-    
-    for record in records:
-        date_str, checkin, checkout, hours, confirmed, notes = record
-        
-        checkin_time = format_time_utc8(datetime.fromisoformat(checkin)) if checkin else "-"
-        checkout_time = format_time_utc8(datetime.fromisoformat(checkout)) if checkout else "-"
-        confirmed_mark = "✅" if confirmed else "❌"
-        
-        report += f"📅 {date_str}\n"
-        report += f"   Начало: {checkin_time}\n"
-        report += f"   Конец: {checkout_time}\n"
-        report += f"   Часов: {hours}\n"
-        report += f"   Подтверждено: {confirmed_mark}\n"
-        if notes:
-            report += f"   📝 {notes}\n"
-        report += "\n"
-        
-        total_hours += hours
+    header = f"📋 ТАБЕЛЬ ЗА {days} ДНЕЙ\n\n"
+    total_minutes = sum(record[3] for record in records)
+    footer = f"📊 ИТОГО: {format_hours(total_minutes)} часов"
     
-    report += f"📊 ИТОГО: {total_hours:.2f} часов"
+    # Итог - за весь период, даже если не все дни поместились в сообщение
+    body, _ = join_limited(map(TIMESHEET_ROW, records), PAGE_TEXT_LIMIT - len(header) - len(footer),
+                           more_rows, len(records))
+    report = header + body + footer
     
     if update.callback_query:
         await update.callback_query.message.reply_text(report)
@@ -709,10 +674,10 @@ async def timesheet(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(report)
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Статистика за 30 дней по дням недели"""
+    """Статистика по дням недели за 30 дней или за указанный период (/stats 90)"""
     user_id = update.effective_user.id
     
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     if not user:
         if update.callback_query:
             await update.callback_query.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
@@ -720,64 +685,43 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
         return
     
+    args = context.args
+    days = 30
+    
+    if args and args[0].isdigit() and int(args[0]) > 0:
+        days = min(int(args[0]), MAX_STATS_DAYS)
+    
     end_date = get_today_date_utc8()
-    start_date = (datetime.now(TIMEZONE) - timedelta(days=29)).date().isoformat()
-    
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT date, hours
-        FROM timesheet
-        WHERE user_id = ? AND date BETWEEN ? AND ? AND status = 'completed'
-    ''', (user_id, start_date, end_date))
-    records = cursor.fetchall()
-    conn.close()
+    start_date = (datetime.now(TIMEZONE) - timedelta(days=days-1)).date().isoformat()
+    
+    records = await storage.get_user_weekday_stats(user_id, start_date, end_date)
     
     if not records:
         if update.callback_query:
-            await update.callback_query.message.reply_text("📊 Нет данных за последние 30 дней")
+            await update.callback_query.message.reply_text(f"📊 Нет данных за последние {days} дней")
         else:
-            await update.message.reply_text("📊 Нет данных за последние 30 дней")
+            await update.message.reply_text(f"📊 Нет данных за последние {days} дней")
         return
     
-    day_stats = {
-        0: {'name': 'Пн', 'count': 0, 'hours': 0},
-        1: {'name': 'Вт', 'count': 0, 'hours': 0},
-        2: {'name': 'Ср', 'count': 0, 'hours': 0},
-        3: {'name': 'Чт', 'count': 0, 'hours': 0},
-        4: {'name': 'Пт', 'count': 0, 'hours': 0},
-        5: {'name': 'Сб', 'count': 0, 'hours': 0},
-        6: {'name': 'Вс', 'count': 0, 'hours': 0}
-    }
+    # Рабочие дни (разные даты) и минуты по дням недели
+    day_stats = {weekday: (work_days, minutes) for weekday, work_days, minutes, _ in records}
+    total_days = sum(work_days for work_days, _ in day_stats.values())
+    total_minutes = sum(minutes for _, minutes in day_stats.values())
     
-    total_days = 0
-    total_hours = 0
+    lines = [f"📊 СТАТИСТИКА ЗА {days} ДНЕЙ\n\n", "По дням недели:\n"]
     
-    for record in records:
-        date_str, hours = record
-        dt = datetime.fromisoformat(date_str)
-        weekday = dt.weekday()
-        
-        day_stats[weekday]['count'] += 1
-        day_stats[weekday]['hours'] += hours
-        total_days += 1
-        total_hours += hours
-    
-    report = "📊 СТАТИСТИКА ЗА 30 ДНЕЙ\n\n"
-    report += "По дням недели:\n"
-    
-    for i in range(7):
-        stats = day_stats[i]
-        if stats['count'] > 0:
-            avg_hours = stats['hours'] / stats['count']
-            report += f"{stats['name']}: {stats['count']} дн., "
-            report += f"в среднем {avg_hours:.2f} ч/день\n"
+    for weekday, name in enumerate(WEEKDAY_NAMES):
+        if weekday in day_stats:
+            work_days, minutes = day_stats[weekday]
+            avg_hours = minutes / 60 / work_days
+            lines.append(f"{name}: {work_days} дн., в среднем {avg_hours:.2f} ч/день\n")
         else:
-            report += f"{stats['name']}: нет данных\n"
+            lines.append(f"{name}: нет данных\n")
     
-    report += f"\n📈 Всего дней: {total_days}\n"
-    report += f"📈 Всего часов: {total_hours:.2f}\n"
-    report += f"📈 Среднее: {total_hours/total_days:.2f} ч/день"
+    lines.append(f"\n📈 Всего дней: {total_days}\n")
+    lines.append(f"📈 Всего часов: {format_hours(total_minutes)}\n")
+    lines.append(f"📈 Среднее: {total_minutes / 60 / total_days:.2f} ч/день")
+    report = ''.join(lines)
     
     if update.callback_query:
         await update.callback_query.message.reply_text(report)
@@ -787,7 +731,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_open_shifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать все открытые смены"""
     user_id = update.effective_user.id
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     
     if not user or not (user[3] or user[4]):
         if update.callback_query:
@@ -798,18 +742,7 @@ async def show_open_shifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     today = get_today_date_utc8()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT e.full_name, e.store, e.position, t.check_in, t.user_id
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE t.date = ? AND t.status = 'working'
-        ORDER BY e.store, e.full_name
-    ''', (today,))
-    
-    open_shifts = cursor.fetchall()
-    conn.close()
+    open_shifts = await storage.get_open_shifts(today)
     
     if not open_shifts:
         if update.callback_query:
@@ -818,14 +751,9 @@ async def show_open_shifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("✅ Сегодня нет открытых смен")
         return
     
-    text = "🔓 ОТКРЫТЫЕ СМЕНЫ СЕГОДНЯ\n\n"
-    
-    for shift in open_shifts:
-        full_name, store, position, check_in, user_id = shift
-        check_in_time = format_time_utc8(datetime.fromisoformat(check_in)) if check_in else ""
-        text += f"👤 {full_name}\n"
-        text += f"   🏪 {store} | 📋 {position}\n"
-        text += f"   ⏱ Открыта в {check_in_time}\n\n"
+    header = "🔓 ОТКРЫТЫЕ СМЕНЫ СЕГОДНЯ\n\n"
+    body, _ = join_limited(map(OPEN_SHIFT_ROW, open_shifts), PAGE_TEXT_LIMIT - len(header), more_rows, len(open_shifts))
+    text = header + body
     
     if update.callback_query:
         await update.callback_query.message.reply_text(text)
@@ -836,35 +764,36 @@ async def show_open_shifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Панель администратора"""
     user_id = update.effective_user.id
-    user = get_user(user_id)
+    user = await storage.get_user(user_id)
     is_super_admin = user[4] if user else 0
     
     keyboard = [
-        [InlineKeyboardButton("✅ Открыть смену", callback_data="admin_checkin")],
-        [InlineKeyboardButton("✅ Закрыть смену", callback_data="admin_checkout")],
-        [InlineKeyboardButton("📊 Мой табель", callback_data="admin_timesheet")],
-        [InlineKeyboardButton("📈 Моя статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton("👥 Управление сотрудниками", callback_data="admin_employees_menu")],
-        [InlineKeyboardButton("📊 По магазинам", callback_data="admin_by_store")],
-        [InlineKeyboardButton("🔓 Открытые смены", callback_data="admin_open_shifts")],
-        [InlineKeyboardButton("📅 Выбрать период", callback_data="period_selection")],
-        [InlineKeyboardButton("📈 Статистика по магазинам", callback_data="admin_store_stats")],
-        [InlineKeyboardButton("✅ Подтверждение смен", callback_data="admin_confirm")],
-        [InlineKeyboardButton("🗑 Запросить удаление", callback_data="admin_delete_menu")],
-        [InlineKeyboardButton("📋 Управление должностями", callback_data="admin_positions_menu")],
-        [InlineKeyboardButton("🏪 Управление магазинами", callback_data="admin_stores_menu")],
-        [InlineKeyboardButton("🔄 Управление сменами", callback_data="admin_shifts_menu")],
+        [InlineKeyboardButton("✅ Открыть смену", callback_data=callbacks.data("admin_checkin"))],
+        [InlineKeyboardButton("✅ Закрыть смену", callback_data=callbacks.data("admin_checkout"))],
+        [InlineKeyboardButton("📊 Мой табель", callback_data=callbacks.data("admin_timesheet"))],
+        [InlineKeyboardButton("📈 Моя статистика", callback_data=callbacks.data("admin_stats"))],
+        [InlineKeyboardButton("👥 Управление сотрудниками", callback_data=callbacks.data("admin_employees_menu"))],
+        [InlineKeyboardButton("📊 По магазинам", callback_data=callbacks.data("admin_by_store"))],
+        [InlineKeyboardButton("🔓 Открытые смены", callback_data=callbacks.data("admin_open_shifts"))],
+        [InlineKeyboardButton("📅 Выбрать период", callback_data=callbacks.data("period_selection"))],
+        [InlineKeyboardButton("📈 Статистика по магазинам", callback_data=callbacks.data("admin_store_stats"))],
+        [InlineKeyboardButton("⏳ Мои отчеты", callback_data=callbacks.data("jobs_list"))],
+        [InlineKeyboardButton("✅ Подтверждение смен", callback_data=callbacks.data("admin_confirm"))],
+        [InlineKeyboardButton("🗑 Запросить удаление", callback_data=callbacks.data("admin_delete_menu"))],
+        [InlineKeyboardButton("📋 Управление должностями", callback_data=callbacks.data("admin_positions_menu"))],
+        [InlineKeyboardButton("🏪 Управление магазинами", callback_data=callbacks.data("admin_stores_menu"))],
+        [InlineKeyboardButton("🔄 Управление сменами", callback_data=callbacks.data("admin_shifts_menu"))],
     ]
     
     if is_super_admin:
         keyboard.extend([
-            [InlineKeyboardButton("➕ Добавить админа", callback_data="admin_add")],
-            [InlineKeyboardButton("📋 Запросы на удаление", callback_data="admin_requests")],
-            [InlineKeyboardButton("👑 Заявки в админы", callback_data="admin_admin_requests")],
-            [InlineKeyboardButton("⭐ Управление супер-админами", callback_data="assign_super_admin_menu")],
+            [InlineKeyboardButton("➕ Добавить админа", callback_data=callbacks.data("admin_add"))],
+            [InlineKeyboardButton("📋 Запросы на удаление", callback_data=callbacks.data("admin_requests"))],
+            [InlineKeyboardButton("👑 Заявки в админы", callback_data=callbacks.data("admin_admin_requests"))],
+            [InlineKeyboardButton("⭐ Управление супер-админами", callback_data=callbacks.data("assign_super_admin_menu"))],
         ])
     
-    keyboard.append([InlineKeyboardButton("❌ Закрыть", callback_data="close")])
+    keyboard.append([InlineKeyboardButton("❌ Закрыть", callback_data=callbacks.data("close"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -874,15 +803,12 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
-async def show_shifts_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_shifts_menu(query):
     """Показать меню управления сменами"""
-    query = update.callback_query
-    await query.answer()
-    
     keyboard = [
-        [InlineKeyboardButton("➕ Добавить смену", callback_data="add_shift_start")],
-        [InlineKeyboardButton("🗑 Удалить смену", callback_data="delete_shift_start")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("➕ Добавить смену", callback_data=callbacks.data("add_shift_start"))],
+        [InlineKeyboardButton("🗑 Удалить смену", callback_data=callbacks.data("delete_shift_start"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -892,16 +818,13 @@ async def show_shifts_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
-async def show_employees_management_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_employees_management_menu(query):
     """Показать меню управления сотрудниками"""
-    query = update.callback_query
-    await query.answer()
-    
     keyboard = [
-        [InlineKeyboardButton("➕ Добавить сотрудника", callback_data="add_employee_start")],
-        [InlineKeyboardButton("👥 Список сотрудников", callback_data="admin_list")],
-        [InlineKeyboardButton("📊 По магазинам", callback_data="admin_by_store")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("➕ Добавить сотрудника", callback_data=callbacks.data("add_employee_start"))],
+        [InlineKeyboardButton("👥 Список сотрудников", callback_data=callbacks.data("admin_list"))],
+        [InlineKeyboardButton("📊 По магазинам", callback_data=callbacks.data("admin_by_store"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -940,7 +863,7 @@ async def add_employee_enter_name(update: Update, context: ContextTypes.DEFAULT_
     context.user_data['add_employee_name'] = full_name
     
     # Показываем должности
-    positions = get_positions()
+    positions = await storage.get_positions()
     
     if not positions:
         await update.message.reply_text(
@@ -950,10 +873,10 @@ async def add_employee_enter_name(update: Update, context: ContextTypes.DEFAULT_
     
     # Создаем клавиатуру с должностями
     keyboard = []
-    for pos in positions:
-        keyboard.append([InlineKeyboardButton(pos, callback_data=f"add_emp_pos_{pos}")])
+    for position_id, pos in positions:
+        keyboard.append([InlineKeyboardButton(pos, callback_data=callbacks.data("add_emp_pos_", position_id))])
     
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="back_to_employee_management")])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.data("back_to_employee_management"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
@@ -964,15 +887,16 @@ async def add_employee_enter_name(update: Update, context: ContextTypes.DEFAULT_
     
     return ADD_EMPLOYEE_POSITION
 
-async def add_employee_select_position(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_employee_select_position(update: Update, context: ContextTypes.DEFAULT_TYPE, position_id: int):
     """Выбор должности для нового сотрудника"""
     query = update.callback_query
-    await query.answer()
-    
-    position = query.data.replace("add_emp_pos_", "", 1)
-    context.user_data['add_employee_position'] = position
+    position = await storage.get_position(position_id)
+    if not position:
+        await query.edit_message_text("❌ Должность не найдена")
+        return ConversationHandler.END
+    context.user_data['add_employee_position'] = (position_id, position)
     
-    stores = get_stores()
+    stores = await storage.get_stores()
     
     if not stores:
         await query.edit_message_text(
@@ -981,11 +905,11 @@ async def add_employee_select_position(update: Update, context: ContextTypes.DEF
         return ConversationHandler.END
     
     keyboard = []
-    for store_name, address in stores:
+    for store_id, store_name, address in stores:
         keyboard.append([
-            InlineKeyboardButton(f"{store_name}", callback_data=f"add_emp_store_{store_name}")
+            InlineKeyboardButton(f"{store_name}", callback_data=callbacks.data("add_emp_store_", store_id))
         ])
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="back_to_employee_management")])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.data("back_to_employee_management"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(
@@ -997,72 +921,53 @@ async def add_employee_select_position(update: Update, context: ContextTypes.DEF
     
     return ADD_EMPLOYEE_STORE
 
-async def add_employee_select_store(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_employee_select_store(update: Update, context: ContextTypes.DEFAULT_TYPE, store_id: int):
     """Выбор магазина и сохранение нового сотрудника"""
     query = update.callback_query
-    await query.answer()
-    
-    store = query.data.replace("add_emp_store_", "", 1)
-    position = context.user_data.get('add_employee_position')
+    store = await storage.get_store(store_id)
+    position_id, position = context.user_data.get('add_employee_position') or (None, None)
     full_name = context.user_data.get('add_employee_name')
     
-    if not position or not full_name:
+    if not position or not full_name or not store:
         await query.edit_message_text(
             "❌ Ошибка регистрации. Пожалуйста, начните заново."
         )
         return ConversationHandler.END
     
-    # Генерируем случайный user_id для сотрудника без телеграм
-    temp_user_id = -random.randint(10000, 99999)
-    
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+    keyboard = [[InlineKeyboardButton("◀️ Назад в управление сотрудниками", 
+                                     callback_data=callbacks.data("admin_employees_menu"))]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
     try:
-        # Проверяем, не существует ли уже такой user_id
-        while True:
-            cursor.execute("SELECT user_id FROM employees WHERE user_id = ?", (temp_user_id,))
-            if not cursor.fetchone():
-                break
-            temp_user_id = -random.randint(10000, 99999)
-        
         # Определяем, может ли сотрудник запрашивать админку
         can_request_admin = 1 if position.lower() == "директор магазина" else 0
         
-        # Регистрируем нового сотрудника
-        cursor.execute('''
-            INSERT INTO employees (user_id, full_name, position, store, reg_date, is_admin, is_super_admin, can_request_admin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (temp_user_id, full_name, position, store, get_today_date_utc8(), 0, 0, can_request_admin))
-        
-        conn.commit()
+        # Регистрируем нового сотрудника со случайным user_id (без телеграм)
+        temp_user_id = await storage.add_offline_employee(
+            full_name, position_id, store_id, get_today_date_utc8(), can_request_admin
+        )
         
         await query.edit_message_text(
             f"✅ Сотрудник успешно добавлен!\n\n"
             f"👤 {full_name}\n"
             f"📋 Должность: {position}\n"
-            f"🏪 Магазин: {store}\n"
+            f"🏪 Магазин: {store[0]}\n"
             f"🆔 Внутренний ID: {temp_user_id}\n\n"
-            f"Теперь вы можете управлять сменами этого сотрудника через меню управления сменами."
+            f"Теперь вы можете управлять сменами этого сотрудника через меню управления сменами.",
+            reply_markup=reply_markup
         )
-        
+    
     except Exception as e:
         logger.error(f"ОШИБКА при добавлении сотрудника: {e}")
         await query.edit_message_text(
-            "❌ Произошла ошибка при добавлении сотрудника. Попробуйте позже."
+            "❌ Произошла ошибка при добавлении сотрудника. Попробуйте позже.",
+            reply_markup=reply_markup
         )
-    finally:
-        conn.close()
     
     # Очищаем временные данные
     context.user_data.pop('add_employee_name', None)
     context.user_data.pop('add_employee_position', None)
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад в управление сотрудниками", 
-                                     callback_data="admin_employees_menu")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    
+
     return ConversationHandler.END
 
 async def back_to_employee_management(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1070,7 +975,7 @@ async def back_to_employee_management(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
     
-    await show_employees_management_menu(update, context)
+    await show_employees_management_menu(query)
     return ConversationHandler.END
 
 async def add_shift_select_store(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1078,16 +983,16 @@ async def add_shift_select_store(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    stores = get_stores()
+    stores = await storage.get_stores()
     if not stores:
         await query.edit_message_text("❌ Нет созданных магазинов")
         return ConversationHandler.END
     
     keyboard = []
-    for store_name, address in stores:
-        keyboard.append([InlineKeyboardButton(f"🏪 {store_name}", callback_data=f"add_shift_store_{store_name}")])
+    for store_id, store_name, address in stores:
+        keyboard.append([InlineKeyboardButton(f"🏪 {store_name}", callback_data=callbacks.data("add_shift_store_", store_id))])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_shifts_menu")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_shifts_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -1098,15 +1003,17 @@ async def add_shift_select_store(update: Update, context: ContextTypes.DEFAULT_T
     
     return ADD_SHIFT_SELECT_STORE
 
-async def add_shift_select_employee_fixed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_shift_select_employee_fixed(update: Update, context: ContextTypes.DEFAULT_TYPE, store_id: int):
     """Выбор сотрудника для добавления смены (исправленная версия)"""
     query = update.callback_query
-    await query.answer()
-    
-    store_name = query.data.replace("add_shift_store_", "", 1)
+    store = await storage.get_store(store_id)
+    if not store:
+        await query.edit_message_text("❌ Магазин не найден")
+        return ConversationHandler.END
+    store_name = store[0]
     context.user_data['add_shift_store'] = store_name
     
-    employees = get_employees_by_store(store_name)
+    employees = await storage.get_employees_by_store(store_id)
     if not employees:
         await query.edit_message_text(f"❌ В магазине '{store_name}' нет сотрудников")
         return ConversationHandler.END
@@ -1114,9 +1021,9 @@ async def add_shift_select_employee_fixed(update: Update, context: ContextTypes.
     keyboard = []
     for user_id, full_name, position in employees:
         keyboard.append([InlineKeyboardButton(f"👤 {full_name} - {position}", 
-                                             callback_data=f"add_shift_emp_{user_id}")])
+                                             callback_data=callbacks.data("add_shift_emp_", user_id))])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="add_shift_start")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("add_shift_start"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -1128,20 +1035,13 @@ async def add_shift_select_employee_fixed(update: Update, context: ContextTypes.
     
     return ADD_SHIFT_SELECT_EMPLOYEE
 
-async def add_shift_select_date_fixed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def add_shift_select_date_fixed(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """Выбор даты для добавления смены (исправленная версия)"""
     query = update.callback_query
-    await query.answer()
-    
-    user_id = int(query.data.replace("add_shift_emp_", "", 1))
     context.user_data['add_shift_user_id'] = user_id
     
     # Получаем информацию о сотруднике
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT full_name FROM employees WHERE user_id = ?", (user_id,))
-    employee = cursor.fetchone()
-    conn.close()
+    employee = await storage.get_employee_card(user_id)
     
     if not employee:
         await query.edit_message_text("❌ Сотрудник не найден")
@@ -1206,36 +1106,21 @@ async def add_shift_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Рассчитываем время начала (7:00) и окончания
         start_time = datetime.strptime(f"{date_str} {WORK_START_HOUR}:00", "%Y-%m-%d %H:%M")
         start_time = TIMEZONE.localize(start_time)
-        end_time = start_time + timedelta(hours=hours)
-        
-        # Сохраняем смену
-        conn = sqlite3.connect('timesheet.db')
-        cursor = conn.cursor()
-        
-        # Проверяем, нет ли уже смены в этот день
-        cursor.execute('''
-            SELECT id FROM timesheet 
-            WHERE user_id = ? AND date = ? AND status = 'completed'
-        ''', (user_id, date_str))
+        end_time = start_time + timedelta(minutes=round(hours * 60))
         
-        existing = cursor.fetchone()
-        if existing:
+        # Сохраняем смену (если в этот день ещё нет завершенной смены)
+        shift_id = await storage.add_completed_shift(
+            user_id, int(start_time.timestamp()), int(end_time.timestamp())
+        )
+        if shift_id is None:
             await update.message.reply_text(
                 f"❌ У сотрудника уже есть завершенная смена в этот день"
             )
-            conn.close()
             return ConversationHandler.END
         
-        cursor.execute('''
-            INSERT INTO timesheet 
-            (user_id, date, status, check_in, check_out, hours, confirmed, created_by_admin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, date_str, 'completed', start_time.isoformat(), 
-              end_time.isoformat(), hours, 0, 1))
-        
-        conn.commit()
-        conn.close()
-        
+        # Возврат в меню - кнопкой под сообщением о результате
+        keyboard = [[InlineKeyboardButton("◀️ Назад в управление сменами", callback_data=callbacks.data("admin_shifts_menu"))]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             f"✅ Смена успешно добавлена!\n\n"
             f"👤 Сотрудник: {employee_name}\n"
@@ -1244,21 +1129,14 @@ async def add_shift_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"⏱ Часов: {hours}\n"
             f"⏰ Начало: {WORK_START_HOUR}:00\n"
             f"⏰ Окончание: {WORK_START_HOUR + int(hours)}:{int((hours % 1) * 60):02d}\n\n"
-            f"⚠️ Смена требует подтверждения администратором."
+            f"⚠️ Смена требует подтверждения администратором.",
+            reply_markup=reply_markup
         )
         
         # Очищаем данные
         for key in ['add_shift_user_id', 'add_shift_store', 'add_shift_employee_name', 'add_shift_date']:
             context.user_data.pop(key, None)
-        
-        # Возвращаемся в меню
-        keyboard = [[InlineKeyboardButton("◀️ Назад в управление сменами", callback_data="admin_shifts_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            "Выберите действие:",
-            reply_markup=reply_markup
-        )
-        
+
         return ConversationHandler.END
         
     except ValueError:
@@ -1272,16 +1150,16 @@ async def delete_shift_select_store(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
     
-    stores = get_stores()
+    stores = await storage.get_stores()
     if not stores:
         await query.edit_message_text("❌ Нет созданных магазинов")
         return ConversationHandler.END
     
     keyboard = []
-    for store_name, address in stores:
-        keyboard.append([InlineKeyboardButton(f"🏪 {store_name}", callback_data=f"delete_shift_store_{store_name}")])
+    for store_id, store_name, address in stores:
+        keyboard.append([InlineKeyboardButton(f"🏪 {store_name}", callback_data=callbacks.data("delete_shift_store_", store_id))])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_shifts_menu")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_shifts_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -1292,15 +1170,17 @@ async def delete_shift_select_store(update: Update, context: ContextTypes.DEFAUL
     
     return DELETE_SHIFT_SELECT_STORE
 
-async def delete_shift_select_employee(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_shift_select_employee(update: Update, context: ContextTypes.DEFAULT_TYPE, store_id: int):
     """Выбор сотрудника для удаления смены"""
     query = update.callback_query
-    await query.answer()
-    
-    store_name = query.data.replace("delete_shift_store_", "", 1)
+    store = await storage.get_store(store_id)
+    if not store:
+        await query.edit_message_text("❌ Магазин не найден")
+        return ConversationHandler.END
+    store_name = store[0]
     context.user_data['delete_shift_store'] = store_name
     
-    employees = get_employees_by_store(store_name)
+    employees = await storage.get_employees_by_store(store_id)
     if not employees:
         await query.edit_message_text(f"❌ В магазине '{store_name}' нет сотрудников")
         return ConversationHandler.END
@@ -1308,9 +1188,9 @@ async def delete_shift_select_employee(update: Update, context: ContextTypes.DEF
     keyboard = []
     for user_id, full_name, position in employees:
         keyboard.append([InlineKeyboardButton(f"👤 {full_name} - {position}", 
-                                             callback_data=f"delete_shift_emp_{user_id}")])
+                                             callback_data=callbacks.data("delete_shift_emp_", user_id))])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="delete_shift_start")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("delete_shift_start"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -1322,20 +1202,13 @@ async def delete_shift_select_employee(update: Update, context: ContextTypes.DEF
     
     return DELETE_SHIFT_SELECT_EMPLOYEE
 
-async def delete_shift_select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_shift_select_date(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """Выбор даты для удаления смены"""
     query = update.callback_query
-    await query.answer()
-    
-    user_id = int(query.data.replace("delete_shift_emp_", "", 1))
     context.user_data['delete_shift_user_id'] = user_id
     
     # Получаем информацию о сотруднике
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT full_name FROM employees WHERE user_id = ?", (user_id,))
-    employee = cursor.fetchone()
-    conn.close()
+    employee = await storage.get_employee_card(user_id)
     
     if not employee:
         await query.edit_message_text("❌ Сотрудник не найден")
@@ -1344,18 +1217,7 @@ async def delete_shift_select_date(update: Update, context: ContextTypes.DEFAULT
     context.user_data['delete_shift_employee_name'] = employee[0]
     
     # Получаем список доступных дат для удаления
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT date, hours, confirmed, id
-        FROM timesheet 
-        WHERE user_id = ? AND status = 'completed'
-        ORDER BY date DESC
-        LIMIT 20
-    ''', (user_id,))
-    
-    shifts = cursor.fetchall()
-    conn.close()
+    shifts = await storage.get_recent_completed_shifts(user_id, limit=20)
     
     if not shifts:
         await query.edit_message_text(
@@ -1366,60 +1228,38 @@ async def delete_shift_select_date(update: Update, context: ContextTypes.DEFAULT
     text = f"👤 Сотрудник: {employee[0]}\n"
     text += f"🏪 Магазин: {context.user_data['delete_shift_store']}\n\n"
     text += "📅 ДОСТУПНЫЕ СМЕНЫ ДЛЯ УДАЛЕНИЯ:\n\n"
+    text += SHIFT_TO_DELETE_ROW.render_all(shifts)
     
     keyboard = []
-    for date_str, hours, confirmed, shift_id in shifts:
-        confirmed_mark = "✅" if confirmed else "❌"
-        text += f"🆔 {shift_id} | 📅 {date_str} | ⏱ {hours} ч | {confirmed_mark}\n"
+    for date_str, minutes, confirmed, shift_id in shifts:
         keyboard.append([InlineKeyboardButton(f"🗑 Удалить смену от {date_str}", 
-                                             callback_data=f"delete_shift_confirm_{shift_id}")])
+                                             callback_data=callbacks.data("delete_shift_confirm_", shift_id))])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="delete_shift_start")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("delete_shift_start"))])
     
+    # Не больше 20 коротких строк - всегда помещается в одно сообщение
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите смену для удаления:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
     
     return DELETE_SHIFT_SELECT_DATE
 
-async def delete_shift_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_shift_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, shift_id: int):
     """Подтверждение удаления смены"""
     query = update.callback_query
-    await query.answer()
-    
-    shift_id = int(query.data.replace("delete_shift_confirm_", "", 1))
     
     # Получаем информацию о смене для подтверждения
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.date, t.hours, e.full_name, e.store
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE t.id = ?
-    ''', (shift_id,))
-    
-    shift = cursor.fetchone()
-    conn.close()
+    shift = await storage.get_shift_details(shift_id)
     
     if not shift:
         await query.edit_message_text("❌ Смена не найдена")
         return ConversationHandler.END
     
-    date_str, hours, full_name, store = shift
+    date_str, minutes, full_name, store = shift
     
     keyboard = [
         [
-            InlineKeyboardButton("✅ Да, удалить", callback_data=f"delete_shift_execute_{shift_id}"),
-            InlineKeyboardButton("❌ Нет, отмена", callback_data="admin_shifts_menu")
+            InlineKeyboardButton("✅ Да, удалить", callback_data=callbacks.data("delete_shift_execute_", shift_id)),
+            InlineKeyboardButton("❌ Нет, отмена", callback_data=callbacks.data("admin_shifts_menu"))
         ]
     ]
     
@@ -1431,847 +1271,578 @@ async def delete_shift_confirm(update: Update, context: ContextTypes.DEFAULT_TYP
         f"👤 Сотрудник: {full_name}\n"
         f"🏪 Магазин: {store}\n"
         f"📅 Дата: {date_str}\n"
-        f"⏱ Часов: {hours}\n\n"
+        f"⏱ Часов: {format_hours(minutes)}\n\n"
         f"Это действие нельзя отменить!",
         reply_markup=reply_markup
     )
 
-async def delete_shift_execute(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def delete_shift_execute(update: Update, context: ContextTypes.DEFAULT_TYPE, shift_id: int):
     """Выполнение удаления смены"""
     query = update.callback_query
-    await query.answer()
     
-    shift_id = int(query.data.replace("delete_shift_execute_", "", 1))
-    
-    if delete_shift(shift_id):
-        await query.edit_message_text(f"✅ Смена #{shift_id} успешно удалена!")
+    if await storage.delete_shift(shift_id):
+        text = f"✅ Смена #{shift_id} успешно удалена!"
     else:
-        await query.edit_message_text(f"❌ Не удалось удалить смену #{shift_id}")
+        text = f"❌ Не удалось удалить смену #{shift_id}"
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад в управление сменами", callback_data="admin_shifts_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад в управление сменами", callback_data=callbacks.data("admin_shifts_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
     
     return ConversationHandler.END
 
-async def show_unconfirmed_period_fixed(query, days):
+async def show_unconfirmed_period_fixed(query, days, offset: int = 0):
     """Показать неподтвержденные смены за период (исправленная версия)"""
     end_date = get_today_date_utc8()
     start_date = (datetime.now(TIMEZONE) - timedelta(days=days-1)).date().isoformat()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.id, e.full_name, e.store, t.date, t.check_in, t.check_out, t.hours
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE t.date BETWEEN ? AND ? AND t.status = 'completed' AND t.confirmed = 0
-        ORDER BY t.date DESC, e.store
-    ''', (start_date, end_date))
-    
-    unconfirmed = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(
+        lambda offset, limit: storage.get_unconfirmed_in_range(start_date, end_date, limit, offset),
+        offset, f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ ЗА {days} ДНЕЙ\n\n", UNCONFIRMED_PERIOD
+    )
     
-    if not unconfirmed:
+    if not page:
         await query.edit_message_text(f"✅ Нет неподтвержденных смен за последние {days} дней")
         return
     
-    text = f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ ЗА {days} ДНЕЙ\n\n"
-    
-    # Группируем по датам
-    by_date = {}
-    for shift in unconfirmed:
-        date = shift[3]
-        if date not in by_date:
-            by_date[date] = []
-        by_date[date].append(shift)
-    
-    for date in sorted(by_date.keys(), reverse=True):
-        text += f"📅 {date}\n"
-        for shift in by_date[date]:
-            shift_id, full_name, store, _, checkin, checkout, hours = shift
-            
-            checkin_time = format_time_utc8(datetime.fromisoformat(checkin)) if checkin else "-"
-            checkout_time = format_time_utc8(datetime.fromisoformat(checkout)) if checkout else "-"
-            
-            text += f"  🆔 {shift_id} | {full_name} | {store}\n"
-            text += f"  ⏱ {checkin_time} - {checkout_time} ({hours} ч)\n\n"
-    
     # Создаем клавиатуру для подтверждения
     keyboard = []
     
     # Добавляем кнопку подтверждения всех за период
     keyboard.append([
         InlineKeyboardButton(f"✅ Подтвердить все за {days} дней", 
-                           callback_data=f"confirm_all_period_{days}")
+                           callback_data=callbacks.data("confirm_all_period_", days))
     ])
     
-    # Добавляем кнопки для каждой смены
-    for shift in unconfirmed[:10]:
+    # Добавляем кнопки для каждой смены страницы
+    for shift in page.records:
         shift_id = shift[0]
         keyboard.append([
             InlineKeyboardButton(f"✅ Подтвердить #{shift_id}", 
-                               callback_data=f"confirm_shift_{shift_id}")
+                               callback_data=callbacks.data("confirm_shift_", shift_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")])
+    keyboard += page_buttons(page, "confirm_period_page_", days)
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def confirm_all_period(query, days):
     """Подтвердить все смены за период"""
     end_date = get_today_date_utc8()
     start_date = (datetime.now(TIMEZONE) - timedelta(days=days-1)).date().isoformat()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE timesheet 
-        SET confirmed = 1 
-        WHERE date BETWEEN ? AND ? AND status = 'completed' AND confirmed = 0
-    ''', (start_date, end_date))
+    count = await storage.confirm_shifts_in_range(start_date, end_date)
     
-    count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    
-    await query.edit_message_text(f"✅ Подтверждено {count} смен за последние {days} дней")
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-
-async def handle_confirm_period_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка выбора периода для неподтвержденных смен"""
-    query = update.callback_query
-    await query.answer()
-    
-    days = int(query.data.replace("confirm_period_", "", 1))
-    await show_unconfirmed_period_fixed(query, days)
+    await query.edit_message_text(f"✅ Подтверждено {count} смен за последние {days} дней", reply_markup=reply_markup)
 
-async def delete_position_fixed(query, position_name):
+async def delete_position_fixed(query, position_id):
     """Удаление должности (исправленная версия)"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    # Очищаем название от возможных подчеркиваний в начале
-    if position_name.startswith('_'):
-        position_name = position_name[1:]
+    position_name = await storage.get_position(position_id) or f"#{position_id}"
     
     logger.info(f"Удаление должности: '{position_name}'")
     
-    # Проверяем, используется ли должность
-    cursor.execute("SELECT COUNT(*) FROM employees WHERE position = ?", (position_name,))
-    count = cursor.fetchone()[0]
+    status, count = await storage.delete_position(position_id)
     
-    if count > 0:
+    if status == 'in_use':
         await query.edit_message_text(
             f"❌ Невозможно удалить должность '{position_name}'\n"
             f"Она используется {count} сотрудником(ами)"
         )
-        conn.close()
         return
     
-    # Проверяем, есть ли такая должность в таблице positions
-    cursor.execute("SELECT COUNT(*) FROM positions WHERE name = ?", (position_name,))
-    pos_count = cursor.fetchone()[0]
-    
-    if pos_count == 0:
+    if status == 'not_found':
         await query.edit_message_text(f"❌ Должность '{position_name}' не найдена в базе данных")
-        conn.close()
         return
     
-    # Удаляем должность
-    cursor.execute("DELETE FROM positions WHERE name = ?", (position_name,))
-    conn.commit()
-    deleted = cursor.rowcount > 0
-    conn.close()
-    
-    if deleted:
-        await query.edit_message_text(f"✅ Должность '{position_name}' успешно удалена!")
+    if status == 'deleted':
+        text = f"✅ Должность '{position_name}' успешно удалена!"
     else:
-        await query.edit_message_text(f"❌ Не удалось удалить должность '{position_name}'")
+        text = f"❌ Не удалось удалить должность '{position_name}'"
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_positions_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_positions_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 # Основной обработчик callback-запросов
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка нажатий на инлайн кнопки"""
-    query = update.callback_query
-    await query.answer()
-    
-    callback_data = query.data
-    user_id = query.from_user.id
+async def registration_select_position(call: RouteCall):
+    """Выбор должности при регистрации"""
+    query, context = call.query, call.context
+    logger.info("🔥🔥🔥 Обработка выбора должности")
     
-    logger.info(f"Callback: {callback_data} от пользователя {user_id}")
-    
-    # Обработка отмены регистрации
-    if callback_data == "cancel_registration":
-        await query.edit_message_text("❌ Регистрация отменена.")
+    if await storage.get_user(call.user_id):
+        await query.edit_message_text("❌ Вы уже зарегистрированы!")
         return ConversationHandler.END
     
-    user = get_user(user_id)
+    # Получаем имя из user_data
+    full_name = context.user_data.get('full_name')
+    logger.info(f"Получено имя из user_data: {full_name}")
     
-    # Обработка регистрации с именем
-    if callback_data.startswith("reg_pos_"):
-        logger.info("🔥🔥🔥 Обработка выбора должности")
-        
-        if user:
-            await query.edit_message_text("❌ Вы уже зарегистрированы!")
-            return ConversationHandler.END
-        
-        # Получаем имя из user_data
-        full_name = context.user_data.get('full_name')
-        logger.info(f"Получено имя из user_data: {full_name}")
-        
-        if not full_name:
-            # Если нет имени, используем имя из Telegram
-            full_name = query.from_user.full_name
-            logger.info(f"Имя не найдено, используем из Telegram: {full_name}")
-            await query.edit_message_text(
-                f"⚠️ Внимание! Будет использовано имя из Telegram: {full_name}\n"
-                f"Если хотите изменить имя, начните регистрацию заново."
-            )
-            await asyncio.sleep(2)
-        
-        position = callback_data[8:]
-        context.user_data['reg_position'] = position
-        context.user_data['full_name'] = full_name
-        
-        logger.info(f"Выбрана должность: {position}")
-        
-        stores = get_stores()
-        logger.info(f"Получен список магазинов: {stores}")
-        
-        if not stores:
-            await query.edit_message_text(
-                "❌ В системе нет магазинов. Обратитесь к администратору."
-            )
-            return ConversationHandler.END
-        
-        keyboard = []
-        for store_name, address in stores:
-            keyboard.append([
-                InlineKeyboardButton(f"{store_name}", callback_data=f"reg_store_{store_name}")
-            ])
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel_registration")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+    if not full_name:
+        # Если нет имени, используем имя из Telegram
+        full_name = query.from_user.full_name
+        logger.info(f"Имя не найдено, используем из Telegram: {full_name}")
         await query.edit_message_text(
-            f"👤 Имя: {full_name}\n"
-            f"📋 Должность: {position}\n\n"
-            f"🏪 Теперь выберите ваш магазин:",
-            reply_markup=reply_markup
+            f"⚠️ Внимание! Будет использовано имя из Telegram: {full_name}\n"
+            f"Если хотите изменить имя, начните регистрацию заново."
         )
-        
-        logger.info(f"🔥 button_callback возвращает SELECT_STORE = {SELECT_STORE}")
-        return SELECT_STORE
+        await asyncio.sleep(2)
     
-    elif callback_data.startswith("reg_store_"):
-        logger.info("🔥🔥🔥 Обработка выбора магазина")
-        
-        if user:
-            await query.edit_message_text("❌ Вы уже зарегистрированы!")
-            return ConversationHandler.END
-            
-        store = callback_data[10:]
-        position = context.user_data.get('reg_position')
-        full_name = context.user_data.get('full_name')
-        
-        logger.info(f"Выбран магазин: {store}")
-        logger.info(f"Должность из user_data: {position}")
-        logger.info(f"Имя из user_data: {full_name}")
-        
-        if not position:
-            logger.error("ОШИБКА: должность не найдена в user_data")
-            await query.edit_message_text(
-                "❌ Ошибка регистрации. Пожалуйста, начните заново с /start"
-            )
-            return ConversationHandler.END
-        
-        if not full_name:
-            full_name = query.from_user.full_name
-            logger.info(f"Имя не найдено, используем из Telegram: {full_name}")
-        
-        user_id = query.from_user.id
-        
-        # Проверяем, является ли должность "директор магазина"
-        can_request_admin = 1 if position.lower() == "директор магазина" else 0
-        
-        conn = sqlite3.connect('timesheet.db')
-        cursor = conn.cursor()
-        
-        try:
-            # Проверяем, не зарегистрирован ли уже пользователь
-            cursor.execute("SELECT user_id FROM employees WHERE user_id = ?", (user_id,))
-            if cursor.fetchone():
-                await query.edit_message_text(
-                    "❌ Вы уже зарегистрированы! Используйте /start"
-                )
-                conn.close()
-                return ConversationHandler.END
-            
-            # Регистрируем нового пользователя
-            cursor.execute('''
-                INSERT INTO employees (user_id, full_name, position, store, reg_date, is_admin, is_super_admin, can_request_admin)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, full_name, position, store, get_today_date_utc8(), 0, 0, can_request_admin))
-            conn.commit()
-            
-            logger.info(f"✅✅✅ Новый пользователь зарегистрирован: {user_id} - {full_name} ({position}, {store})")
-            logger.info(f"Может запрашивать админку: {can_request_admin}")
-            
-            await query.edit_message_text(
-                f"✅ Регистрация успешно завершена!\n\n"
-                f"👤 {full_name}\n"
-                f"📋 Должность: {position}\n"
-                f"🏪 Магазин: {store}"
-            )
-            
-            # Создаем клавиатуру для обычного сотрудника
-            keyboard = get_user_keyboard(can_request_admin)
-            
-            await query.message.reply_text(
-                f"👋 Привет, {full_name}!\n\n"
-                f"📋 Используйте кнопки ниже для работы:",
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            logger.error(f"ОШИБКА при регистрации: {e}")
-            await query.edit_message_text(
-                "❌ Произошла ошибка при регистрации. Попробуйте позже."
-            )
-        finally:
-            conn.close()
-        
-        # Очищаем временные данные
-        context.user_data.pop('reg_position', None)
-        context.user_data.pop('full_name', None)
-        
-        logger.info("🔥 Регистрация завершена, возвращаем ConversationHandler.END")
+    position_id = call.arg
+    position = await storage.get_position(position_id)
+    if not position:
+        await query.edit_message_text("❌ Должность не найдена. Начните заново с /start")
         return ConversationHandler.END
+    context.user_data['reg_position'] = (position_id, position)
+    context.user_data['full_name'] = full_name
     
-    # Для всех остальных callback_data проверяем авторизацию
-    if not user:
-        await query.edit_message_text("❌ Вы не зарегистрированы. Используйте /start")
-        return
-    
-    full_name, position, store, is_admin, is_super_admin, can_request_admin = user
-    
-    if callback_data == "close":
-        await query.delete_message()
-        return
-    
-    elif callback_data == "request_admin":
-        await handle_admin_request(query, context, user_id, user)
-    
-    elif callback_data == "admin_checkin":
-        logger.info(f"Выполняется admin_checkin для пользователя {user_id}")
-        await checkin(update, context)
-    
-    elif callback_data == "admin_checkout":
-        logger.info(f"Выполняется admin_checkout для пользователя {user_id}")
-        await checkout(update, context)
-    
-    elif callback_data == "admin_timesheet":
-        logger.info(f"Выполняется admin_timesheet для пользователя {user_id}")
-        await timesheet(update, context)
-    
-    elif callback_data == "admin_stats":
-        logger.info(f"Выполняется admin_stats для пользователя {user_id}")
-        await stats(update, context)
-    
-    elif callback_data == "admin_open_shifts":
-        logger.info(f"Выполняется admin_open_shifts для пользователя {user_id}")
-        await show_open_shifts(update, context)
+    logger.info(f"Выбрана должность: {position}")
     
-    elif callback_data == "admin_list":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_all_employees(query)
+    stores = await storage.get_stores()
+    logger.info(f"Получен список магазинов: {stores}")
     
-    elif callback_data == "admin_by_store":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_employees_by_store(query)
+    if not stores:
+        await query.edit_message_text(
+            "❌ В системе нет магазинов. Обратитесь к администратору."
+        )
+        return ConversationHandler.END
     
-    elif callback_data == "admin_employees_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_employees_management_menu(update, context)
+    keyboard = []
+    for store_id, store_name, address in stores:
+        keyboard.append([
+            InlineKeyboardButton(f"{store_name}", callback_data=callbacks.data("reg_store_", store_id))
+        ])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.data("cancel_registration"))])
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    elif callback_data == "add_employee_start":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await add_employee_start(update, context)
-        return ADD_EMPLOYEE_NAME
+    await query.edit_message_text(
+        f"👤 Имя: {full_name}\n"
+        f"📋 Должность: {position}\n\n"
+        f"🏪 Теперь выберите ваш магазин:",
+        reply_markup=reply_markup
+    )
     
-    elif callback_data.startswith("add_emp_pos_"):
-        if not (is_admin or is_super_admin):
-            return
-        await add_employee_select_position(update, context)
-        return ADD_EMPLOYEE_STORE
+    logger.info(f"🔥 Выбор должности завершен, переходим в SELECT_STORE = {SELECT_STORE}")
+    return SELECT_STORE
+
+async def registration_select_store(call: RouteCall):
+    """Выбор магазина и завершение регистрации"""
+    query, context = call.query, call.context
+    logger.info("🔥🔥🔥 Обработка выбора магазина")
     
-    elif callback_data.startswith("add_emp_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        await add_employee_select_store(update, context)
+    if await storage.get_user(call.user_id):
+        await query.edit_message_text("❌ Вы уже зарегистрированы!")
         return ConversationHandler.END
-    
-    elif callback_data == "back_to_employee_management":
-        await back_to_employee_management(update, context)
-    
-    # Обработка выбора периода
-    elif callback_data == "period_selection":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_period_selection(query)
-    
-    elif callback_data.startswith("period_"):
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
         
-        period = callback_data[7:]
-        if period == "custom":
-            await query.edit_message_text(
-                "📅 Введите начальную дату в формате ГГГГ-ММ-ДД:"
-            )
-            return CUSTOM_PERIOD_START
-        else:
-            days = 0
-            if period == "7":
-                days = 7
-            elif period == "14":
-                days = 14
-            elif period == "30":
-                days = 30
-            elif period == "90":
-                days = 90
-            elif period == "all":
-                days = 36500
-            
-            context.user_data['period_days'] = days
-            await show_export_options(query, days)
-    
-    # Обработка экспорта
-    elif callback_data == "export_confirmed":
-        if not (is_admin or is_super_admin):
-            return
-        days = context.user_data.get('period_days', 30)
-        await export_csv_period(query, days, confirmed_only=True)
-    
-    elif callback_data == "export_all":
-        if not (is_admin or is_super_admin):
-            return
-        days = context.user_data.get('period_days', 30)
-        await export_csv_period(query, days, confirmed_only=False)
+    store_id = call.arg
+    store_row = await storage.get_store(store_id)
+    store = store_row[0] if store_row else None
+    position_id, position = context.user_data.get('reg_position') or (None, None)
+    full_name = context.user_data.get('full_name')
     
-    elif callback_data == "admin_store_stats":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_store_stats(query)
+    logger.info(f"Выбран магазин: {store}")
+    logger.info(f"Должность из user_data: {position}")
+    logger.info(f"Имя из user_data: {full_name}")
     
-    elif callback_data == "admin_confirm":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_confirm_menu(query)
+    if not position or not store:
+        logger.error("ОШИБКА: должность не найдена в user_data или магазин удален")
+        await query.edit_message_text(
+            "❌ Ошибка регистрации. Пожалуйста, начните заново с /start"
+        )
+        return ConversationHandler.END
     
-    elif callback_data == "admin_delete_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_delete_menu(query)
+    if not full_name:
+        full_name = query.from_user.full_name
+        logger.info(f"Имя не найдено, используем из Telegram: {full_name}")
     
-    elif callback_data == "admin_positions_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_positions_menu(query)
+    user_id = query.from_user.id
     
-    elif callback_data == "admin_stores_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_stores_menu(query)
+    # Проверяем, является ли должность "директор магазина"
+    can_request_admin = 1 if position.lower() == "директор магазина" else 0
     
-    elif callback_data == "admin_shifts_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_shifts_menu(update, context)
-    
-    elif callback_data == "add_shift_start":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await add_shift_select_store(update, context)
-        return ADD_SHIFT_SELECT_STORE
-    
-    elif callback_data.startswith("add_shift_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        await add_shift_select_employee_fixed(update, context)
-        return ADD_SHIFT_SELECT_EMPLOYEE
-    
-    elif callback_data.startswith("add_shift_emp_"):
-        if not (is_admin or is_super_admin):
-            return
-        await add_shift_select_date_fixed(update, context)
-        return ADD_SHIFT_SELECT_DATE
-    
-    elif callback_data == "delete_shift_start":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await delete_shift_select_store(update, context)
-        return DELETE_SHIFT_SELECT_STORE
-    
-    elif callback_data.startswith("delete_shift_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        await delete_shift_select_employee(update, context)
-        return DELETE_SHIFT_SELECT_EMPLOYEE
-    
-    elif callback_data.startswith("delete_shift_emp_"):
-        if not (is_admin or is_super_admin):
-            return
-        await delete_shift_select_date(update, context)
-        return DELETE_SHIFT_SELECT_DATE
-    
-    elif callback_data.startswith("delete_shift_confirm_"):
-        if not (is_admin or is_super_admin):
-            return
-        await delete_shift_confirm(update, context)
-    
-    elif callback_data.startswith("delete_shift_execute_"):
-        if not (is_admin or is_super_admin):
-            return
-        await delete_shift_execute(update, context)
-        return ConversationHandler.END
-    
-    elif callback_data == "back_to_admin":
-        await show_admin_panel(query)
-    
-    elif callback_data == "create_position":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
+    try:
+        # Регистрируем нового пользователя (если он ещё не зарегистрирован)
+        if not await storage.add_employee(user_id, full_name, position_id, store_id, get_today_date_utc8(),
+                               can_request_admin=can_request_admin):
+            await query.edit_message_text(
+                "❌ Вы уже зарегистрированы! Используйте /start"
+            )
+            return ConversationHandler.END
+        
+        logger.info(f"✅✅✅ Новый пользователь зарегистрирован: {user_id} - {full_name} ({position}, {store})")
+        logger.info(f"Может запрашивать админку: {can_request_admin}")
+        
         await query.edit_message_text(
-            "✏️ Введите название новой должности:"
+            f"✅ Регистрация успешно завершена!\n\n"
+            f"👤 {full_name}\n"
+            f"📋 Должность: {position}\n"
+            f"🏪 Магазин: {store}"
         )
-        return CREATE_POSITION_NAME
-    
-    elif callback_data == "list_positions":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await list_positions(query)
-    
-    elif callback_data == "delete_position_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_delete_position_menu(query)
-    
-    elif callback_data.startswith("delete_position_"):
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        position_name = callback_data[15:]
-        logger.info(f"Получен запрос на удаление должности: {position_name}")
-        await delete_position_fixed(query, position_name)
-    
-    elif callback_data == "create_store":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
+        
+        # Создаем клавиатуру для обычного сотрудника
+        keyboard = get_user_keyboard(can_request_admin)
+        
+        await query.message.reply_text(
+            f"👋 Привет, {full_name}!\n\n"
+            f"📋 Используйте кнопки ниже для работы:",
+            reply_markup=keyboard
+        )
+        
+    except Exception as e:
+        logger.error(f"ОШИБКА при регистрации: {e}")
         await query.edit_message_text(
-            "✏️ Введите название магазина:"
+            "❌ Произошла ошибка при регистрации. Попробуйте позже."
         )
-        return CREATE_STORE_NAME
-    
-    elif callback_data == "list_stores":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await list_stores(query)
-    
-    elif callback_data == "delete_store_from_list_menu":
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_delete_store_menu(query)
-    
-    elif callback_data.startswith("delete_store_list_"):
-        if not (is_admin or is_super_admin):
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        store_name = callback_data[17:]
-        if store_name.startswith('_'):
-            store_name = store_name[1:]
-        logger.info(f"Запрос на удаление магазина: {store_name}")
-        await delete_store(query, store_name)
-    
-    elif callback_data == "confirm_today":
-        if not (is_admin or is_super_admin):
-            return
-        await show_unconfirmed_today(query)
-    
-    elif callback_data == "confirm_period":
-        if not (is_admin or is_super_admin):
-            return
-        await show_period_confirm_menu(query)
-    
-    elif callback_data.startswith("confirm_period_"):
-        if not (is_admin or is_super_admin):
-            return
-        await handle_confirm_period_selection(update, context)
-    
-    elif callback_data.startswith("confirm_all_period_"):
-        if not (is_admin or is_super_admin):
-            return
-        days = int(callback_data[18:])
-        await confirm_all_period(query, days)
-    
-    elif callback_data == "confirm_all_today":
-        if not (is_admin or is_super_admin):
-            return
-        await confirm_all_today(query)
-    
-    elif callback_data == "confirm_by_store":
-        if not (is_admin or is_super_admin):
-            return
-        await show_confirm_by_store(query)
     
-    elif callback_data == "confirm_stats":
-        if not (is_admin or is_super_admin):
-            return
-        await show_confirm_stats(query)
-    
-    elif callback_data.startswith("confirm_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        store = callback_data[14:]
-        await show_store_unconfirmed(query, store)
-    
-    elif callback_data.startswith("confirm_all_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        store = callback_data[17:]
-        await confirm_all_store(query, store)
-    
-    elif callback_data.startswith("confirm_shift_"):
-        if not (is_admin or is_super_admin):
-            return
-        shift_id = int(callback_data[14:])
-        await confirm_shift(query, shift_id)
-    
-    elif callback_data == "back_to_confirm":
-        await show_confirm_menu(query)
+    # Очищаем временные данные
+    context.user_data.pop('reg_position', None)
+    context.user_data.pop('full_name', None)
     
-    elif callback_data == "delete_employee_menu":
-        if not (is_admin or is_super_admin):
-            return
-        await show_delete_employee_menu(query)
+    logger.info("🔥 Регистрация завершена, возвращаем ConversationHandler.END")
+    return ConversationHandler.END
+
+async def cancel_registration_callback(call: RouteCall):
+    """Отмена регистрации кнопкой"""
+    await call.query.edit_message_text("❌ Регистрация отменена.")
+    return ConversationHandler.END
+
+async def select_export_period(call: RouteCall):
+    """Выбор периода для выгрузки (дней)"""
+    call.context.user_data['period_days'] = call.arg
+    await show_export_options(call.query, call.arg)
+
+async def ask_custom_period(call: RouteCall):
+    """Запросить начало произвольного периода выгрузки"""
+    await call.query.edit_message_text(
+        "📅 Введите начальную дату в формате ГГГГ-ММ-ДД:"
+    )
+    return CUSTOM_PERIOD_START
+
+async def ask_position_name(call: RouteCall):
+    """Запросить название новой должности"""
+    await call.query.edit_message_text(
+        "✏️ Введите название новой должности:"
+    )
+    return CREATE_POSITION_NAME
+
+async def ask_store_name(call: RouteCall):
+    """Запросить название нового магазина"""
+    await call.query.edit_message_text(
+        "✏️ Введите название магазина:"
+    )
+    return CREATE_STORE_NAME
+
+async def select_super_admin(call: RouteCall):
+    """Выбор сотрудника для назначения супер-админом"""
+    call.context.user_data['selected_super_admin'] = call.arg
+    await confirm_assign_super_admin(call.query, call.arg)
+
+async def confirm_selected_super_admin(call: RouteCall):
+    """Назначить выбранного сотрудника супер-админом"""
+    target_id = call.context.user_data.get('selected_super_admin')
+    if target_id:
+        await assign_super_admin(call.query, target_id)
+
+async def appoint_admin(query, target_id: int):
+    """Назначить сотрудника администратором"""
+    logger.info(f"Назначение администратором пользователя {target_id}")
     
-    elif callback_data == "delete_store_menu":
-        if not (is_admin or is_super_admin):
-            return
-        await show_delete_store_request_menu(query)
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    elif callback_data.startswith("request_delete_employee_"):
-        if not (is_admin or is_super_admin):
-            return
-        target_id_str = callback_data[23:]
-        logger.info(f"Получен ID сотрудника для удаления: {target_id_str}")
+    try:
+        target_name = await storage.make_admin(target_id)
         
-        try:
-            target_id = int(target_id_str)
-            logger.info(f"Успешное преобразование ID: {target_id}")
-            await create_delete_request(query, user_id, full_name, "employee", str(target_id))
-        except ValueError as e:
-            logger.error(f"Ошибка преобразования ID: {target_id_str} - {e}")
-            if target_id_str.startswith('_'):
-                target_id_str = target_id_str[1:]
-                try:
-                    target_id = int(target_id_str)
-                    logger.info(f"Успешное преобразование после удаления подчеркивания: {target_id}")
-                    await create_delete_request(query, user_id, full_name, "employee", str(target_id))
-                except ValueError as e2:
-                    logger.error(f"Ошибка преобразования после удаления подчеркивания: {e2}")
-                    await query.edit_message_text("❌ Ошибка в идентификаторе сотрудника")
-            else:
-                await query.edit_message_text("❌ Ошибка в идентификаторе сотрудника")
-    
-    elif callback_data.startswith("request_delete_store_"):
-        if not (is_admin or is_super_admin):
-            return
-        store_name = callback_data[20:]
-        logger.info(f"Получено название магазина для удаления: {store_name}")
-        if store_name.startswith('_'):
-            store_name = store_name[1:]
-            logger.info(f"Название после удаления подчеркивания: {store_name}")
-        await create_delete_request(query, user_id, full_name, "store", store_name)
-    
-    elif callback_data == "admin_requests":
-        if not is_super_admin:
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_delete_requests(query)
-    
-    elif callback_data.startswith("approve_request_"):
-        if not is_super_admin:
-            return
-        request_id = int(callback_data[16:])
-        await approve_delete_request(query, request_id)
-    
-    elif callback_data.startswith("reject_request_"):
-        if not is_super_admin:
-            return
-        request_id = int(callback_data[15:])
-        await reject_delete_request(query, request_id)
-    
-    elif callback_data == "admin_admin_requests":
-        if not is_super_admin:
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_admin_requests(query)
-    
-    elif callback_data.startswith("approve_admin_"):
-        if not is_super_admin:
-            return
-        req_id = int(callback_data[14:])
-        await approve_admin_request(query, req_id)
-    
-    elif callback_data.startswith("reject_admin_"):
-        if not is_super_admin:
-            return
-        req_id = int(callback_data[13:])
-        await reject_admin_request(query, req_id)
-    
-    elif callback_data == "assign_super_admin_menu":
-        if not is_super_admin:
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_assign_super_admin_menu(query)
-    
-    elif callback_data == "assign_super_admin_list":
-        if not is_super_admin:
-            return
-        await show_assign_super_admin_list(query)
-    
-    elif callback_data == "list_super_admins":
-        if not is_super_admin:
-            return
-        await list_super_admins(query)
-    
-    elif callback_data.startswith("select_super_admin_"):
-        if not is_super_admin:
-            return
-        target_id = int(callback_data[19:])
-        context.user_data['selected_super_admin'] = target_id
-        await confirm_assign_super_admin(query, target_id)
-    
-    elif callback_data == "confirm_assign_super_admin":
-        if not is_super_admin:
-            return
-        target_id = context.user_data.get('selected_super_admin')
-        if target_id:
-            await assign_super_admin(query, target_id)
-    
-    elif callback_data == "admin_add":
-        if not is_super_admin:
-            await query.edit_message_text("❌ Недостаточно прав")
-            return
-        await show_add_admin_menu(query)
-    
-    elif callback_data.startswith("make_admin_"):
-        if not is_super_admin:
-            await query.edit_message_text("❌ Недостаточно прав")
+        if not target_name:
+            await query.edit_message_text("❌ Сотрудник не найден")
             return
         
-        target_id = int(callback_data[10:])
-        logger.info(f"Назначение администратором пользователя {target_id}")
+        logger.info(f"Сотрудник {target_name} назначен администратором")
+        await query.edit_message_text(f"✅ Сотрудник {target_name} назначен администратором!", reply_markup=reply_markup)
         
-        conn = sqlite3.connect('timesheet.db')
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT full_name FROM employees WHERE user_id = ?", (target_id,))
-            result = cursor.fetchone()
-            
-            if not result:
-                await query.edit_message_text("❌ Сотрудник не найден")
-                conn.close()
-                return
-            
-            target_name = result[0]
-            
-            cursor.execute("UPDATE employees SET is_admin = 1 WHERE user_id = ?", (target_id,))
-            conn.commit()
-            
-            logger.info(f"Сотрудник {target_name} назначен администратором")
-            await query.edit_message_text(f"✅ Сотрудник {target_name} назначен администратором!")
-            
-            try:
-                await query.message.bot.send_message(
-                    target_id,
-                    f"👑 Поздравляем! Вы назначены администратором!\n\n"
-                    f"Теперь вам доступна панель администратора."
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify new admin {target_id}: {e}")
-            
-        except Exception as e:
-            logger.error(f"Ошибка при назначении администратора: {e}")
-            await query.edit_message_text("❌ Произошла ошибка при назначении администратора")
-        finally:
-            conn.close()
+        notifier.notify(
+            [target_id],
+            f"👑 Поздравляем! Вы назначены администратором!\n\n"
+            f"Теперь вам доступна панель администратора."
+        )
         
-        keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Ошибка при назначении администратора: {e}")
+        await query.edit_message_text("❌ Произошла ошибка при назначении администратора", reply_markup=reply_markup)
+
+def then(handler, state):
+    """Обработчик маршрута: состояние диалога из handler, а если он его не вернул - state"""
+    async def call(c: RouteCall):
+        result = await handler(c)
+        return state if result is None else result
+    return call
+
+# Роли маршрутов: проверка по записи из get_user
+def role_user(user: Tuple) -> bool:
+    """Любой зарегистрированный сотрудник"""
+    return True
+
+def role_admin(user: Tuple) -> bool:
+    """Администратор или супер-администратор"""
+    return bool(user[3] or user[4])
+
+def role_super_admin(user: Tuple) -> bool:
+    """Супер-администратор"""
+    return bool(user[4])
+
+async def deny_callback(call: RouteCall, registered: bool):
+    """Ответ на нажатие без нужной роли"""
+    if registered:
+        await call.query.edit_message_text("❌ Недостаточно прав")
+    else:
+        await call.query.edit_message_text("❌ Вы не зарегистрированы. Используйте /start")
+
+async def stale_callback(call: RouteCall):
+    """Ответ на устаревшую кнопку (например, после перезапуска бота)"""
+    await call.query.edit_message_text("⌛ Кнопка устарела. Откройте меню заново")
+
+callbacks = CallbackRouter(storage.get_user, deny_callback, stale_callback)
+
+# Регистрация (пользователь еще не зарегистрирован)
+callbacks.add("cancel_registration", cancel_registration_callback)
+callbacks.add("reg_pos_", registration_select_position, param=int)
+callbacks.add("reg_store_", registration_select_store, param=int)
+
+# Сотрудник
+callbacks.add("close", lambda c: c.query.delete_message(), role_user)
+callbacks.add("request_admin", lambda c: handle_admin_request(c.query, c.context, c.user_id, c.user), role_user)
+callbacks.add("admin_checkin", lambda c: checkin(c.update, c.context), role_user)
+callbacks.add("admin_checkout", lambda c: checkout(c.update, c.context), role_user)
+callbacks.add("admin_timesheet", lambda c: timesheet(c.update, c.context), role_user)
+callbacks.add("admin_stats", lambda c: stats(c.update, c.context), role_user)
+callbacks.add("admin_open_shifts", lambda c: show_open_shifts(c.update, c.context), role_user)
+callbacks.add("back_to_admin", lambda c: show_admin_panel(c.query), role_user)
+callbacks.add("back_to_confirm", lambda c: show_confirm_menu(c.query), role_user)
+callbacks.add("back_to_employee_management", lambda c: back_to_employee_management(c.update, c.context), role_user)
+
+# Сотрудники и отчеты
+callbacks.add("admin_list", lambda c: show_all_employees(c.query), role_admin, lane=LANE_BULK)
+callbacks.add("admin_list_page_", lambda c: show_all_employees(c.query, c.arg), role_admin, int, lane=LANE_BULK)
+callbacks.add("admin_by_store", lambda c: show_employees_by_store(c.query), role_admin, lane=LANE_BULK)
+callbacks.add("admin_by_store_page_", lambda c: show_employees_by_store(c.query, c.arg), role_admin, int,
+              lane=LANE_BULK)
+callbacks.add("admin_store_stats", lambda c: store_stats_report(c), role_admin, lane=LANE_BULK)
+callbacks.add("admin_employees_menu", lambda c: show_employees_management_menu(c.query), role_admin)
+callbacks.add("add_employee_start",
+              then(lambda c: add_employee_start(c.update, c.context), ADD_EMPLOYEE_NAME), role_admin)
+callbacks.add("add_emp_pos_",
+              then(lambda c: add_employee_select_position(c.update, c.context, c.arg), ADD_EMPLOYEE_STORE),
+              role_admin, int)
+callbacks.add("add_emp_store_",
+              then(lambda c: add_employee_select_store(c.update, c.context, c.arg), ConversationHandler.END),
+              role_admin, int)
+
+# Выгрузка за период
+callbacks.add("period_selection", lambda c: show_period_selection(c.query), role_admin)
+callbacks.add("period_", select_export_period, role_admin, int)
+callbacks.add("period_custom", ask_custom_period, role_admin)
+callbacks.add("export_confirmed", lambda c: export_report(c, confirmed_only=True), role_admin, lane=LANE_BULK)
+callbacks.add("export_all", lambda c: export_report(c, confirmed_only=False), role_admin, lane=LANE_BULK)
+callbacks.add("jobs_list", lambda c: show_jobs(c.query, c.user_id), role_admin)
+callbacks.add("job_cancel_", lambda c: cancel_job(c.query, c.user_id, c.arg), role_admin, int)
+
+# Меню администратора
+callbacks.add("admin_confirm", lambda c: show_confirm_menu(c.query), role_admin)
+callbacks.add("admin_delete_menu", lambda c: show_delete_menu(c.query), role_admin)
+callbacks.add("admin_positions_menu", lambda c: show_positions_menu(c.query), role_admin)
+callbacks.add("admin_stores_menu", lambda c: show_stores_menu(c.query), role_admin)
+callbacks.add("admin_shifts_menu", lambda c: show_shifts_menu(c.query), role_admin)
+
+# Ручное добавление и удаление смен
+callbacks.add("add_shift_start",
+              then(lambda c: add_shift_select_store(c.update, c.context), ADD_SHIFT_SELECT_STORE), role_admin)
+callbacks.add("add_shift_store_",
+              then(lambda c: add_shift_select_employee_fixed(c.update, c.context, c.arg), ADD_SHIFT_SELECT_EMPLOYEE),
+              role_admin, int)
+callbacks.add("add_shift_emp_",
+              then(lambda c: add_shift_select_date_fixed(c.update, c.context, c.arg), ADD_SHIFT_SELECT_DATE),
+              role_admin, int)
+callbacks.add("delete_shift_start",
+              then(lambda c: delete_shift_select_store(c.update, c.context), DELETE_SHIFT_SELECT_STORE), role_admin)
+callbacks.add("delete_shift_store_",
+              then(lambda c: delete_shift_select_employee(c.update, c.context, c.arg), DELETE_SHIFT_SELECT_EMPLOYEE),
+              role_admin, int)
+callbacks.add("delete_shift_emp_",
+              then(lambda c: delete_shift_select_date(c.update, c.context, c.arg), DELETE_SHIFT_SELECT_DATE),
+              role_admin, int)
+callbacks.add("delete_shift_confirm_", lambda c: delete_shift_confirm(c.update, c.context, c.arg), role_admin, int)
+callbacks.add("delete_shift_execute_",
+              then(lambda c: delete_shift_execute(c.update, c.context, c.arg), ConversationHandler.END),
+              role_admin, int)
+
+# Должности и магазины
+callbacks.add("create_position", ask_position_name, role_admin)
+callbacks.add("list_positions", lambda c: list_positions(c.query), role_admin)
+callbacks.add("delete_position_menu", lambda c: show_delete_position_menu(c.query), role_admin)
+callbacks.add("delete_position_menu_page_", lambda c: show_delete_position_menu(c.query, c.arg), role_admin, int)
+callbacks.add("delete_position_", lambda c: delete_position_fixed(c.query, c.arg), role_admin, int)
+callbacks.add("create_store", ask_store_name, role_admin)
+callbacks.add("list_stores", lambda c: list_stores(c.query), role_admin)
+callbacks.add("delete_store_from_list_menu", lambda c: show_delete_store_menu(c.query), role_admin)
+callbacks.add("delete_store_from_list_menu_page_", lambda c: show_delete_store_menu(c.query, c.arg), role_admin, int)
+callbacks.add("delete_store_list_", lambda c: delete_store(c.query, c.arg), role_admin, int)
+
+# Подтверждение смен
+callbacks.add("confirm_today", lambda c: show_unconfirmed_today(c.query), role_admin)
+callbacks.add("confirm_today_page_", lambda c: show_unconfirmed_today(c.query, c.arg), role_admin, int)
+callbacks.add("confirm_period", lambda c: show_period_confirm_menu(c.query), role_admin)
+callbacks.add("confirm_period_", lambda c: unconfirmed_period_report(c), role_admin, int, lane=LANE_BULK)
+# Следующие страницы - один запрос с LIMIT, без фоновой задачи
+callbacks.add("confirm_period_page_", lambda c: show_unconfirmed_period_fixed(c.query, *c.arg), role_admin, ints)
+callbacks.add("confirm_all_period_", lambda c: confirm_all_period(c.query, c.arg), role_admin, int, lane=LANE_BULK)
+callbacks.add("confirm_all_today", lambda c: confirm_all_today(c.query), role_admin, lane=LANE_BULK)
+callbacks.add("confirm_by_store", lambda c: show_confirm_by_store(c.query), role_admin)
+callbacks.add("confirm_stats", lambda c: show_confirm_stats(c.query), role_admin, lane=LANE_BULK)
+callbacks.add("confirm_store_", lambda c: show_store_unconfirmed(c.query, c.arg), role_admin, int)
+callbacks.add("confirm_store_page_", lambda c: show_store_unconfirmed(c.query, *c.arg), role_admin, ints)
+callbacks.add("confirm_all_store_", lambda c: confirm_all_store(c.query, c.arg), role_admin, int, lane=LANE_BULK)
+callbacks.add("confirm_shift_", lambda c: confirm_shift(c.query, c.arg), role_admin, int)
+
+# Запросы на удаление
+callbacks.add("delete_employee_menu", lambda c: show_delete_employee_menu(c.query), role_admin)
+callbacks.add("delete_employee_menu_page_", lambda c: show_delete_employee_menu(c.query, c.arg), role_admin, int)
+callbacks.add("delete_store_menu", lambda c: show_delete_store_request_menu(c.query), role_admin)
+callbacks.add("delete_store_menu_page_", lambda c: show_delete_store_request_menu(c.query, c.arg), role_admin, int)
+callbacks.add("request_delete_employee_",
+              lambda c: create_delete_request(c.query, c.user_id, c.user[0], "employee", str(c.arg)),
+              role_admin, int)
+callbacks.add("request_delete_store_",
+              lambda c: create_delete_request(c.query, c.user_id, c.user[0], "store", str(c.arg)),
+              role_admin, int)
+
+# Супер-администратор
+callbacks.add("admin_requests", lambda c: show_delete_requests(c.query), role_super_admin)
+callbacks.add("admin_requests_page_", lambda c: show_delete_requests(c.query, c.arg), role_super_admin, int)
+callbacks.add("approve_request_", lambda c: approve_delete_request(c.query, c.arg), role_super_admin, int)
+callbacks.add("reject_request_", lambda c: reject_delete_request(c.query, c.arg), role_super_admin, int)
+callbacks.add("admin_admin_requests", lambda c: show_admin_requests(c.query), role_super_admin)
+callbacks.add("admin_admin_requests_page_", lambda c: show_admin_requests(c.query, c.arg), role_super_admin, int)
+callbacks.add("approve_admin_", lambda c: approve_admin_request(c.query, c.arg), role_super_admin, int)
+callbacks.add("reject_admin_", lambda c: reject_admin_request(c.query, c.arg), role_super_admin, int)
+callbacks.add("assign_super_admin_menu", lambda c: show_assign_super_admin_menu(c.query), role_super_admin)
+callbacks.add("assign_super_admin_list", lambda c: show_assign_super_admin_list(c.query), role_super_admin)
+callbacks.add("assign_super_admin_list_page_", lambda c: show_assign_super_admin_list(c.query, c.arg),
+              role_super_admin, int)
+callbacks.add("list_super_admins", lambda c: list_super_admins(c.query), role_super_admin)
+callbacks.add("select_super_admin_", select_super_admin, role_super_admin, int)
+callbacks.add("confirm_assign_super_admin", confirm_selected_super_admin, role_super_admin)
+callbacks.add("admin_add", lambda c: show_add_admin_menu(c.query), role_super_admin)
+callbacks.add("admin_add_page_", lambda c: show_add_admin_menu(c.query, c.arg), role_super_admin, int)
+callbacks.add("make_admin_", lambda c: appoint_admin(c.query, c.arg), role_super_admin, int)
+
+# Кнопки нижнего меню: экраны получают query-адаптер сообщения
+async def request_admin_from_menu(call: RouteCall):
+    """Заявка на права администратора из нижнего меню"""
+    is_admin, is_super_admin, can_request_admin = call.user[3:6]
+    
+    if is_admin or is_super_admin:
+        await call.update.message.reply_text("❌ Вы уже являетесь администратором")
+        return
+    
+    if not can_request_admin:
+        await call.update.message.reply_text("❌ У вас нет прав для запроса администраторских полномочий")
+        return
+    
+    await handle_admin_request_from_message(call.update, call.context, call.user_id, call.user)
+
+async def deny_menu_button(call: RouteCall, registered: bool):
+    """Ответ на кнопку меню без нужной роли"""
+    if registered:
+        await call.update.message.reply_text("❌ Недостаточно прав")
+    else:
+        await call.update.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
+
+menu_buttons = TextRouter(storage.get_user, deny_menu_button)
+
+# Сотрудник (права проверяют сами команды)
+menu_buttons.add("🏠 Главное меню", lambda c: start(c.update, c.context))
+menu_buttons.add("✅ Открыть смену", lambda c: checkin(c.update, c.context))
+menu_buttons.add("✅ Закрыть смену", lambda c: checkout(c.update, c.context))
+menu_buttons.add("📊 Мой табель", lambda c: timesheet(c.update, c.context))
+menu_buttons.add("📈 Моя статистика", lambda c: stats(c.update, c.context))
+menu_buttons.add("👑 Запросить права администратора", request_admin_from_menu, role_user)
+
+# Администратор
+menu_buttons.add("👑 Панель админа", lambda c: admin_panel(c.update, c.context), role_admin)
+menu_buttons.add("👥 Все сотрудники", lambda c: show_all_employees(c.query), role_admin, lane=LANE_BULK)
+menu_buttons.add("📊 По магазинам", lambda c: show_employees_by_store(c.query), role_admin, lane=LANE_BULK)
+menu_buttons.add("🔓 Открытые смены", lambda c: show_open_shifts(c.update, c.context), role_admin)
+menu_buttons.add("📅 Выбрать период", lambda c: show_period_selection(c.query), role_admin)
+menu_buttons.add("📈 Статистика по магазинам", lambda c: store_stats_report(c), role_admin, lane=LANE_BULK)
+menu_buttons.add("✅ Подтверждение смен", lambda c: show_confirm_menu(c.query), role_admin)
+menu_buttons.add("🗑 Запросить удаление", lambda c: show_delete_menu(c.query), role_admin)
+menu_buttons.add("📋 Управление должностями", lambda c: show_positions_menu(c.query), role_admin)
+menu_buttons.add("🏪 Управление магазинами", lambda c: show_stores_menu(c.query), role_admin)
+menu_buttons.add("🔄 Управление сменами", lambda c: show_shifts_menu(c.query), role_admin)
+menu_buttons.add("👥 Управление сотрудниками", lambda c: show_employees_management_menu(c.query), role_admin)
+menu_buttons.add("👤 Запросить удаление сотрудника", lambda c: show_delete_employee_menu(c.query), role_admin)
+menu_buttons.add("🏪 Запросить удаление магазина", lambda c: show_delete_store_request_menu(c.query), role_admin)
+
+# Супер-администратор
+menu_buttons.add("➕ Добавить админа", lambda c: show_add_admin_menu(c.query), role_super_admin)
+menu_buttons.add("📋 Запросы на удаление", lambda c: show_delete_requests(c.query), role_super_admin)
+menu_buttons.add("👑 Заявки в админы", lambda c: show_admin_requests(c.query), role_super_admin)
+menu_buttons.add("⭐ Управление супер-админами", lambda c: show_assign_super_admin_menu(c.query), role_super_admin)
+
+# Команды тяжелой полосы обработки
+BULK_COMMANDS = frozenset({"rebuild_stats"})
+
+def update_lane(update: Update) -> Optional[str]:
+    """Полоса обработки обновления: тяжелые отчеты отдельно от отметок сотрудников"""
+    if update.callback_query is not None:
+        return callbacks.lane(update.callback_query.data or '')
+    message = update.message
+    if message is None or not message.text:
+        return None
+    if message.text.startswith('/'):
+        command = message.text[1:].split('@', 1)[0].split(maxsplit=1)
+        return LANE_BULK if command and command[0] in BULK_COMMANDS else None
+    return menu_buttons.lane(message.text)
+
+async def shed_update(update: Update):
+    """Ответ на тяжелый запрос, отклоненный при перегрузке"""
+    text = "⏳ Сейчас формируется много отчетов. Повторите через минуту"
+    if update.callback_query is not None:
+        await update.callback_query.answer(text, show_alert=True)
+    elif update.message is not None:
+        await update.message.reply_text(text)
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка нажатий на инлайн кнопки"""
+    query = update.callback_query
+    await query.answer()
+    
+    logger.info(f"Callback: {query.data} от пользователя {query.from_user.id}")
+    return await callbacks.dispatch(update, context)
 
 # Остальные вспомогательные функции
 async def show_admin_panel(query):
     """Показать панель администратора"""
     keyboard = [
-        [InlineKeyboardButton("✅ Открыть смену", callback_data="admin_checkin")],
-        [InlineKeyboardButton("✅ Закрыть смену", callback_data="admin_checkout")],
-        [InlineKeyboardButton("📊 Мой табель", callback_data="admin_timesheet")],
-        [InlineKeyboardButton("📈 Моя статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton("👥 Управление сотрудниками", callback_data="admin_employees_menu")],
-        [InlineKeyboardButton("📊 По магазинам", callback_data="admin_by_store")],
-        [InlineKeyboardButton("🔓 Открытые смены", callback_data="admin_open_shifts")],
-        [InlineKeyboardButton("📅 Выбрать период", callback_data="period_selection")],
-        [InlineKeyboardButton("📈 Статистика по магазинам", callback_data="admin_store_stats")],
-        [InlineKeyboardButton("✅ Подтверждение смен", callback_data="admin_confirm")],
-        [InlineKeyboardButton("🗑 Запросить удаление", callback_data="admin_delete_menu")],
-        [InlineKeyboardButton("📋 Управление должностями", callback_data="admin_positions_menu")],
-        [InlineKeyboardButton("🏪 Управление магазинами", callback_data="admin_stores_menu")],
-        [InlineKeyboardButton("🔄 Управление сменами", callback_data="admin_shifts_menu")],
-        [InlineKeyboardButton("❌ Закрыть", callback_data="close")]
+        [InlineKeyboardButton("✅ Открыть смену", callback_data=callbacks.data("admin_checkin"))],
+        [InlineKeyboardButton("✅ Закрыть смену", callback_data=callbacks.data("admin_checkout"))],
+        [InlineKeyboardButton("📊 Мой табель", callback_data=callbacks.data("admin_timesheet"))],
+        [InlineKeyboardButton("📈 Моя статистика", callback_data=callbacks.data("admin_stats"))],
+        [InlineKeyboardButton("👥 Управление сотрудниками", callback_data=callbacks.data("admin_employees_menu"))],
+        [InlineKeyboardButton("📊 По магазинам", callback_data=callbacks.data("admin_by_store"))],
+        [InlineKeyboardButton("🔓 Открытые смены", callback_data=callbacks.data("admin_open_shifts"))],
+        [InlineKeyboardButton("📅 Выбрать период", callback_data=callbacks.data("period_selection"))],
+        [InlineKeyboardButton("📈 Статистика по магазинам", callback_data=callbacks.data("admin_store_stats"))],
+        [InlineKeyboardButton("⏳ Мои отчеты", callback_data=callbacks.data("jobs_list"))],
+        [InlineKeyboardButton("✅ Подтверждение смен", callback_data=callbacks.data("admin_confirm"))],
+        [InlineKeyboardButton("🗑 Запросить удаление", callback_data=callbacks.data("admin_delete_menu"))],
+        [InlineKeyboardButton("📋 Управление должностями", callback_data=callbacks.data("admin_positions_menu"))],
+        [InlineKeyboardButton("🏪 Управление магазинами", callback_data=callbacks.data("admin_stores_menu"))],
+        [InlineKeyboardButton("🔄 Управление сменами", callback_data=callbacks.data("admin_shifts_menu"))],
+        [InlineKeyboardButton("❌ Закрыть", callback_data=callbacks.data("close"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2280,196 +1851,85 @@ async def show_admin_panel(query):
         reply_markup=reply_markup
     )
 
-async def show_employees_by_store(query):
+async def render_employees_by_store(today: str) -> List[Tuple[str, str]]:
+    """Строки отчета «Сотрудники по магазинам»: (магазин, строка сотрудника)"""
+    employees = await storage.get_employees_with_shifts(today)
+    return [(emp[0], EMPLOYEE_SHIFT_ROW(emp)) for emp in employees]
+
+async def show_employees_by_store(query, offset: int = 0):
     """Показать сотрудников по магазинам с отметками о сменах"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
     today = get_today_date_utc8()
+    lines = await storage.render(
+        ('employees_by_store', today), lambda: render_employees_by_store(today),
+        depends=(db.DATA_EMPLOYEES, db.DATA_SHIFTS)
+    )
     
-    cursor.execute('''
-        SELECT e.store, e.user_id, e.full_name, e.position, e.is_admin, e.is_super_admin, e.can_request_admin,
-               t.status, t.check_in, t.check_out
-        FROM employees e
-        LEFT JOIN timesheet t ON e.user_id = t.user_id AND t.date = ?
-        ORDER BY e.store, e.full_name
-    ''', (today,))
-    
-    employees = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(from_list(lines), offset, f"📊 СОТРУДНИКИ ПО МАГАЗИНАМ\n📅 {today}\n\n", EMPLOYEES_BY_STORE)
     
-    if not employees:
+    if not page:
         await query.edit_message_text("👥 Нет зарегистрированных сотрудников")
         return
     
-    # Группируем по магазинам
-    stores_dict = {}
-    for emp in employees:
-        store, user_id, full_name, position, is_admin, is_super_admin, can_request_admin, status, check_in, check_out = emp
-        
-        if store not in stores_dict:
-            stores_dict[store] = []
-        
-        # Определяем статус смены
-        shift_status = ""
-        if status == "working":
-            check_in_time = format_time_utc8(datetime.fromisoformat(check_in)) if check_in else ""
-            shift_status = f" 🔓 Смена открыта в {check_in_time}"
-        elif status == "completed":
-            check_in_time = format_time_utc8(datetime.fromisoformat(check_in)) if check_in else ""
-            check_out_time = format_time_utc8(datetime.fromisoformat(check_out)) if check_out else ""
-            shift_status = f" ✅ Смена завершена ({check_in_time} - {check_out_time})"
-        else:
-            shift_status = " ⏳ Смена не открыта"
-        
-        role = "⭐" if is_super_admin else "👑" if is_admin else "👤"
-        request_mark = " 📝" if can_request_admin and not (is_admin or is_super_admin) else ""
-        
-        stores_dict[store].append(f"{role} {full_name} - {position}{request_mark}{shift_status}")
-    
-    text = "📊 СОТРУДНИКИ ПО МАГАЗИНАМ\n"
-    text += f"📅 {today}\n\n"
-    
-    for store, employees_list in stores_dict.items():
-        text += f"🏪 {store}\n"
-        for emp in employees_list:
-            text += f"  {emp}\n"
-        text += "\n"
-    
-    # Разбиваем длинное сообщение
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-    else:
-        await query.edit_message_text(text)
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]]
+    keyboard = page_buttons(page, "admin_by_store_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
-async def show_store_stats(query):
-    """Показать статистику по магазинам с открытыми/закрытыми сменами"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+async def render_store_stats(today: str, month_ago: str) -> Optional[str]:
+    """Текст статистики по магазинам или None, если магазинов нет"""
+    store_stats = await storage.get_store_stats(today, month_ago)
     
-    # Получаем список магазинов
-    cursor.execute("SELECT name FROM stores")
-    stores = cursor.fetchall()
-    
-    if not stores:
-        await query.edit_message_text("❌ Нет созданных магазинов")
-        return
+    if not store_stats:
+        return None
     
+    header = "📈 СТАТИСТИКА ПО МАГАЗИНАМ\n\n"
+    body, _ = join_limited(map(STORE_STATS_ROW, store_stats), PAGE_TEXT_LIMIT - len(header), more_rows, len(store_stats))
+    return header + body
+
+async def show_store_stats(query):
+    """Показать статистику по магазинам с открытыми/закрытыми сменами"""
     today = get_today_date_utc8()
-    text = "📈 СТАТИСТИКА ПО МАГАЗИНАМ\n\n"
-    
-    for store in stores:
-        store_name = store[0]
-        
-        # Количество сотрудников в магазине
-        cursor.execute(
-            "SELECT COUNT(*) FROM employees WHERE store = ?",
-            (store_name,)
-        )
-        emp_count = cursor.fetchone()[0]
-        
-        # Количество открытых смен сегодня
-        cursor.execute('''
-            SELECT COUNT(*) 
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE e.store = ? AND t.date = ? AND t.status = 'working'
-        ''', (store_name, today))
-        open_shifts = cursor.fetchone()[0]
-        
-        # Количество закрытых смен сегодня
-        cursor.execute('''
-            SELECT COUNT(*) 
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE e.store = ? AND t.date = ? AND t.status = 'completed'
-        ''', (store_name, today))
-        closed_shifts = cursor.fetchone()[0]
-        
-        # Статистика за 30 дней
-        month_ago = (datetime.now(TIMEZONE) - timedelta(days=30)).date().isoformat()
-        cursor.execute('''
-            SELECT COUNT(DISTINCT t.id), SUM(t.hours), COUNT(DISTINCT t.user_id)
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE e.store = ? AND t.date BETWEEN ? AND ? AND t.status = 'completed'
-        ''', (store_name, month_ago, today))
-        
-        shifts, total_hours, active_employees = cursor.fetchone()
-        shifts = shifts or 0
-        total_hours = total_hours or 0
-        active_employees = active_employees or 0
-        
-        text += f"🏪 {store_name}\n"
-        text += f"   👥 Сотрудников: {emp_count}\n"
-        text += f"   📊 Активных (30 дн): {active_employees}\n"
-        text += f"   📅 Смен (30 дн): {shifts}\n"
-        text += f"   ⏱ Часов (30 дн): {total_hours:.2f}\n"
-        text += f"   🔓 Открытых смен сегодня: {open_shifts}\n"
-        text += f"   ✅ Закрытых смен сегодня: {closed_shifts}\n\n"
-    
-    conn.close()
-    
-    await query.edit_message_text(text)
+    month_ago = (datetime.now(TIMEZONE) - timedelta(days=30)).date().isoformat()
+    text = await storage.render(
+        ('store_stats', today, month_ago), lambda: render_store_stats(today, month_ago),
+        depends=(db.DATA_EMPLOYEES, db.DATA_SHIFTS)
+    )
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]]
+    # Отчет приходит в сообщение «готовится…» вместе с кнопкой возврата, без отдельного меню
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text or "❌ Нет созданных магазинов", reply_markup=reply_markup)
+
+async def render_all_employees() -> List[str]:
+    """Записи списка всех сотрудников"""
+    employees = await storage.get_all_employees()
+    return [ALL_EMPLOYEES_ROW(emp) for emp in employees]
 
-async def show_all_employees(query):
+async def show_all_employees(query, offset: int = 0):
     """Показать всех сотрудников"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT full_name, position, store, is_admin, is_super_admin, can_request_admin 
-        FROM employees ORDER BY store, full_name
-    ''')
-    employees = cursor.fetchall()
-    conn.close()
+    today = get_today_date_utc8()
+    entries = await storage.render(('all_employees', today), render_all_employees, depends=(db.DATA_EMPLOYEES,))
+    page = await fetch_page(from_list(entries), offset, "👥 ВСЕ СОТРУДНИКИ\n\n", lambda entry, previous: entry)
     
-    if not employees:
+    if not page:
         await query.edit_message_text("👥 Нет зарегистрированных сотрудников")
         return
     
-    text = "👥 ВСЕ СОТРУДНИКИ\n\n"
-    for emp in employees:
-        full_name, position, store, is_admin, is_super_admin, can_request_admin = emp
-        role = "⭐ Супер-админ" if is_super_admin else "👑 Админ" if is_admin else "👤 Сотрудник"
-        request_status = " ✅ может запросить админку" if can_request_admin and not (is_admin or is_super_admin) else ""
-        text += f"• {full_name}\n  {role} | {position} | {store}{request_status}\n\n"
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        for i in range(0, len(text), MAX_MESSAGE_LENGTH):
-            part = text[i:i+MAX_MESSAGE_LENGTH]
-            if i == 0:
-                await query.edit_message_text(part)
-            else:
-                await query.message.reply_text(part)
-    else:
-        await query.edit_message_text(text)
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]]
+    keyboard = page_buttons(page, "admin_list_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def show_period_selection(query):
     """Меню выбора периода"""
     keyboard = [
-        [InlineKeyboardButton("📅 Последние 7 дней", callback_data="period_7")],
-        [InlineKeyboardButton("📅 Последние 14 дней", callback_data="period_14")],
-        [InlineKeyboardButton("📅 Последние 30 дней", callback_data="period_30")],
-        [InlineKeyboardButton("📅 Последние 90 дней", callback_data="period_90")],
-        [InlineKeyboardButton("📅 Весь период", callback_data="period_all")],
-        [InlineKeyboardButton("📅 Выбрать даты", callback_data="period_custom")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("📅 Последние 7 дней", callback_data=callbacks.data("period_", 7))],
+        [InlineKeyboardButton("📅 Последние 14 дней", callback_data=callbacks.data("period_", 14))],
+        [InlineKeyboardButton("📅 Последние 30 дней", callback_data=callbacks.data("period_", 30))],
+        [InlineKeyboardButton("📅 Последние 90 дней", callback_data=callbacks.data("period_", 90))],
+        [InlineKeyboardButton("📅 Весь период", callback_data=callbacks.data("period_", ALL_PERIOD_DAYS))],
+        [InlineKeyboardButton("📅 Выбрать даты", callback_data=callbacks.data("period_custom"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2482,9 +1942,9 @@ async def show_period_selection(query):
 async def show_export_options(query, days):
     """Показать опции экспорта после выбора периода"""
     keyboard = [
-        [InlineKeyboardButton("📥 CSV (только подтвержденные)", callback_data="export_confirmed")],
-        [InlineKeyboardButton("📥 CSV (все смены)", callback_data="export_all")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="period_selection")]
+        [InlineKeyboardButton("📥 CSV (только подтвержденные)", callback_data=callbacks.data("export_confirmed"))],
+        [InlineKeyboardButton("📥 CSV (все смены)", callback_data=callbacks.data("export_all"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("period_selection"))]
     ]
     
     period_text = "весь период" if days > 365 else f"последние {days} дней"
@@ -2501,30 +1961,8 @@ async def export_csv_period(query, days, confirmed_only=True):
     end_date = get_today_date_utc8()
     start_date = (datetime.now(TIMEZONE) - timedelta(days=days-1)).date().isoformat()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    if confirmed_only:
-        cursor.execute('''
-            SELECT e.full_name, e.position, e.store, t.date, t.check_in, t.check_out, 
-                   t.hours, t.notes, t.confirmed
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE t.date BETWEEN ? AND ? AND t.status = 'completed' AND t.confirmed = 1
-            ORDER BY t.date DESC, e.store
-        ''', (start_date, end_date))
-    else:
-        cursor.execute('''
-            SELECT e.full_name, e.position, e.store, t.date, t.check_in, t.check_out, 
-                   t.hours, t.notes, t.confirmed
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE t.date BETWEEN ? AND ? AND t.status = 'completed'
-            ORDER BY t.date DESC, e.store
-        ''', (start_date, end_date))
-    
-    records = cursor.fetchall()
-    conn.close()
+    records = await storage.get_export_rows(start_date, end_date, confirmed_only)
+    shifts, minutes, confirmed_shifts, confirmed_minutes = await storage.get_period_totals(start_date, end_date)
     
     if not records:
         period_text = f"с {start_date} по {end_date}"
@@ -2540,16 +1978,11 @@ async def export_csv_period(query, days, confirmed_only=True):
     ])
     
     for record in records:
-        full_name, position, store_name, date_str, checkin, checkout, hours, notes, confirmed = record
-        
-        checkin_time = format_time_utc8(datetime.fromisoformat(checkin)) if checkin else "-"
-        checkout_time = format_time_utc8(datetime.fromisoformat(checkout)) if checkout else "-"
-        confirmed_str = "Да" if confirmed else "Нет"
-        hours_str = str(hours).replace('.', ',')
+        full_name, position, store_name, date_str, checkin, checkout, minutes, notes, confirmed = record
         
         writer.writerow([
-            full_name, position, store_name, date_str, checkin_time, checkout_time,
-            hours_str, notes or "", confirmed_str
+            full_name, position, store_name, date_str, format_clock(checkin), format_clock(checkout),
+            format_hours(minutes).replace('.', ','), notes or "", "Да" if confirmed else "Нет"
         ])
     
     csv_data = output.getvalue().encode('utf-8-sig')
@@ -2561,24 +1994,106 @@ async def export_csv_period(query, days, confirmed_only=True):
     await query.message.reply_document(
         document=io.BytesIO(csv_data),
         filename=filename,
-        caption=f"📊 Экспорт за период {start_date} - {end_date}"
+        caption=(
+            f"📊 Экспорт за период {start_date} - {end_date}\n"
+            f"Смен: {confirmed_shifts if confirmed_only else shifts}, "
+            f"часов: {format_hours(confirmed_minutes if confirmed_only else minutes)}"
+        ),
+        rate_limit_args=PRIORITY_BULK
     )
     
-    await query.edit_message_text("✅ Экспорт завершен!")
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text("✅ Экспорт завершен!", reply_markup=reply_markup)
+
+# Фоновые отчеты
+jobs = JobRunner()
+
+async def run_report(query, title: str, work):
+    """Выполнить отчет в фоновой задаче; об ошибке сообщить пользователю"""
+    try:
+        await work()
+    except Exception:
+        await query.message.reply_text(f"❌ Не удалось подготовить отчет «{title}». Попробуйте позже")
+        raise
+
+async def submit_report(call: RouteCall, key, title: str, work):
+    """Поставить тяжелый отчет в фоновую задачу и сразу ответить «готовится…»"""
+    query = call.query
+    try:
+        job, created = jobs.submit(call.user_id, key, title, lambda: run_report(query, title, work))
+    except JobLimitError:
+        keyboard = [[InlineKeyboardButton("⏳ Мои отчеты", callback_data=callbacks.data("jobs_list"))]]
+        await query.edit_message_text(
+            f"⏳ У вас уже готовятся {jobs.max_per_owner} отчетов. Дождитесь их или отмените",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return
+    
+    keyboard = [
+        [InlineKeyboardButton("🚫 Отменить", callback_data=callbacks.data("job_cancel_", job.id))],
+        [InlineKeyboardButton("⏳ Мои отчеты", callback_data=callbacks.data("jobs_list"))]
+    ]
+    status = "готовится…" if created else "уже готовится…"
+    await query.edit_message_text(
+        f"⏳ {title}: {status}\nРезультат придет сюда, когда будет готов",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def export_report(call: RouteCall, confirmed_only: bool):
+    """Экспорт CSV за выбранный период в фоновой задаче"""
+    days = call.context.user_data.get('period_days', 30)
+    title = "Экспорт CSV (только подтвержденные)" if confirmed_only else "Экспорт CSV (все смены)"
+    await submit_report(call, ('export', days, confirmed_only), title,
+                        lambda: export_csv_period(call.query, days, confirmed_only))
+
+async def store_stats_report(call: RouteCall):
+    """Статистика по магазинам в фоновой задаче"""
+    await submit_report(call, ('store_stats',), "Статистика по магазинам", lambda: show_store_stats(call.query))
+
+async def unconfirmed_period_report(call: RouteCall):
+    """Неподтвержденные смены за период в фоновой задаче"""
+    days = call.arg
+    await submit_report(call, ('unconfirmed', days), "Неподтвержденные смены за период",
+                        lambda: show_unconfirmed_period_fixed(call.query, days))
+
+async def show_jobs(query, user_id: int):
+    """Отчеты пользователя, которые еще готовятся"""
+    own = jobs.jobs(user_id)
+    keyboard = [
+        [InlineKeyboardButton(f"🚫 Отменить #{job.id}", callback_data=callbacks.data("job_cancel_", job.id))]
+        for job in own
+    ]
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
+    
+    if not own:
+        text = "✅ Нет отчетов в работе"
+    else:
+        text = "⏳ ОТЧЕТЫ В РАБОТЕ\n\n" + ''.join(
+            f"#{job.id} {job.title}\n   {'выполняется' if job.status == RUNNING else 'в очереди'}, {int(job.age())} с\n\n"
+            for job in own
+        )
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def cancel_job(query, user_id: int, job_id: int):
+    """Отменить отчет пользователя"""
+    if jobs.cancel(user_id, job_id):
+        text = f"🚫 Отчет #{job_id} отменен"
+    else:
+        text = f"ℹ️ Отчет #{job_id} уже готов или отменен"
+    keyboard = [[InlineKeyboardButton("⏳ Мои отчеты", callback_data=callbacks.data("jobs_list"))],
+                [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]]
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def show_confirm_menu(query):
     """Меню подтверждения смен"""
     keyboard = [
-        [InlineKeyboardButton("📋 Неподтвержденные сегодня", callback_data="confirm_today")],
-        [InlineKeyboardButton("📅 Неподтвержденные за период", callback_data="confirm_period")],
-        [InlineKeyboardButton("✅ Подтвердить все сегодня", callback_data="confirm_all_today")],
-        [InlineKeyboardButton("🏪 По магазинам", callback_data="confirm_by_store")],
-        [InlineKeyboardButton("📊 Статистика подтверждений", callback_data="confirm_stats")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("📋 Неподтвержденные сегодня", callback_data=callbacks.data("confirm_today"))],
+        [InlineKeyboardButton("📅 Неподтвержденные за период", callback_data=callbacks.data("confirm_period"))],
+        [InlineKeyboardButton("✅ Подтвердить все сегодня", callback_data=callbacks.data("confirm_all_today"))],
+        [InlineKeyboardButton("🏪 По магазинам", callback_data=callbacks.data("confirm_by_store"))],
+        [InlineKeyboardButton("📊 Статистика подтверждений", callback_data=callbacks.data("confirm_stats"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2588,72 +2103,43 @@ async def show_confirm_menu(query):
         reply_markup=reply_markup
     )
 
-async def show_unconfirmed_today(query):
+async def show_unconfirmed_today(query, offset: int = 0):
     """Показать неподтвержденные смены за сегодня"""
     today = get_today_date_utc8()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.id, e.full_name, e.store, t.check_in, t.check_out, t.hours
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE t.date = ? AND t.status = 'completed' AND t.confirmed = 0
-        ORDER BY e.store, e.full_name
-    ''', (today,))
-    
-    unconfirmed = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(
+        lambda offset, limit: storage.get_unconfirmed_for_date(today, limit, offset),
+        offset, f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ ЗА {today}\n\n", UNCONFIRMED_TODAY_ROW
+    )
     
-    if not unconfirmed:
+    if not page:
         await query.edit_message_text("✅ Сегодня нет неподтвержденных смен")
         return
     
-    text = f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ ЗА {today}\n\n"
-    
-    for shift in unconfirmed:
-        shift_id, full_name, store, checkin, checkout, hours = shift
-        
-        checkin_time = format_time_utc8(datetime.fromisoformat(checkin)) if checkin else "-"
-        checkout_time = format_time_utc8(datetime.fromisoformat(checkout)) if checkout else "-"
-        
-        text += f"🆔 {shift_id}\n"
-        text += f"👤 {full_name}\n"
-        text += f"🏪 {store}\n"
-        text += f"⏱ {checkin_time} - {checkout_time} ({hours} ч)\n\n"
-    
     keyboard = []
-    for shift in unconfirmed:
+    for shift in page.records:
         shift_id = shift[0]
         keyboard.append([
             InlineKeyboardButton(f"✅ Подтвердить смену #{shift_id}", 
-                               callback_data=f"confirm_shift_{shift_id}")
+                               callback_data=callbacks.data("confirm_shift_", shift_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")])
+    keyboard += page_buttons(page, "confirm_today_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def show_period_confirm_menu(query):
     """Меню выбора периода для подтверждения"""
     keyboard = [
-        [InlineKeyboardButton("📅 3 дня", callback_data="confirm_period_3")],
-        [InlineKeyboardButton("📅 7 дней", callback_data="confirm_period_7")],
-        [InlineKeyboardButton("📅 14 дней", callback_data="confirm_period_14")],
-        [InlineKeyboardButton("📅 30 дней", callback_data="confirm_period_30")],
-        [InlineKeyboardButton("📅 90 дней", callback_data="confirm_period_90")],
-        [InlineKeyboardButton("📅 Весь период", callback_data="confirm_period_36500")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]
+        [InlineKeyboardButton("📅 3 дня", callback_data=callbacks.data("confirm_period_", 3))],
+        [InlineKeyboardButton("📅 7 дней", callback_data=callbacks.data("confirm_period_", 7))],
+        [InlineKeyboardButton("📅 14 дней", callback_data=callbacks.data("confirm_period_", 14))],
+        [InlineKeyboardButton("📅 30 дней", callback_data=callbacks.data("confirm_period_", 30))],
+        [InlineKeyboardButton("📅 90 дней", callback_data=callbacks.data("confirm_period_", 90))],
+        [InlineKeyboardButton("📅 Весь период", callback_data=callbacks.data("confirm_period_", ALL_PERIOD_DAYS))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2667,50 +2153,32 @@ async def confirm_all_today(query):
     """Подтвердить все смены за сегодня"""
     today = get_today_date_utc8()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE timesheet 
-        SET confirmed = 1 
-        WHERE date = ? AND status = 'completed' AND confirmed = 0
-    ''', (today,))
-    count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    
-    await query.edit_message_text(f"✅ Подтверждено {count} смен за {today}")
+    count = await storage.confirm_shifts_for_date(today)
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(f"✅ Подтверждено {count} смен за {today}", reply_markup=reply_markup)
 
 async def show_confirm_by_store(query):
     """Меню подтверждения по магазинам"""
-    stores = get_stores()
+    stores = await storage.get_stores()
     
     if not stores:
         await query.edit_message_text("❌ Нет созданных магазинов")
         return
     
+    unconfirmed_counts = await storage.get_unconfirmed_counts_by_store()
+    
     keyboard = []
-    for store_name, address in stores:
-        conn = sqlite3.connect('timesheet.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) 
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE e.store = ? AND t.status = 'completed' AND t.confirmed = 0
-        ''', (store_name,))
-        count = cursor.fetchone()[0]
-        conn.close()
+    for store_id, store_name, address in stores:
+        count = unconfirmed_counts.get(store_id, 0)
         
         keyboard.append([
             InlineKeyboardButton(f"{store_name} ({count} неподтв.)", 
-                               callback_data=f"confirm_store_{store_name}")
+                               callback_data=callbacks.data("confirm_store_", store_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -2719,170 +2187,98 @@ async def show_confirm_by_store(query):
         reply_markup=reply_markup
     )
 
-async def show_store_unconfirmed(query, store):
+async def show_store_unconfirmed(query, store_id, offset: int = 0):
     """Показать неподтвержденные смены в магазине"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.id, e.full_name, t.date, t.check_in, t.check_out, t.hours
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE e.store = ? AND t.status = 'completed' AND t.confirmed = 0
-        ORDER BY t.date DESC
-    ''', (store,))
-    
-    unconfirmed = cursor.fetchall()
-    conn.close()
-    
-    if not unconfirmed:
-        await query.edit_message_text(f"✅ В магазине '{store}' нет неподтвержденных смен")
+    store_row = await storage.get_store(store_id)
+    if not store_row:
+        await query.edit_message_text("❌ Магазин не найден")
         return
+    store = store_row[0]
     
-    text = f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ В МАГАЗИНЕ {store}\n\n"
+    page = await fetch_page(
+        lambda offset, limit: storage.get_unconfirmed_for_store(store_id, limit, offset),
+        offset, f"📋 НЕПОДТВЕРЖДЕННЫЕ СМЕНЫ В МАГАЗИНЕ {store}\n\n", UNCONFIRMED_STORE_ROW
+    )
     
-    for shift in unconfirmed:
-        shift_id, full_name, date, checkin, checkout, hours = shift
-        
-        checkin_time = format_time_utc8(datetime.fromisoformat(checkin)) if checkin else "-"
-        checkout_time = format_time_utc8(datetime.fromisoformat(checkout)) if checkout else "-"
-        
-        text += f"🆔 {shift_id} | {full_name}\n"
-        text += f"📅 {date}\n"
-        text += f"⏱ {checkin_time} - {checkout_time} ({hours} ч)\n\n"
+    if not page:
+        await query.edit_message_text(f"✅ В магазине '{store}' нет неподтвержденных смен")
+        return
     
     keyboard = [
         [InlineKeyboardButton(f"✅ Подтвердить все в {store}", 
-                            callback_data=f"confirm_all_store_{store}")]
+                            callback_data=callbacks.data("confirm_all_store_", store_id))]
     ]
     
-    for shift in unconfirmed[:10]:
+    for shift in page.records:
         shift_id = shift[0]
         keyboard.append([
             InlineKeyboardButton(f"✅ Подтвердить #{shift_id}", 
-                               callback_data=f"confirm_shift_{shift_id}")
+                               callback_data=callbacks.data("confirm_shift_", shift_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="confirm_by_store")])
+    keyboard += page_buttons(page, "confirm_store_page_", store_id)
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("confirm_by_store"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
-async def confirm_all_store(query, store):
+async def confirm_all_store(query, store_id):
     """Подтвердить все смены в магазине"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE timesheet 
-        SET confirmed = 1 
-        WHERE id IN (
-            SELECT t.id 
-            FROM timesheet t
-            JOIN employees e ON t.user_id = e.user_id
-            WHERE e.store = ? AND t.status = 'completed' AND t.confirmed = 0
-        )
-    ''', (store,))
-    
-    count = cursor.rowcount
-    conn.commit()
-    conn.close()
+    store_row = await storage.get_store(store_id)
+    store = store_row[0] if store_row else f"#{store_id}"
+    count = await storage.confirm_store_shifts(store_id)
     
-    await query.edit_message_text(f"✅ Подтверждено {count} смен в магазине '{store}'")
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(f"✅ Подтверждено {count} смен в магазине '{store}'", reply_markup=reply_markup)
 
 async def confirm_shift(query, shift_id):
     """Подтвердить конкретную смену"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute("UPDATE timesheet SET confirmed = 1 WHERE id = ?", (shift_id,))
-    conn.commit()
-    conn.close()
-    
-    await query.edit_message_text(f"✅ Смена #{shift_id} подтверждена")
+    await storage.confirm_shift(shift_id)
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(f"✅ Смена #{shift_id} подтверждена", reply_markup=reply_markup)
 
-async def show_confirm_stats(query):
-    """Показать статистику подтверждений"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN confirmed = 1 THEN 1 ELSE 0 END) as confirmed,
-            SUM(CASE WHEN confirmed = 0 AND status = 'completed' THEN 1 ELSE 0 END) as unconfirmed
-        FROM timesheet
-        WHERE status = 'completed'
-    ''')
-    
-    total, confirmed, unconfirmed = cursor.fetchone()
-    total = total or 0
-    confirmed = confirmed or 0
-    unconfirmed = unconfirmed or 0
-    
-    cursor.execute('''
-        SELECT 
-            e.store,
-            COUNT(*) as total,
-            SUM(CASE WHEN t.confirmed = 1 THEN 1 ELSE 0 END) as confirmed
-        FROM timesheet t
-        JOIN employees e ON t.user_id = e.user_id
-        WHERE t.status = 'completed'
-        GROUP BY e.store
-        ORDER BY e.store
-    ''')
-    
-    store_stats = cursor.fetchall()
-    conn.close()
-    
-    text = "📊 СТАТИСТИКА ПОДТВЕРЖДЕНИЙ\n\n"
-    text += f"Всего завершенных смен: {total}\n"
-    text += f"✅ Подтверждено: {confirmed}\n"
-    text += f"❌ Не подтверждено: {unconfirmed}\n"
+async def render_confirm_stats() -> str:
+    """Текст статистики подтверждений"""
+    (total, confirmed, unconfirmed), store_stats = await storage.get_confirm_stats()
+    
+    lines = [
+        "📊 СТАТИСТИКА ПОДТВЕРЖДЕНИЙ\n\n",
+        f"Всего завершенных смен: {total}\n",
+        f"✅ Подтверждено: {confirmed}\n",
+        f"❌ Не подтверждено: {unconfirmed}\n",
+    ]
     
     if total > 0:
         percent = (confirmed / total) * 100
-        text += f"📈 Процент подтверждения: {percent:.1f}%\n\n"
-    
-    text += "По магазинам:\n"
-    for store, store_total, store_confirmed in store_stats:
-        store_confirmed = store_confirmed or 0
-        text += f"🏪 {store}: {store_confirmed}/{store_total} "
-        if store_total > 0:
-            store_percent = (store_confirmed / store_total) * 100
-            text += f"({store_percent:.1f}%)\n"
-        else:
-            text += "(0%)\n"
+        lines.append(f"📈 Процент подтверждения: {percent:.1f}%\n\n")
     
-    await query.edit_message_text(text)
+    lines.append("По магазинам:\n")
+    header = ''.join(lines)
+    body, _ = join_limited(map(STORE_CONFIRM_ROW, store_stats), PAGE_TEXT_LIMIT - len(header), more_rows, len(store_stats))
+    return header + body
+
+async def show_confirm_stats(query):
+    """Показать статистику подтверждений"""
+    today = get_today_date_utc8()
+    text = await storage.render(
+        ('confirm_stats', today), render_confirm_stats, depends=(db.DATA_EMPLOYEES, db.DATA_SHIFTS)
+    )
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_confirm")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_confirm"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 # Функции для управления должностями
 async def show_positions_menu(query):
     """Меню управления должностями"""
     keyboard = [
-        [InlineKeyboardButton("➕ Создать должность", callback_data="create_position")],
-        [InlineKeyboardButton("📋 Список должностей", callback_data="list_positions")],
-        [InlineKeyboardButton("🗑 Удалить должность", callback_data="delete_position_menu")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("➕ Создать должность", callback_data=callbacks.data("create_position"))],
+        [InlineKeyboardButton("📋 Список должностей", callback_data=callbacks.data("list_positions"))],
+        [InlineKeyboardButton("🗑 Удалить должность", callback_data=callbacks.data("delete_position_menu"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -2894,102 +2290,78 @@ async def show_positions_menu(query):
 
 async def list_positions(query):
     """Показать список должностей"""
-    positions = get_positions()
+    positions = await storage.get_positions()
     
     if not positions:
         await query.edit_message_text("📋 Список должностей пуст")
         return
     
-    text = "📋 СПИСОК ДОЛЖНОСТЕЙ\n\n"
-    for i, pos in enumerate(positions, 1):
-        text += f"{i}. {pos}\n"
+    header = "📋 СПИСОК ДОЛЖНОСТЕЙ\n\n"
+    lines = (f"{i}. {pos}\n" for i, (position_id, pos) in enumerate(positions, 1))
+    body, _ = join_limited(lines, PAGE_TEXT_LIMIT - len(header), more_rows, len(positions))
+    text = header + body
     
-    await query.edit_message_text(text)
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_positions_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_positions_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
-async def show_delete_position_menu(query):
+async def show_delete_position_menu(query, offset: int = 0):
     """Меню удаления должностей - показывает все должности"""
-    positions = get_positions()
+    positions = await storage.get_positions()
     
     if not positions:
         await query.edit_message_text("📋 Нет должностей для удаления")
         return
     
     # Получаем информацию о том, какие должности используются
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+    usage = await storage.get_position_usage()
     
     text = "🗑 ВЫБОР ДОЛЖНОСТИ ДЛЯ УДАЛЕНИЯ\n\n"
     text += "❌ - нельзя удалить (используется)\n"
     text += "✅ - можно удалить\n\n"
     
-    keyboard = []
-    for pos in positions:
-        cursor.execute("SELECT COUNT(*) FROM employees WHERE position = ?", (pos,))
-        count = cursor.fetchone()[0]
-        
+    if all(usage.get(position_id, 0) for position_id, pos in positions):
+        text += "❌ Нет должностей, которые можно удалить\n(все должности используются сотрудниками)\n\n"
+    
+    def render(position, previous):
+        position_id, pos = position
+        count = usage.get(position_id, 0)
         if count == 0:
             # Должность не используется - можно удалить
-            text += f"✅ {pos}\n"
-            callback_data = f"delete_position_{pos}"
-            logger.info(f"Создаем callback_data для должности {pos}: {callback_data}")
-            keyboard.append([
-                InlineKeyboardButton(f"🗑 {pos}", callback_data=callback_data)
-            ])
-        else:
-            # Должность используется - нельзя удалить
-            text += f"❌ {pos} (используется {count} сотрудниками)\n"
+            return f"✅ {pos}\n"
+        # Должность используется - нельзя удалить
+        return f"❌ {pos} (используется {count} сотрудниками)\n"
     
-    conn.close()
+    page = await fetch_page(from_list(positions), offset, text, render)
     
-    if not keyboard:
-        text += "\n❌ Нет должностей, которые можно удалить\n(все должности используются сотрудниками)"
+    keyboard = []
+    for position_id, pos in page.records:
+        if usage.get(position_id, 0) == 0:
+            keyboard.append([
+                InlineKeyboardButton(f"🗑 {pos}", callback_data=callbacks.data("delete_position_", position_id))
+            ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_positions_menu")])
+    keyboard += page_buttons(page, "delete_position_menu_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_positions_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def create_position(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Создание новой должности"""
     user_id = update.effective_user.id
     position_name = update.message.text.strip()
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-            INSERT INTO positions (name, created_by, created_date)
-            VALUES (?, ?, ?)
-        ''', (position_name, user_id, get_today_date_utc8()))
-        conn.commit()
-        await update.message.reply_text(f"✅ Должность '{position_name}' создана!")
-    except sqlite3.IntegrityError:
-        await update.message.reply_text(f"❌ Должность '{position_name}' уже существует")
-    finally:
-        conn.close()
+    if await storage.create_position(position_name, user_id, get_today_date_utc8()):
+        text = f"✅ Должность '{position_name}' создана!"
+    else:
+        text = f"❌ Должность '{position_name}' уже существует"
     
     keyboard = [
-        [InlineKeyboardButton("◀️ Назад в управление должностями", callback_data="admin_positions_menu")]
+        [InlineKeyboardButton("◀️ Назад в управление должностями", callback_data=callbacks.data("admin_positions_menu"))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(
-        "Выберите действие:",
-        reply_markup=reply_markup
-    )
+    await update.message.reply_text(text, reply_markup=reply_markup)
     
     return ConversationHandler.END
 
@@ -2997,10 +2369,10 @@ async def create_position(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_stores_menu(query):
     """Меню управления магазинами"""
     keyboard = [
-        [InlineKeyboardButton("➕ Создать магазин", callback_data="create_store")],
-        [InlineKeyboardButton("📋 Список магазинов", callback_data="list_stores")],
-        [InlineKeyboardButton("🗑 Удалить магазин", callback_data="delete_store_from_list_menu")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("➕ Создать магазин", callback_data=callbacks.data("create_store"))],
+        [InlineKeyboardButton("📋 Список магазинов", callback_data=callbacks.data("list_stores"))],
+        [InlineKeyboardButton("🗑 Удалить магазин", callback_data=callbacks.data("delete_store_from_list_menu"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -3031,31 +2403,18 @@ async def create_store_address(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Ошибка создания. Начните заново.")
         return ConversationHandler.END
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute('''
-            INSERT INTO stores (name, address, created_by, created_date)
-            VALUES (?, ?, ?, ?)
-        ''', (store_name, store_address, user_id, get_today_date_utc8()))
-        conn.commit()
-        await update.message.reply_text(
+    if await storage.create_store(store_name, store_address, user_id, get_today_date_utc8()):
+        text = (
             f"✅ Магазин создан!\n\n"
             f"Название: {store_name}\n"
             f"Адрес: {store_address}"
         )
-    except sqlite3.IntegrityError:
-        await update.message.reply_text(f"❌ Магазин '{store_name}' уже существует")
-    finally:
-        conn.close()
+    else:
+        text = f"❌ Магазин '{store_name}' уже существует"
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_stores_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_stores_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(
-        "Выберите действие:",
-        reply_markup=reply_markup
-    )
+    await update.message.reply_text(text, reply_markup=reply_markup)
     
     context.user_data.pop('new_store_name', None)
     
@@ -3063,109 +2422,93 @@ async def create_store_address(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def list_stores(query):
     """Показать список магазинов"""
-    stores = get_stores()
+    stores = await storage.get_stores()
     
     if not stores:
         await query.edit_message_text("🏪 Список магазинов пуст")
         return
     
-    text = "🏪 СПИСОК МАГАЗИНОВ\n\n"
-    for i, (name, address) in enumerate(stores, 1):
-        text += f"{i}. {name}\n   📍 {address}\n\n"
-    
-    await query.edit_message_text(text)
+    header = "🏪 СПИСОК МАГАЗИНОВ\n\n"
+    lines = (f"{i}. {name}\n   📍 {address}\n\n" for i, (store_id, name, address) in enumerate(stores, 1))
+    body, _ = join_limited(lines, PAGE_TEXT_LIMIT - len(header), more_rows, len(stores))
+    text = header + body
     
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_stores_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_stores_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-
-async def show_delete_store_menu(query):
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+def render_store_usage(store: Tuple, usage: Dict[int, int]) -> str:
+    """Запись магазина в меню удаления: можно ли удалить и адрес"""
+    store_id, store_name, address = store
+    count = usage.get(store_id, 0)
+    if count == 0:
+        # Магазин не используется - можно удалить
+        return f"✅ {store_name}\n   📍 {address}\n\n"
+    # Магазин используется - нельзя удалить
+    return f"❌ {store_name} (используется {count} сотрудниками)\n   📍 {address}\n\n"
+
+async def show_delete_store_menu(query, offset: int = 0):
     """Меню удаления магазинов"""
-    stores = get_stores()
+    stores = await storage.get_stores()
     
     if not stores:
         await query.edit_message_text("🏪 Нет магазинов для удаления")
         return
     
     # Получаем информацию о том, какие магазины используются
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+    usage = await storage.get_store_usage()
     
     text = "🗑 ВЫБОР МАГАЗИНА ДЛЯ УДАЛЕНИЯ\n\n"
     text += "❌ - нельзя удалить (есть сотрудники)\n"
     text += "✅ - можно удалить\n\n"
     
+    if all(usage.get(store_id, 0) for store_id, store_name, address in stores):
+        text += "❌ Нет магазинов, которые можно удалить\n(во всех магазинах есть сотрудники)\n\n"
+    
+    page = await fetch_page(from_list(stores), offset, text, lambda store, previous: render_store_usage(store, usage))
+    
     keyboard = []
-    for store_name, address in stores:
-        cursor.execute("SELECT COUNT(*) FROM employees WHERE store = ?", (store_name,))
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            # Магазин не используется - можно удалить
-            text += f"✅ {store_name}\n"
-            text += f"   📍 {address}\n\n"
+    for store_id, store_name, address in page.records:
+        if usage.get(store_id, 0) == 0:
             keyboard.append([
-                InlineKeyboardButton(f"🗑 {store_name}", callback_data=f"delete_store_list_{store_name}")
+                InlineKeyboardButton(f"🗑 {store_name}", callback_data=callbacks.data("delete_store_list_", store_id))
             ])
-        else:
-            # Магазин используется - нельзя удалить
-            text += f"❌ {store_name} (используется {count} сотрудниками)\n"
-            text += f"   📍 {address}\n\n"
-    
-    conn.close()
     
-    if not keyboard:
-        text += "\n❌ Нет магазинов, которые можно удалить\n(во всех магазинах есть сотрудники)"
-    
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_stores_menu")])
+    keyboard += page_buttons(page, "delete_store_from_list_menu_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_stores_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
-async def delete_store(query, store_name):
+async def delete_store(query, store_id):
     """Удаление магазина"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+    store_row = await storage.get_store(store_id)
+    if not store_row:
+        await query.edit_message_text("❌ Магазин не найден")
+        return
+    store_name = store_row[0]
     
-    # Проверяем, используется ли магазин
-    cursor.execute("SELECT COUNT(*) FROM employees WHERE store = ?", (store_name,))
-    count = cursor.fetchone()[0]
+    # Удаляем магазин, если он не используется
+    count = await storage.delete_store(store_id)
     
     if count > 0:
         await query.edit_message_text(
             f"❌ Невозможно удалить магазин '{store_name}'\n"
             f"В нем работает {count} сотрудников"
         )
-        conn.close()
         return
     
-    # Удаляем магазин
-    cursor.execute("DELETE FROM stores WHERE name = ?", (store_name,))
-    conn.commit()
-    conn.close()
-    
-    await query.edit_message_text(f"✅ Магазин '{store_name}' удален")
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_stores_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_stores_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(f"✅ Магазин '{store_name}' удален", reply_markup=reply_markup)
 
 # Функции для меню удаления
 async def show_delete_menu(query):
     """Меню запросов на удаление"""
     keyboard = [
-        [InlineKeyboardButton("👤 Запросить удаление сотрудника", callback_data="delete_employee_menu")],
-        [InlineKeyboardButton("🏪 Запросить удаление магазина", callback_data="delete_store_menu")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+        [InlineKeyboardButton("👤 Запросить удаление сотрудника", callback_data=callbacks.data("delete_employee_menu"))],
+        [InlineKeyboardButton("🏪 Запросить удаление магазина", callback_data=callbacks.data("delete_store_menu"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -3175,357 +2518,167 @@ async def show_delete_menu(query):
         reply_markup=reply_markup
     )
 
-async def show_delete_employee_menu(query):
+async def show_delete_employee_menu(query, offset: int = 0):
     """Меню выбора сотрудника для удаления"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT user_id, full_name, position, store 
-        FROM employees 
-        WHERE is_super_admin = 0
-        ORDER BY store, full_name
-    ''')
-    
-    employees = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(
+        lambda offset, limit: storage.get_deletable_employees(limit, offset),
+        offset, "👤 ВЫБОР СОТРУДНИКА ДЛЯ УДАЛЕНИЯ\n\n", DELETE_EMPLOYEE
+    )
     
-    if not employees:
+    if not page:
         await query.edit_message_text("👥 Нет сотрудников для удаления")
         return
     
-    text = "👤 ВЫБОР СОТРУДНИКА ДЛЯ УДАЛЕНИЯ\n\n"
-    
-    by_store = {}
-    for emp in employees:
-        user_id, full_name, position, store = emp
-        if store not in by_store:
-            by_store[store] = []
-        by_store[store].append((user_id, full_name, position))
-    
-    for store, emps in by_store.items():
-        text += f"🏪 {store}\n"
-        for user_id, full_name, position in emps:
-            text += f"  👤 {full_name} - {position}\n"
-        text += "\n"
-    
     keyboard = []
-    for user_id, full_name, position, store in employees:
+    for user_id, full_name, position, store in page.records:
         keyboard.append([
             InlineKeyboardButton(f"🗑 {full_name} ({store})", 
-                               callback_data=f"request_delete_employee_{user_id}")
+                               callback_data=callbacks.data("request_delete_employee_", user_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_delete_menu")])
+    keyboard += page_buttons(page, "delete_employee_menu_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_delete_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите сотрудника:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
-async def show_delete_store_request_menu(query):
+async def show_delete_store_request_menu(query, offset: int = 0):
     """Меню выбора магазина для удаления"""
-    stores = get_stores()
+    stores = await storage.get_stores()
     
     if not stores:
         await query.edit_message_text("🏪 Нет магазинов для удаления")
         return
     
     # Получаем информацию о том, какие магазины используются
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
+    usage = await storage.get_store_usage()
     
     text = "🏪 ВЫБОР МАГАЗИНА ДЛЯ ЗАПРОСА УДАЛЕНИЯ\n\n"
     text += "❌ - нельзя удалить (есть сотрудники)\n"
     text += "✅ - можно удалить\n\n"
     
+    if all(usage.get(store_id, 0) for store_id, store_name, address in stores):
+        text += "❌ Нет магазинов, для которых можно запросить удаление\n(во всех магазинах есть сотрудники)\n\n"
+    
+    page = await fetch_page(from_list(stores), offset, text, lambda store, previous: render_store_usage(store, usage))
+    
     keyboard = []
-    for store_name, address in stores:
-        cursor.execute("SELECT COUNT(*) FROM employees WHERE store = ?", (store_name,))
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            # Магазин не используется - можно запросить удаление
-            text += f"✅ {store_name}\n"
-            text += f"   📍 {address}\n\n"
+    for store_id, store_name, address in page.records:
+        if usage.get(store_id, 0) == 0:
             keyboard.append([
-                InlineKeyboardButton(f"🗑 {store_name}", callback_data=f"request_delete_store_{store_name}")
+                InlineKeyboardButton(f"🗑 {store_name}", callback_data=callbacks.data("request_delete_store_", store_id))
             ])
-        else:
-            # Магазин используется - нельзя удалить
-            text += f"❌ {store_name} (используется {count} сотрудниками)\n"
-            text += f"   📍 {address}\n\n"
-    
-    conn.close()
     
-    if not keyboard:
-        text += "\n❌ Нет магазинов, для которых можно запросить удаление\n(во всех магазинах есть сотрудники)"
-    
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_delete_menu")])
+    keyboard += page_buttons(page, "delete_store_menu_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("admin_delete_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите магазин:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 # Функции для запросов на удаление
 async def create_delete_request(query, requester_id, requester_name, target_type, target_id):
     """Создание запроса на удаление"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id FROM delete_requests 
-        WHERE target_type = ? AND target_id = ? AND status = 'pending'
-    ''', (target_type, target_id))
-    
-    existing = cursor.fetchone()
+    status, target_name = await storage.create_delete_request(
+        get_today_date_utc8(), requester_id, requester_name, target_type, target_id
+    )
     
-    if existing:
+    if status == 'exists':
         await query.edit_message_text(
             f"❌ Запрос на удаление этого {target_type} уже существует"
         )
-        conn.close()
         return
     
-    # Получаем имя цели
-    if target_type == "employee":
-        cursor.execute("SELECT full_name FROM employees WHERE user_id = ?", (target_id,))
-        target_name = cursor.fetchone()
-        if not target_name:
-            await query.edit_message_text("❌ Сотрудник не найден")
-            conn.close()
-            return
-        target_name = target_name[0]
-    else:  # store
-        target_name = target_id
-    
-    # Создаем запрос
-    cursor.execute('''
-        INSERT INTO delete_requests 
-        (request_date, requester_id, requester_name, target_type, target_id, target_name, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (get_today_date_utc8(), requester_id, requester_name, 
-          target_type, target_id, target_name, 'pending'))
-    
-    conn.commit()
-    conn.close()
+    if status == 'not_found':
+        await query.edit_message_text("❌ Сотрудник не найден" if target_type == "employee" else "❌ Магазин не найден")
+        return
     
     await query.edit_message_text(
         f"✅ Запрос на удаление {target_type} '{target_name}' отправлен супер-администратору"
     )
     
     # Уведомляем супер-админов
-    super_admins = get_super_admins()
-    for admin_id, admin_name in super_admins:
-        try:
-            await query.message.bot.send_message(
-                admin_id,
-                f"🔔 Новый запрос на удаление!\n\n"
-                f"От: {requester_name}\n"
-                f"Тип: {target_type}\n"
-                f"Цель: {target_name}\n\n"
-                f"Используйте 👑 Панель админа для рассмотрения запроса."
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify super admin {admin_id}: {e}")
+    super_admins = await storage.get_super_admins()
+    notifier.notify(
+        [admin_id for admin_id, _ in super_admins],
+        f"🔔 Новый запрос на удаление!\n\n"
+        f"От: {requester_name}\n"
+        f"Тип: {target_type}\n"
+        f"Цель: {target_name}\n\n"
+        f"Используйте 👑 Панель админа для рассмотрения запроса."
+    )
 
-async def show_delete_requests(query):
+async def show_delete_requests(query, offset: int = 0):
     """Показать все запросы на удаление"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, request_date, requester_name, target_type, target_name, status
-        FROM delete_requests
-        ORDER BY 
-            CASE status 
-                WHEN 'pending' THEN 1
-                WHEN 'approved' THEN 2
-                ELSE 3
-            END,
-            request_date DESC
-    ''')
-    
-    requests = cursor.fetchall()
-    conn.close()
-    
-    if not requests:
+    page = await fetch_page(
+        lambda offset, limit: storage.get_delete_requests(limit, offset),
+        offset, "📋 ЗАПРОСЫ НА УДАЛЕНИЕ\n\n", DELETE_REQUEST
+    )
+    
+    if not page:
         await query.edit_message_text("📋 Нет запросов на удаление")
         return
     
-    text = "📋 ЗАПРОСЫ НА УДАЛЕНИЕ\n\n"
-    
-    pending_keyboard = []
-    other_text = ""
-    
-    for req in requests:
-        req_id, req_date, requester, target_type, target_name, status = req
-        
-        status_emoji = {
-            'pending': '⏳',
-            'approved': '✅',
-            'rejected': '❌'
-        }.get(status, '❓')
-        
-        status_text = {
-            'pending': 'Ожидает',
-            'approved': 'Одобрен',
-            'rejected': 'Отклонен'
-        }.get(status, 'Неизвестно')
-        
-        type_text = "сотрудника" if target_type == "employee" else "магазин"
-        
-        req_text = f"{status_emoji} Запрос #{req_id}\n"
-        req_text += f"📅 {req_date}\n"
-        req_text += f"👤 От: {requester}\n"
-        req_text += f"🎯 Тип: {type_text}\n"
-        req_text += f"📌 Цель: {target_name}\n"
-        req_text += f"📊 Статус: {status_text}\n\n"
-        
+    keyboard = []
+    for req in page.records:
+        req_id, status = req[0], req[5]
         if status == 'pending':
-            pending_keyboard.append([
-                InlineKeyboardButton(f"✅ Одобрить #{req_id}", callback_data=f"approve_request_{req_id}"),
-                InlineKeyboardButton(f"❌ Отклонить #{req_id}", callback_data=f"reject_request_{req_id}")
+            keyboard.append([
+                InlineKeyboardButton(f"✅ Одобрить #{req_id}", callback_data=callbacks.data("approve_request_", req_id)),
+                InlineKeyboardButton(f"❌ Отклонить #{req_id}", callback_data=callbacks.data("reject_request_", req_id))
             ])
-            text += req_text
-        else:
-            other_text += req_text
-    
-    if other_text:
-        text += "📋 ЗАВЕРШЕННЫЕ ЗАПРОСЫ:\n\n" + other_text
     
-    keyboard = pending_keyboard
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+    keyboard += page_buttons(page, "admin_requests_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def approve_delete_request(query, request_id):
     """Одобрить запрос на удаление"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT target_type, target_id, target_name, requester_id, requester_name
-        FROM delete_requests
-        WHERE id = ? AND status = 'pending'
-    ''', (request_id,))
-    
-    request = cursor.fetchone()
+    status, request, emp_count = await storage.approve_delete_request(request_id)
     
-    if not request:
+    if status == 'not_found':
         await query.edit_message_text(f"❌ Запрос #{request_id} не найден или уже обработан")
-        conn.close()
         return
     
     target_type, target_id, target_name, requester_id, requester_name = request
     
-    if target_type == "employee":
-        cursor.execute("SELECT is_super_admin FROM employees WHERE user_id = ?", (target_id,))
-        is_super_admin = cursor.fetchone()
-        if is_super_admin and is_super_admin[0] == 1:
-            await query.edit_message_text("❌ Нельзя удалить супер-администратора")
-            conn.close()
-            return
-        
-        cursor.execute("DELETE FROM timesheet WHERE user_id = ?", (target_id,))
-        cursor.execute("DELETE FROM employees WHERE user_id = ?", (target_id,))
-        
-    else:
-        cursor.execute("SELECT COUNT(*) FROM employees WHERE store = ?", (target_name,))
-        emp_count = cursor.fetchone()[0]
-        
-        if emp_count > 0:
-            await query.edit_message_text(
-                f"❌ Нельзя удалить магазин '{target_name}'\n"
-                f"В нем работает {emp_count} сотрудников"
-            )
-            conn.close()
-            return
-        
-        cursor.execute("DELETE FROM stores WHERE name = ?", (target_name,))
-    
-    cursor.execute('''
-        UPDATE delete_requests 
-        SET status = 'approved' 
-        WHERE id = ?
-    ''', (request_id,))
+    if status == 'super_admin':
+        await query.edit_message_text("❌ Нельзя удалить супер-администратора")
+        return
     
-    conn.commit()
-    conn.close()
+    if status == 'store_in_use':
+        await query.edit_message_text(
+            f"❌ Нельзя удалить магазин '{target_name}'\n"
+            f"В нем работает {emp_count} сотрудников"
+        )
+        return
     
     await query.edit_message_text(f"✅ Запрос #{request_id} одобрен, удаление выполнено")
     
-    try:
-        await query.message.bot.send_message(
-            requester_id,
-            f"✅ Ваш запрос на удаление {target_type} '{target_name}' одобрен и выполнен!"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify requester {requester_id}: {e}")
+    notifier.notify(
+        [requester_id],
+        f"✅ Ваш запрос на удаление {target_type} '{target_name}' одобрен и выполнен!"
+    )
     
     await show_delete_requests(query)
 
 async def reject_delete_request(query, request_id):
     """Отклонить запрос на удаление"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT target_type, target_name, requester_id
-        FROM delete_requests
-        WHERE id = ? AND status = 'pending'
-    ''', (request_id,))
-    
-    request = cursor.fetchone()
+    request = await storage.reject_delete_request(request_id)
     
     if not request:
         await query.edit_message_text(f"❌ Запрос #{request_id} не найден или уже обработан")
-        conn.close()
         return
     
     target_type, target_name, requester_id = request
     
-    cursor.execute('''
-        UPDATE delete_requests 
-        SET status = 'rejected' 
-        WHERE id = ?
-    ''', (request_id,))
-    
-    conn.commit()
-    conn.close()
-    
     await query.edit_message_text(f"❌ Запрос #{request_id} отклонен")
     
-    try:
-        await query.message.bot.send_message(
-            requester_id,
-            f"❌ Ваш запрос на удаление {target_type} '{target_name}' отклонен супер-администратором"
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify requester {requester_id}: {e}")
+    notifier.notify(
+        [requester_id],
+        f"❌ Ваш запрос на удаление {target_type} '{target_name}' отклонен супер-администратором"
+    )
     
     await show_delete_requests(query)
 
@@ -3536,228 +2689,90 @@ async def handle_admin_request(query, context, user_id, user_info):
     position = user_info[1] if user_info and len(user_info) > 1 else "Не указана"
     store = user_info[2] if user_info and len(user_info) > 2 else "Не указан"
     
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id FROM admin_requests 
-        WHERE user_id = ? AND status = 'pending'
-    ''', (user_id,))
-    
-    existing = cursor.fetchone()
-    
-    if existing:
+    if not await storage.create_admin_request(get_today_date_utc8(), user_id, full_name, position, store):
         await query.edit_message_text(
             "❌ У вас уже есть активная заявка на становление администратором"
         )
-        conn.close()
         return
     
-    cursor.execute('''
-        INSERT INTO admin_requests 
-        (request_date, user_id, user_name, user_position, user_store, status)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (get_today_date_utc8(), user_id, full_name, position, store, 'pending'))
-    
-    conn.commit()
-    conn.close()
-    
     await query.edit_message_text(
         "✅ Заявка на становление администратором отправлена!\n"
         "Ожидайте решения супер-администратора."
     )
     
-    super_admins = get_super_admins()
-    for admin_id, admin_name in super_admins:
-        try:
-            await query.message.bot.send_message(
-                admin_id,
-                f"👑 Новая заявка на становление администратором!\n\n"
-                f"От: {full_name}\n"
-                f"Должность: {position}\n"
-                f"Магазин: {store}\n"
-                f"ID: {user_id}\n\n"
-                f"Используйте 👑 Панель админа для рассмотрения заявки."
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify super admin {admin_id}: {e}")
+    super_admins = await storage.get_super_admins()
+    notifier.notify(
+        [admin_id for admin_id, _ in super_admins],
+        f"👑 Новая заявка на становление администратором!\n\n"
+        f"От: {full_name}\n"
+        f"Должность: {position}\n"
+        f"Магазин: {store}\n"
+        f"ID: {user_id}\n\n"
+        f"Используйте 👑 Панель админа для рассмотрения заявки."
+    )
 
-async def show_admin_requests(query):
+async def show_admin_requests(query, offset: int = 0):
     """Показать все заявки на админа"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, request_date, user_name, user_position, user_store, user_id, status
-        FROM admin_requests
-        ORDER BY 
-            CASE status 
-                WHEN 'pending' THEN 1
-                WHEN 'approved' THEN 2
-                ELSE 3
-            END,
-            request_date DESC
-    ''')
-    
-    requests = cursor.fetchall()
-    conn.close()
-    
-    if not requests:
+    page = await fetch_page(
+        lambda offset, limit: storage.get_admin_requests(limit, offset),
+        offset, "👑 ЗАЯВКИ НА СТАНОВЛЕНИЕ АДМИНИСТРАТОРОМ\n\n", ADMIN_REQUEST
+    )
+    
+    if not page:
         await query.edit_message_text("📋 Нет заявок на становление администратором")
         return
     
-    text = "👑 ЗАЯВКИ НА СТАНОВЛЕНИЕ АДМИНИСТРАТОРОМ\n\n"
-    
-    pending_keyboard = []
-    other_text = ""
-    
-    for req in requests:
-        req_id, req_date, user_name, user_position, user_store, user_id, status = req
-        
-        status_emoji = {
-            'pending': '⏳',
-            'approved': '✅',
-            'rejected': '❌'
-        }.get(status, '❓')
-        
-        status_text = {
-            'pending': 'Ожидает',
-            'approved': 'Одобрена',
-            'rejected': 'Отклонена'
-        }.get(status, 'Неизвестно')
-        
-        req_text = f"{status_emoji} Заявка #{req_id}\n"
-        req_text += f"📅 {req_date}\n"
-        req_text += f"👤 {user_name}\n"
-        req_text += f"📋 Должность: {user_position}\n"
-        req_text += f"🏪 Магазин: {user_store}\n"
-        req_text += f"🆔 ID: {user_id}\n"
-        req_text += f"📊 Статус: {status_text}\n\n"
-        
+    keyboard = []
+    for req in page.records:
+        req_id, status = req[0], req[6]
         if status == 'pending':
-            pending_keyboard.append([
-                InlineKeyboardButton(f"✅ Одобрить #{req_id}", callback_data=f"approve_admin_{req_id}"),
-                InlineKeyboardButton(f"❌ Отклонить #{req_id}", callback_data=f"reject_admin_{req_id}")
+            keyboard.append([
+                InlineKeyboardButton(f"✅ Одобрить #{req_id}", callback_data=callbacks.data("approve_admin_", req_id)),
+                InlineKeyboardButton(f"❌ Отклонить #{req_id}", callback_data=callbacks.data("reject_admin_", req_id))
             ])
-            text += req_text
-        else:
-            other_text += req_text
-    
-    if other_text:
-        text += "📋 ЗАВЕРШЕННЫЕ ЗАЯВКИ:\n\n" + other_text
     
-    keyboard = pending_keyboard
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+    keyboard += page_buttons(page, "admin_admin_requests_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def approve_admin_request(query, request_id):
     """Одобрить заявку на админа"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT user_id, user_name, user_position, user_store
-        FROM admin_requests
-        WHERE id = ? AND status = 'pending'
-    ''', (request_id,))
-    
-    request = cursor.fetchone()
+    request = await storage.approve_admin_request(request_id, get_today_date_utc8())
     
     if not request:
         await query.edit_message_text(f"❌ Заявка #{request_id} не найдена или уже обработана")
-        conn.close()
         return
     
     user_id, user_name, user_position, user_store = request
     
-    cursor.execute("SELECT full_name FROM employees WHERE user_id = ?", (user_id,))
-    employee = cursor.fetchone()
-    
-    if employee:
-        # Пользователь уже зарегистрирован - делаем его админом
-        cursor.execute('''
-            UPDATE employees 
-            SET is_admin = 1 
-            WHERE user_id = ?
-        ''', (user_id,))
-    else:
-        # Новый пользователь - создаем запись
-        cursor.execute('''
-            INSERT INTO employees 
-            (user_id, full_name, position, store, reg_date, is_admin, is_super_admin, can_request_admin)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, user_name, user_position, user_store, 
-              get_today_date_utc8(), 1, 0, 0))
-    
-    cursor.execute('''
-        UPDATE admin_requests 
-        SET status = 'approved' 
-        WHERE id = ?
-    ''', (request_id,))
-    
-    conn.commit()
-    conn.close()
-    
     await query.edit_message_text(f"✅ Заявка #{request_id} одобрена, пользователь стал администратором")
     
-    try:
-        await query.message.bot.send_message(
-            user_id,
-            f"✅ Поздравляем! Ваша заявка на становление администратором одобрена!\n\n"
-            f"Теперь вам доступна панель администратора."
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify user {user_id}: {e}")
+    notifier.notify(
+        [user_id],
+        f"✅ Поздравляем! Ваша заявка на становление администратором одобрена!\n\n"
+        f"Теперь вам доступна панель администратора."
+    )
     
     await show_admin_requests(query)
 
 async def reject_admin_request(query, request_id):
     """Отклонить заявку на админа"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT user_id, user_name
-        FROM admin_requests
-        WHERE id = ? AND status = 'pending'
-    ''', (request_id,))
-    
-    request = cursor.fetchone()
+    request = await storage.reject_admin_request(request_id)
     
     if not request:
         await query.edit_message_text(f"❌ Заявка #{request_id} не найдена или уже обработана")
-        conn.close()
         return
     
     user_id, user_name = request
     
-    cursor.execute('''
-        UPDATE admin_requests 
-        SET status = 'rejected' 
-        WHERE id = ?
-    ''', (request_id,))
-    
-    conn.commit()
-    conn.close()
-    
     await query.edit_message_text(f"❌ Заявка #{request_id} отклонена")
     
-    try:
-        await query.message.bot.send_message(
-            user_id,
-            f"❌ К сожалению, ваша заявка на становление администратором отклонена."
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify user {user_id}: {e}")
+    notifier.notify(
+        [user_id],
+        f"❌ К сожалению, ваша заявка на становление администратором отклонена."
+    )
     
     await show_admin_requests(query)
 
@@ -3766,10 +2781,10 @@ async def show_assign_super_admin_menu(query):
     """Меню управления супер-админами"""
     keyboard = [
         [InlineKeyboardButton("⭐ Назначить супер-администратора", 
-                            callback_data="assign_super_admin_list")],
+                            callback_data=callbacks.data("assign_super_admin_list"))],
         [InlineKeyboardButton("📋 Список супер-админов", 
-                            callback_data="list_super_admins")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")]
+                            callback_data=callbacks.data("list_super_admins"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -3779,68 +2794,35 @@ async def show_assign_super_admin_menu(query):
         reply_markup=reply_markup
     )
 
-async def show_assign_super_admin_list(query):
+async def show_assign_super_admin_list(query, offset: int = 0):
     """Показать список администраторов для назначения супер-админом"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT user_id, full_name, position, store 
-        FROM employees 
-        WHERE is_admin = 1 AND is_super_admin = 0
-        ORDER BY store, full_name
-    ''')
-    
-    admins = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(
+        lambda offset, limit: storage.get_admins_for_promotion(limit, offset),
+        offset, "⭐ ВЫБОР АДМИНИСТРАТОРА ДЛЯ НАЗНАЧЕНИЯ СУПЕР-АДМИНОМ\n\n", PROMOTION_ROW
+    )
     
-    if not admins:
+    if not page:
         await query.edit_message_text(
             "👥 Нет администраторов для назначения супер-админом"
         )
         return
     
-    text = "⭐ ВЫБОР АДМИНИСТРАТОРА ДЛЯ НАЗНАЧЕНИЯ СУПЕР-АДМИНОМ\n\n"
-    
     keyboard = []
-    for admin in admins:
-        user_id, full_name, position, store = admin
-        text += f"👑 {full_name}\n"
-        text += f"   Должность: {position}\n"
-        text += f"   Магазин: {store}\n\n"
-        
+    for user_id, full_name, position, store in page.records:
         keyboard.append([
             InlineKeyboardButton(f"⭐ {full_name}", 
-                               callback_data=f"select_super_admin_{user_id}")
+                               callback_data=callbacks.data("select_super_admin_", user_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="assign_super_admin_menu")])
+    keyboard += page_buttons(page, "assign_super_admin_list_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("assign_super_admin_menu"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите администратора:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 async def confirm_assign_super_admin(query, target_id):
     """Подтверждение назначения супер-админа"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT full_name, position, store 
-        FROM employees 
-        WHERE user_id = ?
-    ''', (target_id,))
-    
-    candidate = cursor.fetchone()
-    conn.close()
+    candidate = await storage.get_employee_card(target_id)
     
     if not candidate:
         await query.edit_message_text("❌ Пользователь не найден")
@@ -3850,8 +2832,8 @@ async def confirm_assign_super_admin(query, target_id):
     
     keyboard = [
         [
-            InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_assign_super_admin"),
-            InlineKeyboardButton("❌ Отмена", callback_data="assign_super_admin_menu")
+            InlineKeyboardButton("✅ Подтвердить", callback_data=callbacks.data("confirm_assign_super_admin")),
+            InlineKeyboardButton("❌ Отмена", callback_data=callbacks.data("assign_super_admin_menu"))
         ]
     ]
     
@@ -3868,100 +2850,61 @@ async def confirm_assign_super_admin(query, target_id):
 
 async def assign_super_admin(query, target_id):
     """Назначение супер-администратора"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE employees 
-        SET is_super_admin = 1 
-        WHERE user_id = ?
-    ''', (target_id,))
+    await storage.set_super_admin(target_id)
     
-    conn.commit()
-    conn.close()
-    
-    await query.edit_message_text(f"✅ Пользователь назначен супер-администратором!")
-    
-    try:
-        await query.message.bot.send_message(
-            target_id,
-            f"⭐ Поздравляем! Вы назначены супер-администратором!\n\n"
-            f"Теперь вам доступны все функции управления ботом."
-        )
-    except Exception as e:
-        logger.error(f"Failed to notify new super admin {target_id}: {e}")
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="assign_super_admin_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("assign_super_admin_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(f"✅ Пользователь назначен супер-администратором!", reply_markup=reply_markup)
+    
+    notifier.notify(
+        [target_id],
+        f"⭐ Поздравляем! Вы назначены супер-администратором!\n\n"
+        f"Теперь вам доступны все функции управления ботом."
+    )
 
 async def list_super_admins(query):
     """Показать список супер-админов"""
-    super_admins = get_super_admins()
+    super_admins = await storage.get_super_admins()
     
     if not super_admins:
         await query.edit_message_text("⭐ Нет супер-администраторов")
         return
     
-    text = "⭐ СПИСОК СУПЕР-АДМИНИСТРАТОРОВ\n\n"
+    header = "⭐ СПИСОК СУПЕР-АДМИНИСТРАТОРОВ\n\n"
+    lines = (f"{i}. {full_name} (ID: {user_id})\n" for i, (user_id, full_name) in enumerate(super_admins, 1))
+    body, _ = join_limited(lines, PAGE_TEXT_LIMIT - len(header), more_rows, len(super_admins))
+    text = header + body
     
-    for i, (user_id, full_name) in enumerate(super_admins, 1):
-        text += f"{i}. {full_name} (ID: {user_id})\n"
-    
-    await query.edit_message_text(text)
-    
-    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="assign_super_admin_menu")]]
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("assign_super_admin_menu"))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 # Функции для добавления администраторов
-async def show_add_admin_menu(query):
+async def show_add_admin_menu(query, offset: int = 0):
     """Меню добавления администратора"""
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT user_id, full_name, position, store 
-        FROM employees 
-        WHERE is_admin = 0 AND is_super_admin = 0
-        ORDER BY store, full_name
-    ''')
-    
-    employees = cursor.fetchall()
-    conn.close()
+    page = await fetch_page(
+        lambda offset, limit: storage.get_regular_employees(limit, offset),
+        offset, "➕ ВЫБОР СОТРУДНИКА ДЛЯ НАЗНАЧЕНИЯ АДМИНИСТРАТОРОМ\n\n", REGULAR_EMPLOYEE_ROW
+    )
     
-    if not employees:
+    if not page:
         await query.edit_message_text(
             "👥 Нет обычных сотрудников для назначения администраторами"
         )
         return
     
-    text = "➕ ВЫБОР СОТРУДНИКА ДЛЯ НАЗНАЧЕНИЯ АДМИНИСТРАТОРОМ\n\n"
-    
     keyboard = []
-    for emp in employees:
-        user_id, full_name, position, store = emp
-        text += f"👤 {full_name}\n"
-        text += f"   {position} | {store}\n\n"
-        
+    for user_id, full_name, position, store in page.records:
         keyboard.append([
             InlineKeyboardButton(f"👑 {full_name}", 
-                               callback_data=f"make_admin_{user_id}")
+                               callback_data=callbacks.data("make_admin_", user_id))
         ])
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_admin")])
+    keyboard += page_buttons(page, "admin_add_page_")
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("back_to_admin"))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if len(text) > MAX_MESSAGE_LENGTH:
-        await query.edit_message_text(text[:MAX_MESSAGE_LENGTH])
-        remaining = text[MAX_MESSAGE_LENGTH:]
-        while remaining:
-            await query.message.reply_text(remaining[:MAX_MESSAGE_LENGTH])
-            remaining = remaining[MAX_MESSAGE_LENGTH:]
-        await query.message.reply_text("Выберите сотрудника:", reply_markup=reply_markup)
-    else:
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    await query.edit_message_text(page.text, reply_markup=reply_markup)
 
 # Обработчики текстовых сообщений для ConversationHandler
 async def get_custom_period_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -4003,9 +2946,9 @@ async def get_custom_period_end(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data['period_days'] = days
         
         keyboard = [
-            [InlineKeyboardButton("📥 CSV (только подтвержденные)", callback_data="export_confirmed")],
-            [InlineKeyboardButton("📥 CSV (все смены)", callback_data="export_all")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="period_selection")]
+            [InlineKeyboardButton("📥 CSV (только подтвержденные)", callback_data=callbacks.data("export_confirmed"))],
+            [InlineKeyboardButton("📥 CSV (все смены)", callback_data=callbacks.data("export_all"))],
+            [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.data("period_selection"))]
         ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -4039,295 +2982,35 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Обработка кнопок из нижнего меню
-    if text == "🏠 Главное меню":
-        await start(update, context)
-        return
-    elif text == "👑 Панель админа":
-        # Проверяем, есть ли права администратора
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):  # is_admin или is_super_admin
-            await admin_panel(update, context)
-        else:
-            await update.message.reply_text("❌ У вас нет прав доступа к панели администратора")
-        return
-    elif text == "✅ Открыть смену":
-        await checkin(update, context)
-        return
-    elif text == "✅ Закрыть смену":
-        await checkout(update, context)
-        return
-    elif text == "📊 Мой табель":
-        await timesheet(update, context)
-        return
-    elif text == "📈 Моя статистика":
-        await stats(update, context)
-        return
-    elif text == "👥 Все сотрудники":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_list',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_all_employees(query)
-        return
-    elif text == "📊 По магазинам":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_by_store',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_employees_by_store(query)
-        return
-    elif text == "🔓 Открытые смены":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            await show_open_shifts(update, context)
-        return
-    elif text == "📅 Выбрать период":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'period_selection',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_period_selection(query)
-        return
-    elif text == "📈 Статистика по магазинам":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_store_stats',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_store_stats(query)
-        return
-    elif text == "✅ Подтверждение смен":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_confirm',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_confirm_menu(query)
-        return
-    elif text == "🗑 Запросить удаление":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_delete_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_delete_menu(query)
-        return
-    elif text == "📋 Управление должностями":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_positions_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_positions_menu(query)
-        return
-    elif text == "🏪 Управление магазинами":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_stores_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_stores_menu(query)
-        return
-    elif text == "🔄 Управление сменами":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_shifts_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_shifts_menu(update, context)
-        return
-    elif text == "👥 Управление сотрудниками":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'admin_employees_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_employees_management_menu(update, context)
-        return
-    elif text == "➕ Добавить админа":
-        user = get_user(user_id)
-        if user and user[4]:  # is_super_admin
-            query = type('Query', (), {
-                'data': 'admin_add',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_add_admin_menu(query)
-        return
-    elif text == "📋 Запросы на удаление":
-        user = get_user(user_id)
-        if user and user[4]:  # is_super_admin
-            query = type('Query', (), {
-                'data': 'admin_requests',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_delete_requests(query)
-        return
-    elif text == "👑 Заявки в админы":
-        user = get_user(user_id)
-        if user and user[4]:  # is_super_admin
-            query = type('Query', (), {
-                'data': 'admin_admin_requests',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_admin_requests(query)
-        return
-    elif text == "⭐ Управление супер-админами":
-        user = get_user(user_id)
-        if user and user[4]:  # is_super_admin
-            query = type('Query', (), {
-                'data': 'assign_super_admin_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_assign_super_admin_menu(query)
-        return
-    elif text == "👤 Запросить удаление сотрудника":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'delete_employee_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_delete_employee_menu(query)
-        return
-    elif text == "🏪 Запросить удаление магазина":
-        user = get_user(user_id)
-        if user and (user[3] or user[4]):
-            query = type('Query', (), {
-                'data': 'delete_store_menu',
-                'from_user': update.effective_user,
-                'message': update.message,
-                'answer': lambda: None,
-                'edit_message_text': lambda text, reply_markup=None: None
-            })()
-            await show_delete_store_request_menu(query)
-        return
-    elif text == "👑 Запросить права администратора":
-        user = get_user(user_id)
-        if not user:
-            await update.message.reply_text("❌ Сначала зарегистрируйтесь через /start")
-            return
-        
-        full_name, position, store, is_admin, is_super_admin, can_request_admin = user
-        
-        if is_admin or is_super_admin:
-            await update.message.reply_text("❌ Вы уже являетесь администратором")
-            return
-        
-        if not can_request_admin:
-            await update.message.reply_text("❌ У вас нет прав для запроса администраторских полномочий")
-            return
-        
-        await handle_admin_request_from_message(update, context, user_id, user)
+    await menu_buttons.dispatch(update, context)
 
 async def handle_admin_request_from_message(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, user_info: Tuple):
     """Обработка заявки на становление администратором из сообщения"""
     full_name, position, store, is_admin, is_super_admin, can_request_admin = user_info
     
-    # Проверяем, нет ли уже активной заявки
-    conn = sqlite3.connect('timesheet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id FROM admin_requests 
-        WHERE user_id = ? AND status = 'pending'
-    ''', (user_id,))
-    
-    existing = cursor.fetchone()
-    
-    if existing:
+    # Создаем заявку, если нет уже активной
+    if not await storage.create_admin_request(get_today_date_utc8(), user_id, full_name, position, store):
         await update.message.reply_text(
             "❌ У вас уже есть активная заявка на становление администратором"
         )
-        conn.close()
         return
     
-    # Создаем заявку
-    cursor.execute('''
-        INSERT INTO admin_requests 
-        (request_date, user_id, user_name, user_position, user_store, status)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (get_today_date_utc8(), user_id, full_name, position, store, 'pending'))
-    
-    conn.commit()
-    conn.close()
-    
     await update.message.reply_text(
         "✅ Заявка на становление администратором отправлена!\n"
         "Ожидайте решения супер-администратора."
     )
     
     # Уведомляем супер-админов
-    super_admins = get_super_admins()
-    for admin_id, admin_name in super_admins:
-        try:
-            await update.message.bot.send_message(
-                admin_id,
-                f"👑 Новая заявка на становление администратором!\n\n"
-                f"От: {full_name}\n"
-                f"Должность: {position}\n"
-                f"Магазин: {store}\n"
-                f"ID: {user_id}\n\n"
-                f"Используйте 👑 Панель админа для рассмотрения заявки."
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify super admin {admin_id}: {e}")
+    super_admins = await storage.get_super_admins()
+    notifier.notify(
+        [admin_id for admin_id, _ in super_admins],
+        f"👑 Новая заявка на становление администратором!\n\n"
+        f"От: {full_name}\n"
+        f"Должность: {position}\n"
+        f"Магазин: {store}\n"
+        f"ID: {user_id}\n\n"
+        f"Используйте 👑 Панель админа для рассмотрения заявки."
+    )
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена текущего действия"""
@@ -4337,6 +3020,84 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 # Основная функция запуска
+@require_auth(super_admin_only=True)
+async def rebuild_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пересчитать дневные сводки из табеля"""
+    days = await storage.rebuild_rollups()
+    await update.message.reply_text(f"✅ Сводки пересчитаны: {days} дней сотрудников")
+
+
+async def wal_checkpoint_loop():
+    """Периодический checkpoint журнала WAL"""
+    while True:
+        await asyncio.sleep(db.DB_CHECKPOINT_INTERVAL)
+        try:
+            busy, log_pages, checkpointed = await storage.checkpoint()
+            if busy:
+                logger.info(f"WAL checkpoint занят читателями: перенесено {checkpointed} из {log_pages} страниц")
+        except Exception as e:
+            logger.error(f"Ошибка при checkpoint базы: {e}")
+
+
+async def reconcile_unconfirmed_loop():
+    """Периодическая сверка счетчиков неподтвержденных смен с табелем"""
+    while True:
+        await asyncio.sleep(db.UNCONFIRMED_RECONCILE_INTERVAL)
+        try:
+            drift = await storage.reconcile_unconfirmed_counts()
+            if drift:
+                logger.warning(f"Счетчики неподтвержденных смен исправлены (было, стало): {drift}")
+        except Exception as e:
+            logger.error(f"Ошибка при сверке счетчиков неподтвержденных смен: {e}")
+
+
+async def notification_retry_loop():
+    """Периодическая повторная отправка недоставленных уведомлений"""
+    while True:
+        await asyncio.sleep(NOTIFY_RETRY_INTERVAL)
+        try:
+            sent = await notifier.retry_pending()
+            if sent:
+                logger.info(f"Повторно отправлено уведомлений: {sent}")
+        except Exception as e:
+            logger.error(f"Ошибка при повторной отправке уведомлений: {e}")
+
+
+async def post_init(application: Application):
+    """Фоновые задачи, запускаемые вместе с ботом"""
+    notifier.start(lambda chat_id, text: application.bot.send_message(
+        chat_id, text, rate_limit_args=PRIORITY_NOTIFY
+    ))
+    if NOTIFY_RETRY_INTERVAL > 0:
+        application.bot_data['notification_retry'] = asyncio.create_task(notification_retry_loop())
+    if (db.DB_BACKEND == 'sqlite' and db.DB_CHECKPOINT_INTERVAL > 0
+            and db.pool.tuning.get('journal_mode', '').upper() == 'WAL'):
+        application.bot_data['wal_checkpoint'] = asyncio.create_task(wal_checkpoint_loop())
+    if db.UNCONFIRMED_RECONCILE_INTERVAL > 0:
+        application.bot_data['reconcile_unconfirmed'] = asyncio.create_task(reconcile_unconfirmed_loop())
+
+
+async def post_shutdown(application: Application):
+    """Остановка фоновых задач"""
+    await jobs.shutdown()
+    for name in ('wal_checkpoint', 'reconcile_unconfirmed', 'notification_retry'):
+        task = application.bot_data.pop(name, None)
+        if task:
+            task.cancel()
+    await notifier.stop()
+    batcher = getattr(storage, 'batcher', None)
+    if batcher:
+        logger.info(f"Групповая запись отметок: {batcher.metrics.snapshot()}")
+    logger.info(f"Кэши: {storage.cache_metrics()}")
+    logger.info(f"Маршруты кнопок: {callbacks.metrics()}")
+    logger.info(f"Токены кнопок: {callbacks.tokens.snapshot()}")
+    logger.info(f"Кнопки меню: {menu_buttons.metrics()}")
+    logger.info(f"Обработка обновлений: {application.update_processor.metrics()}")
+    logger.info(f"Фоновые отчеты: {jobs.metrics.snapshot()}")
+    logger.info(f"Исходящие сообщения: {application.bot.rate_limiter.snapshot()}")
+    logger.info(f"Уведомления: {notifier.metrics.snapshot()}")
+
+
 async def main():
     """Упрощенная функция запуска"""
     try:
@@ -4345,18 +3106,28 @@ async def main():
         await asyncio.sleep(1)
         
         # Инициализируем базу данных
-        init_database()
-        
-        # Создаем приложение
-        app = Application.builder().token(BOT_TOKEN).build()
+        await storage.start()
+        
+        # Создаем приложение: обновления разных пользователей обрабатываются
+        # параллельно, одного пользователя - по очереди; тяжелые отчеты - в
+        # отдельной полосе
+        app = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(SequencedUpdateProcessor(update_lane, shed_update))
+            .rate_limiter(OutboundScheduler())
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
         # ConversationHandler для регистрации
         reg_conv_handler = ConversationHandler(
             entry_points=[CommandHandler("start", start)],
             states={
                 ENTER_FULL_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, enter_full_name)],
-                SELECT_POSITION: [CallbackQueryHandler(button_callback, pattern="^reg_pos_")],
-                SELECT_STORE: [CallbackQueryHandler(button_callback, pattern="^reg_store_")],
+                SELECT_POSITION: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("reg_pos_"))],
+                SELECT_STORE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("reg_store_"))],
             },
             fallbacks=[CommandHandler("cancel", cancel_registration)],
             allow_reentry=True
@@ -4365,7 +3136,7 @@ async def main():
         
         # ConversationHandler для создания должности
         create_position_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^create_position$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("create_position"))],
             states={
                 CREATE_POSITION_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_position)],
             },
@@ -4376,7 +3147,7 @@ async def main():
         
         # ConversationHandler для создания магазина
         create_store_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^create_store$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("create_store"))],
             states={
                 CREATE_STORE_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_store_name)],
                 CREATE_STORE_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, create_store_address)],
@@ -4388,7 +3159,7 @@ async def main():
         
         # ConversationHandler для пользовательского периода
         custom_period_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^period_custom$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("period_custom"))],
             states={
                 CUSTOM_PERIOD_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_custom_period_start)],
                 CUSTOM_PERIOD_END: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_custom_period_end)],
@@ -4400,10 +3171,10 @@ async def main():
         
         # ConversationHandler для добавления смен
         add_shift_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^add_shift_start$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_shift_start"))],
             states={
-                ADD_SHIFT_SELECT_STORE: [CallbackQueryHandler(button_callback, pattern="^add_shift_store_")],
-                ADD_SHIFT_SELECT_EMPLOYEE: [CallbackQueryHandler(button_callback, pattern="^add_shift_emp_")],
+                ADD_SHIFT_SELECT_STORE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_shift_store_"))],
+                ADD_SHIFT_SELECT_EMPLOYEE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_shift_emp_"))],
                 ADD_SHIFT_SELECT_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_shift_enter_hours)],
                 ADD_SHIFT_ENTER_HOURS: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_shift_save)],
             },
@@ -4414,11 +3185,11 @@ async def main():
         
         # ConversationHandler для удаления смен
         delete_shift_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^delete_shift_start$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("delete_shift_start"))],
             states={
-                DELETE_SHIFT_SELECT_STORE: [CallbackQueryHandler(button_callback, pattern="^delete_shift_store_")],
-                DELETE_SHIFT_SELECT_EMPLOYEE: [CallbackQueryHandler(button_callback, pattern="^delete_shift_emp_")],
-                DELETE_SHIFT_SELECT_DATE: [CallbackQueryHandler(button_callback, pattern="^delete_shift_confirm_")],
+                DELETE_SHIFT_SELECT_STORE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("delete_shift_store_"))],
+                DELETE_SHIFT_SELECT_EMPLOYEE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("delete_shift_emp_"))],
+                DELETE_SHIFT_SELECT_DATE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("delete_shift_confirm_"))],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
             allow_reentry=True
@@ -4427,11 +3198,11 @@ async def main():
         
         # ConversationHandler для добавления сотрудников
         add_employee_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(button_callback, pattern="^add_employee_start$")],
+            entry_points=[CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_employee_start"))],
             states={
                 ADD_EMPLOYEE_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_employee_enter_name)],
-                ADD_EMPLOYEE_POSITION: [CallbackQueryHandler(button_callback, pattern="^add_emp_pos_")],
-                ADD_EMPLOYEE_STORE: [CallbackQueryHandler(button_callback, pattern="^add_emp_store_")],
+                ADD_EMPLOYEE_POSITION: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_emp_pos_"))],
+                ADD_EMPLOYEE_STORE: [CallbackQueryHandler(button_callback, pattern=callbacks.pattern("add_emp_store_"))],
             },
             fallbacks=[CommandHandler("cancel", cancel)],
             allow_reentry=True
@@ -4444,6 +3215,7 @@ async def main():
         app.add_handler(CommandHandler("timesheet", timesheet))
         app.add_handler(CommandHandler("stats", stats))
         app.add_handler(CommandHandler("admin", admin_panel))
+        app.add_handler(CommandHandler("rebuild_stats", rebuild_stats))
         app.add_handler(CommandHandler("cancel", cancel_registration))
         
         # Обработчик текстовых сообщений
@@ -4460,6 +3232,8 @@ async def main():
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}", exc_info=True)
         raise
+    finally:
+        await storage.close()
 
 if __name__ == '__main__':
     try:
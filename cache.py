@@ -0,0 +1,581 @@
+"""Кэши в памяти процесса поверх хранилища.
+
+CachedStorage оборачивает выбранное хранилище (SQLite или PostgreSQL):
+часто читаемые данные отдаются из памяти, а операции, которые их меняют,
+сразу сбрасывают соответствующие записи. Срок жизни записей ограничивает
+расхождение, если базу меняет другой процесс бота.
+"""
+import functools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Настройки кэша сотрудников
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '5000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+# Справочники меняются редко; срок жизни нужен только для других процессов бота
+REFERENCE_CACHE_TTL = float(os.getenv('REFERENCE_CACHE_TTL', '600'))
+# Готовые тексты отчетов администратора
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '200'))
+REPORT_CACHE_TTL = float(os.getenv('REPORT_CACHE_TTL', '60'))
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Ограниченный LRU-кэш со сроком жизни записей и счетчиками.
+
+    Значение None тоже кэшируется (например, «пользователь не зарегистрирован»).
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._clock = clock
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+        # Растет при каждом сбросе: значение, прочитанное из базы до сброса, не кэшируется
+        self.generation = 0
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        """Значение по ключу или default, если записи нет или она устарела"""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+            self.expired += 1
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any):
+        """Сохранить значение, вытеснив самую старую запись при переполнении"""
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def invalidate(self, key: Hashable = _MISSING):
+        """Сбросить запись по ключу или, без ключа, весь кэш"""
+        self.generation += 1
+        if key is _MISSING:
+            self.invalidated += len(self._data)
+            self._data.clear()
+        elif self._data.pop(key, None) is not None:
+            self.invalidated += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Счетчики для логов"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'invalidated': self.invalidated,
+        }
+
+
+class ReferenceCache:
+    """Снимки справочников (магазины, должности, супер-админы) с общим номером версии.
+
+    Любое изменение справочника увеличивает версию; снимок, загруженный
+    при другой версии, считается устаревшим и перечитывается. Снимки -
+    кортежи, их можно отдавать всем читателям без копирования.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self.version = 0
+        self._snapshots: Dict[str, Tuple[int, float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str) -> Any:
+        """Снимок справочника текущей версии или _MISSING"""
+        entry = self._snapshots.get(name)
+        if entry is not None:
+            version, expires, value = entry
+            if version == self.version and expires > self._clock():
+                self.hits += 1
+                return value
+        self.misses += 1
+        return _MISSING
+
+    def put(self, name: str, version: int, value: Any):
+        """Сохранить снимок, прочитанный при версии version"""
+        self._snapshots[name] = (version, self._clock() + self.ttl, value)
+
+    def bump(self):
+        """Отметить, что справочники изменились"""
+        self.version += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Счетчики для логов"""
+        return {'version': self.version, 'hits': self.hits, 'misses': self.misses}
+
+
+class ActiveShiftIndex:
+    """Открытые смены в памяти: (user_id, дата) -> (ID смены, начало).
+
+    Загружается из базы при старте и обновляется результатами записей
+    открытия, закрытия и удаления смен, поэтому верен, пока этот процесс -
+    единственный писатель (SQLite). До загрузки индекс не используется.
+    date_of - рабочая дата по началу смены, exists_error - исключение
+    хранилища для уже открытой смены.
+    """
+
+    def __init__(self, date_of: Callable[[int], str], exists_error: Callable[[int, int], Exception]):
+        self.date_of = date_of
+        self._exists_error = exists_error
+        self._by_date: Dict[str, Dict[int, Tuple[int, int]]] = {}
+        self._by_id: Dict[int, Tuple[int, str]] = {}
+        self.loaded = False
+        # Счетчик изменений и записи, которые сейчас перечитываются из базы:
+        # (user_id, дата) -> [число чтений, номер последнего изменения записи]
+        self._changes = 0
+        self._refreshing: Dict[Tuple[int, str], List[int]] = {}
+
+    def load(self, rows: List[Tuple[int, int, str, int]]):
+        """Заполнить индекс строками (ID, user_id, дата, начало)"""
+        self._by_date.clear()
+        self._by_id.clear()
+        for shift_id, user_id, date_str, check_in in rows:
+            self._put(shift_id, user_id, date_str, check_in)
+        self.loaded = True
+
+    def get(self, user_id: int, date_str: str) -> Optional[Tuple[int, int]]:
+        """Открытая смена сотрудника за дату: (ID, начало) или None"""
+        return self._by_date.get(date_str, {}).get(user_id)
+
+    def ensure_free(self, user_id: int, check_in: int):
+        """Исключение хранилища, если у сотрудника уже открыта смена за этот день"""
+        active = self.get(user_id, self.date_of(check_in))
+        if active:
+            raise self._exists_error(*active)
+
+    def on_date(self, date_str: str) -> Dict[int, Tuple[int, int]]:
+        """Открытые смены за дату: user_id -> (ID, начало)"""
+        return self._by_date.get(date_str, {})
+
+    def key(self, shift_id: int) -> Optional[Tuple[int, str]]:
+        """(user_id, дата) открытой смены или None"""
+        return self._by_id.get(shift_id)
+
+    def add(self, shift_id: int, user_id: int, check_in: int):
+        """Учесть открытую смену"""
+        self._put(shift_id, user_id, self.date_of(check_in), check_in)
+
+    def _put(self, shift_id: int, user_id: int, date_str: str, check_in: int):
+        self._by_date.setdefault(date_str, {})[user_id] = (shift_id, check_in)
+        self._by_id[shift_id] = (user_id, date_str)
+        self._touch(user_id, date_str)
+
+    def _touch(self, user_id: int, date_str: str):
+        self._changes += 1
+        refreshing = self._refreshing.get((user_id, date_str))
+        if refreshing:
+            refreshing[1] = self._changes
+
+    def begin_refresh(self, user_id: int, date_str: str) -> int:
+        """Начать перечитывание записи сотрудника за дату; метка для replace"""
+        self._refreshing.setdefault((user_id, date_str), [0, 0])[0] += 1
+        return self._changes
+
+    def replace(self, user_id: int, date_str: str, active: Optional[Tuple[int, int]], since: int):
+        """Записать прочитанную из базы смену (ID, начало) или ее отсутствие.
+
+        Если запись изменилась после begin_refresh (успешная запись
+        открыла или закрыла смену), прочитанное могло устареть и не применяется.
+        """
+        if self._refreshing[(user_id, date_str)][1] > since:
+            return
+        current = self.get(user_id, date_str)
+        if current:
+            self.remove(current[0])
+        if active:
+            self._put(active[0], user_id, date_str, active[1])
+
+    def end_refresh(self, user_id: int, date_str: str):
+        """Завершить перечитывание, начатое begin_refresh"""
+        key = (user_id, date_str)
+        self._refreshing[key][0] -= 1
+        if not self._refreshing[key][0]:
+            del self._refreshing[key]
+
+    def remove(self, shift_id: int):
+        """Убрать смену (закрыта или удалена)"""
+        key = self._by_id.pop(shift_id, None)
+        if key is None:
+            return
+        user_id, date_str = key
+        self._touch(user_id, date_str)
+        shifts = self._by_date.get(date_str)
+        if shifts and shifts.get(user_id, (None,))[0] == shift_id:
+            del shifts[user_id]
+            if not shifts:
+                del self._by_date[date_str]
+
+    def remove_user(self, user_id: int):
+        """Убрать все смены сотрудника (сотрудник удален)"""
+        for shift_id in [sid for sid, (uid, _) in self._by_id.items() if uid == user_id]:
+            self.remove(shift_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+def _changes_data(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Обновить версии данных, которые меняет операция записи, после ее успеха"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        result = await method(self, *args, **kwargs)
+        self._changed(method.__name__)
+        return result
+    return wrapper
+
+
+class CachedStorage:
+    """Хранилище с кэшем сотрудников, ролей, справочников и отчетов.
+
+    get_user и справочники отдаются из кэша; операции, меняющие сотрудника,
+    его права или справочники, после выполнения сбрасывают нужные записи.
+    write_operations - какие данные (смены, сотрудники, запросы) меняет
+    каждая операция записи: успешная запись увеличивает версии этих данных,
+    и только отчеты (render), которые от них зависят, собираются заново.
+    Неудачная запись в транзакции ничего не меняет и версий не трогает.
+    Остальные операции передаются хранилищу без изменений.
+    """
+
+    def __init__(self, backend: Any, user_cache: Optional[LRUCache] = None,
+                 reference_cache: Optional[ReferenceCache] = None,
+                 active_shifts: Optional[ActiveShiftIndex] = None,
+                 report_cache: Optional[LRUCache] = None,
+                 write_operations: Mapping[str, FrozenSet[str]] = {}):
+        self.backend = backend
+        self.users = user_cache or LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self.references = reference_cache or ReferenceCache(REFERENCE_CACHE_TTL)
+        # Индекс открытых смен включается только для единственного писателя
+        self.active_shifts = active_shifts
+        self.reports = report_cache or LRUCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL)
+        self.write_operations = write_operations
+        # Версии данных: название -> число успешных записей, которые их меняли
+        self.data_versions: Dict[str, int] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.backend, name)
+        if not self.write_operations.get(name):
+            return attr
+
+        async def call(*args, **kwargs):
+            result = await attr(*args, **kwargs)
+            self._changed(name)
+            return result
+        return call
+
+    def _changed(self, operation: str):
+        for data in self.write_operations.get(operation, ()):
+            self.data_versions[data] = self.data_versions.get(data, 0) + 1
+
+    def _versions(self, depends: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.data_versions.get(data, 0) for data in depends)
+
+    async def start(self):
+        """Подготовить хранилище и загрузить индекс открытых смен"""
+        await self.backend.start()
+        if self.active_shifts is not None:
+            self.active_shifts.load(await self.backend.get_working_shifts())
+
+    def _shift_index(self) -> Optional[ActiveShiftIndex]:
+        if self.active_shifts is not None and self.active_shifts.loaded:
+            return self.active_shifts
+        return None
+
+    def cache_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики всех кэшей"""
+        metrics = {
+            'users': self.users.snapshot(),
+            'references': self.references.snapshot(),
+            'reports': self.reports.snapshot(),
+        }
+        if self._shift_index() is not None:
+            metrics['active_shifts'] = {'size': len(self.active_shifts)}
+        return metrics
+
+    async def render(self, key: Hashable, build: Callable[[], Awaitable[Any]], depends: Iterable[str]) -> Any:
+        """Готовый отчет по ключу для текущих версий данных depends; при промахе - build()"""
+        depends = tuple(depends)
+        version = self._versions(depends)
+        versioned_key = (key, version)
+        value = self.reports.get(versioned_key)
+        if value is _MISSING:
+            value = await build()
+            # Отчет, собранный во время записи, мог захватить часть изменений
+            if version == self._versions(depends):
+                self.reports.put(versioned_key, value)
+        return value
+
+    # Открытые смены
+    async def get_active_shift(self, user_id: int, date_str: str) -> Optional[Tuple]:
+        """Активная смена пользователя: (ID, начало) или None"""
+        index = self._shift_index()
+        if index is not None:
+            return index.get(user_id, date_str)
+        return await self.backend.get_active_shift(user_id, date_str)
+
+    @_changes_data
+    async def open_shift(self, user_id: int, check_in: int) -> int:
+        """Открыть смену. ActiveShiftExists, если смена уже открыта"""
+        index = self._shift_index()
+        if index is not None:
+            index.ensure_free(user_id, check_in)
+        try:
+            shift_id = await self.backend.open_shift(user_id, check_in)
+        except Exception:
+            # Например, ActiveShiftExists для смены, которой нет в индексе
+            if index is not None:
+                await self._refresh_shift(user_id, index.date_of(check_in))
+            raise
+        if index is not None:
+            index.add(shift_id, user_id, check_in)
+        return shift_id
+
+    @_changes_data
+    async def close_shift(self, shift_id: int, check_out: int) -> int:
+        """Закрыть смену, вернуть минуты. ShiftNotActive, если она уже закрыта"""
+        key = self._shift_key(shift_id)
+        try:
+            minutes = await self.backend.close_shift(shift_id, check_out)
+        except Exception:
+            await self._refresh_shift(*key)
+            raise
+        if self.active_shifts is not None:
+            self.active_shifts.remove(shift_id)
+        return minutes
+
+    @_changes_data
+    async def delete_shift(self, shift_id: int) -> bool:
+        """Удалить смену по ID"""
+        key = self._shift_key(shift_id)
+        try:
+            deleted = await self.backend.delete_shift(shift_id)
+        except Exception:
+            await self._refresh_shift(*key)
+            raise
+        if self.active_shifts is not None:
+            self.active_shifts.remove(shift_id)
+        return deleted
+
+    def _shift_key(self, shift_id: int) -> Tuple[Optional[int], Optional[str]]:
+        index = self._shift_index()
+        key = index.key(shift_id) if index is not None else None
+        return key or (None, None)
+
+    async def _refresh_shift(self, user_id: Optional[int], date_str: Optional[str]):
+        # После неудачной записи состояние смены неизвестно - перечитываем из базы
+        # только запись этого сотрудника за дату. Весь индекс не перезагружается:
+        # записи, успевшие пройти во время чтения, были бы потеряны
+        index = self._shift_index()
+        if index is None or user_id is None:
+            return
+        since = index.begin_refresh(user_id, date_str)
+        try:
+            index.replace(user_id, date_str, await self.backend.get_active_shift(user_id, date_str), since)
+        except Exception as e:
+            logger.error(f"Не удалось перечитать открытую смену {user_id} за {date_str}: {e}")
+        finally:
+            index.end_refresh(user_id, date_str)
+
+    async def get_open_shifts(self, date_str: str) -> List[Tuple]:
+        """Открытые смены за дату: ФИО, магазин, должность, начало, user_id"""
+        index = self._shift_index()
+        if index is None:
+            return await self.backend.get_open_shifts(date_str)
+
+        rows = []
+        for user_id, (_, check_in) in list(index.on_date(date_str).items()):
+            user = await self.get_user(user_id)
+            if user:
+                full_name, position, store = user[:3]
+                rows.append((full_name, store, position, check_in, user_id))
+        rows.sort(key=lambda row: (row[1], row[0]))
+        return rows
+
+    async def _reference(self, name: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.references.get(name)
+        if value is _MISSING:
+            version = self.references.version
+            value = await load()
+            self.references.put(name, version, value)
+        return value
+
+    # Справочники
+    async def get_positions(self) -> Tuple[Tuple[int, str], ...]:
+        """Список всех должностей (ID, название)"""
+        return await self._reference(
+            'positions', lambda: self._snapshot(self.backend.get_positions)
+        )
+
+    async def get_position(self, position_id: int) -> Optional[str]:
+        """Название должности по ID"""
+        positions = await self._reference(
+            'positions_by_id', lambda: self._index(self.get_positions, lambda row: row[1])
+        )
+        return positions.get(position_id)
+
+    async def get_stores(self) -> Tuple[Tuple[int, str, str], ...]:
+        """Список всех магазинов (ID, название, адрес)"""
+        return await self._reference(
+            'stores', lambda: self._snapshot(self.backend.get_stores)
+        )
+
+    async def get_store(self, store_id: int) -> Optional[Tuple[str, str]]:
+        """Название и адрес магазина по ID"""
+        stores = await self._reference(
+            'stores_by_id', lambda: self._index(self.get_stores, lambda row: row[1:])
+        )
+        return stores.get(store_id)
+
+    async def get_super_admins(self) -> Tuple[Tuple[int, str], ...]:
+        """Список супер-администраторов"""
+        return await self._reference(
+            'super_admins', lambda: self._snapshot(self.backend.get_super_admins)
+        )
+
+    @staticmethod
+    async def _snapshot(load: Callable[[], Awaitable[List[Tuple]]]) -> Tuple[Tuple, ...]:
+        return tuple(tuple(row) for row in await load())
+
+    @staticmethod
+    async def _index(load: Callable[[], Awaitable[Tuple[Tuple, ...]]],
+                     value: Callable[[Tuple], Any]) -> Dict[int, Any]:
+        return {row[0]: value(row) for row in await load()}
+
+    @_changes_data
+    async def create_position(self, *args, **kwargs) -> bool:
+        """Создать должность и обновить версию справочников"""
+        try:
+            return await self.backend.create_position(*args, **kwargs)
+        finally:
+            self.references.bump()
+
+    @_changes_data
+    async def delete_position(self, position_id: int) -> Tuple[str, int]:
+        """Удалить должность и обновить версию справочников"""
+        try:
+            return await self.backend.delete_position(position_id)
+        finally:
+            self.references.bump()
+
+    @_changes_data
+    async def create_store(self, *args, **kwargs) -> bool:
+        """Создать магазин и обновить версию справочников"""
+        try:
+            return await self.backend.create_store(*args, **kwargs)
+        finally:
+            self.references.bump()
+
+    @_changes_data
+    async def delete_store(self, store_id: int) -> int:
+        """Удалить магазин и обновить версию справочников"""
+        try:
+            return await self.backend.delete_store(store_id)
+        finally:
+            self.references.bump()
+
+    # Сотрудники
+    async def get_user(self, user_id: int) -> Optional[Tuple]:
+        """Получить информацию о пользователе (из кэша, если есть)"""
+        user = self.users.get(user_id)
+        if user is _MISSING:
+            generation = self.users.generation
+            user = await self.backend.get_user(user_id)
+            if generation == self.users.generation:
+                self.users.put(user_id, user)
+        return user
+
+    @_changes_data
+    async def add_employee(self, user_id: int, full_name: str, position_id: int, store_id: int,
+                           reg_date: str, is_admin: int = 0, is_super_admin: int = 0,
+                           can_request_admin: int = 0) -> bool:
+        """Добавить сотрудника и сбросить его запись в кэше"""
+        try:
+            return await self.backend.add_employee(user_id, full_name, position_id, store_id, reg_date,
+                                                   is_admin, is_super_admin, can_request_admin)
+        finally:
+            self.users.invalidate(user_id)
+            if is_super_admin:
+                self.references.bump()
+
+    @_changes_data
+    async def add_first_super_admin(self, user_id: int, *args, **kwargs):
+        """Зарегистрировать первого супер-администратора (и его должность с магазином)"""
+        try:
+            return await self.backend.add_first_super_admin(user_id, *args, **kwargs)
+        finally:
+            self.users.invalidate(user_id)
+            self.references.bump()
+
+    @_changes_data
+    async def add_offline_employee(self, *args, **kwargs) -> int:
+        """Добавить сотрудника без Telegram"""
+        user_id = await self.backend.add_offline_employee(*args, **kwargs)
+        self.users.invalidate(user_id)
+        return user_id
+
+    @_changes_data
+    async def make_admin(self, user_id: int) -> Optional[str]:
+        """Назначить администратора и сбросить его запись"""
+        try:
+            return await self.backend.make_admin(user_id)
+        finally:
+            self.users.invalidate(user_id)
+
+    @_changes_data
+    async def set_super_admin(self, user_id: int):
+        """Назначить супер-администратора и сбросить его запись"""
+        try:
+            return await self.backend.set_super_admin(user_id)
+        finally:
+            self.users.invalidate(user_id)
+            self.references.bump()
+
+    @_changes_data
+    async def approve_admin_request(self, request_id: int, reg_date: str) -> Optional[Tuple]:
+        """Одобрить заявку на админа и сбросить запись заявителя"""
+        request = await self.backend.approve_admin_request(request_id, reg_date)
+        if request:
+            self.users.invalidate(request[0])
+            # Должность и магазин из заявки могли быть созданы
+            self.references.bump()
+        return request
+
+    @_changes_data
+    async def approve_delete_request(self, request_id: int) -> Tuple[str, Optional[Tuple], int]:
+        """Одобрить запрос на удаление и сбросить запись удаленного сотрудника"""
+        status, request, emp_count = await self.backend.approve_delete_request(request_id)
+        if status == 'approved':
+            if request[0] == 'employee':
+                self.users.invalidate(int(request[1]))
+                if self.active_shifts is not None:
+                    self.active_shifts.remove_user(int(request[1]))
+            self.references.bump()
+        return status, request, emp_count
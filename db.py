@@ -0,0 +1,1602 @@
+import os
+import asyncio
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, FrozenSet, List, Tuple, Optional, Iterator
+
+import cache
+import migrations
+from shifts import ActiveShiftExists, ShiftError, ShiftNotActive, UTC_OFFSET, local_date
+
+logger = logging.getLogger(__name__)
+
+# Настройки подключения к базе данных
+# DB_BACKEND: sqlite (файл DB_PATH) или postgres (строка подключения DB_DSN)
+DB_BACKEND = os.getenv('DB_BACKEND', 'sqlite')
+DB_DSN = os.getenv('DB_DSN', '')
+DB_PATH = os.getenv('DB_PATH', 'timesheet.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+DB_READER_THREADS = int(os.getenv('DB_READER_THREADS', '3'))
+DB_STATEMENT_CACHE = 256
+DB_PROFILE = os.getenv('DB_PROFILE', 'wal')
+DB_CHECKPOINT_INTERVAL = int(os.getenv('DB_CHECKPOINT_INTERVAL', '300'))
+DB_CHECKPOINT_TRUNCATE_PAGES = int(os.getenv('DB_CHECKPOINT_TRUNCATE_PAGES', '10000'))
+# Как часто сверять счетчики неподтвержденных смен с табелем (секунды, 0 - не сверять)
+UNCONFIRMED_RECONCILE_INTERVAL = int(os.getenv('UNCONFIRMED_RECONCILE_INTERVAL', '3600'))
+DB_BATCH_WINDOW_MS = float(os.getenv('DB_BATCH_WINDOW_MS', '5'))
+DB_BATCH_MAX_SIZE = int(os.getenv('DB_BATCH_MAX_SIZE', '200'))
+
+# Профили настройки SQLite: PRAGMA -> значение.
+# legacy - поведение до перехода на WAL (журнал отката, полная синхронизация)
+TUNING_PROFILES: Dict[str, Dict[str, Any]] = {
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # в КиБ
+        # temp_store=MEMORY на бенчмарке замедлял GROUP BY отчетов, задается через DB_TEMP_STORE
+        'busy_timeout': 5000,  # мс
+    },
+}
+TUNING_PRAGMAS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store', 'busy_timeout')
+
+
+def load_tuning(profile: Optional[str] = None) -> Dict[str, Any]:
+    """Настройки SQLite: профиль плюс переопределения из DB_<PRAGMA> в окружении"""
+    profile = profile or DB_PROFILE
+    if profile not in TUNING_PROFILES:
+        raise ValueError(f"Неизвестный профиль SQLite: {profile}")
+
+    tuning = dict(TUNING_PROFILES[profile])
+    for pragma in TUNING_PRAGMAS:
+        value = os.getenv(f'DB_{pragma.upper()}')
+        if value:
+            tuning[pragma] = value
+    return tuning
+
+
+# Пул долгоживущих соединений
+class ConnectionPool:
+    """Пул постоянных соединений с SQLite.
+
+    Соединения открываются лениво и возвращаются в пул после использования,
+    поэтому кэш схемы и подготовленных запросов переживает отдельные вызовы.
+    """
+
+    def __init__(self, path: str, size: int, tuning: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.size = max(1, size)
+        self.tuning = tuning or {}
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть новое соединение"""
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        # Каскадное удаление смен работает только с включенными внешними ключами
+        conn.execute("PRAGMA foreign_keys = ON")
+        for pragma, value in self.tuning.items():
+            if pragma not in TUNING_PRAGMAS:
+                raise ValueError(f"Недопустимая настройка SQLite: {pragma}")
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула (или открыть новое, если лимит не исчерпан)"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                conn = self._connect()
+                self._created += 1
+                self._all.append(conn)
+                return conn
+
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        """Вернуть соединение в пул"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение для чтения"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Соединение с транзакцией: commit при успехе, rollback при ошибке"""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Закрыть все соединения пула"""
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка при закрытии соединения: {e}")
+            self._all.clear()
+            self._created = 0
+            self._idle = queue.LifoQueue()
+
+
+pool = ConnectionPool(DB_PATH, DB_POOL_SIZE, load_tuning())
+
+# Реестр операций репозитория: имя -> (тип, функция)
+OPERATIONS: Dict[str, Tuple[str, Callable]] = {}
+
+
+def reader(func: Callable) -> Callable:
+    """Пометить функцию репозитория как операцию чтения"""
+    OPERATIONS[func.__name__] = ('read', func)
+    return func
+
+
+def writer(func: Callable) -> Callable:
+    """Пометить функцию репозитория как операцию записи"""
+    OPERATIONS[func.__name__] = ('write', func)
+    return func
+
+
+# Групповая запись отметок
+class BatchMetrics:
+    """Счетчики размера пакетов и времени их фиксации"""
+
+    SIZE_BUCKETS = (1, 4, 16, 64)
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+        self.max_size = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.size_histogram = {bucket: 0 for bucket in self.SIZE_BUCKETS + (None,)}
+
+    def record(self, size: int, seconds: float, failed: bool = False):
+        """Учесть один зафиксированный пакет"""
+        self.batches += 1
+        self.items += size
+        self.failed_batches += int(failed)
+        self.max_size = max(self.max_size, size)
+        self.commit_seconds += seconds
+        self.max_commit_seconds = max(self.max_commit_seconds, seconds)
+        bucket = next((b for b in self.SIZE_BUCKETS if size <= b), None)
+        self.size_histogram[bucket] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов и бенчмарка"""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'failed_batches': self.failed_batches,
+            'avg_size': self.items / self.batches if self.batches else 0.0,
+            'max_size': self.max_size,
+            'avg_commit_ms': self.commit_seconds * 1000 / self.batches if self.batches else 0.0,
+            'max_commit_ms': self.max_commit_seconds * 1000,
+            'size_histogram': {
+                (f"<={bucket}" if bucket else f">{self.SIZE_BUCKETS[-1]}"): count
+                for bucket, count in self.size_histogram.items()
+            },
+        }
+
+
+class WriteBatcher:
+    """Собирает записи табеля за короткое окно и фиксирует их одной транзакцией.
+
+    Каждый вызывающий получает свой результат (ID смены) или свое исключение
+    (например, ActiveShiftExists); ошибка одной записи не откатывает остальные.
+    """
+
+    def __init__(self, database: 'AsyncDatabase', window_ms: float = DB_BATCH_WINDOW_MS,
+                 max_size: int = DB_BATCH_MAX_SIZE):
+        self._database = database
+        self.window = max(0.0, window_ms) / 1000
+        self.max_size = max(1, max_size)
+        self.metrics = BatchMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, operation: str, *args) -> Any:
+        """Поставить операцию в очередь и дождаться ее результата"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self._queue.put_nowait((operation, args, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.window:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, tuple, asyncio.Future]]):
+        started = time.perf_counter()
+        try:
+            results = await self._database.run(
+                'write', apply_batch, [(operation, args) for operation, args, _ in batch]
+            )
+        except Exception as e:
+            self.metrics.record(len(batch), time.perf_counter() - started, failed=True)
+            logger.error(f"Ошибка при записи пакета из {len(batch)} операций: {e}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.metrics.record(len(batch), time.perf_counter() - started)
+        for (ok, value), (_, _, future) in zip(results, batch):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def cancel(self):
+        """Остановить фоновую задачу (операции в очереди не выполняются)"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+
+# Асинхронный фасад над репозиторием
+class AsyncDatabase:
+    """Асинхронный доступ к репозиторию без блокировки event loop.
+
+    Все записи выполняются по очереди в одном потоке-писателе,
+    чтения - в небольшом пуле потоков. Обработчики вызывают
+    `await storage.get_user(user_id)` вместо синхронного `get_user`.
+    """
+
+    def __init__(self, reader_threads: int = DB_READER_THREADS):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, reader_threads), thread_name_prefix='db-reader'
+        )
+        self.batcher = WriteBatcher(self)
+
+    async def run(self, kind: str, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить синхронную функцию в исполнителе нужного типа"""
+        executor = self._writer if kind == 'write' else self._readers
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str) -> Callable:
+        try:
+            kind, func = OPERATIONS[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        async def call(*args, **kwargs):
+            return await self.run(kind, func, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = func.__doc__
+        return call
+
+    async def open_shift(self, user_id: int, check_in: int) -> int:
+        """Открыть смену через групповую запись. ActiveShiftExists, если смена уже открыта"""
+        return await self.batcher.submit('open_shift', user_id, check_in)
+
+    async def close_shift(self, shift_id: int, check_out: int) -> int:
+        """Закрыть смену через групповую запись, вернуть минуты. ShiftNotActive, если она уже закрыта"""
+        return await self.batcher.submit('close_shift', shift_id, check_out)
+
+    async def start(self):
+        """Создать или обновить схему базы"""
+        await self.run('write', init_database)
+
+    async def close(self):
+        """Остановить исполнители и закрыть соединения"""
+        self.shutdown()
+        pool.close_all()
+
+    def shutdown(self):
+        """Остановить потоки исполнителей"""
+        self.batcher.cancel()
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+def _limit(limit: Optional[int]) -> int:
+    """LIMIT для SQLite: -1 - без предела"""
+    return -1 if limit is None else limit
+
+
+# Инициализация базы данных
+def init_database():
+    """Создание и обновление схемы базы данных"""
+    with pool.connection() as conn:
+        version = migrations.migrate(conn)
+    logger.info(f"Database initialized successfully (schema version {version})")
+
+
+@writer
+def checkpoint() -> Tuple[int, int, int]:
+    """Перенести WAL в основной файл базы.
+
+    Обычно выполняется PASSIVE-checkpoint, который не ждет читателей;
+    если журнал разросся больше DB_CHECKPOINT_TRUNCATE_PAGES страниц,
+    он переносится целиком и обрезается. Возвращает (busy, страниц в журнале, перенесено).
+    """
+    with pool.connection() as conn:
+        busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        if log_pages > DB_CHECKPOINT_TRUNCATE_PAGES:
+            busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return busy, log_pages, checkpointed
+
+
+# Дневные сводки
+def _shift_key(conn: sqlite3.Connection, shift_id: int) -> Optional[Tuple[int, str]]:
+    """(user_id, date) смены для обновления сводок"""
+    return conn.execute("SELECT user_id, date FROM timesheet WHERE id = ?", (shift_id,)).fetchone()
+
+
+def _add_store_day(conn: sqlite3.Connection, store_id: int, date_str: str, minutes: int,
+                   shifts: int, confirmed: int, confirmed_minutes: int, employees: int):
+    conn.execute('''
+        INSERT INTO daily_store_stats (store_id, date, minutes, shifts, confirmed, confirmed_minutes, employees)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (store_id, date) DO UPDATE SET
+            minutes = minutes + excluded.minutes,
+            shifts = shifts + excluded.shifts,
+            confirmed = confirmed + excluded.confirmed,
+            confirmed_minutes = confirmed_minutes + excluded.confirmed_minutes,
+            employees = employees + excluded.employees
+    ''', (store_id, date_str, minutes, shifts, confirmed, confirmed_minutes, employees))
+    conn.execute(
+        "DELETE FROM daily_store_stats WHERE store_id = ? AND date = ? AND employees <= 0",
+        (store_id, date_str)
+    )
+    _add_store_unconfirmed(conn, store_id, shifts - confirmed)
+
+
+def _add_store_unconfirmed(conn: sqlite3.Connection, store_id: int, delta: int):
+    if delta:
+        conn.execute('''
+            INSERT INTO store_unconfirmed (store_id, unconfirmed)
+            VALUES (?, ?)
+            ON CONFLICT (store_id) DO UPDATE SET unconfirmed = unconfirmed + excluded.unconfirmed
+        ''', (store_id, delta))
+
+
+def _refresh_rollups(conn: sqlite3.Connection, keys):
+    """Пересчитать сводки для пар (user_id, date) в текущей транзакции.
+
+    Строка сотрудника за день считается заново по табелю (это несколько строк
+    по индексу), а в сводку магазина добавляется разница со старым значением.
+    """
+    for user_id, date_str in set(keys):
+        old = conn.execute('''
+            SELECT store_id, minutes, shifts, confirmed, confirmed_minutes
+            FROM daily_user_stats
+            WHERE user_id = ? AND date = ?
+        ''', (user_id, date_str)).fetchone()
+        new = conn.execute('''
+            SELECT e.store_id, SUM(t.minutes), COUNT(*),
+                   SUM(t.confirmed = 1), SUM(CASE WHEN t.confirmed = 1 THEN t.minutes ELSE 0 END)
+            FROM timesheet t
+            JOIN employees e ON e.user_id = t.user_id
+            WHERE t.user_id = ? AND t.date = ? AND t.status = 'completed'
+        ''', (user_id, date_str)).fetchone()
+
+        if old:
+            store_id, minutes, shifts, confirmed, confirmed_minutes = old
+            _add_store_day(conn, store_id, date_str, -minutes, -shifts, -confirmed, -confirmed_minutes, -1)
+            conn.execute(
+                "DELETE FROM daily_user_stats WHERE user_id = ? AND date = ?", (user_id, date_str)
+            )
+
+        store_id, minutes, shifts, confirmed, confirmed_minutes = new
+        if shifts:
+            conn.execute('''
+                INSERT INTO daily_user_stats (user_id, date, store_id, minutes, shifts, confirmed, confirmed_minutes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, date_str, store_id, minutes, shifts, confirmed, confirmed_minutes))
+            _add_store_day(conn, store_id, date_str, minutes, shifts, confirmed, confirmed_minutes, 1)
+
+
+def _confirm_rollups(conn: sqlite3.Connection, where: str, params: tuple):
+    """Отметить дни как полностью подтвержденные после массового подтверждения"""
+    pending = conn.execute(f'''
+        SELECT store_id, SUM(shifts - confirmed)
+        FROM daily_store_stats
+        WHERE {where} AND confirmed < shifts
+        GROUP BY store_id
+    ''', params).fetchall()
+    for store_id, count in pending:
+        _add_store_unconfirmed(conn, store_id, -count)
+    for table in ('daily_user_stats', 'daily_store_stats'):
+        conn.execute(
+            f"UPDATE {table} SET confirmed = shifts, confirmed_minutes = minutes WHERE {where}", params
+        )
+
+
+@writer
+def rebuild_rollups() -> int:
+    """Пересчитать все дневные сводки из табеля. Возвращает число дней сотрудников"""
+    with pool.transaction() as conn:
+        migrations.fill_daily_rollups(conn)
+        migrations.fill_store_unconfirmed(conn)
+        return conn.execute("SELECT COUNT(*) FROM daily_user_stats").fetchone()[0]
+
+
+@writer
+def reconcile_unconfirmed_counts() -> Dict[int, Tuple[int, int]]:
+    """Сверить счетчики неподтвержденных смен с табелем и исправить расхождения.
+
+    Возвращает {ID магазина: (счетчик, фактическое количество)} для исправленных магазинов.
+    """
+    with pool.transaction() as conn:
+        actual = dict(conn.execute('''
+            SELECT e.store_id, COUNT(*)
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            WHERE t.status = 'completed' AND t.confirmed = 0
+            GROUP BY e.store_id
+        ''').fetchall())
+        counters = dict(conn.execute("SELECT store_id, unconfirmed FROM store_unconfirmed").fetchall())
+
+        drift = {}
+        for store_id in actual.keys() | counters.keys():
+            counter, count = counters.get(store_id, 0), actual.get(store_id, 0)
+            if counter != count:
+                drift[store_id] = (counter, count)
+                _add_store_unconfirmed(conn, store_id, count - counter)
+        conn.execute("DELETE FROM store_unconfirmed WHERE unconfirmed = 0")
+    return drift
+
+
+@reader
+def get_period_totals(start_date: str, end_date: str) -> Tuple[int, int, int, int]:
+    """Смены, минуты, подтвержденные смены и минуты за период по сводкам магазинов"""
+    with pool.connection() as conn:
+        shifts, minutes, confirmed, confirmed_minutes = conn.execute('''
+            SELECT SUM(shifts), SUM(minutes), SUM(confirmed), SUM(confirmed_minutes)
+            FROM daily_store_stats
+            WHERE date BETWEEN ? AND ?
+        ''', (start_date, end_date)).fetchone()
+    return shifts or 0, minutes or 0, confirmed or 0, confirmed_minutes or 0
+
+
+# Сотрудники
+@reader
+def get_user(user_id: int) -> Optional[Tuple]:
+    """Получить информацию о пользователе"""
+    with pool.connection() as conn:
+        return conn.execute(
+            '''
+            SELECT e.full_name, p.name, s.name, e.is_admin, e.is_super_admin, e.can_request_admin
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.user_id = ?
+            ''',
+            (user_id,)
+        ).fetchone()
+
+
+@reader
+def get_employee_card(user_id: int) -> Optional[Tuple]:
+    """Получить ФИО, должность и магазин сотрудника"""
+    with pool.connection() as conn:
+        return conn.execute(
+            '''
+            SELECT e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.user_id = ?
+            ''',
+            (user_id,)
+        ).fetchone()
+
+
+@reader
+def get_registration_counts() -> Tuple[int, int, int]:
+    """Количество супер-админов, должностей и магазинов"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM employees WHERE is_super_admin = 1),
+                (SELECT COUNT(*) FROM positions),
+                (SELECT COUNT(*) FROM stores)
+        ''').fetchone()
+
+
+@reader
+def get_super_admins() -> List[Tuple[int, str]]:
+    """Получить список супер-администраторов"""
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT user_id, full_name FROM employees WHERE is_super_admin = 1 ORDER BY full_name"
+        ).fetchall()
+
+
+@reader
+def get_employees_by_store(store_id: int = None) -> List[Tuple]:
+    """Получить список сотрудников по магазину"""
+    with pool.connection() as conn:
+        if store_id:
+            return conn.execute('''
+                SELECT e.user_id, e.full_name, p.name
+                FROM employees e
+                JOIN positions p ON p.id = e.position_id
+                WHERE e.store_id = ?
+                ORDER BY e.full_name
+            ''', (store_id,)).fetchall()
+        return conn.execute('''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            ORDER BY s.name, e.full_name
+        ''').fetchall()
+
+
+@reader
+def get_all_employees() -> List[Tuple]:
+    """Все сотрудники с ролями"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT e.full_name, p.name, s.name, e.is_admin, e.is_super_admin, e.can_request_admin
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            ORDER BY s.name, e.full_name
+        ''').fetchall()
+
+
+@reader
+def get_employees_with_shifts(date_str: str) -> List[Tuple]:
+    """Сотрудники по магазинам со сменами за дату"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT s.name, e.user_id, e.full_name, p.name, e.is_admin, e.is_super_admin, e.can_request_admin,
+                   t.status, t.check_in, t.check_out
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            LEFT JOIN timesheet t ON e.user_id = t.user_id AND t.date = ?
+            ORDER BY s.name, e.full_name
+        ''', (date_str,)).fetchall()
+
+
+@reader
+def get_deletable_employees(limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Сотрудники, которых можно предложить к удалению (не супер-админы); limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.is_super_admin = 0
+            ORDER BY s.name, e.full_name, e.user_id
+            LIMIT ? OFFSET ?
+        ''', (_limit(limit), offset)).fetchall()
+
+
+@reader
+def get_admins_for_promotion(limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Администраторы, которых можно назначить супер-админами; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.is_admin = 1 AND e.is_super_admin = 0
+            ORDER BY s.name, e.full_name, e.user_id
+            LIMIT ? OFFSET ?
+        ''', (_limit(limit), offset)).fetchall()
+
+
+@reader
+def get_regular_employees(limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Обычные сотрудники без прав администратора; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.is_admin = 0 AND e.is_super_admin = 0
+            ORDER BY s.name, e.full_name, e.user_id
+            LIMIT ? OFFSET ?
+        ''', (_limit(limit), offset)).fetchall()
+
+
+@writer
+def add_employee(user_id: int, full_name: str, position_id: int, store_id: int, reg_date: str,
+                 is_admin: int = 0, is_super_admin: int = 0, can_request_admin: int = 0) -> bool:
+    """Добавить сотрудника. False, если такой user_id уже зарегистрирован"""
+    with pool.transaction() as conn:
+        if conn.execute("SELECT 1 FROM employees WHERE user_id = ?", (user_id,)).fetchone():
+            return False
+        conn.execute('''
+            INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin))
+    return True
+
+
+def _reference_ids(conn: sqlite3.Connection, position: str, store: str,
+                   created_by: int, created_date: str) -> Tuple[int, int]:
+    """ID должности и магазина по названиям, недостающие создаются"""
+    conn.execute(
+        "INSERT OR IGNORE INTO positions (name, created_by, created_date) VALUES (?, ?, ?)",
+        (position, created_by, created_date)
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO stores (name, address, created_by, created_date) VALUES (?, '', ?, ?)",
+        (store, created_by, created_date)
+    )
+    position_id = conn.execute("SELECT id FROM positions WHERE name = ?", (position,)).fetchone()[0]
+    store_id = conn.execute("SELECT id FROM stores WHERE name = ?", (store,)).fetchone()[0]
+    return position_id, store_id
+
+
+@writer
+def add_first_super_admin(user_id: int, full_name: str, reg_date: str,
+                          position: str = "Администратор", store: str = "Главный офис"):
+    """Зарегистрировать первого супер-администратора вместе с его должностью и магазином"""
+    with pool.transaction() as conn:
+        position_id, store_id = _reference_ids(conn, position, store, user_id, reg_date)
+        conn.execute('''
+            INSERT OR IGNORE INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin)
+            VALUES (?, ?, ?, ?, ?, 1, 1)
+        ''', (user_id, full_name, position_id, store_id, reg_date))
+
+
+@writer
+def add_offline_employee(full_name: str, position_id: int, store_id: int, reg_date: str,
+                         can_request_admin: int = 0) -> int:
+    """Добавить сотрудника без Telegram со случайным отрицательным ID"""
+    with pool.transaction() as conn:
+        # Генерируем случайный user_id, которого ещё нет в базе
+        while True:
+            temp_user_id = -random.randint(10000, 99999)
+            if not conn.execute("SELECT 1 FROM employees WHERE user_id = ?", (temp_user_id,)).fetchone():
+                break
+
+        conn.execute('''
+            INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (temp_user_id, full_name, position_id, store_id, reg_date, 0, 0, can_request_admin))
+    return temp_user_id
+
+
+@writer
+def make_admin(user_id: int) -> Optional[str]:
+    """Назначить сотрудника администратором. Возвращает ФИО или None"""
+    with pool.transaction() as conn:
+        row = conn.execute("SELECT full_name FROM employees WHERE user_id = ?", (user_id,)).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE employees SET is_admin = 1 WHERE user_id = ?", (user_id,))
+    return row[0]
+
+
+@writer
+def set_super_admin(user_id: int):
+    """Назначить супер-администратора"""
+    with pool.transaction() as conn:
+        conn.execute("UPDATE employees SET is_super_admin = 1 WHERE user_id = ?", (user_id,))
+
+
+# Табель
+# Время смен - секунды эпохи, рабочая дата - shifts.local_date
+@reader
+def get_active_shift(user_id: int, date_str: str) -> Optional[Tuple]:
+    """Получить активную смену пользователя"""
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT id, check_in FROM timesheet WHERE user_id = ? AND date = ? AND status = 'working'",
+            (user_id, date_str)
+        ).fetchone()
+
+
+@reader
+def get_working_shifts() -> List[Tuple]:
+    """Все открытые смены: (ID, user_id, дата, начало)"""
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT id, user_id, date, check_in FROM timesheet WHERE status = 'working'"
+        ).fetchall()
+
+
+def _insert_shift(conn: sqlite3.Connection, user_id: int, check_in: int) -> int:
+    active = conn.execute(
+        "SELECT id, check_in FROM timesheet WHERE user_id = ? AND date = ? AND status = 'working'",
+        (user_id, local_date(check_in))
+    ).fetchone()
+    if active:
+        raise ActiveShiftExists(*active)
+
+    cursor = conn.execute('''
+        INSERT INTO timesheet (user_id, status, check_in)
+        VALUES (?, ?, ?)
+    ''', (user_id, 'working', check_in))
+    return cursor.lastrowid
+
+
+def _finish_shift(conn: sqlite3.Connection, shift_id: int, check_out: int) -> int:
+    row = conn.execute(
+        "SELECT user_id, date, check_in FROM timesheet WHERE id = ? AND status = 'working'", (shift_id,)
+    ).fetchone()
+    if not row:
+        raise ShiftNotActive(shift_id)
+
+    user_id, date_str, check_in = row
+    minutes = max(0, (check_out - check_in) // 60)
+    conn.execute('''
+        UPDATE timesheet
+        SET status = 'completed', check_out = ?, minutes = ?
+        WHERE id = ?
+    ''', (check_out, minutes, shift_id))
+    _refresh_rollups(conn, [(user_id, date_str)])
+    return minutes
+
+
+# Операции, которые можно выполнять пакетом через WriteBatcher
+BATCH_OPERATIONS: Dict[str, Callable] = {
+    'open_shift': _insert_shift,
+    'close_shift': _finish_shift,
+}
+
+
+def apply_batch(items: List[Tuple[str, tuple]]) -> List[Tuple[bool, Any]]:
+    """Выполнить пакет операций в одной транзакции.
+
+    Каждая операция идет в своей точке сохранения: при ошибке откатывается
+    только она. Возвращает (успех, результат или исключение) для каждой операции.
+    """
+    results = []
+    with pool.transaction() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for operation, args in items:
+            conn.execute("SAVEPOINT batch_item")
+            try:
+                result = BATCH_OPERATIONS[operation](conn, *args)
+            except (ShiftError, sqlite3.IntegrityError, KeyError) as e:
+                conn.execute("ROLLBACK TO batch_item")
+                conn.execute("RELEASE batch_item")
+                results.append((False, e))
+            else:
+                conn.execute("RELEASE batch_item")
+                results.append((True, result))
+    return results
+
+
+@writer
+def open_shift(user_id: int, check_in: int) -> int:
+    """Открыть смену, вернуть её ID. ActiveShiftExists, если смена уже открыта"""
+    with pool.transaction() as conn:
+        return _insert_shift(conn, user_id, check_in)
+
+
+@writer
+def close_shift(shift_id: int, check_out: int) -> int:
+    """Закрыть смену, вернуть отработанные минуты. ShiftNotActive, если она уже закрыта"""
+    with pool.transaction() as conn:
+        return _finish_shift(conn, shift_id, check_out)
+
+
+@writer
+def add_completed_shift(user_id: int, check_in: int, check_out: int) -> Optional[int]:
+    """Добавить завершённую смену от администратора. None, если смена за день уже есть"""
+    date_str = local_date(check_in)
+    with pool.transaction() as conn:
+        existing = conn.execute('''
+            SELECT id FROM timesheet
+            WHERE user_id = ? AND date = ? AND status = 'completed'
+        ''', (user_id, date_str)).fetchone()
+        if existing:
+            return None
+
+        cursor = conn.execute('''
+            INSERT INTO timesheet
+            (user_id, status, check_in, check_out, minutes, confirmed, created_by_admin)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, 'completed', check_in, check_out, (check_out - check_in) // 60, 0, 1))
+        _refresh_rollups(conn, [(user_id, date_str)])
+    return cursor.lastrowid
+
+
+@writer
+def delete_shift(shift_id: int) -> bool:
+    """Удалить смену по ID"""
+    with pool.transaction() as conn:
+        key = _shift_key(conn, shift_id)
+        if not key:
+            return False
+        conn.execute("DELETE FROM timesheet WHERE id = ?", (shift_id,))
+        _refresh_rollups(conn, [key])
+    return True
+
+
+@reader
+def get_shifts_by_date(user_id: int, date_str: str) -> List[Tuple]:
+    """Получить смены сотрудника за указанную дату"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT id, check_in, check_out, minutes, confirmed, status
+            FROM timesheet
+            WHERE user_id = ? AND date = ?
+            ORDER BY check_in
+        ''', (user_id, date_str)).fetchall()
+
+
+@reader
+def get_user_timesheet(user_id: int, start_date: str, end_date: str) -> List[Tuple]:
+    """Завершённые смены сотрудника за период"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT date, check_in, check_out, minutes, confirmed, notes
+            FROM timesheet
+            WHERE user_id = ? AND date BETWEEN ? AND ? AND status = 'completed'
+            ORDER BY date DESC
+        ''', (user_id, start_date, end_date)).fetchall()
+
+
+@reader
+def get_user_weekday_stats(user_id: int, start_date: str, end_date: str) -> List[Tuple]:
+    """Статистика сотрудника за период по дням недели: (день недели, 0 - Пн;
+    рабочих дней; минут; смен). Рабочий день - отдельная дата, сколько бы
+    смен в нее ни было; строки берутся из дневной сводки по ключу (user_id, date).
+    """
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT (CAST(strftime('%w', date) AS INTEGER) + 6) % 7 AS weekday,
+                   COUNT(*), SUM(minutes), SUM(shifts)
+            FROM daily_user_stats
+            WHERE user_id = ? AND date BETWEEN ? AND ?
+            GROUP BY weekday
+            ORDER BY weekday
+        ''', (user_id, start_date, end_date)).fetchall()
+
+
+@reader
+def get_recent_completed_shifts(user_id: int, limit: int = 20) -> List[Tuple]:
+    """Последние завершённые смены сотрудника"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT date, minutes, confirmed, id
+            FROM timesheet
+            WHERE user_id = ? AND status = 'completed'
+            ORDER BY date DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+
+
+@reader
+def get_shift_details(shift_id: int) -> Optional[Tuple]:
+    """Дата, минуты, сотрудник и магазин смены"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT t.date, t.minutes, e.full_name, s.name
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.id = ?
+        ''', (shift_id,)).fetchone()
+
+
+@reader
+def get_open_shifts(date_str: str) -> List[Tuple]:
+    """Открытые смены за дату"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT e.full_name, s.name, p.name, t.check_in, t.user_id
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date = ? AND t.status = 'working'
+            ORDER BY s.name, e.full_name
+        ''', (date_str,)).fetchall()
+
+
+@reader
+def get_export_rows(start_date: str, end_date: str, confirmed_only: bool = True) -> List[Tuple]:
+    """Строки для экспорта табеля в CSV"""
+    confirmed_filter = "AND t.confirmed = 1" if confirmed_only else ""
+    with pool.connection() as conn:
+        return conn.execute(f'''
+            SELECT e.full_name, p.name, s.name, t.date, t.check_in, t.check_out,
+                   t.minutes, t.notes, t.confirmed
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date BETWEEN ? AND ? AND t.status = 'completed' {confirmed_filter}
+            ORDER BY t.date DESC, s.name
+        ''', (start_date, end_date)).fetchall()
+
+
+@reader
+def get_store_stats(today: str, month_ago: str) -> List[Tuple]:
+    """Статистика по каждому магазину: сотрудники, смены сегодня и за 30 дней"""
+    with pool.connection() as conn:
+        # Каждая таблица агрегируется один раз с группировкой по магазину,
+        # а не отдельными запросами на каждый магазин
+        return conn.execute('''
+            SELECT s.name,
+                   COALESCE(e.employees, 0),
+                   COALESCE(w.open_shifts, 0),
+                   COALESCE(d.closed_today, 0),
+                   COALESCE(d.shifts, 0),
+                   COALESCE(d.minutes, 0),
+                   COALESCE(u.active_employees, 0)
+            FROM stores s
+            LEFT JOIN (
+                SELECT store_id, COUNT(*) AS employees
+                FROM employees
+                GROUP BY store_id
+            ) e ON e.store_id = s.id
+            LEFT JOIN (
+                SELECT e.store_id, COUNT(*) AS open_shifts
+                FROM timesheet t
+                JOIN employees e ON t.user_id = e.user_id
+                WHERE t.date = :today AND t.status = 'working'
+                GROUP BY e.store_id
+            ) w ON w.store_id = s.id
+            LEFT JOIN (
+                SELECT store_id,
+                       SUM(CASE WHEN date = :today THEN shifts ELSE 0 END) AS closed_today,
+                       SUM(shifts) AS shifts,
+                       SUM(minutes) AS minutes
+                FROM daily_store_stats
+                WHERE date BETWEEN :month_ago AND :today
+                GROUP BY store_id
+            ) d ON d.store_id = s.id
+            LEFT JOIN (
+                SELECT store_id, COUNT(DISTINCT user_id) AS active_employees
+                FROM daily_user_stats
+                WHERE date BETWEEN :month_ago AND :today
+                GROUP BY store_id
+            ) u ON u.store_id = s.id
+            ORDER BY s.id
+        ''', {'today': today, 'month_ago': month_ago}).fetchall()
+
+
+# Подтверждение смен
+@reader
+def get_unconfirmed_in_range(start_date: str, end_date: str, limit: Optional[int] = None,
+                             offset: int = 0) -> List[Tuple]:
+    """Неподтверждённые смены за период; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT t.id, e.full_name, s.name, t.date, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date BETWEEN ? AND ? AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY t.date DESC, s.name, t.id
+            LIMIT ? OFFSET ?
+        ''', (start_date, end_date, _limit(limit), offset)).fetchall()
+
+
+@reader
+def get_unconfirmed_for_date(date_str: str, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Неподтверждённые смены за день; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT t.id, e.full_name, s.name, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date = ? AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY s.name, e.full_name, t.id
+            LIMIT ? OFFSET ?
+        ''', (date_str, _limit(limit), offset)).fetchall()
+
+
+@reader
+def get_unconfirmed_for_store(store_id: int, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Неподтверждённые смены в магазине; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT t.id, e.full_name, t.date, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            WHERE e.store_id = ? AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY t.date DESC, t.id
+            LIMIT ? OFFSET ?
+        ''', (store_id, _limit(limit), offset)).fetchall()
+
+
+@reader
+def get_unconfirmed_counts_by_store() -> Dict[int, int]:
+    """Количество неподтверждённых смен по ID магазина (из счетчиков)"""
+    with pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT store_id, unconfirmed FROM store_unconfirmed WHERE unconfirmed > 0"
+        ).fetchall()
+    return dict(rows)
+
+
+@writer
+def confirm_shift(shift_id: int):
+    """Подтвердить конкретную смену"""
+    with pool.transaction() as conn:
+        key = _shift_key(conn, shift_id)
+        conn.execute("UPDATE timesheet SET confirmed = 1 WHERE id = ?", (shift_id,))
+        if key:
+            _refresh_rollups(conn, [key])
+
+
+@writer
+def confirm_shifts_in_range(start_date: str, end_date: str) -> int:
+    """Подтвердить все смены за период, вернуть количество"""
+    with pool.transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE timesheet
+            SET confirmed = 1
+            WHERE date BETWEEN ? AND ? AND status = 'completed' AND confirmed = 0
+        ''', (start_date, end_date))
+        _confirm_rollups(conn, "date BETWEEN ? AND ?", (start_date, end_date))
+    return cursor.rowcount
+
+
+@writer
+def confirm_shifts_for_date(date_str: str) -> int:
+    """Подтвердить все смены за день, вернуть количество"""
+    with pool.transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE timesheet
+            SET confirmed = 1
+            WHERE date = ? AND status = 'completed' AND confirmed = 0
+        ''', (date_str,))
+        _confirm_rollups(conn, "date = ?", (date_str,))
+    return cursor.rowcount
+
+
+@writer
+def confirm_store_shifts(store_id: int) -> int:
+    """Подтвердить все смены в магазине, вернуть количество"""
+    with pool.transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE timesheet
+            SET confirmed = 1
+            WHERE id IN (
+                SELECT t.id
+                FROM timesheet t
+                JOIN employees e ON t.user_id = e.user_id
+                WHERE e.store_id = ? AND t.status = 'completed' AND t.confirmed = 0
+            )
+        ''', (store_id,))
+        _confirm_rollups(conn, "store_id = ?", (store_id,))
+    return cursor.rowcount
+
+
+@reader
+def get_confirm_stats() -> Tuple[Tuple[int, int, int], List[Tuple]]:
+    """Общая статистика подтверждений и разбивка по магазинам"""
+    with pool.connection() as conn:
+        store_stats = conn.execute('''
+            SELECT s.name, SUM(d.shifts) as total, SUM(d.confirmed) as confirmed
+            FROM daily_store_stats d
+            JOIN stores s ON s.id = d.store_id
+            GROUP BY d.store_id
+            ORDER BY s.name
+        ''').fetchall()
+
+    total = sum(row[1] for row in store_stats)
+    confirmed = sum(row[2] for row in store_stats)
+    return (total, confirmed, total - confirmed), store_stats
+
+
+# Должности
+@reader
+def get_positions() -> List[Tuple[int, str]]:
+    """Получить список всех должностей (ID, название)"""
+    with pool.connection() as conn:
+        return conn.execute("SELECT id, name FROM positions ORDER BY name").fetchall()
+
+
+@reader
+def get_position(position_id: int) -> Optional[str]:
+    """Название должности по ID"""
+    with pool.connection() as conn:
+        row = conn.execute("SELECT name FROM positions WHERE id = ?", (position_id,)).fetchone()
+    return row[0] if row else None
+
+
+@reader
+def get_position_usage() -> Dict[int, int]:
+    """Количество сотрудников на каждой должности по ID"""
+    with pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT position_id, COUNT(*) FROM employees GROUP BY position_id"
+        ).fetchall()
+    return dict(rows)
+
+
+@writer
+def create_position(name: str, created_by: int, created_date: str) -> bool:
+    """Создать должность. False, если такая уже существует"""
+    try:
+        with pool.transaction() as conn:
+            conn.execute('''
+                INSERT INTO positions (name, created_by, created_date)
+                VALUES (?, ?, ?)
+            ''', (name, created_by, created_date))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+@writer
+def delete_position(position_id: int) -> Tuple[str, int]:
+    """Удалить должность.
+
+    Возвращает статус ('in_use', 'not_found', 'deleted', 'failed')
+    и количество сотрудников на этой должности.
+    """
+    with pool.transaction() as conn:
+        count = conn.execute(
+            "SELECT COUNT(*) FROM employees WHERE position_id = ?", (position_id,)
+        ).fetchone()[0]
+        if count > 0:
+            return 'in_use', count
+
+        if not conn.execute("SELECT 1 FROM positions WHERE id = ?", (position_id,)).fetchone():
+            return 'not_found', 0
+
+        cursor = conn.execute("DELETE FROM positions WHERE id = ?", (position_id,))
+    return ('deleted' if cursor.rowcount > 0 else 'failed'), 0
+
+
+# Магазины
+@reader
+def get_stores() -> List[Tuple[int, str, str]]:
+    """Получить список всех магазинов (ID, название, адрес)"""
+    with pool.connection() as conn:
+        return conn.execute("SELECT id, name, address FROM stores ORDER BY name").fetchall()
+
+
+@reader
+def get_store(store_id: int) -> Optional[Tuple[str, str]]:
+    """Название и адрес магазина по ID"""
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT name, address FROM stores WHERE id = ?", (store_id,)
+        ).fetchone()
+
+
+@reader
+def get_store_usage() -> Dict[int, int]:
+    """Количество сотрудников в каждом магазине по ID"""
+    with pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT store_id, COUNT(*) FROM employees GROUP BY store_id"
+        ).fetchall()
+    return dict(rows)
+
+
+@writer
+def create_store(name: str, address: str, created_by: int, created_date: str) -> bool:
+    """Создать магазин. False, если такой уже существует"""
+    try:
+        with pool.transaction() as conn:
+            conn.execute('''
+                INSERT INTO stores (name, address, created_by, created_date)
+                VALUES (?, ?, ?, ?)
+            ''', (name, address, created_by, created_date))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+@writer
+def delete_store(store_id: int) -> int:
+    """Удалить магазин, если в нём нет сотрудников.
+
+    Возвращает количество сотрудников магазина (0 - магазин удалён).
+    """
+    with pool.transaction() as conn:
+        count = conn.execute(
+            "SELECT COUNT(*) FROM employees WHERE store_id = ?", (store_id,)
+        ).fetchone()[0]
+        if count == 0:
+            conn.execute("DELETE FROM stores WHERE id = ?", (store_id,))
+    return count
+
+
+# Запросы на удаление
+@writer
+def create_delete_request(request_date: str, requester_id: int, requester_name: str,
+                          target_type: str, target_id: str) -> Tuple[str, Optional[str]]:
+    """Создать запрос на удаление.
+
+    Возвращает статус ('exists', 'not_found', 'created') и имя цели.
+    """
+    with pool.transaction() as conn:
+        existing = conn.execute('''
+            SELECT id FROM delete_requests
+            WHERE target_type = ? AND target_id = ? AND status = 'pending'
+        ''', (target_type, target_id)).fetchone()
+        if existing:
+            return 'exists', None
+
+        # Получаем имя цели
+        if target_type == "employee":
+            row = conn.execute(
+                "SELECT full_name FROM employees WHERE user_id = ?", (target_id,)
+            ).fetchone()
+            if not row:
+                return 'not_found', None
+            target_name = row[0]
+        else:  # store
+            row = conn.execute("SELECT name FROM stores WHERE id = ?", (target_id,)).fetchone()
+            if not row:
+                return 'not_found', None
+            target_name = row[0]
+
+        conn.execute('''
+            INSERT INTO delete_requests
+            (request_date, requester_id, requester_name, target_type, target_id, target_name, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (request_date, requester_id, requester_name,
+              target_type, target_id, target_name, 'pending'))
+    return 'created', target_name
+
+
+@reader
+def get_delete_requests(limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Все запросы на удаление, ожидающие - первыми; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT id, request_date, requester_name, target_type, target_name, status
+            FROM delete_requests
+            ORDER BY
+                CASE status
+                    WHEN 'pending' THEN 1
+                    WHEN 'approved' THEN 2
+                    ELSE 3
+                END,
+                request_date DESC,
+                id DESC
+            LIMIT ? OFFSET ?
+        ''', (_limit(limit), offset)).fetchall()
+
+
+@writer
+def approve_delete_request(request_id: int) -> Tuple[str, Optional[Tuple], int]:
+    """Одобрить запрос на удаление и выполнить удаление.
+
+    Возвращает статус ('not_found', 'super_admin', 'store_in_use', 'approved'),
+    запрос (target_type, target_id, target_name, requester_id, requester_name)
+    и количество сотрудников удаляемого магазина.
+    """
+    with pool.transaction() as conn:
+        request = conn.execute('''
+            SELECT target_type, target_id, target_name, requester_id, requester_name
+            FROM delete_requests
+            WHERE id = ? AND status = 'pending'
+        ''', (request_id,)).fetchone()
+        if not request:
+            return 'not_found', None, 0
+
+        target_type, target_id, target_name, requester_id, requester_name = request
+        emp_count = 0
+
+        if target_type == "employee":
+            row = conn.execute(
+                "SELECT is_super_admin FROM employees WHERE user_id = ?", (target_id,)
+            ).fetchone()
+            if row and row[0] == 1:
+                return 'super_admin', request, 0
+
+            # Смены сотрудника удаляются каскадом, сводки пересчитываются после удаления
+            days = conn.execute(
+                "SELECT user_id, date FROM daily_user_stats WHERE user_id = ?", (target_id,)
+            ).fetchall()
+            conn.execute("DELETE FROM employees WHERE user_id = ?", (target_id,))
+            _refresh_rollups(conn, days)
+        else:
+            emp_count = conn.execute(
+                "SELECT COUNT(*) FROM employees WHERE store_id = ?", (int(target_id),)
+            ).fetchone()[0]
+            if emp_count > 0:
+                return 'store_in_use', request, emp_count
+
+            conn.execute("DELETE FROM stores WHERE id = ?", (int(target_id),))
+
+        conn.execute('''
+            UPDATE delete_requests
+            SET status = 'approved'
+            WHERE id = ?
+        ''', (request_id,))
+    return 'approved', request, emp_count
+
+
+@writer
+def reject_delete_request(request_id: int) -> Optional[Tuple]:
+    """Отклонить запрос на удаление. Возвращает (target_type, target_name, requester_id)"""
+    with pool.transaction() as conn:
+        request = conn.execute('''
+            SELECT target_type, target_name, requester_id
+            FROM delete_requests
+            WHERE id = ? AND status = 'pending'
+        ''', (request_id,)).fetchone()
+        if not request:
+            return None
+
+        conn.execute('''
+            UPDATE delete_requests
+            SET status = 'rejected'
+            WHERE id = ?
+        ''', (request_id,))
+    return request
+
+
+# Заявки на админа
+@writer
+def create_admin_request(request_date: str, user_id: int, user_name: str,
+                         position: str, store: str) -> bool:
+    """Создать заявку на админа. False, если активная заявка уже есть"""
+    with pool.transaction() as conn:
+        existing = conn.execute('''
+            SELECT id FROM admin_requests
+            WHERE user_id = ? AND status = 'pending'
+        ''', (user_id,)).fetchone()
+        if existing:
+            return False
+
+        conn.execute('''
+            INSERT INTO admin_requests
+            (request_date, user_id, user_name, user_position, user_store, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (request_date, user_id, user_name, position, store, 'pending'))
+    return True
+
+
+@reader
+def get_admin_requests(limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+    """Все заявки на админа, ожидающие - первыми; limit/offset - страница списка"""
+    with pool.connection() as conn:
+        return conn.execute('''
+            SELECT id, request_date, user_name, user_position, user_store, user_id, status
+            FROM admin_requests
+            ORDER BY
+                CASE status
+                    WHEN 'pending' THEN 1
+                    WHEN 'approved' THEN 2
+                    ELSE 3
+                END,
+                request_date DESC,
+                id DESC
+            LIMIT ? OFFSET ?
+        ''', (_limit(limit), offset)).fetchall()
+
+
+@writer
+def approve_admin_request(request_id: int, reg_date: str) -> Optional[Tuple]:
+    """Одобрить заявку на админа. Возвращает (user_id, user_name, user_position, user_store)"""
+    with pool.transaction() as conn:
+        request = conn.execute('''
+            SELECT user_id, user_name, user_position, user_store
+            FROM admin_requests
+            WHERE id = ? AND status = 'pending'
+        ''', (request_id,)).fetchone()
+        if not request:
+            return None
+
+        user_id, user_name, user_position, user_store = request
+
+        if conn.execute("SELECT 1 FROM employees WHERE user_id = ?", (user_id,)).fetchone():
+            # Пользователь уже зарегистрирован - делаем его админом
+            conn.execute('''
+                UPDATE employees
+                SET is_admin = 1
+                WHERE user_id = ?
+            ''', (user_id,))
+        else:
+            # Новый пользователь - создаем запись, должность и магазин берутся из заявки
+            position_id, store_id = _reference_ids(conn, user_position, user_store, user_id, reg_date)
+            conn.execute('''
+                INSERT INTO employees
+                (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, user_name, position_id, store_id, reg_date, 1, 0, 0))
+
+        conn.execute('''
+            UPDATE admin_requests
+            SET status = 'approved'
+            WHERE id = ?
+        ''', (request_id,))
+    return request
+
+
+@writer
+def reject_admin_request(request_id: int) -> Optional[Tuple]:
+    """Отклонить заявку на админа. Возвращает (user_id, user_name)"""
+    with pool.transaction() as conn:
+        request = conn.execute('''
+            SELECT user_id, user_name
+            FROM admin_requests
+            WHERE id = ? AND status = 'pending'
+        ''', (request_id,)).fetchone()
+        if not request:
+            return None
+
+        conn.execute('''
+            UPDATE admin_requests
+            SET status = 'rejected'
+            WHERE id = ?
+        ''', (request_id,))
+    return request
+
+
+# Очередь уведомлений
+@writer
+def add_notifications(chat_ids: List[int], text: str, created: int, lease_until: int) -> List[Tuple[int, int]]:
+    """Записать уведомления, занятые отправкой до lease_until. Возвращает (id, chat_id)"""
+    with pool.transaction() as conn:
+        return [
+            (conn.execute('''
+                INSERT INTO notifications (chat_id, text, created, next_attempt)
+                VALUES (?, ?, ?, ?)
+            ''', (chat_id, text, created, lease_until)).lastrowid, chat_id)
+            for chat_id in chat_ids
+        ]
+
+
+@writer
+def claim_notifications(now: int, lease_until: int, limit: int) -> List[Tuple[int, int, str, int]]:
+    """Забрать уведомления, которым пора повторить отправку: (id, chat_id, text, attempts).
+
+    До lease_until их не заберет никто другой.
+    """
+    with pool.transaction() as conn:
+        rows = conn.execute('''
+            SELECT id, chat_id, text, attempts
+            FROM notifications
+            WHERE next_attempt <= ?
+            ORDER BY next_attempt
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE notifications SET next_attempt = ? WHERE id = ?",
+            [(lease_until, row[0]) for row in rows]
+        )
+    return rows
+
+
+@writer
+def delete_notifications(notification_ids: List[int]) -> int:
+    """Удалить доставленные (или недоставляемые) уведомления"""
+    with pool.transaction() as conn:
+        return conn.executemany(
+            "DELETE FROM notifications WHERE id = ?", [(i,) for i in notification_ids]
+        ).rowcount
+
+
+@writer
+def defer_notification(notification_id: int, next_attempt: Optional[int], error: str):
+    """Отложить уведомление до next_attempt (None - больше не пытаться)"""
+    with pool.transaction() as conn:
+        conn.execute('''
+            UPDATE notifications
+            SET attempts = attempts + 1, next_attempt = ?, last_error = ?
+            WHERE id = ?
+        ''', (next_attempt, error, notification_id))
+
+
+def create_storage(backend: str = DB_BACKEND):
+    """Хранилище, выбранное настройкой DB_BACKEND.
+
+    Оба варианта предоставляют операции из OPERATIONS как корутины,
+    а также start() и close().
+    """
+    if backend == 'sqlite':
+        return AsyncDatabase()
+    if backend == 'postgres':
+        import db_postgres
+        storage = db_postgres.PostgresDatabase(DB_DSN, max_size=DB_POOL_SIZE)
+        missing = [name for name in OPERATIONS if not callable(getattr(storage, name, None))]
+        if missing:
+            raise NotImplementedError(f"PostgresDatabase не реализует: {', '.join(missing)}")
+        return storage
+    raise ValueError(f"Неизвестный DB_BACKEND: {backend}")
+
+
+# Данные, от которых зависят готовые отчеты (CachedStorage.render)
+DATA_SHIFTS = 'shifts'  # табель, дневные сводки, подтверждения
+DATA_EMPLOYEES = 'employees'  # сотрудники, роли, магазины, должности
+DATA_REQUESTS = 'requests'  # запросы на удаление и заявки на админа
+ALL_DATA = frozenset({DATA_SHIFTS, DATA_EMPLOYEES, DATA_REQUESTS})
+
+# Какие данные меняет операция записи. Операция, которой здесь нет, считается
+# меняющей все (например, approve_delete_request удаляет сотрудника вместе
+# со сменами). Служебные записи отчетов не касаются
+_SHIFTS = frozenset({DATA_SHIFTS})
+_EMPLOYEES = frozenset({DATA_EMPLOYEES})
+_REQUESTS = frozenset({DATA_REQUESTS})
+WRITE_DATA: Dict[str, FrozenSet[str]] = {
+    'checkpoint': frozenset(),
+    'add_notifications': frozenset(),
+    'claim_notifications': frozenset(),
+    'delete_notifications': frozenset(),
+    'defer_notification': frozenset(),
+    'rebuild_rollups': _SHIFTS,
+    'reconcile_unconfirmed_counts': _SHIFTS,
+    'open_shift': _SHIFTS,
+    'close_shift': _SHIFTS,
+    'add_completed_shift': _SHIFTS,
+    'delete_shift': _SHIFTS,
+    'confirm_shift': _SHIFTS,
+    'confirm_shifts_in_range': _SHIFTS,
+    'confirm_shifts_for_date': _SHIFTS,
+    'confirm_store_shifts': _SHIFTS,
+    'add_employee': _EMPLOYEES,
+    'add_first_super_admin': _EMPLOYEES,
+    'add_offline_employee': _EMPLOYEES,
+    'make_admin': _EMPLOYEES,
+    'set_super_admin': _EMPLOYEES,
+    'create_position': _EMPLOYEES,
+    'delete_position': _EMPLOYEES,
+    'create_store': _EMPLOYEES,
+    'delete_store': _EMPLOYEES,
+    'create_delete_request': _REQUESTS,
+    'reject_delete_request': _REQUESTS,
+    'create_admin_request': _REQUESTS,
+    'reject_admin_request': _REQUESTS,
+    'approve_admin_request': _EMPLOYEES | _REQUESTS,
+}
+
+storage = cache.CachedStorage(
+    create_storage(),
+    # Индекс открытых смен верен только при единственном процессе-писателе
+    active_shifts=cache.ActiveShiftIndex(local_date, ActiveShiftExists) if DB_BACKEND == 'sqlite' else None,
+    write_operations={
+        name: WRITE_DATA.get(name, ALL_DATA) for name, (kind, _) in OPERATIONS.items() if kind == 'write'
+    },
+)
@@ -0,0 +1,1121 @@
+"""Хранилище на PostgreSQL (DB_BACKEND=postgres).
+
+Повторяет операции репозитория db.py с теми же аргументами и результатами,
+но выполняет их асинхронно через пул соединений asyncpg. Несколько процессов
+бота могут работать с одной базой: проверки, которые в SQLite обеспечивал
+единственный писатель, здесь держатся на ограничениях и блокировках строк.
+"""
+import logging
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from shifts import ActiveShiftExists, ShiftNotActive, local_date
+
+try:
+    import asyncpg
+except ImportError:  # нужен только для DB_BACKEND=postgres
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# Схема PostgreSQL: (версия, название, SQL). Версия 1 соответствует
+# версии 6 схемы SQLite, версия 2 - версии 7, версия 3 - версии 8; дата смены
+# записывается приложением
+SCHEMA: List[Tuple[int, str, str]] = [
+    (1, "initial schema", '''
+        CREATE TABLE positions (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            created_by BIGINT NOT NULL,
+            created_date TEXT NOT NULL
+        );
+        CREATE TABLE stores (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            address TEXT,
+            created_by BIGINT NOT NULL,
+            created_date TEXT NOT NULL
+        );
+        CREATE TABLE employees (
+            user_id BIGINT PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            position_id INTEGER NOT NULL REFERENCES positions (id),
+            store_id INTEGER NOT NULL REFERENCES stores (id),
+            reg_date TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            is_super_admin INTEGER DEFAULT 0,
+            can_request_admin INTEGER DEFAULT 0
+        );
+        CREATE INDEX idx_employees_store ON employees (store_id);
+        CREATE INDEX idx_employees_position ON employees (position_id);
+
+        CREATE TABLE timesheet (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES employees (user_id) ON DELETE CASCADE,
+            date TEXT NOT NULL,
+            status TEXT DEFAULT 'working',
+            check_in BIGINT NOT NULL,
+            check_out BIGINT,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            notes TEXT,
+            confirmed INTEGER DEFAULT 0,
+            created_by_admin INTEGER DEFAULT 0
+        );
+        CREATE INDEX idx_timesheet_user_date_status ON timesheet (user_id, date, status);
+        CREATE INDEX idx_timesheet_date_status_confirmed ON timesheet (date, status, confirmed);
+        CREATE INDEX idx_timesheet_unconfirmed ON timesheet (user_id, date)
+            WHERE status = 'completed' AND confirmed = 0;
+        -- Одна открытая смена на сотрудника в день, даже при нескольких процессах бота
+        CREATE UNIQUE INDEX idx_timesheet_working ON timesheet (user_id, date)
+            WHERE status = 'working';
+
+        CREATE TABLE delete_requests (
+            id SERIAL PRIMARY KEY,
+            request_date TEXT NOT NULL,
+            requester_id BIGINT NOT NULL,
+            requester_name TEXT NOT NULL,
+            target_type TEXT NOT NULL,
+            target_id TEXT NOT NULL,
+            target_name TEXT NOT NULL,
+            status TEXT DEFAULT 'pending'
+        );
+        CREATE INDEX idx_delete_requests_status ON delete_requests (status, request_date);
+
+        CREATE TABLE admin_requests (
+            id SERIAL PRIMARY KEY,
+            request_date TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            user_name TEXT NOT NULL,
+            user_position TEXT,
+            user_store TEXT,
+            status TEXT DEFAULT 'pending'
+        );
+        CREATE INDEX idx_admin_requests_user_status ON admin_requests (user_id, status);
+
+        CREATE TABLE daily_user_stats (
+            user_id BIGINT NOT NULL,
+            date TEXT NOT NULL,
+            store_id INTEGER NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        );
+        CREATE INDEX idx_daily_user_stats_store_date ON daily_user_stats (store_id, date);
+
+        CREATE TABLE daily_store_stats (
+            store_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_minutes INTEGER NOT NULL DEFAULT 0,
+            employees INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_id, date)
+        );
+        CREATE INDEX idx_daily_store_stats_date ON daily_store_stats (date);
+    '''),
+    (2, "per-store unconfirmed shift counters", '''
+        CREATE TABLE store_unconfirmed (
+            store_id INTEGER PRIMARY KEY,
+            unconfirmed INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT INTO store_unconfirmed (store_id, unconfirmed)
+        SELECT store_id, SUM(shifts - confirmed)
+        FROM daily_store_stats
+        GROUP BY store_id
+        HAVING SUM(shifts - confirmed) > 0;
+    '''),
+    (3, "notification outbox", '''
+        CREATE TABLE notifications (
+            id BIGSERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            text TEXT NOT NULL,
+            created BIGINT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt BIGINT,
+            last_error TEXT
+        );
+        CREATE INDEX idx_notifications_next_attempt ON notifications (next_attempt)
+        WHERE next_attempt IS NOT NULL;
+    '''),
+]
+
+# Порядок статусов заявок: ожидающие - первыми
+REQUEST_ORDER = '''
+    ORDER BY
+        CASE status
+            WHEN 'pending' THEN 1
+            WHEN 'approved' THEN 2
+            ELSE 3
+        END,
+        request_date DESC,
+        id DESC
+'''
+
+
+def _rows(records) -> List[Tuple]:
+    return [tuple(record) for record in records]
+
+
+def _row(record) -> Optional[Tuple]:
+    return tuple(record) if record is not None else None
+
+
+class PostgresDatabase:
+    """Асинхронное хранилище на PostgreSQL с тем же набором операций, что и AsyncDatabase"""
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("Для DB_BACKEND=postgres нужен пакет asyncpg")
+        if not dsn:
+            raise RuntimeError("Для DB_BACKEND=postgres нужно указать DB_DSN")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.pool: Optional['asyncpg.Pool'] = None
+
+    async def start(self):
+        """Создать пул соединений и применить схему"""
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            version = await self._migrate(conn)
+        logger.info(f"Database initialized successfully (PostgreSQL schema version {version})")
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _migrate(self, conn) -> int:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        ''')
+        # Несколько процессов могут стартовать одновременно: схему применяет один
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+            applied = {row[0] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+            for version, name, sql in SCHEMA:
+                if version in applied:
+                    continue
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES ($1, $2, $3)",
+                    version, name, datetime.now().isoformat()
+                )
+                logger.info(f"Применена миграция PostgreSQL {version}: {name}")
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+    @asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[Any]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def _fetch(self, sql: str, *args) -> List[Tuple]:
+        async with self.pool.acquire() as conn:
+            return _rows(await conn.fetch(sql, *args))
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[Tuple]:
+        async with self.pool.acquire() as conn:
+            return _row(await conn.fetchrow(sql, *args))
+
+    async def checkpoint(self) -> Tuple[int, int, int]:
+        """Журнал PostgreSQL обслуживает сам сервер"""
+        return 0, 0, 0
+
+    # Дневные сводки
+    async def _add_store_day(self, conn, store_id: int, date_str: str, minutes: int,
+                             shifts: int, confirmed: int, confirmed_minutes: int, employees: int):
+        await conn.execute('''
+            INSERT INTO daily_store_stats (store_id, date, minutes, shifts, confirmed, confirmed_minutes, employees)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (store_id, date) DO UPDATE SET
+                minutes = daily_store_stats.minutes + excluded.minutes,
+                shifts = daily_store_stats.shifts + excluded.shifts,
+                confirmed = daily_store_stats.confirmed + excluded.confirmed,
+                confirmed_minutes = daily_store_stats.confirmed_minutes + excluded.confirmed_minutes,
+                employees = daily_store_stats.employees + excluded.employees
+        ''', store_id, date_str, minutes, shifts, confirmed, confirmed_minutes, employees)
+        await conn.execute(
+            "DELETE FROM daily_store_stats WHERE store_id = $1 AND date = $2 AND employees <= 0",
+            store_id, date_str
+        )
+        await self._add_store_unconfirmed(conn, store_id, shifts - confirmed)
+
+    async def _add_store_unconfirmed(self, conn, store_id: int, delta: int):
+        if delta:
+            await conn.execute('''
+                INSERT INTO store_unconfirmed (store_id, unconfirmed)
+                VALUES ($1, $2)
+                ON CONFLICT (store_id) DO UPDATE SET
+                    unconfirmed = store_unconfirmed.unconfirmed + excluded.unconfirmed
+            ''', store_id, delta)
+
+    async def _refresh_rollups(self, conn, keys):
+        """Пересчитать сводки для пар (user_id, date), как db._refresh_rollups"""
+        for user_id, date_str in sorted(set(keys)):
+            old = await conn.fetchrow('''
+                SELECT store_id, minutes, shifts, confirmed, confirmed_minutes
+                FROM daily_user_stats
+                WHERE user_id = $1 AND date = $2
+                FOR UPDATE
+            ''', user_id, date_str)
+            new = await conn.fetchrow('''
+                SELECT e.store_id, SUM(t.minutes), COUNT(*),
+                       COUNT(*) FILTER (WHERE t.confirmed = 1),
+                       COALESCE(SUM(t.minutes) FILTER (WHERE t.confirmed = 1), 0)
+                FROM timesheet t
+                JOIN employees e ON e.user_id = t.user_id
+                WHERE t.user_id = $1 AND t.date = $2 AND t.status = 'completed'
+                GROUP BY e.store_id
+            ''', user_id, date_str)
+
+            if old:
+                store_id, minutes, shifts, confirmed, confirmed_minutes = old
+                await self._add_store_day(conn, store_id, date_str, -minutes, -shifts,
+                                          -confirmed, -confirmed_minutes, -1)
+                await conn.execute(
+                    "DELETE FROM daily_user_stats WHERE user_id = $1 AND date = $2", user_id, date_str
+                )
+
+            if new:
+                store_id, minutes, shifts, confirmed, confirmed_minutes = new
+                await conn.execute('''
+                    INSERT INTO daily_user_stats (user_id, date, store_id, minutes, shifts, confirmed, confirmed_minutes)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ''', user_id, date_str, store_id, minutes, shifts, confirmed, confirmed_minutes)
+                await self._add_store_day(conn, store_id, date_str, minutes, shifts,
+                                          confirmed, confirmed_minutes, 1)
+
+    async def _confirm_rollups(self, conn, where: str, *args):
+        pending = await conn.fetch(f'''
+            SELECT store_id, SUM(shifts - confirmed)
+            FROM daily_store_stats
+            WHERE {where} AND confirmed < shifts
+            GROUP BY store_id
+        ''', *args)
+        for store_id, count in pending:
+            await self._add_store_unconfirmed(conn, store_id, -count)
+        for table in ('daily_user_stats', 'daily_store_stats'):
+            await conn.execute(
+                f"UPDATE {table} SET confirmed = shifts, confirmed_minutes = minutes WHERE {where}", *args
+            )
+
+    async def rebuild_rollups(self) -> int:
+        """Пересчитать все дневные сводки из табеля. Возвращает число дней сотрудников"""
+        async with self._transaction() as conn:
+            await conn.execute(
+                "LOCK TABLE daily_user_stats, daily_store_stats, store_unconfirmed IN EXCLUSIVE MODE"
+            )
+            await conn.execute("DELETE FROM daily_user_stats")
+            await conn.execute("DELETE FROM daily_store_stats")
+            await conn.execute("DELETE FROM store_unconfirmed")
+            await conn.execute('''
+                INSERT INTO daily_user_stats (user_id, date, store_id, minutes, shifts, confirmed, confirmed_minutes)
+                SELECT t.user_id, t.date, e.store_id, SUM(t.minutes), COUNT(*),
+                       COUNT(*) FILTER (WHERE t.confirmed = 1),
+                       COALESCE(SUM(t.minutes) FILTER (WHERE t.confirmed = 1), 0)
+                FROM timesheet t
+                JOIN employees e ON e.user_id = t.user_id
+                WHERE t.status = 'completed'
+                GROUP BY t.user_id, t.date, e.store_id
+            ''')
+            await conn.execute('''
+                INSERT INTO daily_store_stats (store_id, date, minutes, shifts, confirmed, confirmed_minutes, employees)
+                SELECT store_id, date, SUM(minutes), SUM(shifts), SUM(confirmed), SUM(confirmed_minutes), COUNT(*)
+                FROM daily_user_stats
+                GROUP BY store_id, date
+            ''')
+            await conn.execute('''
+                INSERT INTO store_unconfirmed (store_id, unconfirmed)
+                SELECT store_id, SUM(shifts - confirmed)
+                FROM daily_store_stats
+                GROUP BY store_id
+                HAVING SUM(shifts - confirmed) > 0
+            ''')
+            return await conn.fetchval("SELECT COUNT(*) FROM daily_user_stats")
+
+    async def reconcile_unconfirmed_counts(self) -> Dict[int, Tuple[int, int]]:
+        """Сверить счетчики неподтвержденных смен с табелем и исправить расхождения"""
+        async with self._transaction() as conn:
+            # Блокировка не дает подтверждениям менять счетчики во время сверки
+            await conn.execute("LOCK TABLE store_unconfirmed IN EXCLUSIVE MODE")
+            actual = dict(_rows(await conn.fetch('''
+                SELECT e.store_id, COUNT(*)
+                FROM timesheet t
+                JOIN employees e ON t.user_id = e.user_id
+                WHERE t.status = 'completed' AND t.confirmed = 0
+                GROUP BY e.store_id
+            ''')))
+            counters = dict(_rows(await conn.fetch("SELECT store_id, unconfirmed FROM store_unconfirmed")))
+
+            drift = {}
+            for store_id in actual.keys() | counters.keys():
+                counter, count = counters.get(store_id, 0), actual.get(store_id, 0)
+                if counter != count:
+                    drift[store_id] = (counter, count)
+                    await self._add_store_unconfirmed(conn, store_id, count - counter)
+            await conn.execute("DELETE FROM store_unconfirmed WHERE unconfirmed = 0")
+        return drift
+
+    async def get_period_totals(self, start_date: str, end_date: str) -> Tuple[int, int, int, int]:
+        """Смены, минуты, подтвержденные смены и минуты за период по сводкам магазинов"""
+        shifts, minutes, confirmed, confirmed_minutes = await self._fetchrow('''
+            SELECT SUM(shifts), SUM(minutes), SUM(confirmed), SUM(confirmed_minutes)
+            FROM daily_store_stats
+            WHERE date BETWEEN $1 AND $2
+        ''', start_date, end_date)
+        return shifts or 0, minutes or 0, confirmed or 0, confirmed_minutes or 0
+
+    # Сотрудники
+    async def get_user(self, user_id: int) -> Optional[Tuple]:
+        """Получить информацию о пользователе"""
+        return await self._fetchrow('''
+            SELECT e.full_name, p.name, s.name, e.is_admin, e.is_super_admin, e.can_request_admin
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.user_id = $1
+        ''', user_id)
+
+    async def get_employee_card(self, user_id: int) -> Optional[Tuple]:
+        """Получить ФИО, должность и магазин сотрудника"""
+        return await self._fetchrow('''
+            SELECT e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE e.user_id = $1
+        ''', user_id)
+
+    async def get_registration_counts(self) -> Tuple[int, int, int]:
+        """Количество супер-админов, должностей и магазинов"""
+        return await self._fetchrow('''
+            SELECT
+                (SELECT COUNT(*) FROM employees WHERE is_super_admin = 1),
+                (SELECT COUNT(*) FROM positions),
+                (SELECT COUNT(*) FROM stores)
+        ''')
+
+    async def get_super_admins(self) -> List[Tuple[int, str]]:
+        """Получить список супер-администраторов"""
+        return await self._fetch(
+            "SELECT user_id, full_name FROM employees WHERE is_super_admin = 1 ORDER BY full_name"
+        )
+
+    async def get_employees_by_store(self, store_id: int = None) -> List[Tuple]:
+        """Получить список сотрудников по магазину"""
+        if store_id:
+            return await self._fetch('''
+                SELECT e.user_id, e.full_name, p.name
+                FROM employees e
+                JOIN positions p ON p.id = e.position_id
+                WHERE e.store_id = $1
+                ORDER BY e.full_name
+            ''', store_id)
+        return await self._fetch('''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            ORDER BY s.name, e.full_name
+        ''')
+
+    async def get_all_employees(self) -> List[Tuple]:
+        """Все сотрудники с ролями"""
+        return await self._fetch('''
+            SELECT e.full_name, p.name, s.name, e.is_admin, e.is_super_admin, e.can_request_admin
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            ORDER BY s.name, e.full_name
+        ''')
+
+    async def get_employees_with_shifts(self, date_str: str) -> List[Tuple]:
+        """Сотрудники по магазинам со сменами за дату"""
+        return await self._fetch('''
+            SELECT s.name, e.user_id, e.full_name, p.name, e.is_admin, e.is_super_admin, e.can_request_admin,
+                   t.status, t.check_in, t.check_out
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            LEFT JOIN timesheet t ON e.user_id = t.user_id AND t.date = $1
+            ORDER BY s.name, e.full_name
+        ''', date_str)
+
+    async def _employees_where(self, condition: str, limit: Optional[int], offset: int) -> List[Tuple]:
+        return await self._fetch(f'''
+            SELECT e.user_id, e.full_name, p.name, s.name
+            FROM employees e
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE {condition}
+            ORDER BY s.name, e.full_name, e.user_id
+            LIMIT $1 OFFSET $2
+        ''', limit, offset)
+
+    async def get_deletable_employees(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        """Сотрудники, которых можно предложить к удалению (не супер-админы); limit/offset - страница списка"""
+        return await self._employees_where("e.is_super_admin = 0", limit, offset)
+
+    async def get_admins_for_promotion(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        """Администраторы, которых можно назначить супер-админами; limit/offset - страница списка"""
+        return await self._employees_where("e.is_admin = 1 AND e.is_super_admin = 0", limit, offset)
+
+    async def get_regular_employees(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        """Обычные сотрудники без прав администратора; limit/offset - страница списка"""
+        return await self._employees_where("e.is_admin = 0 AND e.is_super_admin = 0", limit, offset)
+
+    async def add_employee(self, user_id: int, full_name: str, position_id: int, store_id: int,
+                           reg_date: str, is_admin: int = 0, is_super_admin: int = 0,
+                           can_request_admin: int = 0) -> bool:
+        """Добавить сотрудника. False, если такой user_id уже зарегистрирован"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                ON CONFLICT (user_id) DO NOTHING
+            ''', user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+        return status.endswith(' 1')
+
+    async def _reference_ids(self, conn, position: str, store: str,
+                             created_by: int, created_date: str) -> Tuple[int, int]:
+        """ID должности и магазина по названиям, недостающие создаются"""
+        await conn.execute('''
+            INSERT INTO positions (name, created_by, created_date) VALUES ($1, $2, $3)
+            ON CONFLICT (name) DO NOTHING
+        ''', position, created_by, created_date)
+        await conn.execute('''
+            INSERT INTO stores (name, address, created_by, created_date) VALUES ($1, '', $2, $3)
+            ON CONFLICT (name) DO NOTHING
+        ''', store, created_by, created_date)
+        position_id = await conn.fetchval("SELECT id FROM positions WHERE name = $1", position)
+        store_id = await conn.fetchval("SELECT id FROM stores WHERE name = $1", store)
+        return position_id, store_id
+
+    async def add_first_super_admin(self, user_id: int, full_name: str, reg_date: str,
+                                    position: str = "Администратор", store: str = "Главный офис"):
+        """Зарегистрировать первого супер-администратора вместе с его должностью и магазином"""
+        async with self._transaction() as conn:
+            position_id, store_id = await self._reference_ids(conn, position, store, user_id, reg_date)
+            await conn.execute('''
+                INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin)
+                VALUES ($1, $2, $3, $4, $5, 1, 1)
+                ON CONFLICT (user_id) DO NOTHING
+            ''', user_id, full_name, position_id, store_id, reg_date)
+
+    async def add_offline_employee(self, full_name: str, position_id: int, store_id: int, reg_date: str,
+                                   can_request_admin: int = 0) -> int:
+        """Добавить сотрудника без Telegram со случайным отрицательным ID"""
+        async with self._transaction() as conn:
+            while True:
+                temp_user_id = -random.randint(10000, 99999)
+                status = await conn.execute('''
+                    INSERT INTO employees (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+                    VALUES ($1, $2, $3, $4, $5, 0, 0, $6)
+                    ON CONFLICT (user_id) DO NOTHING
+                ''', temp_user_id, full_name, position_id, store_id, reg_date, can_request_admin)
+                if status.endswith(' 1'):
+                    return temp_user_id
+
+    async def make_admin(self, user_id: int) -> Optional[str]:
+        """Назначить сотрудника администратором. Возвращает ФИО или None"""
+        async with self._transaction() as conn:
+            return await conn.fetchval(
+                "UPDATE employees SET is_admin = 1 WHERE user_id = $1 RETURNING full_name", user_id
+            )
+
+    async def set_super_admin(self, user_id: int):
+        """Назначить супер-администратора"""
+        async with self._transaction() as conn:
+            await conn.execute("UPDATE employees SET is_super_admin = 1 WHERE user_id = $1", user_id)
+
+    # Табель
+    async def get_active_shift(self, user_id: int, date_str: str) -> Optional[Tuple]:
+        """Получить активную смену пользователя"""
+        return await self._fetchrow(
+            "SELECT id, check_in FROM timesheet WHERE user_id = $1 AND date = $2 AND status = 'working'",
+            user_id, date_str
+        )
+
+    async def get_working_shifts(self) -> List[Tuple]:
+        """Все открытые смены: (ID, user_id, дата, начало)"""
+        return await self._fetch(
+            "SELECT id, user_id, date, check_in FROM timesheet WHERE status = 'working'"
+        )
+
+    async def open_shift(self, user_id: int, check_in: int) -> int:
+        """Открыть смену, вернуть её ID. ActiveShiftExists, если смена уже открыта"""
+        date_str = local_date(check_in)
+        async with self._transaction() as conn:
+            shift_id = await conn.fetchval('''
+                INSERT INTO timesheet (user_id, date, status, check_in)
+                VALUES ($1, $2, 'working', $3)
+                ON CONFLICT (user_id, date) WHERE status = 'working' DO NOTHING
+                RETURNING id
+            ''', user_id, date_str, check_in)
+            if shift_id is None:
+                active = await conn.fetchrow(
+                    "SELECT id, check_in FROM timesheet WHERE user_id = $1 AND date = $2 AND status = 'working'",
+                    user_id, date_str
+                )
+                raise ActiveShiftExists(*active)
+        return shift_id
+
+    async def close_shift(self, shift_id: int, check_out: int) -> int:
+        """Закрыть смену, вернуть отработанные минуты. ShiftNotActive, если она уже закрыта"""
+        async with self._transaction() as conn:
+            row = await conn.fetchrow('''
+                UPDATE timesheet
+                SET status = 'completed', check_out = $2,
+                    minutes = GREATEST(0, ($2 - check_in) / 60)
+                WHERE id = $1 AND status = 'working'
+                RETURNING user_id, date, minutes
+            ''', shift_id, check_out)
+            if row is None:
+                raise ShiftNotActive(shift_id)
+            user_id, date_str, minutes = row
+            await self._refresh_rollups(conn, [(user_id, date_str)])
+        return minutes
+
+    async def add_completed_shift(self, user_id: int, check_in: int, check_out: int) -> Optional[int]:
+        """Добавить завершённую смену от администратора. None, если смена за день уже есть"""
+        date_str = local_date(check_in)
+        async with self._transaction() as conn:
+            # Блокировка сотрудника не дает двум администраторам добавить смену одновременно
+            await conn.execute("SELECT 1 FROM employees WHERE user_id = $1 FOR UPDATE", user_id)
+            existing = await conn.fetchval('''
+                SELECT id FROM timesheet
+                WHERE user_id = $1 AND date = $2 AND status = 'completed'
+            ''', user_id, date_str)
+            if existing:
+                return None
+
+            shift_id = await conn.fetchval('''
+                INSERT INTO timesheet
+                (user_id, date, status, check_in, check_out, minutes, confirmed, created_by_admin)
+                VALUES ($1, $2, 'completed', $3, $4, $5, 0, 1)
+                RETURNING id
+            ''', user_id, date_str, check_in, check_out, (check_out - check_in) // 60)
+            await self._refresh_rollups(conn, [(user_id, date_str)])
+        return shift_id
+
+    async def delete_shift(self, shift_id: int) -> bool:
+        """Удалить смену по ID"""
+        async with self._transaction() as conn:
+            key = await conn.fetchrow(
+                "DELETE FROM timesheet WHERE id = $1 RETURNING user_id, date", shift_id
+            )
+            if not key:
+                return False
+            await self._refresh_rollups(conn, [tuple(key)])
+        return True
+
+    async def get_shifts_by_date(self, user_id: int, date_str: str) -> List[Tuple]:
+        """Получить смены сотрудника за указанную дату"""
+        return await self._fetch('''
+            SELECT id, check_in, check_out, minutes, confirmed, status
+            FROM timesheet
+            WHERE user_id = $1 AND date = $2
+            ORDER BY check_in
+        ''', user_id, date_str)
+
+    async def get_user_timesheet(self, user_id: int, start_date: str, end_date: str) -> List[Tuple]:
+        """Завершённые смены сотрудника за период"""
+        return await self._fetch('''
+            SELECT date, check_in, check_out, minutes, confirmed, notes
+            FROM timesheet
+            WHERE user_id = $1 AND date BETWEEN $2 AND $3 AND status = 'completed'
+            ORDER BY date DESC
+        ''', user_id, start_date, end_date)
+
+    async def get_user_weekday_stats(self, user_id: int, start_date: str, end_date: str) -> List[Tuple]:
+        """Статистика сотрудника за период по дням недели (0 - Пн), как db.get_user_weekday_stats"""
+        return await self._fetch('''
+            SELECT EXTRACT(ISODOW FROM date::date)::int - 1 AS weekday,
+                   COUNT(*), SUM(minutes), SUM(shifts)
+            FROM daily_user_stats
+            WHERE user_id = $1 AND date BETWEEN $2 AND $3
+            GROUP BY weekday
+            ORDER BY weekday
+        ''', user_id, start_date, end_date)
+
+    async def get_recent_completed_shifts(self, user_id: int, limit: int = 20) -> List[Tuple]:
+        """Последние завершённые смены сотрудника"""
+        return await self._fetch('''
+            SELECT date, minutes, confirmed, id
+            FROM timesheet
+            WHERE user_id = $1 AND status = 'completed'
+            ORDER BY date DESC
+            LIMIT $2
+        ''', user_id, limit)
+
+    async def get_shift_details(self, shift_id: int) -> Optional[Tuple]:
+        """Дата, минуты, сотрудник и магазин смены"""
+        return await self._fetchrow('''
+            SELECT t.date, t.minutes, e.full_name, s.name
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.id = $1
+        ''', shift_id)
+
+    async def get_open_shifts(self, date_str: str) -> List[Tuple]:
+        """Открытые смены за дату"""
+        return await self._fetch('''
+            SELECT e.full_name, s.name, p.name, t.check_in, t.user_id
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date = $1 AND t.status = 'working'
+            ORDER BY s.name, e.full_name
+        ''', date_str)
+
+    async def get_export_rows(self, start_date: str, end_date: str, confirmed_only: bool = True) -> List[Tuple]:
+        """Строки для экспорта табеля в CSV"""
+        confirmed_filter = "AND t.confirmed = 1" if confirmed_only else ""
+        return await self._fetch(f'''
+            SELECT e.full_name, p.name, s.name, t.date, t.check_in, t.check_out,
+                   t.minutes, t.notes, t.confirmed
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN positions p ON p.id = e.position_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date BETWEEN $1 AND $2 AND t.status = 'completed' {confirmed_filter}
+            ORDER BY t.date DESC, s.name
+        ''', start_date, end_date)
+
+    async def get_store_stats(self, today: str, month_ago: str) -> List[Tuple]:
+        """Статистика по каждому магазину: сотрудники, смены сегодня и за 30 дней"""
+        # Каждая таблица агрегируется один раз с группировкой по магазину, как в db.get_store_stats
+        return await self._fetch('''
+            SELECT s.name,
+                   COALESCE(e.employees, 0),
+                   COALESCE(w.open_shifts, 0),
+                   COALESCE(d.closed_today, 0),
+                   COALESCE(d.shifts, 0),
+                   COALESCE(d.minutes, 0),
+                   COALESCE(u.active_employees, 0)
+            FROM stores s
+            LEFT JOIN (
+                SELECT store_id, COUNT(*) AS employees
+                FROM employees
+                GROUP BY store_id
+            ) e ON e.store_id = s.id
+            LEFT JOIN (
+                SELECT e.store_id, COUNT(*) AS open_shifts
+                FROM timesheet t
+                JOIN employees e ON t.user_id = e.user_id
+                WHERE t.date = $1 AND t.status = 'working'
+                GROUP BY e.store_id
+            ) w ON w.store_id = s.id
+            LEFT JOIN (
+                SELECT store_id,
+                       COALESCE(SUM(shifts) FILTER (WHERE date = $1), 0) AS closed_today,
+                       SUM(shifts) AS shifts,
+                       SUM(minutes) AS minutes
+                FROM daily_store_stats
+                WHERE date BETWEEN $2 AND $1
+                GROUP BY store_id
+            ) d ON d.store_id = s.id
+            LEFT JOIN (
+                SELECT store_id, COUNT(DISTINCT user_id) AS active_employees
+                FROM daily_user_stats
+                WHERE date BETWEEN $2 AND $1
+                GROUP BY store_id
+            ) u ON u.store_id = s.id
+            ORDER BY s.id
+        ''', today, month_ago)
+
+    # Подтверждение смен
+    async def get_unconfirmed_in_range(self, start_date: str, end_date: str, limit: Optional[int] = None,
+                                       offset: int = 0) -> List[Tuple]:
+        """Неподтверждённые смены за период; limit/offset - страница списка"""
+        return await self._fetch('''
+            SELECT t.id, e.full_name, s.name, t.date, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date BETWEEN $1 AND $2 AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY t.date DESC, s.name, t.id
+            LIMIT $3 OFFSET $4
+        ''', start_date, end_date, limit, offset)
+
+    async def get_unconfirmed_for_date(self, date_str: str, limit: Optional[int] = None,
+                                       offset: int = 0) -> List[Tuple]:
+        """Неподтверждённые смены за день; limit/offset - страница списка"""
+        return await self._fetch('''
+            SELECT t.id, e.full_name, s.name, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            JOIN stores s ON s.id = e.store_id
+            WHERE t.date = $1 AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY s.name, e.full_name, t.id
+            LIMIT $2 OFFSET $3
+        ''', date_str, limit, offset)
+
+    async def get_unconfirmed_for_store(self, store_id: int, limit: Optional[int] = None,
+                                        offset: int = 0) -> List[Tuple]:
+        """Неподтверждённые смены в магазине; limit/offset - страница списка"""
+        return await self._fetch('''
+            SELECT t.id, e.full_name, t.date, t.check_in, t.check_out, t.minutes
+            FROM timesheet t
+            JOIN employees e ON t.user_id = e.user_id
+            WHERE e.store_id = $1 AND t.status = 'completed' AND t.confirmed = 0
+            ORDER BY t.date DESC, t.id
+            LIMIT $2 OFFSET $3
+        ''', store_id, limit, offset)
+
+    async def get_unconfirmed_counts_by_store(self) -> Dict[int, int]:
+        """Количество неподтверждённых смен по ID магазина (из счетчиков)"""
+        return dict(await self._fetch(
+            "SELECT store_id, unconfirmed FROM store_unconfirmed WHERE unconfirmed > 0"
+        ))
+
+    async def confirm_shift(self, shift_id: int):
+        """Подтвердить конкретную смену"""
+        async with self._transaction() as conn:
+            key = await conn.fetchrow(
+                "UPDATE timesheet SET confirmed = 1 WHERE id = $1 RETURNING user_id, date", shift_id
+            )
+            if key:
+                await self._refresh_rollups(conn, [tuple(key)])
+
+    async def confirm_shifts_in_range(self, start_date: str, end_date: str) -> int:
+        """Подтвердить все смены за период, вернуть количество"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                UPDATE timesheet
+                SET confirmed = 1
+                WHERE date BETWEEN $1 AND $2 AND status = 'completed' AND confirmed = 0
+            ''', start_date, end_date)
+            await self._confirm_rollups(conn, "date BETWEEN $1 AND $2", start_date, end_date)
+        return int(status.split()[-1])
+
+    async def confirm_shifts_for_date(self, date_str: str) -> int:
+        """Подтвердить все смены за день, вернуть количество"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                UPDATE timesheet
+                SET confirmed = 1
+                WHERE date = $1 AND status = 'completed' AND confirmed = 0
+            ''', date_str)
+            await self._confirm_rollups(conn, "date = $1", date_str)
+        return int(status.split()[-1])
+
+    async def confirm_store_shifts(self, store_id: int) -> int:
+        """Подтвердить все смены в магазине, вернуть количество"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                UPDATE timesheet t
+                SET confirmed = 1
+                FROM employees e
+                WHERE e.user_id = t.user_id AND e.store_id = $1
+                  AND t.status = 'completed' AND t.confirmed = 0
+            ''', store_id)
+            await self._confirm_rollups(conn, "store_id = $1", store_id)
+        return int(status.split()[-1])
+
+    async def get_confirm_stats(self) -> Tuple[Tuple[int, int, int], List[Tuple]]:
+        """Общая статистика подтверждений и разбивка по магазинам"""
+        store_stats = await self._fetch('''
+            SELECT s.name, SUM(d.shifts) as total, SUM(d.confirmed) as confirmed
+            FROM daily_store_stats d
+            JOIN stores s ON s.id = d.store_id
+            GROUP BY d.store_id, s.name
+            ORDER BY s.name
+        ''')
+        total = sum(row[1] for row in store_stats)
+        confirmed = sum(row[2] for row in store_stats)
+        return (total, confirmed, total - confirmed), store_stats
+
+    # Должности
+    async def get_positions(self) -> List[Tuple[int, str]]:
+        """Получить список всех должностей (ID, название)"""
+        return await self._fetch("SELECT id, name FROM positions ORDER BY name")
+
+    async def get_position(self, position_id: int) -> Optional[str]:
+        """Название должности по ID"""
+        row = await self._fetchrow("SELECT name FROM positions WHERE id = $1", position_id)
+        return row[0] if row else None
+
+    async def get_position_usage(self) -> Dict[int, int]:
+        """Количество сотрудников на каждой должности по ID"""
+        return dict(await self._fetch(
+            "SELECT position_id, COUNT(*) FROM employees GROUP BY position_id"
+        ))
+
+    async def create_position(self, name: str, created_by: int, created_date: str) -> bool:
+        """Создать должность. False, если такая уже существует"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                INSERT INTO positions (name, created_by, created_date)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (name) DO NOTHING
+            ''', name, created_by, created_date)
+        return status.endswith(' 1')
+
+    async def delete_position(self, position_id: int) -> Tuple[str, int]:
+        """Удалить должность. Статусы как у db.delete_position"""
+        async with self._transaction() as conn:
+            count = await conn.fetchval(
+                "SELECT COUNT(*) FROM employees WHERE position_id = $1", position_id
+            )
+            if count > 0:
+                return 'in_use', count
+
+            status = await conn.execute("DELETE FROM positions WHERE id = $1", position_id)
+        return ('deleted' if status.endswith(' 1') else 'not_found'), 0
+
+    # Магазины
+    async def get_stores(self) -> List[Tuple[int, str, str]]:
+        """Получить список всех магазинов (ID, название, адрес)"""
+        return await self._fetch("SELECT id, name, address FROM stores ORDER BY name")
+
+    async def get_store(self, store_id: int) -> Optional[Tuple[str, str]]:
+        """Название и адрес магазина по ID"""
+        return await self._fetchrow("SELECT name, address FROM stores WHERE id = $1", store_id)
+
+    async def get_store_usage(self) -> Dict[int, int]:
+        """Количество сотрудников в каждом магазине по ID"""
+        return dict(await self._fetch(
+            "SELECT store_id, COUNT(*) FROM employees GROUP BY store_id"
+        ))
+
+    async def create_store(self, name: str, address: str, created_by: int, created_date: str) -> bool:
+        """Создать магазин. False, если такой уже существует"""
+        async with self._transaction() as conn:
+            status = await conn.execute('''
+                INSERT INTO stores (name, address, created_by, created_date)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (name) DO NOTHING
+            ''', name, address, created_by, created_date)
+        return status.endswith(' 1')
+
+    async def delete_store(self, store_id: int) -> int:
+        """Удалить магазин, если в нём нет сотрудников. Возвращает количество сотрудников"""
+        async with self._transaction() as conn:
+            # Блокировка магазина: сотрудника нельзя добавить, пока идет проверка
+            await conn.execute("SELECT 1 FROM stores WHERE id = $1 FOR UPDATE", store_id)
+            count = await conn.fetchval("SELECT COUNT(*) FROM employees WHERE store_id = $1", store_id)
+            if count == 0:
+                await conn.execute("DELETE FROM stores WHERE id = $1", store_id)
+        return count
+
+    # Запросы на удаление
+    async def create_delete_request(self, request_date: str, requester_id: int, requester_name: str,
+                                    target_type: str, target_id: str) -> Tuple[str, Optional[str]]:
+        """Создать запрос на удаление. Статусы как у db.create_delete_request"""
+        async with self._transaction() as conn:
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('delete_requests'))")
+            existing = await conn.fetchval('''
+                SELECT id FROM delete_requests
+                WHERE target_type = $1 AND target_id = $2 AND status = 'pending'
+            ''', target_type, target_id)
+            if existing:
+                return 'exists', None
+
+            if target_type == "employee":
+                target_name = await conn.fetchval(
+                    "SELECT full_name FROM employees WHERE user_id = $1", int(target_id)
+                )
+            else:  # store
+                target_name = await conn.fetchval(
+                    "SELECT name FROM stores WHERE id = $1", int(target_id)
+                )
+            if target_name is None:
+                return 'not_found', None
+
+            await conn.execute('''
+                INSERT INTO delete_requests
+                (request_date, requester_id, requester_name, target_type, target_id, target_name, status)
+                VALUES ($1, $2, $3, $4, $5, $6, 'pending')
+            ''', request_date, requester_id, requester_name, target_type, target_id, target_name)
+        return 'created', target_name
+
+    async def get_delete_requests(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        """Все запросы на удаление, ожидающие - первыми; limit/offset - страница списка"""
+        return await self._fetch(f'''
+            SELECT id, request_date, requester_name, target_type, target_name, status
+            FROM delete_requests
+            {REQUEST_ORDER}
+            LIMIT $1 OFFSET $2
+        ''', limit, offset)
+
+    async def approve_delete_request(self, request_id: int) -> Tuple[str, Optional[Tuple], int]:
+        """Одобрить запрос на удаление и выполнить удаление. Результат как у db.approve_delete_request"""
+        async with self._transaction() as conn:
+            request = _row(await conn.fetchrow('''
+                SELECT target_type, target_id, target_name, requester_id, requester_name
+                FROM delete_requests
+                WHERE id = $1 AND status = 'pending'
+                FOR UPDATE
+            ''', request_id))
+            if not request:
+                return 'not_found', None, 0
+
+            target_type, target_id, target_name, requester_id, requester_name = request
+            emp_count = 0
+
+            if target_type == "employee":
+                is_super_admin = await conn.fetchval(
+                    "SELECT is_super_admin FROM employees WHERE user_id = $1 FOR UPDATE", int(target_id)
+                )
+                if is_super_admin == 1:
+                    return 'super_admin', request, 0
+
+                days = await conn.fetch(
+                    "SELECT user_id, date FROM daily_user_stats WHERE user_id = $1", int(target_id)
+                )
+                await conn.execute("DELETE FROM employees WHERE user_id = $1", int(target_id))
+                await self._refresh_rollups(conn, _rows(days))
+            else:
+                await conn.execute("SELECT 1 FROM stores WHERE id = $1 FOR UPDATE", int(target_id))
+                emp_count = await conn.fetchval(
+                    "SELECT COUNT(*) FROM employees WHERE store_id = $1", int(target_id)
+                )
+                if emp_count > 0:
+                    return 'store_in_use', request, emp_count
+
+                await conn.execute("DELETE FROM stores WHERE id = $1", int(target_id))
+
+            await conn.execute(
+                "UPDATE delete_requests SET status = 'approved' WHERE id = $1", request_id
+            )
+        return 'approved', request, emp_count
+
+    async def reject_delete_request(self, request_id: int) -> Optional[Tuple]:
+        """Отклонить запрос на удаление. Возвращает (target_type, target_name, requester_id)"""
+        return await self._set_request_status(
+            'delete_requests', "target_type, target_name, requester_id", request_id, 'rejected'
+        )
+
+    async def _set_request_status(self, table: str, columns: str, request_id: int,
+                                  status: str) -> Optional[Tuple]:
+        async with self._transaction() as conn:
+            return _row(await conn.fetchrow(f'''
+                UPDATE {table}
+                SET status = $2
+                WHERE id = $1 AND status = 'pending'
+                RETURNING {columns}
+            ''', request_id, status))
+
+    # Заявки на админа
+    async def create_admin_request(self, request_date: str, user_id: int, user_name: str,
+                                   position: str, store: str) -> bool:
+        """Создать заявку на админа. False, если активная заявка уже есть"""
+        async with self._transaction() as conn:
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", user_id)
+            existing = await conn.fetchval('''
+                SELECT id FROM admin_requests
+                WHERE user_id = $1 AND status = 'pending'
+            ''', user_id)
+            if existing:
+                return False
+
+            await conn.execute('''
+                INSERT INTO admin_requests
+                (request_date, user_id, user_name, user_position, user_store, status)
+                VALUES ($1, $2, $3, $4, $5, 'pending')
+            ''', request_date, user_id, user_name, position, store)
+        return True
+
+    async def get_admin_requests(self, limit: Optional[int] = None, offset: int = 0) -> List[Tuple]:
+        """Все заявки на админа, ожидающие - первыми; limit/offset - страница списка"""
+        return await self._fetch(f'''
+            SELECT id, request_date, user_name, user_position, user_store, user_id, status
+            FROM admin_requests
+            {REQUEST_ORDER}
+            LIMIT $1 OFFSET $2
+        ''', limit, offset)
+
+    async def approve_admin_request(self, request_id: int, reg_date: str) -> Optional[Tuple]:
+        """Одобрить заявку на админа. Возвращает (user_id, user_name, user_position, user_store)"""
+        async with self._transaction() as conn:
+            request = _row(await conn.fetchrow('''
+                UPDATE admin_requests
+                SET status = 'approved'
+                WHERE id = $1 AND status = 'pending'
+                RETURNING user_id, user_name, user_position, user_store
+            ''', request_id))
+            if not request:
+                return None
+
+            user_id, user_name, user_position, user_store = request
+            status = await conn.execute(
+                "UPDATE employees SET is_admin = 1 WHERE user_id = $1", user_id
+            )
+            if status.endswith(' 0'):
+                # Новый пользователь - создаем запись, должность и магазин берутся из заявки
+                position_id, store_id = await self._reference_ids(
+                    conn, user_position, user_store, user_id, reg_date
+                )
+                await conn.execute('''
+                    INSERT INTO employees
+                    (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+                    VALUES ($1, $2, $3, $4, $5, 1, 0, 0)
+                ''', user_id, user_name, position_id, store_id, reg_date)
+        return request
+
+    async def reject_admin_request(self, request_id: int) -> Optional[Tuple]:
+        """Отклонить заявку на админа. Возвращает (user_id, user_name)"""
+        return await self._set_request_status(
+            'admin_requests', "user_id, user_name", request_id, 'rejected'
+        )
+
+    # Очередь уведомлений
+    async def add_notifications(self, chat_ids: List[int], text: str, created: int,
+                                lease_until: int) -> List[Tuple[int, int]]:
+        """Записать уведомления, занятые отправкой до lease_until. Возвращает (id, chat_id)"""
+        return await self._fetch('''
+            INSERT INTO notifications (chat_id, text, created, next_attempt)
+            SELECT chat_id, $2, $3, $4 FROM unnest($1::bigint[]) AS chat_id
+            RETURNING id, chat_id
+        ''', list(chat_ids), text, created, lease_until)
+
+    async def claim_notifications(self, now: int, lease_until: int, limit: int) -> List[Tuple[int, int, str, int]]:
+        """Забрать уведомления, которым пора повторить отправку: (id, chat_id, text, attempts).
+
+        Строки, которые забирает другой процесс, пропускаются.
+        """
+        return await self._fetch('''
+            UPDATE notifications n
+            SET next_attempt = $2
+            FROM (
+                SELECT id FROM notifications
+                WHERE next_attempt <= $1
+                ORDER BY next_attempt
+                LIMIT $3
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE n.id = due.id
+            RETURNING n.id, n.chat_id, n.text, n.attempts
+        ''', now, lease_until, limit)
+
+    async def delete_notifications(self, notification_ids: List[int]) -> int:
+        """Удалить доставленные (или недоставляемые) уведомления"""
+        async with self.pool.acquire() as conn:
+            status = await conn.execute(
+                "DELETE FROM notifications WHERE id = ANY($1::bigint[])", list(notification_ids)
+            )
+        return int(status.split()[-1])
+
+    async def defer_notification(self, notification_id: int, next_attempt: Optional[int], error: str):
+        """Отложить уведомление до next_attempt (None - больше не пытаться)"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE notifications
+                SET attempts = attempts + 1, next_attempt = $2, last_error = $3
+                WHERE id = $1
+            ''', notification_id, next_attempt, error)
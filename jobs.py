@@ -0,0 +1,160 @@
+"""Фоновые задачи для тяжелых отчетов администраторов.
+
+Нажатие кнопки только ставит задачу и сразу отвечает «готовится…»;
+задача выполняется в пуле из JOB_WORKERS исполнителей и сама доставляет
+результат (документ или текст), когда он готов. Повторный запрос того же
+отчета тем же пользователем, пока задача не завершена, возвращает уже
+поставленную задачу. Пользователь видит свои задачи и может их отменить.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import Durations
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Незавершенных задач у одного пользователя (0 - без предела)
+JOB_MAX_PER_USER = int(os.getenv('JOB_MAX_PER_USER', '5'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+
+
+class JobLimitError(Exception):
+    """У пользователя слишком много незавершенных задач"""
+
+
+class Job:
+    """Поставленная задача: владелец, ключ для слияния повторов и состояние"""
+
+    __slots__ = ('id', 'owner', 'key', 'title', 'status', 'created', 'started', 'task')
+
+    def __init__(self, job_id: int, owner: int, key: Hashable, title: str):
+        self.id = job_id
+        self.owner = owner
+        self.key = key
+        self.title = title
+        self.status = QUEUED
+        self.created = time.monotonic()
+        self.started: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def age(self) -> float:
+        """Секунд с постановки задачи"""
+        return time.monotonic() - self.created
+
+
+class JobMetrics:
+    """Счетчики задач и времени их ожидания и выполнения"""
+
+    def __init__(self):
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wait = Durations()
+        self.run = Durations()
+
+    def record(self, wait: float, run: float):
+        """Учесть одну выполненную задачу"""
+        self.wait.record(wait)
+        self.run.record(run)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов"""
+        return {
+            'submitted': self.submitted,
+            'deduplicated': self.deduplicated,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            **self.wait.snapshot('wait'),
+            **self.run.snapshot('run'),
+        }
+
+
+class JobRunner:
+    """Пул исполнителей фоновых задач.
+
+    Задача - корутинная функция без аргументов: она строит результат и сама
+    отправляет его пользователю. Ошибки и отмену обрабатывает тоже она
+    (отмена приходит как CancelledError); runner только считает их.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_per_owner: int = JOB_MAX_PER_USER):
+        self.workers = max(1, workers)
+        self.max_per_owner = max_per_owner
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._ids = itertools.count(1)
+        self._jobs: Dict[int, Job] = {}
+        self._by_key: Dict[Tuple[int, Hashable], Job] = {}
+        self.metrics = JobMetrics()
+
+    def submit(self, owner: int, key: Hashable, title: str,
+               work: Callable[[], Awaitable[Any]]) -> Tuple[Job, bool]:
+        """Поставить задачу; возвращает задачу и False, если такая уже стоит.
+
+        JobLimitError - у владельца уже max_per_owner незавершенных задач.
+        """
+        job = self._by_key.get((owner, key))
+        if job is not None:
+            self.metrics.deduplicated += 1
+            return job, False
+        if self.max_per_owner and len(self.jobs(owner)) >= self.max_per_owner:
+            self.metrics.rejected += 1
+            raise JobLimitError(f"Незавершенных задач: {self.max_per_owner}")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        job = Job(next(self._ids), owner, key, title)
+        self._jobs[job.id] = job
+        self._by_key[(owner, key)] = job
+        job.task = asyncio.create_task(self._run(job, work))
+        self.metrics.submitted += 1
+        return job, True
+
+    async def _run(self, job: Job, work: Callable[[], Awaitable[Any]]):
+        try:
+            async with self._slots:
+                job.status = RUNNING
+                job.started = time.monotonic()
+                try:
+                    await work()
+                    self.metrics.completed += 1
+                except Exception as e:
+                    self.metrics.failed += 1
+                    logger.error(f"Ошибка фоновой задачи {job.id} ({job.title}): {e}", exc_info=True)
+                self.metrics.record(job.started - job.created, time.monotonic() - job.started)
+        except asyncio.CancelledError:
+            self.metrics.cancelled += 1
+        finally:
+            del self._jobs[job.id]
+            del self._by_key[(job.owner, job.key)]
+
+    def jobs(self, owner: int) -> List[Job]:
+        """Незавершенные задачи владельца в порядке постановки"""
+        return [job for job in self._jobs.values() if job.owner == owner]
+
+    def cancel(self, owner: int, job_id: int) -> bool:
+        """Отменить задачу владельца; False - задачи нет или она уже завершена"""
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    async def shutdown(self):
+        """Отменить незавершенные задачи и дождаться их остановки"""
+        tasks = [job.task for job in self._jobs.values()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,26 @@
+"""Учет длительностей для счетчиков в логах: ожидание в очереди, выполнение."""
+from typing import Any, Dict
+
+
+class Durations:
+    """Число, сумма и максимум длительностей одного вида"""
+
+    __slots__ = ('count', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        """Учесть одну длительность"""
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self, name: str) -> Dict[str, Any]:
+        """avg_<name>_ms и max_<name>_ms; среднее None, пока не учтено ни одной"""
+        return {
+            f'avg_{name}_ms': round(self.seconds / self.count * 1000, 2) if self.count else None,
+            f'max_{name}_ms': round(self.max_seconds * 1000, 2),
+        }
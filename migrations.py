@@ -0,0 +1,558 @@
+"""Версионированные миграции схемы базы данных.
+
+Каждая миграция - функция, получающая соединение; номер версии задает порядок.
+Примененные версии хранятся в таблице schema_migrations, поэтому при запуске
+выполняются только новые шаги, каждый в своей транзакции.
+"""
+import logging
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Смены хранятся в секундах эпохи, рабочая дата считается по UTC+8
+# (Asia/Singapore без перехода на летнее время). Смещение входит в
+# определение вычисляемого столбца timesheet.date
+UTC_OFFSET = 8 * 3600
+
+# Список миграций: (версия, название, функция)
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = []
+
+
+def migration(version: int, name: str) -> Callable:
+    """Зарегистрировать шаг миграции"""
+    def decorator(func: Callable[[sqlite3.Connection], None]) -> Callable:
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        MIGRATIONS.append((version, name, func))
+        return func
+    return decorator
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Последняя примененная версия схемы"""
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применить все новые миграции. Возвращает версию схемы"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+    # Пересборка таблиц невозможна при включенных внешних ключах,
+    # целостность проверяется отдельно после всех шагов
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, name, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, datetime.now().isoformat())
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Миграция {version} ({name}) не применена")
+                raise
+            logger.info(f"Применена миграция {version}: {name}")
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+    violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+    if violations:
+        logger.error(f"Нарушены внешние ключи: {len(violations)}, например {violations[:5]}")
+
+    return current_version(conn)
+
+
+@migration(1, "base tables")
+def _base_tables(conn: sqlite3.Connection):
+    # Таблица сотрудников
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            user_id INTEGER PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            position TEXT NOT NULL,
+            store TEXT NOT NULL,
+            reg_date TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            is_super_admin INTEGER DEFAULT 0,
+            can_request_admin INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Таблица табеля
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS timesheet (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT DEFAULT 'working',
+            check_in TEXT,
+            check_out TEXT,
+            hours REAL DEFAULT 0,
+            notes TEXT,
+            confirmed INTEGER DEFAULT 0,
+            created_by_admin INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES employees (user_id)
+        )
+    ''')
+
+    # Таблица должностей
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS positions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_date TEXT NOT NULL
+        )
+    ''')
+
+    # Таблица магазинов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            address TEXT,
+            created_by INTEGER NOT NULL,
+            created_date TEXT NOT NULL
+        )
+    ''')
+
+    # Таблица запросов на удаление
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS delete_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_date TEXT NOT NULL,
+            requester_id INTEGER NOT NULL,
+            requester_name TEXT NOT NULL,
+            target_type TEXT NOT NULL,
+            target_id TEXT NOT NULL,
+            target_name TEXT NOT NULL,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+
+    # Таблица запросов на админа
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS admin_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_date TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            user_position TEXT,
+            user_store TEXT,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+
+
+@migration(2, "timesheet cascades on employee delete")
+def _timesheet_cascade(conn: sqlite3.Connection):
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'timesheet'"
+    ).fetchone()[0]
+    if 'ON DELETE CASCADE' in sql.upper():
+        return
+
+    # Смены удаленных сотрудников нарушили бы внешний ключ. Это данные для
+    # расчета зарплаты - они не удаляются, а переносятся в orphaned_timesheet
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS orphaned_timesheet (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT,
+            check_in TEXT,
+            check_out TEXT,
+            hours REAL,
+            notes TEXT,
+            confirmed INTEGER,
+            created_by_admin INTEGER,
+            moved_at TEXT NOT NULL
+        )
+    ''')
+    orphans = conn.execute('''
+        INSERT INTO orphaned_timesheet
+            (id, user_id, date, status, check_in, check_out, hours, notes, confirmed, created_by_admin, moved_at)
+        SELECT id, user_id, date, status, check_in, check_out, hours, notes, confirmed, created_by_admin, ?
+        FROM timesheet
+        WHERE user_id NOT IN (SELECT user_id FROM employees)
+    ''', (datetime.now().isoformat(),)).rowcount
+    if orphans:
+        conn.execute("DELETE FROM timesheet WHERE user_id NOT IN (SELECT user_id FROM employees)")
+        logger.warning(f"Смены без сотрудника перенесены в orphaned_timesheet: {orphans}")
+
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'timesheet'").fetchone()
+    sequence = row[0] if row else 0
+
+    conn.execute('''
+        CREATE TABLE timesheet_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT DEFAULT 'working',
+            check_in TEXT,
+            check_out TEXT,
+            hours REAL DEFAULT 0,
+            notes TEXT,
+            confirmed INTEGER DEFAULT 0,
+            created_by_admin INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES employees (user_id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO timesheet_new
+            (id, user_id, date, status, check_in, check_out, hours, notes, confirmed, created_by_admin)
+        SELECT id, user_id, date, status, check_in, check_out, hours, notes, confirmed, created_by_admin
+        FROM timesheet
+    ''')
+    conn.execute("DROP TABLE timesheet")
+    conn.execute("ALTER TABLE timesheet_new RENAME TO timesheet")
+
+    # Не выдавать заново ID уже удаленных смен
+    conn.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'timesheet'", (sequence,)
+    )
+
+
+@migration(3, "indexes for shift and employee lookups")
+def _query_indexes(conn: sqlite3.Connection):
+    # Текущая смена сотрудника: user_id = ? AND date = ? AND status = ?
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_timesheet_user_date_status
+        ON timesheet (user_id, date, status)
+    ''')
+    # Периоды и даты: date BETWEEN ? AND ? AND status = ? AND confirmed = ?
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_timesheet_date_status_confirmed
+        ON timesheet (date, status, confirmed)
+    ''')
+    # Неподтвержденные смены по магазину: JOIN employees ... WHERE e.store = ?
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_timesheet_unconfirmed
+        ON timesheet (user_id, date)
+        WHERE status = 'completed' AND confirmed = 0
+    ''')
+    # Открытые смены
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_timesheet_working
+        ON timesheet (date, user_id)
+        WHERE status = 'working'
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employees_store ON employees (store)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employees_position ON employees (position)")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_delete_requests_status
+        ON delete_requests (status, request_date)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_admin_requests_user_status
+        ON admin_requests (user_id, status)
+    ''')
+    conn.execute("ANALYZE")
+
+
+@migration(4, "employees reference stores and positions by id")
+def _employee_reference_ids(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(employees)")}
+    if 'store_id' in columns:
+        return
+
+    # Должности и магазины, которые были записаны у сотрудников только текстом
+    today = datetime.now().date().isoformat()
+    created = conn.execute('''
+        INSERT INTO positions (name, created_by, created_date)
+        SELECT DISTINCT position, 0, ? FROM employees
+        WHERE position NOT IN (SELECT name FROM positions)
+    ''', (today,)).rowcount
+    created += conn.execute('''
+        INSERT INTO stores (name, address, created_by, created_date)
+        SELECT DISTINCT store, '', 0, ? FROM employees
+        WHERE store NOT IN (SELECT name FROM stores)
+    ''', (today,)).rowcount
+    if created:
+        logger.warning(f"Созданы недостающие должности и магазины: {created}")
+
+    conn.execute('''
+        CREATE TABLE employees_new (
+            user_id INTEGER PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            position_id INTEGER NOT NULL REFERENCES positions (id),
+            store_id INTEGER NOT NULL REFERENCES stores (id),
+            reg_date TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            is_super_admin INTEGER DEFAULT 0,
+            can_request_admin INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO employees_new
+            (user_id, full_name, position_id, store_id, reg_date, is_admin, is_super_admin, can_request_admin)
+        SELECT e.user_id, e.full_name, p.id, s.id, e.reg_date, e.is_admin, e.is_super_admin, e.can_request_admin
+        FROM employees e
+        JOIN positions p ON p.name = e.position
+        JOIN stores s ON s.name = e.store
+    ''')
+    conn.execute("DROP TABLE employees")
+    conn.execute("ALTER TABLE employees_new RENAME TO employees")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employees_store ON employees (store_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employees_position ON employees (position_id)")
+
+    # Запросы на удаление магазина ссылаются на магазин по ID
+    conn.execute('''
+        UPDATE delete_requests
+        SET target_id = CAST((SELECT id FROM stores WHERE name = delete_requests.target_id) AS TEXT)
+        WHERE target_type = 'store' AND target_id IN (SELECT name FROM stores)
+    ''')
+    conn.execute("ANALYZE")
+
+
+@migration(5, "daily rollups per employee and per store")
+def _daily_rollups(conn: sqlite3.Connection):
+    # Завершенные смены сотрудника за день
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            store_id INTEGER NOT NULL,
+            hours REAL NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_hours REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_user_stats_store_date
+        ON daily_user_stats (store_id, date)
+    ''')
+
+    # Завершенные смены магазина за день
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_store_stats (
+            store_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            hours REAL NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_hours REAL NOT NULL DEFAULT 0,
+            employees INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_id, date)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_store_stats_date
+        ON daily_store_stats (date)
+    ''')
+
+    conn.execute('''
+        INSERT INTO daily_user_stats (user_id, date, store_id, hours, shifts, confirmed, confirmed_hours)
+        SELECT t.user_id, t.date, e.store_id, SUM(t.hours), COUNT(*),
+               SUM(t.confirmed = 1), SUM(CASE WHEN t.confirmed = 1 THEN t.hours ELSE 0 END)
+        FROM timesheet t
+        JOIN employees e ON e.user_id = t.user_id
+        WHERE t.status = 'completed'
+        GROUP BY t.user_id, t.date
+    ''')
+    conn.execute('''
+        INSERT INTO daily_store_stats (store_id, date, hours, shifts, confirmed, confirmed_hours, employees)
+        SELECT store_id, date, SUM(hours), SUM(shifts), SUM(confirmed), SUM(confirmed_hours), COUNT(*)
+        FROM daily_user_stats
+        GROUP BY store_id, date
+    ''')
+
+
+def _iso_to_epoch(value: Optional[str], date_str: str) -> int:
+    """ISO-время смены в секунды эпохи; без времени - полночь рабочей даты по UTC+8"""
+    local = timezone(timedelta(seconds=UTC_OFFSET))
+    dt = datetime.fromisoformat(value) if value else datetime.fromisoformat(date_str)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=local)
+    return int(dt.timestamp())
+
+
+def fill_daily_rollups(conn: sqlite3.Connection):
+    """Пересчитать дневные сводки по сотрудникам и магазинам из табеля"""
+    conn.execute("DELETE FROM daily_user_stats")
+    conn.execute("DELETE FROM daily_store_stats")
+    conn.execute('''
+        INSERT INTO daily_user_stats (user_id, date, store_id, minutes, shifts, confirmed, confirmed_minutes)
+        SELECT t.user_id, t.date, e.store_id, SUM(t.minutes), COUNT(*),
+               SUM(t.confirmed = 1), SUM(CASE WHEN t.confirmed = 1 THEN t.minutes ELSE 0 END)
+        FROM timesheet t
+        JOIN employees e ON e.user_id = t.user_id
+        WHERE t.status = 'completed'
+        GROUP BY t.user_id, t.date
+    ''')
+    conn.execute('''
+        INSERT INTO daily_store_stats (store_id, date, minutes, shifts, confirmed, confirmed_minutes, employees)
+        SELECT store_id, date, SUM(minutes), SUM(shifts), SUM(confirmed), SUM(confirmed_minutes), COUNT(*)
+        FROM daily_user_stats
+        GROUP BY store_id, date
+    ''')
+
+
+@migration(6, "epoch timestamps and integer minutes")
+def _epoch_timesheet(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(timesheet)")}
+    if 'minutes' in columns:
+        return
+
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'timesheet'").fetchone()
+    sequence = row[0] if row else 0
+
+    # Рабочая дата вычисляется из начала смены, отдельно ее больше не записывают
+    conn.execute(f'''
+        CREATE TABLE timesheet_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'working',
+            check_in INTEGER NOT NULL,
+            check_out INTEGER,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            notes TEXT,
+            confirmed INTEGER DEFAULT 0,
+            created_by_admin INTEGER DEFAULT 0,
+            date TEXT GENERATED ALWAYS AS (date(check_in + {UTC_OFFSET}, 'unixepoch')) STORED,
+            FOREIGN KEY (user_id) REFERENCES employees (user_id) ON DELETE CASCADE
+        )
+    ''')
+    conn.create_function("iso_to_epoch", 2, _iso_to_epoch, deterministic=True)
+    conn.execute('''
+        INSERT INTO timesheet_new
+            (id, user_id, status, check_in, check_out, minutes, notes, confirmed, created_by_admin)
+        SELECT id, user_id, status, iso_to_epoch(check_in, date),
+               CASE WHEN check_out IS NOT NULL THEN iso_to_epoch(check_out, date) END,
+               CAST(ROUND(COALESCE(hours, 0) * 60) AS INTEGER), notes, confirmed, created_by_admin
+        FROM timesheet
+    ''')
+
+    moved = conn.execute('''
+        SELECT COUNT(*) FROM timesheet_new n JOIN timesheet t ON t.id = n.id
+        WHERE n.date <> t.date
+    ''').fetchone()[0]
+    if moved:
+        logger.warning(f"Смен с датой, не совпадающей с началом смены: {moved}")
+
+    conn.execute("DROP TABLE timesheet")
+    conn.execute("ALTER TABLE timesheet_new RENAME TO timesheet")
+    conn.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'timesheet'", (sequence,)
+    )
+
+    conn.execute('''
+        CREATE INDEX idx_timesheet_user_date_status
+        ON timesheet (user_id, date, status)
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_timesheet_date_status_confirmed
+        ON timesheet (date, status, confirmed)
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_timesheet_unconfirmed
+        ON timesheet (user_id, date)
+        WHERE status = 'completed' AND confirmed = 0
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_timesheet_working
+        ON timesheet (date, user_id)
+        WHERE status = 'working'
+    ''')
+
+    # Сводки тоже считают минуты: целые суммы не накапливают ошибку округления
+    conn.execute("DROP TABLE daily_user_stats")
+    conn.execute("DROP TABLE daily_store_stats")
+    conn.execute('''
+        CREATE TABLE daily_user_stats (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            store_id INTEGER NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_daily_user_stats_store_date
+        ON daily_user_stats (store_id, date)
+    ''')
+    conn.execute('''
+        CREATE TABLE daily_store_stats (
+            store_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            minutes INTEGER NOT NULL DEFAULT 0,
+            shifts INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0,
+            confirmed_minutes INTEGER NOT NULL DEFAULT 0,
+            employees INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (store_id, date)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX idx_daily_store_stats_date
+        ON daily_store_stats (date)
+    ''')
+    fill_daily_rollups(conn)
+    conn.execute("ANALYZE")
+
+
+def fill_store_unconfirmed(conn: sqlite3.Connection):
+    """Пересчитать счетчики неподтвержденных смен магазинов по дневным сводкам"""
+    conn.execute("DELETE FROM store_unconfirmed")
+    conn.execute('''
+        INSERT INTO store_unconfirmed (store_id, unconfirmed)
+        SELECT store_id, SUM(shifts - confirmed)
+        FROM daily_store_stats
+        GROUP BY store_id
+        HAVING SUM(shifts - confirmed) > 0
+    ''')
+
+
+@migration(7, "per-store unconfirmed shift counters")
+def _store_unconfirmed(conn: sqlite3.Connection):
+    # Одна строка на магазин: меню подтверждения не сканирует историю табеля
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS store_unconfirmed (
+            store_id INTEGER PRIMARY KEY,
+            unconfirmed INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    fill_store_unconfirmed(conn)
+
+
+@migration(8, "notification outbox")
+def _notifications(conn: sqlite3.Connection):
+    # Уведомления до доставки; next_attempt NULL - попытки исчерпаны
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            created INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt INTEGER,
+            last_error TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notifications_next_attempt
+        ON notifications (next_attempt)
+        WHERE next_attempt IS NOT NULL
+    ''')
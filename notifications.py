@@ -0,0 +1,164 @@
+"""Доставка уведомлений пользователям (супер-админам, заявителям).
+
+Обработчик вызывает notify() и сразу продолжает работу: уведомления
+записываются в очередь в базе и рассылаются в фоне, одновременно не больше
+NOTIFY_CONCURRENCY отправок. Временная ошибка повторяется с растущей паузой
+NOTIFY_RETRIES раз; недоставленное уведомление остается в базе, и
+retry_pending() повторяет его позже, пока не будет исчерпано
+NOTIFY_MAX_ATTEMPTS таких серий. Заблокировавший бота или несуществующий чат
+повторять бесполезно - такие уведомления удаляются сразу.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram.error import BadRequest, Forbidden
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))
+NOTIFY_RETRIES = int(os.getenv('NOTIFY_RETRIES', '3'))
+NOTIFY_BACKOFF = float(os.getenv('NOTIFY_BACKOFF', '1'))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '10'))
+# Как часто повторять недоставленные уведомления из базы (секунды, 0 - не повторять)
+NOTIFY_RETRY_INTERVAL = int(os.getenv('NOTIFY_RETRY_INTERVAL', '60'))
+# Сколько уведомление считается занятым отправкой и не выдается повторно (секунды)
+NOTIFY_LEASE = int(os.getenv('NOTIFY_LEASE', '300'))
+NOTIFY_CLAIM_LIMIT = 100
+
+Send = Callable[[int, str], Awaitable[Any]]
+
+
+class NotificationMetrics:
+    """Счетчики доставки уведомлений"""
+
+    def __init__(self):
+        self.queued = 0
+        self.delivered = 0
+        self.retried = 0
+        self.deferred = 0
+        self.dropped = 0
+        self.abandoned = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов"""
+        return {
+            'queued': self.queued,
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'deferred': self.deferred,
+            'dropped': self.dropped,
+            'abandoned': self.abandoned,
+        }
+
+
+class Notifier:
+    """Рассылка уведомлений через очередь в базе.
+
+    storage - хранилище с операциями add/claim/delete/defer_notification(s);
+    send(chat_id, text) задается в start(), когда бот уже создан.
+    """
+
+    def __init__(self, storage: Any, concurrency: int = NOTIFY_CONCURRENCY, retries: int = NOTIFY_RETRIES,
+                 backoff: float = NOTIFY_BACKOFF, max_attempts: int = NOTIFY_MAX_ATTEMPTS):
+        self.storage = storage
+        self.concurrency = max(1, concurrency)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self._send: Optional[Send] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics = NotificationMetrics()
+
+    def start(self, send: Send):
+        """Начать рассылку через send(chat_id, text)"""
+        self._send = send
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def stop(self):
+        """Дождаться рассылок, начатых до остановки.
+
+        Недоставленное остается в базе и будет отправлено после перезапуска.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def notify(self, chat_ids: Iterable[int], text: str):
+        """Поставить уведомление в очередь для каждого чата; не ждет отправки"""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        if not chat_ids:
+            return
+        self.metrics.queued += len(chat_ids)
+        self._spawn(self._fan_out(chat_ids, text))
+
+    def _spawn(self, coroutine: Awaitable[Any]):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fan_out(self, chat_ids: List[int], text: str):
+        now = int(time.time())
+        try:
+            rows = await self.storage.add_notifications(chat_ids, text, now, now + NOTIFY_LEASE)
+        except Exception as e:
+            # Без записи в базе уведомление все равно пробуем отправить
+            logger.error(f"Ошибка при записи уведомлений в очередь: {e}")
+            rows = [(None, chat_id) for chat_id in chat_ids]
+        await self._deliver_all([(notification_id, chat_id, text, 0) for notification_id, chat_id in rows])
+
+    async def retry_pending(self) -> int:
+        """Повторить недоставленные уведомления, которым пора. Возвращает их число"""
+        now = int(time.time())
+        rows = await self.storage.claim_notifications(now, now + NOTIFY_LEASE, NOTIFY_CLAIM_LIMIT)
+        if rows:
+            await self._deliver_all(rows)
+        return len(rows)
+
+    async def _deliver_all(self, rows: List[Tuple[Optional[int], int, str, int]]):
+        done = await asyncio.gather(*(self._deliver(*row) for row in rows))
+        finished = [row[0] for row, ok in zip(rows, done) if ok and row[0] is not None]
+        if finished:
+            try:
+                await self.storage.delete_notifications(finished)
+            except Exception as e:
+                logger.error(f"Ошибка при удалении доставленных уведомлений: {e}")
+
+    async def _deliver(self, notification_id: Optional[int], chat_id: int, text: str, attempts: int) -> bool:
+        """Отправить уведомление; True - больше не нужно (доставлено или недоставляемо)"""
+        error: Optional[Exception] = None
+        for attempt in range(self.retries):
+            if attempt:
+                self.metrics.retried += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                async with self._slots:
+                    await self._send(chat_id, text)
+            except (Forbidden, BadRequest) as e:
+                logger.warning(f"Уведомление для {chat_id} недоставляемо: {e}")
+                self.metrics.dropped += 1
+                return True
+            except Exception as e:
+                error = e
+                continue
+            self.metrics.delivered += 1
+            return True
+
+        attempts += 1
+        if notification_id is None:
+            logger.error(f"Уведомление для {chat_id} не доставлено и не сохранено: {error}")
+            return False
+        if attempts >= self.max_attempts:
+            logger.error(f"Уведомление {notification_id} для {chat_id} не доставлено, серий попыток: {attempts}: {error}")
+            self.metrics.abandoned += 1
+            next_attempt = None
+        else:
+            self.metrics.deferred += 1
+            next_attempt = int(time.time() + self.backoff * 2 ** (self.retries + attempts))
+        try:
+            await self.storage.defer_notification(notification_id, next_attempt, str(error))
+        except Exception as e:
+            logger.error(f"Ошибка при откладывании уведомления {notification_id}: {e}")
+        return False
@@ -0,0 +1,193 @@
+"""Планировщик исходящих запросов к Telegram с учетом ограничений частоты.
+
+Подключается к приложению как rate_limiter, поэтому через него проходят
+все вызовы Bot API. Запросы в чат (с chat_id) ограничиваются двумя
+ведрами токенов: общим на бота (OUTBOUND_GLOBAL_RATE в секунду) и своим
+для каждого чата (OUTBOUND_CHAT_RATE в секунду с запасом
+OUTBOUND_CHAT_BURST, для групп - OUTBOUND_GROUP_PER_MINUTE в минуту).
+Остальные запросы (getUpdates, answerCallbackQuery) не ограничиваются.
+
+Приоритет запроса передается в rate_limit_args: ответы пользователю,
+части отчетов и документы, уведомления. Запросы с низким приоритетом
+берут токен из общего ведра, только если в нем остается запас для более
+срочных. RetryAfter от Telegram приостанавливает чат на указанное время,
+запрос повторяется до OUTBOUND_MAX_RETRIES раз.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from cache import LRUCache
+from metrics import Durations
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_CHAT_BUCKETS = int(os.getenv('OUTBOUND_CHAT_BUCKETS', '10000'))
+
+# Классы приоритета (rate_limit_args); меньше - срочнее
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NOTIFY = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk', PRIORITY_NOTIFY: 'notify'}
+# Запас токенов общего ведра, который класс оставляет более срочным
+PRIORITY_RESERVE = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BULK: 5.0, PRIORITY_NOTIFY: 10.0}
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'blocked_until', '_clock')
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def delay(self, reserve: float = 0.0) -> float:
+        """Секунд до появления токена сверх reserve; 0 - токен есть"""
+        now = self._clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = 1.0 + min(reserve, self.burst - 1.0)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self):
+        """Забрать токен (после delay() == 0)"""
+        self.tokens -= 1.0
+
+    def block(self, seconds: float):
+        """Не выдавать токены seconds секунд (ответ RetryAfter)"""
+        self.blocked_until = max(self.blocked_until, self._clock() + seconds)
+        self.tokens = 0.0
+
+
+class OutboundMetrics:
+    """Счетчики одного класса приоритета: очередь, ожидание и повторы"""
+
+    def __init__(self):
+        self.requests = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        # Ожидание токена запросами, которым он достался не сразу
+        self.wait = Durations()
+        self.retry_after = 0
+        self.failed = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов"""
+        return {
+            'requests': self.requests,
+            'delayed': self.wait.count,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            **self.wait.snapshot('wait'),
+            'retry_after': self.retry_after,
+            'failed': self.failed,
+        }
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """Ограничитель частоты для ApplicationBuilder.rate_limiter"""
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, group_per_minute: float = OUTBOUND_GROUP_PER_MINUTE,
+                 max_retries: int = OUTBOUND_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_retries = max_retries
+        # Ведро чата; давно не писавшие чаты вытесняются, их ведра все равно полны
+        self._chats = LRUCache(OUTBOUND_CHAT_BUCKETS, float('inf'))
+        self.metrics = {priority: OutboundMetrics() for priority in PRIORITY_NAMES}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id, None)
+        if bucket is None:
+            # Отрицательный ID или @имя - группа или канал
+            if isinstance(chat_id, str) or chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1.0)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats.put(chat_id, bucket)
+        return bucket
+
+    async def _acquire(self, chat_id: Union[int, str], priority: int, metrics: OutboundMetrics):
+        """Дождаться токенов чата и общего ведра"""
+        reserve = PRIORITY_RESERVE[priority]
+        started = None
+        try:
+            while True:
+                chat = self._chat_bucket(chat_id)
+                delay = max(chat.delay(), self.global_bucket.delay(reserve))
+                # Токены забираются сразу после проверки, без await между ними
+                if delay <= 0:
+                    chat.take()
+                    self.global_bucket.take()
+                    break
+                if started is None:
+                    started = time.perf_counter()
+                    metrics.waiting += 1
+                    metrics.max_waiting = max(metrics.max_waiting, metrics.waiting)
+                await asyncio.sleep(delay)
+        finally:
+            if started is not None:
+                metrics.waiting -= 1
+                metrics.wait.record(time.perf_counter() - started)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = rate_limit_args if rate_limit_args in PRIORITY_NAMES else PRIORITY_INTERACTIVE
+        metrics = self.metrics[priority]
+        metrics.requests += 1
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority, metrics)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                metrics.retry_after += 1
+                if attempt == self.max_retries:
+                    metrics.failed += 1
+                    raise
+                logger.warning(f"Telegram просит подождать {e.retry_after} с перед {endpoint} в чат {chat_id}")
+                self._chat_bucket(chat_id).block(float(e.retry_after))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Счетчики классов приоритета и ведер чатов для логов"""
+        result = {PRIORITY_NAMES[priority]: metrics.snapshot() for priority, metrics in self.metrics.items()}
+        result['chats'] = len(self._chats)
+        return result
@@ -0,0 +1,154 @@
+"""Постраничный вывод длинных списков в одном сообщении.
+
+Экран показывает одну страницу: не больше PAGE_SIZE записей, и все они
+целиком помещаются в сообщение Telegram - текст режется только на границах
+записей. Границы страниц постоянны (0, PAGE_SIZE, 2 * PAGE_SIZE, ...);
+страница, которая не помещается в сообщение, делится на части, и части
+всегда считаются от начала страницы. Поэтому номер страницы и смещения
+соседних страниц зависят только от смещения, и ◀️ ведет ровно на ту часть,
+с которой пришли. Страница запрашивается у источника отдельно (LIMIT/OFFSET
+в базе или срез готового списка) вместе со следующей - так без подсчета
+всех строк известно, есть ли следующая и на сколько частей она делится
+(подпись ▶️). Кнопки ◀️/▶️ несут смещение соседней страницы, и по нажатию
+запрашивается только она.
+"""
+import bisect
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+from templates import join_limited
+
+# Записей на странице
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '10'))
+# Предел текста сообщения Telegram (4096) с запасом
+PAGE_TEXT_LIMIT = 4000
+
+# Источник записей: (смещение, число) -> записи
+Fetch = Callable[[int, int], Awaitable[Sequence[Any]]]
+# Текст записи; второй аргумент - предыдущая запись страницы (None - первая),
+# по нему запись добавляет заголовок группы (дата, магазин)
+Render = Callable[[Any, Optional[Any]], str]
+
+
+class Page:
+    """Страница списка: текст, показанные записи и смещения соседних страниц.
+
+    name, prev_name, next_name - подписи страниц для кнопок: «3» или
+    «3 (2/3)» для части страницы.
+    """
+
+    __slots__ = ('text', 'records', 'offset', 'prev_offset', 'next_offset', 'number',
+                 'name', 'prev_name', 'next_name')
+
+    def __init__(self, text: str, records: Sequence[Any], offset: int,
+                 prev_offset: Optional[int], next_offset: Optional[int], number: int):
+        self.text = text
+        self.records = records
+        self.offset = offset
+        self.prev_offset = prev_offset
+        self.next_offset = next_offset
+        self.number = number
+        self.name = str(number)
+        self.prev_name: Optional[str] = None
+        self.next_name: Optional[str] = None
+
+
+def page_name(number: int, part: int, parts: int) -> str:
+    """Подпись страницы: номер, а для разделенной страницы - и часть"""
+    return f"{number} ({part}/{parts})" if parts > 1 else str(number)
+
+
+def from_list(records: Sequence[Any]) -> Fetch:
+    """Источник страниц из готового списка (справочники, кэшированные отчеты)"""
+    async def fetch(offset: int, limit: int) -> Sequence[Any]:
+        return records[offset:offset + limit]
+    return fetch
+
+
+def layout(header: str, records: Sequence[Any], render: Render,
+           limit: int = PAGE_TEXT_LIMIT) -> Page:
+    """Собрать текст из записей, пока он помещается в limit.
+
+    Не поместившиеся записи не попадают в страницу (next_offset - первая из
+    них); запись, которая одна длиннее сообщения, обрезается.
+    """
+    blocks = []
+    previous = None
+    for record in records:
+        blocks.append(render(record, previous))
+        previous = record
+    body, shown = join_limited(blocks, limit - len(header))
+    if not shown and blocks:
+        body, shown = blocks[0][:limit - len(header)], 1
+    next_offset = shown if shown < len(records) else None
+    return Page(header + body, records[:shown], 0, None, next_offset, 1)
+
+
+def _part_starts(header: str, number: int, records: Sequence[Any], render: Render,
+                 page_size: int, limit: int) -> List[int]:
+    """Начала частей страницы (индексы в records), считая от ее начала.
+
+    Место под подпись оставляется по самой длинной подписи части, чтобы
+    деление не зависело от того, какая часть сейчас показывается.
+    """
+    label = f"📄 Страница {page_name(number, page_size, page_size)}\n\n"
+    starts = []
+    start = 0
+    while start < len(records):
+        starts.append(start)
+        start += len(layout(header + label, records[start:], render, limit).records)
+    return starts
+
+
+async def fetch_page(fetch: Fetch, offset: int, header: str, render: Render,
+                     page_size: int = PAGE_SIZE, limit: int = PAGE_TEXT_LIMIT) -> Optional[Page]:
+    """Страница (или ее часть) со смещения offset; None - список пуст.
+
+    Если записей со смещения уже нет (их подтвердили или удалили), показывается
+    первая страница; смещение, которое больше не совпадает с началом части,
+    показывает часть, в которую попадает.
+    """
+    offset = max(0, offset)
+    start = offset - offset % page_size
+    records = list(await fetch(start, 2 * page_size))
+    if not records:
+        if offset:
+            return await fetch_page(fetch, 0, header, render, page_size, limit)
+        return None
+
+    block = records[:page_size]
+    number = start // page_size + 1
+    starts = _part_starts(header, number, block, render, page_size, limit)
+    part = bisect.bisect_right(starts, offset - start) - 1
+    end = starts[part + 1] if part + 1 < len(starts) else len(block)
+    name = page_name(number, part + 1, len(starts))
+    label = f"📄 Страница {name}\n\n"
+    page = layout(header + label, block[starts[part]:end], render, limit)
+    page.offset = start + starts[part]
+    page.number = number
+    page.name = name
+
+    if part + 1 < len(starts):
+        page.next_offset = start + starts[part + 1]
+        page.next_name = page_name(number, part + 2, len(starts))
+    elif len(records) > page_size:
+        # Первая часть следующей страницы
+        next_starts = _part_starts(header, number + 1, records[page_size:], render, page_size, limit)
+        page.next_offset = start + page_size
+        page.next_name = page_name(number + 1, 1, len(next_starts))
+    else:
+        page.next_offset = None
+
+    if part:
+        page.prev_offset = start + starts[part - 1]
+        page.prev_name = page_name(number, part, len(starts))
+    elif start:
+        # Последняя часть предыдущей страницы - ее деление считается заново
+        previous = list(await fetch(start - page_size, page_size))
+        prev_starts = _part_starts(header, number - 1, previous, render, page_size, limit) or [0]
+        page.prev_offset = start - page_size + prev_starts[-1]
+        page.prev_name = page_name(number - 1, len(prev_starts), len(prev_starts))
+    elif page.next_offset is None:
+        # Единственная страница - без номера
+        page.text = header + page.text[len(header) + len(label):]
+    return page
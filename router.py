@@ -0,0 +1,389 @@
+"""Маршрутизация нажатий кнопок: инлайн (callback_data) и нижнего меню (текст).
+
+Маршрут инлайн-кнопки - имя без параметра или префикс с параметром
+("confirm_store_" + ID магазина). Кнопки получают компактную callback_data
+(CallbackRouter.data): версия формата, код маршрута из трех символов и
+целый аргумент, например "1aZ3:42", или несколько целых через двоеточие
+("1aZ3:42:20" - магазин и смещение страницы). Аргумент, который так не помещается в
+64 байта Telegram (или не целое число), хранится на сервере под случайным
+токеном ("1~токен") ограниченное время. Разбор - фиксированные срезы строки;
+неизвестная версия, код или токен считаются устаревшей или чужой кнопкой.
+
+Кнопки старого формата (имя маршрута и параметр строкой) из уже
+отправленных сообщений ищутся по имени: точные значения в словаре,
+префиксы в префиксном дереве (побеждает самый длинный префикс). Кнопки
+нижнего меню ищутся по тексту в словаре.
+
+Маршрут объявляет требуемую роль - проверку по записи пользователя.
+Пользователь загружается только для маршрутов с ролью. Тяжелым маршрутам
+(выгрузкам) задается предел одновременных вызовов; ROUTE_CONCURRENCY
+переопределяет его для любого маршрута: "export_all=1,period_=2".
+Маршрут может указать полосу обработки обновлений (updates.LANE_BULK для
+тяжелых отчетов); полоса определяется до выполнения, по callback_data или
+тексту кнопки.
+"""
+import abc
+import asyncio
+import logging
+import os
+import secrets
+import string
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Формат callback_data: версия, код маршрута, ":" и аргумент либо "~" и токен
+CALLBACK_VERSION = '1'
+CALLBACK_DATA_LIMIT = 64
+OPCODE_ALPHABET = string.digits + string.ascii_letters
+OPCODE_LENGTH = 3
+# Токены аргументов, не поместившихся в callback_data
+CALLBACK_TOKEN_CACHE_SIZE = int(os.getenv('CALLBACK_TOKEN_CACHE_SIZE', '10000'))
+CALLBACK_TOKEN_TTL = float(os.getenv('CALLBACK_TOKEN_TTL', '86400'))
+# Пределы одновременных вызовов маршрутов: "имя=число,имя=число"
+ROUTE_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition('=') for item in os.getenv('ROUTE_CONCURRENCY', '').split(','))
+    if name.strip() and limit.strip()
+}
+
+# Проверка роли по записи пользователя (кортеж get_user)
+Role = Callable[[Tuple], bool]
+
+
+def ints(raw: str) -> Tuple[int, ...]:
+    """Параметр из нескольких целых через двоеточие: "42:20" -> (42, 20)"""
+    return tuple(int(part) for part in raw.split(':'))
+
+
+class MessageQuery:
+    """Сообщение с интерфейсом CallbackQuery.
+
+    Экраны, которые открываются и инлайн-кнопкой, и кнопкой нижнего меню,
+    работают с query; для сообщения edit_message_text отправляет ответ
+    новым сообщением, а answer ничего не делает.
+    """
+
+    __slots__ = ('message', 'from_user')
+
+    data = None
+
+    def __init__(self, message: Any, from_user: Any):
+        self.message = message
+        self.from_user = from_user
+
+    async def answer(self, *args, **kwargs) -> bool:
+        return True
+
+    async def edit_message_text(self, text: str, **kwargs) -> Any:
+        return await self.message.reply_text(text, **kwargs)
+
+    async def delete_message(self) -> bool:
+        return await self.message.delete()
+
+
+class RouteCall:
+    """Нажатие кнопки, переданное обработчику маршрута"""
+
+    __slots__ = ('update', 'context', 'query', 'user', 'arg')
+
+    def __init__(self, update: Any, context: Any, query: Any, arg: Any = None):
+        self.update = update
+        self.context = context
+        self.query = query
+        self.user: Optional[Tuple] = None
+        self.arg = arg
+
+    @property
+    def user_id(self) -> int:
+        return self.query.from_user.id
+
+
+Handler = Callable[[RouteCall], Awaitable[Any]]
+
+
+class RouteStats:
+    """Счетчики вызовов и времени обработки маршрута"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, failed: bool = False):
+        """Учесть один вызов"""
+        self.calls += 1
+        self.errors += int(failed)
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов"""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'avg_ms': round(self.seconds / self.calls * 1000, 2) if self.calls else None,
+            'max_ms': round(self.max_seconds * 1000, 2),
+        }
+
+
+def opcode(name: str) -> str:
+    """Код маршрута: три символа из хеша имени, не зависят от порядка маршрутов"""
+    value = zlib.crc32(name.encode())
+    chars = []
+    for _ in range(OPCODE_LENGTH):
+        value, digit = divmod(value, len(OPCODE_ALPHABET))
+        chars.append(OPCODE_ALPHABET[digit])
+    return ''.join(chars)
+
+
+class Route:
+    """Маршрут: обработчик, требуемая роль и тип параметра (None - без параметра).
+
+    limit - предел одновременных вызовов (None - без предела), lane - полоса
+    обработки обновлений (None - срочная).
+    """
+
+    __slots__ = ('name', 'handler', 'role', 'param', 'opcode', 'limit', 'lane', 'slots', 'stats')
+
+    def __init__(self, name: str, handler: Handler, role: Optional[Role],
+                 param: Optional[Callable[[str], Any]] = None, limit: Optional[int] = None,
+                 lane: Optional[str] = None):
+        self.name = name
+        self.handler = handler
+        self.role = role
+        self.param = param
+        self.opcode = opcode(name)
+        self.limit = ROUTE_CONCURRENCY.get(name, limit)
+        self.lane = lane
+        # Семафор создается при первом вызове, внутри event loop
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.stats = RouteStats()
+
+
+class Router(abc.ABC):
+    """Общая часть маршрутизаторов: проверка роли и счетчики.
+
+    load_user(user_id) возвращает запись пользователя или None;
+    deny(call, registered) отвечает на нажатие без нужной роли.
+    Наследник хранит маршруты по-своему и отдает их через _routes().
+    """
+
+    def __init__(self, load_user: Callable[[int], Awaitable[Optional[Tuple]]],
+                 deny: Callable[[RouteCall, bool], Awaitable[Any]]):
+        self._load_user = load_user
+        self._deny = deny
+
+    @abc.abstractmethod
+    def _routes(self) -> Iterable[Route]:
+        """Все маршруты (для счетчиков)"""
+
+    async def _run(self, route: Route, call: RouteCall) -> Any:
+        if route.role is not None:
+            call.user = await self._load_user(call.user_id)
+            if not call.user or not route.role(call.user):
+                return await self._deny(call, bool(call.user))
+
+        if route.limit is None:
+            return await self._call(route, call)
+        if route.slots is None:
+            route.slots = asyncio.Semaphore(max(1, route.limit))
+        if route.slots.locked():
+            route.stats.throttled += 1
+        async with route.slots:
+            return await self._call(route, call)
+
+    async def _call(self, route: Route, call: RouteCall) -> Any:
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await route.handler(call)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            route.stats.record(time.perf_counter() - started, failed)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики маршрутов, которые вызывались"""
+        return {route.name: route.stats.snapshot() for route in self._routes() if route.stats.calls}
+
+
+class CallbackRouter(Router):
+    """Таблица маршрутов инлайн-кнопок.
+
+    stale(call) отвечает на устаревшую или чужую кнопку.
+    """
+
+    def __init__(self, load_user: Callable[[int], Awaitable[Optional[Tuple]]],
+                 deny: Callable[[RouteCall, bool], Awaitable[Any]],
+                 stale: Optional[Callable[[RouteCall], Awaitable[Any]]] = None,
+                 tokens: Optional[LRUCache] = None):
+        super().__init__(load_user, deny)
+        self._stale = stale
+        self.tokens = tokens or LRUCache(CALLBACK_TOKEN_CACHE_SIZE, CALLBACK_TOKEN_TTL)
+        self._by_name: Dict[str, Route] = {}
+        self._by_opcode: Dict[str, Route] = {}
+        self._exact: Dict[str, Route] = {}
+        # Узел дерева: символ -> дочерний узел, ключ None - маршрут этого префикса
+        self._prefixes: Dict[Any, Any] = {}
+
+    def add(self, name: str, handler: Handler, role: Optional[Role] = None,
+            param: Optional[Callable[[str], Any]] = None, limit: Optional[int] = None,
+            lane: Optional[str] = None):
+        """Добавить маршрут. С param имя - префикс, остаток строки - параметр"""
+        if name in self._by_name:
+            raise ValueError(f"Маршрут {name} уже задан")
+        route = Route(name, handler, role, param, limit, lane)
+        other = self._by_opcode.get(route.opcode)
+        if other is not None:
+            raise ValueError(f"Код маршрута {name} совпадает с {other.name}, переименуйте маршрут")
+        self._by_name[name] = route
+        self._by_opcode[route.opcode] = route
+
+        if param is None:
+            self._exact[name] = route
+            return
+        node = self._prefixes
+        for char in name:
+            node = node.setdefault(char, {})
+        node[None] = route
+
+    def data(self, name: str, arg: Any = None) -> str:
+        """callback_data кнопки маршрута name с аргументом arg"""
+        route = self._by_name[name]
+        if route.param is None:
+            return CALLBACK_VERSION + route.opcode
+        if type(arg) is int:
+            data = f"{CALLBACK_VERSION}{route.opcode}:{arg}"
+            if len(data) <= CALLBACK_DATA_LIMIT:
+                return data
+        elif route.param is ints and type(arg) is tuple and all(type(part) is int for part in arg):
+            data = f"{CALLBACK_VERSION}{route.opcode}:" + ':'.join(map(str, arg))
+            if len(data) <= CALLBACK_DATA_LIMIT:
+                return data
+        token = secrets.token_urlsafe(9)
+        self.tokens.put(token, (route, arg))
+        return f"{CALLBACK_VERSION}~{token}"
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, Any]]:
+        """Маршрут и аргумент для callback_data; None - кнопка устарела или чужая.
+
+        ValueError - аргумент не разбирается как параметр маршрута.
+        """
+        if data[:1] == CALLBACK_VERSION:
+            if data[1:2] == '~':
+                return self.tokens.get(data[2:], None)
+            route = self._by_opcode.get(data[1:1 + OPCODE_LENGTH])
+            if route is None:
+                return None
+            rest = data[1 + OPCODE_LENGTH:]
+            if route.param is None:
+                return (route, None) if not rest else None
+            if rest[:1] != ':':
+                return None
+            return route, ints(rest[1:]) if route.param is ints else int(rest[1:])
+
+        # Кнопка старого формата
+        matched = self.match(data)
+        if matched is None:
+            return None
+        route, raw = matched
+        return route, route.param(raw) if route.param is not None else None
+
+    def lane(self, data: str) -> Optional[str]:
+        """Полоса обработки нажатия; None - срочная или кнопка не разбирается"""
+        try:
+            resolved = self.resolve(data)
+        except ValueError:
+            return None
+        return resolved[0].lane if resolved is not None else None
+
+    def pattern(self, name: str) -> Callable[[str], bool]:
+        """Фильтр callback_data для CallbackQueryHandler: кнопка ведет в маршрут name"""
+        def check(data: str) -> bool:
+            try:
+                resolved = self.resolve(data or '')
+            except ValueError:
+                return False
+            return resolved is not None and resolved[0].name == name
+        return check
+
+    def match(self, data: str) -> Optional[Tuple[Route, str]]:
+        """Маршрут для callback_data старого формата и строка параметра"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ''
+        found = None
+        node = self._prefixes
+        for i, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found = node[None], data[i + 1:]
+        return found
+
+    async def dispatch(self, update: Any, context: Any) -> Any:
+        """Выполнить маршрут нажатия; возвращает результат обработчика"""
+        query = update.callback_query
+        data = query.data or ''
+        call = RouteCall(update, context, query)
+        try:
+            resolved = self.resolve(data)
+        except ValueError:
+            logger.warning(f"Некорректный параметр callback: {data}")
+            return None
+        if resolved is None:
+            logger.warning(f"Устаревшая или неизвестная кнопка: {data}")
+            if self._stale is not None:
+                await self._stale(call)
+            return None
+
+        route, call.arg = resolved
+        return await self._run(route, call)
+
+    def _routes(self) -> Iterable[Route]:
+        return self._by_name.values()
+
+
+class TextRouter(Router):
+    """Таблица кнопок нижнего меню: текст кнопки -> маршрут"""
+
+    def __init__(self, load_user: Callable[[int], Awaitable[Optional[Tuple]]],
+                 deny: Callable[[RouteCall, bool], Awaitable[Any]]):
+        super().__init__(load_user, deny)
+        self._texts: Dict[str, Route] = {}
+
+    def add(self, text: str, handler: Handler, role: Optional[Role] = None, limit: Optional[int] = None,
+            lane: Optional[str] = None):
+        """Добавить кнопку"""
+        if text in self._texts:
+            raise ValueError(f"Кнопка {text} уже задана")
+        self._texts[text] = Route(text, handler, role, limit=limit, lane=lane)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._texts
+
+    def lane(self, text: str) -> Optional[str]:
+        """Полоса обработки кнопки; None - срочная или текст без маршрута"""
+        route = self._texts.get(text)
+        return route.lane if route is not None else None
+
+    async def dispatch(self, update: Any, context: Any) -> Any:
+        """Выполнить маршрут кнопки; текст без маршрута пропускается (None)"""
+        route = self._texts.get(update.message.text)
+        if route is None:
+            return None
+        call = RouteCall(update, context, MessageQuery(update.message, update.effective_user))
+        return await self._run(route, call)
+
+    def _routes(self) -> Iterable[Route]:
+        return self._texts.values()
@@ -0,0 +1,35 @@
+"""Общее для хранилищ SQLite (db.py) и PostgreSQL (db_postgres.py):
+рабочая дата смены и ошибки операций со сменами.
+"""
+import time
+
+import migrations
+
+# Время смен - секунды эпохи, длительность - целые минуты
+UTC_OFFSET = migrations.UTC_OFFSET
+
+
+def local_date(timestamp: int) -> str:
+    """Рабочая дата смены (UTC+8) по метке времени"""
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp + UTC_OFFSET))
+
+
+class ShiftError(Exception):
+    """Операция со сменой не может быть выполнена"""
+
+
+class ActiveShiftExists(ShiftError):
+    """У сотрудника уже есть открытая смена за этот день"""
+
+    def __init__(self, shift_id: int, check_in: int):
+        super().__init__(f"Смена {shift_id} за {local_date(check_in)} уже открыта")
+        self.shift_id = shift_id
+        self.check_in = check_in
+
+
+class ShiftNotActive(ShiftError):
+    """Смена уже закрыта или удалена"""
+
+    def __init__(self, shift_id: int):
+        super().__init__(f"Смена {shift_id} не активна")
+        self.shift_id = shift_id
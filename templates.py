@@ -0,0 +1,150 @@
+"""Шаблоны строк текстовых отчетов.
+
+Строка отчета описывается один раз, при импорте: имена столбцов кортежа из
+базы, формат в синтаксисе str.format и функции подготовки значений
+(format_clock, подписи статусов). RowTemplate один раз разбирает формат:
+поля заменяются позиционными, для каждого поля готовится функция,
+достающая значение из кортежа (operator.itemgetter) и при необходимости
+подготавливающая его. Отчет собирается одним ''.join из кусков
+вместо повторного text += в цикле; join_limited останавливает сборку на
+границе строки, когда текст не помещается в сообщение.
+"""
+import string
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Optional, Sequence, Tuple, Union
+
+
+class RowTemplate:
+    """Шаблон строки: RowTemplate("date minutes", "📅 {date}: {hours} ч\\n", hours=...).
+
+    Поле формата из fields подставляется из столбца с тем же номером;
+    функция подготовки с именем столбца получает его значение, с другим
+    именем - весь кортеж (для значений из нескольких столбцов). Неизвестное
+    поле - ValueError сразу при создании шаблона.
+    """
+
+    __slots__ = ('fields', 'template', 'render', '_render_all')
+
+    def __init__(self, fields: Union[str, Sequence[str]], template: str, **prepare: Callable[[Any], Any]):
+        self.fields = tuple(fields.split() if isinstance(fields, str) else fields)
+        self.template = template
+        self.render: Callable[[Sequence[Any]], str]
+        self._render_all: Callable[[Iterable[Sequence[Any]]], str]
+        self.render, self._render_all = self._compile(prepare)
+
+    def _compile(self, prepare) -> Tuple[Callable[[Sequence[Any]], str], Callable[[Iterable[Sequence[Any]]], str]]:
+        columns = {name: i for i, name in enumerate(self.fields)}
+        getters = []
+        template = []
+        for literal, name, spec, conversion in string.Formatter().parse(self.template):
+            template.append(literal.replace('{', '{{').replace('}', '}}'))
+            if name is None:
+                continue
+            if name in prepare:
+                getter = _prepared(prepare[name], columns[name]) if name in columns else prepare[name]
+            elif name in columns:
+                getter = itemgetter(columns[name])
+            else:
+                raise ValueError(f"Поле {{{name}}} шаблона не задано: {self.template!r}")
+            if '{' in spec:
+                raise ValueError(f"Вложенные поля в формате не поддерживаются: {self.template!r}")
+            # Поля нумеруются по порядку: значение номер i дает getters[i]
+            template.append('{' + str(len(getters)) + (f'!{conversion}' if conversion else '')
+                            + (f':{spec}' if spec else '') + '}')
+            getters.append(getter)
+        fmt = ''.join(template).format
+
+        def render(row: Sequence[Any]) -> str:
+            return fmt(*[getter(row) for getter in getters])
+
+        def render_all(rows: Iterable[Sequence[Any]]) -> str:
+            return ''.join([fmt(*[getter(row) for getter in getters]) for row in rows])
+
+        return render, render_all
+
+    def __call__(self, row: Sequence[Any], previous: Optional[Sequence[Any]] = None) -> str:
+        # previous - чтобы шаблон подходил как Render страниц; строке он не нужен
+        return self.render(row)
+
+    def render_all(self, rows: Iterable[Sequence[Any]]) -> str:
+        """Строки всех записей одним текстом"""
+        return self._render_all(rows)
+
+
+def _prepared(func: Callable[[Any], Any], index: int) -> Callable[[Sequence[Any]], Any]:
+    """Значение столбца index, подготовленное func"""
+    column = itemgetter(index)
+    return lambda row: func(column(row))
+
+
+class Grouped:
+    """Запись с заголовком группы: заголовок выводится, когда меняется key.
+
+    Вызывается как (запись, предыдущая запись или None) - как Render страниц;
+    gap отделяет новую группу от предыдущей.
+    """
+
+    __slots__ = ('key', 'header', 'row', 'gap')
+
+    def __init__(self, key: Callable[[Any], Any], header: Callable[[Any], str],
+                 row: Callable[[Any], str], gap: str = ''):
+        self.key = key
+        # У шаблонов берется скомпилированная функция - без лишнего вызова __call__
+        self.header = header.render if isinstance(header, RowTemplate) else header
+        self.row = row.render if isinstance(row, RowTemplate) else row
+        self.gap = gap
+
+    def __call__(self, record: Any, previous: Optional[Any] = None) -> str:
+        if previous is None:
+            return self.header(record) + self.row(record)
+        if self.key(previous) != self.key(record):
+            return self.gap + self.header(record) + self.row(record)
+        return self.row(record)
+
+    def render_all(self, records: Iterable[Any]) -> str:
+        """Все записи с заголовками групп одним текстом"""
+        key, header, row = self.key, self.header, self.row
+        parts = []
+        current = first = object()
+        for record in records:
+            group = key(record)
+            if group != current:
+                if current is not first:
+                    parts.append(self.gap)
+                parts.append(header(record))
+                current = group
+            parts.append(row(record))
+        return ''.join(parts)
+
+
+def join_limited(parts: Iterable[str], limit: int, more: Optional[Callable[[int], str]] = None,
+                 count: Optional[int] = None) -> Tuple[str, int]:
+    """Склеить куски, пока текст не длиннее limit; текст и число вошедших кусков.
+
+    Кусок целиком входит или не входит. Если вошли не все, к тексту
+    добавляется more(сколько не вошло) - место под него оставляется заранее.
+    Если известно число кусков count, parts может быть ленивым (map по
+    записям): куски за пределом сообщения тогда не вычисляются.
+    """
+    if count is None:
+        parts = list(parts)
+        count = len(parts)
+    # Сколько кусков не войдет, заранее неизвестно - место под подпись с запасом
+    reserve = len(more(count)) if more is not None else 0
+    chunks = []
+    length = 0
+    shown = None
+    for part in parts:
+        length += len(part)
+        if length > limit:
+            break
+        chunks.append(part)
+        if shown is None and length + reserve > limit:
+            shown = len(chunks) - 1
+    else:
+        return ''.join(chunks), len(chunks)
+
+    if shown is None:
+        shown = len(chunks)
+    tail = more(count - shown) if more is not None else ''
+    return ''.join(chunks[:shown]) + tail, shown
@@ -0,0 +1,123 @@
+"""Индекс открытых смен CachedStorage при одновременных записях."""
+import asyncio
+
+import db
+from cache import ActiveShiftIndex, CachedStorage
+
+CHECK_IN = 1709254800  # 2024-03-01 09:00 по рабочему времени
+TODAY = db.local_date(CHECK_IN)
+
+
+class FakeBackend:
+    """Открытые смены в памяти. Чтения фиксируют состояние и ждут gate,
+    как запрос, который прочитал строки до того, как другая запись зафиксировалась.
+    """
+
+    def __init__(self):
+        self.working = {}  # ID -> (user_id, дата, начало)
+        self.next_id = 1
+        self.fail = set()  # операции, которые завершаются ошибкой
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.reading = asyncio.Event()
+
+    async def start(self):
+        pass
+
+    async def _read(self, rows):
+        self.reading.set()
+        await self.gate.wait()
+        return rows
+
+    async def get_working_shifts(self):
+        return await self._read([(i, *row) for i, row in self.working.items()])
+
+    async def get_active_shift(self, user_id, date_str):
+        return await self._read(next(
+            ((i, check_in) for i, (uid, day, check_in) in self.working.items() if (uid, day) == (user_id, date_str)),
+            None
+        ))
+
+    async def open_shift(self, user_id, check_in):
+        if 'open_shift' in self.fail:
+            raise ConnectionError("соединение потеряно")
+        for i, (uid, day, started) in self.working.items():
+            if (uid, day) == (user_id, db.local_date(check_in)):
+                raise db.ActiveShiftExists(i, started)
+        shift_id, self.next_id = self.next_id, self.next_id + 1
+        self.working[shift_id] = (user_id, db.local_date(check_in), check_in)
+        return shift_id
+
+    async def close_shift(self, shift_id, check_out):
+        if 'close_shift' in self.fail:
+            raise ConnectionError("соединение потеряно")
+        if self.working.pop(shift_id, None) is None:
+            raise db.ShiftNotActive(shift_id)
+        return (check_out - CHECK_IN) // 60
+
+
+async def started_storage(backend):
+    storage = CachedStorage(backend, active_shifts=ActiveShiftIndex(db.local_date, db.ActiveShiftExists))
+    await storage.start()
+    return storage
+
+
+async def pause_reads(backend, failing):
+    """Запустить неудачную запись и дождаться, пока она перечитывает смену из базы"""
+    backend.gate.clear()
+    backend.reading.clear()
+    task = asyncio.ensure_future(failing)
+    await backend.reading.wait()
+    return task
+
+
+async def test_failed_open_keeps_concurrent_open_of_other_user():
+    backend = FakeBackend()
+    storage = await started_storage(backend)
+    # Смена сотрудника 2 уже открыта в базе, но индекс о ней не знает
+    backend.working[99] = (2, TODAY, CHECK_IN)
+
+    failed = await pause_reads(backend, storage.open_shift(2, CHECK_IN))
+    shift_id = await storage.open_shift(1, CHECK_IN)
+    backend.gate.set()
+    assert isinstance((await asyncio.gather(failed, return_exceptions=True))[0], db.ActiveShiftExists)
+
+    assert await storage.get_active_shift(1, TODAY) == (shift_id, CHECK_IN)
+    assert await storage.get_active_shift(2, TODAY) == (99, CHECK_IN)
+
+
+async def test_failed_write_does_not_restore_concurrently_closed_shift():
+    backend = FakeBackend()
+    storage = await started_storage(backend)
+    shift_id = await storage.open_shift(1, CHECK_IN)
+
+    # Закрытие падает и перечитывает смену, пока та еще открыта в базе
+    backend.fail.add('close_shift')
+    failed = await pause_reads(backend, storage.close_shift(shift_id, CHECK_IN + 1800))
+    backend.fail.clear()
+    # Повторное закрытие зафиксировалось во время чтения
+    assert await storage.close_shift(shift_id, CHECK_IN + 3600) == 60
+    backend.gate.set()
+    assert isinstance((await asyncio.gather(failed, return_exceptions=True))[0], ConnectionError)
+
+    assert await storage.get_active_shift(1, TODAY) is None
+
+
+async def test_failed_close_rereads_only_its_shift():
+    backend = FakeBackend()
+    storage = await started_storage(backend)
+    first = await storage.open_shift(1, CHECK_IN)
+    second = await storage.open_shift(2, CHECK_IN)
+
+    # Закрытие зафиксировалось в базе, но ответ потерян
+    backend.working.pop(first)
+    backend.fail.add('close_shift')
+    failed = await pause_reads(backend, storage.close_shift(first, CHECK_IN + 3600))
+    backend.fail.clear()
+    assert await storage.close_shift(second, CHECK_IN + 3600) == 60
+    backend.gate.set()
+    assert isinstance((await asyncio.gather(failed, return_exceptions=True))[0], ConnectionError)
+
+    assert await storage.get_active_shift(1, TODAY) is None
+    assert await storage.get_active_shift(2, TODAY) is None
+    assert await storage.open_shift(1, CHECK_IN + 7200) == 3
@@ -0,0 +1,79 @@
+"""Постраничный вывод: обход вперед и назад, подписи страниц и кнопок."""
+import random
+
+import pytest
+
+from pages import fetch_page, from_list
+
+HEADER = "📋 СПИСОК\n\n"
+
+
+async def walk_forward(fetch, render, page_size, limit):
+    pages = []
+    offset = 0
+    while offset is not None:
+        page = await fetch_page(fetch, offset, HEADER, render, page_size, limit)
+        pages.append(page)
+        offset = page.next_offset
+    return pages
+
+
+async def check_walk(records, render, page_size, limit=4000):
+    fetch = from_list(records)
+    forward = await walk_forward(fetch, render, page_size, limit)
+
+    # Вперед: каждая запись показана ровно один раз, текст помещается в сообщение
+    assert [record for page in forward for record in page.records] == records
+    assert all(len(page.text) <= limit for page in forward)
+    for page in forward:
+        if len(forward) > 1:
+            assert page.text.startswith(f"{HEADER}📄 Страница {page.name}\n\n")
+        assert page.name.split()[0] == str(page.number)
+        assert page.number == page.offset // page_size + 1
+    # Подпись ▶️ совпадает с подписью страницы, которая по ней откроется
+    for page, following in zip(forward, forward[1:]):
+        assert (page.next_offset, page.next_name) == (following.offset, following.name)
+    assert forward[-1].next_name is None
+
+    # Назад с последней страницы: те же страницы в обратном порядке, подпись ◀️ точная
+    page = forward[-1]
+    backward = [page]
+    while page.prev_offset is not None:
+        previous = await fetch_page(fetch, page.prev_offset, HEADER, render, page_size, limit)
+        assert page.prev_name == previous.name
+        backward.append(previous)
+        page = previous
+    assert page.prev_name is None
+    assert [(p.offset, p.name, list(p.records), p.text) for p in backward[::-1]] == \
+        [(p.offset, p.name, list(p.records), p.text) for p in forward]
+    return forward
+
+
+@pytest.mark.parametrize('seed', range(100))
+async def test_random_lists(seed):
+    rng = random.Random(seed)
+    count = rng.randrange(1, 60)
+    sizes = [rng.choice([5, 50, 400, 900, 1500, 4500]) for _ in range(count)]
+    await check_walk(list(range(count)), lambda record, previous: "x" * sizes[record] + "\n",
+                     rng.choice([3, 5, 10]))
+
+
+async def test_split_pages_are_named_by_part():
+    pages = await check_walk(list(range(25)), lambda record, previous: "x" * 900 + "\n", 10)
+    assert [(page.offset, page.name) for page in pages] == [
+        (0, "1 (1/3)"), (4, "1 (2/3)"), (8, "1 (3/3)"),
+        (10, "2 (1/3)"), (14, "2 (2/3)"), (18, "2 (3/3)"),
+        (20, "3 (1/2)"), (24, "3 (2/2)"),
+    ]
+    assert pages[2].next_name == "2 (1/3)"
+    assert pages[3].prev_name == "1 (3/3)"
+
+
+async def test_single_page_has_no_label_and_stale_offset_shows_first_page():
+    fetch = from_list(["а\n", "б\n"])
+    render = lambda record, previous: record
+    page = await fetch_page(fetch, 0, HEADER, render, 10)
+    assert page.text == HEADER + "а\nб\n"
+    assert (page.prev_offset, page.next_offset) == (None, None)
+    assert (await fetch_page(fetch, 30, HEADER, render, 10)).text == page.text
+    assert await fetch_page(from_list([]), 0, HEADER, render, 10) is None
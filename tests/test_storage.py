@@ -0,0 +1,285 @@
+"""Операции хранилища: смены, сводки, подтверждения, запросы и очередь уведомлений.
+
+Каждый тест выполняется на SQLite и на PostgreSQL (если задан DB_DSN).
+"""
+import asyncio
+import calendar
+
+import pytest
+
+import db
+import db_postgres
+
+# Полночь 1 марта 2024 по рабочему времени (UTC+8)
+DAY = calendar.timegm((2024, 3, 1, 0, 0, 0)) - db.UTC_OFFSET
+HOUR = 3600
+FIRST, SECOND, THIRD = '2024-03-01', '2024-03-02', '2024-03-03'
+
+
+def at(day: int, hour: float) -> int:
+    """Метка времени: день от 1 марта и час рабочего времени"""
+    return DAY + day * 24 * HOUR + int(hour * HOUR)
+
+
+async def seed(storage):
+    """Два магазина, должность и три сотрудника: 1 и 2 в первом магазине, 3 - во втором"""
+    await storage.create_position("Кассир", 1, FIRST)
+    await storage.create_store("Центральный", "ул. Ленина, 1", 1, FIRST)
+    await storage.create_store("Северный", "ул. Мира, 5", 1, FIRST)
+    position_id = (await storage.get_positions())[0][0]
+    stores = {name: store_id for store_id, name, _ in await storage.get_stores()}
+    central, north = stores["Центральный"], stores["Северный"]
+    assert await storage.add_employee(1, "Иванов Иван", position_id, central, FIRST, is_super_admin=1)
+    assert await storage.add_employee(2, "Петров Петр", position_id, central, FIRST)
+    assert await storage.add_employee(3, "Сидорова Анна", position_id, north, FIRST)
+    return central, north
+
+
+async def work(storage, user_id: int, day: int, start: float, end: float) -> int:
+    """Открыть и закрыть смену, вернуть её ID"""
+    shift_id = await storage.open_shift(user_id, at(day, start))
+    await storage.close_shift(shift_id, at(day, end))
+    return shift_id
+
+
+async def fill(storage):
+    """Смены за три дня в обоих магазинах, часть из них подтверждена или удалена"""
+    central, north = await seed(storage)
+    shifts = [
+        await work(storage, 1, 0, 9, 18),
+        await work(storage, 2, 0, 10, 14.5),
+        await work(storage, 3, 0, 8, 20),
+        await work(storage, 1, 1, 9, 17),
+        await work(storage, 3, 1, 9, 13),
+    ]
+    await storage.add_completed_shift(2, at(2, 9), at(2, 15))
+    await storage.add_completed_shift(3, at(2, 12), at(2, 19))
+    await storage.open_shift(1, at(2, 9))  # открытая смена в сводки не входит
+    await storage.confirm_shift(shifts[0])
+    await storage.confirm_shift(shifts[2])
+    assert await storage.delete_shift(shifts[3])
+    return central, north
+
+
+async def rollups(backend):
+    """Содержимое всех таблиц сводок"""
+    return (
+        await backend.sql('''
+            SELECT user_id, date, store_id, minutes, shifts, confirmed, confirmed_minutes
+            FROM daily_user_stats ORDER BY user_id, date
+        '''),
+        await backend.sql('''
+            SELECT store_id, date, minutes, shifts, confirmed, confirmed_minutes, employees
+            FROM daily_store_stats ORDER BY store_id, date
+        '''),
+        await backend.sql(
+            "SELECT store_id, unconfirmed FROM store_unconfirmed WHERE unconfirmed <> 0 ORDER BY store_id"
+        ),
+    )
+
+
+def test_postgres_implements_all_operations():
+    assert [name for name in db.OPERATIONS if not callable(getattr(db_postgres.PostgresDatabase, name, None))] == []
+
+
+async def test_open_and_close_shift(storage):
+    await seed(storage)
+    shift_id = await storage.open_shift(1, at(0, 9))
+    assert await storage.get_active_shift(1, FIRST) == (shift_id, at(0, 9))
+
+    with pytest.raises(db.ActiveShiftExists) as error:
+        await storage.open_shift(1, at(0, 11))
+    assert (error.value.shift_id, error.value.check_in) == (shift_id, at(0, 9))
+
+    assert await storage.close_shift(shift_id, at(0, 17) + 59) == 8 * 60
+    with pytest.raises(db.ShiftNotActive):
+        await storage.close_shift(shift_id, at(0, 18))
+    assert await storage.get_active_shift(1, FIRST) is None
+    assert await storage.get_working_shifts() == []
+    assert await storage.get_period_totals(FIRST, FIRST) == (1, 8 * 60, 0, 0)
+
+    # После закрытия можно открыть новую смену за тот же день
+    second_id = await storage.open_shift(1, at(0, 19))
+    assert second_id != shift_id
+    assert await storage.get_working_shifts() == [(second_id, 1, FIRST, at(0, 19))]
+
+
+async def test_concurrent_open_shift_keeps_one_active(storage):
+    await seed(storage)
+    results = await asyncio.gather(
+        *(storage.open_shift(2, at(0, 9) + i) for i in range(5)), return_exceptions=True
+    )
+    opened = [result for result in results if not isinstance(result, Exception)]
+    assert len(opened) == 1
+    assert all(isinstance(result, db.ActiveShiftExists) and result.shift_id == opened[0]
+               for result in results if isinstance(result, Exception))
+    assert [row[0] for row in await storage.get_working_shifts()] == opened
+
+
+async def test_add_and_delete_completed_shift(storage):
+    await seed(storage)
+    shift_id = await storage.add_completed_shift(3, at(0, 9), at(0, 13))
+    assert shift_id is not None
+    assert await storage.add_completed_shift(3, at(0, 14), at(0, 16)) is None
+    assert await storage.get_period_totals(FIRST, FIRST) == (1, 4 * 60, 0, 0)
+
+    assert await storage.delete_shift(shift_id)
+    assert not await storage.delete_shift(shift_id)
+    assert await storage.get_period_totals(FIRST, FIRST) == (0, 0, 0, 0)
+    assert await storage.get_unconfirmed_counts_by_store() == {}
+    assert await storage.add_completed_shift(3, at(0, 14), at(0, 16)) is not None
+
+
+async def test_rollups_match_rebuild(backend):
+    storage = backend.storage
+    central, north = await fill(storage)
+    assert await storage.get_period_totals(FIRST, THIRD) == (6, 2550, 2, 1260)
+    assert await storage.get_unconfirmed_counts_by_store() == {central: 2, north: 2}
+    incremental = await rollups(backend)
+
+    assert await storage.rebuild_rollups() == 6
+    assert await rollups(backend) == incremental
+    assert await storage.get_period_totals(FIRST, THIRD) == (6, 2550, 2, 1260)
+
+
+async def test_store_stats(storage):
+    await fill(storage)
+    # Магазины в порядке создания: сотрудники, открыто сегодня, закрыто сегодня,
+    # смены и минуты за период, сотрудники со сменами за период
+    assert await storage.get_store_stats(THIRD, FIRST) == [
+        ("Центральный", 2, 1, 1, 3, 1170, 2),
+        ("Северный", 1, 0, 1, 3, 1380, 1),
+    ]
+    assert await storage.get_store_stats(SECOND, SECOND) == [
+        ("Центральный", 2, 0, 0, 0, 0, 0),
+        ("Северный", 1, 0, 1, 1, 240, 1),
+    ]
+
+
+async def test_unconfirmed_counters_match_reconcile(backend):
+    storage = backend.storage
+    central, north = await fill(storage)
+    await storage.confirm_shifts_for_date(SECOND)
+    assert await storage.reconcile_unconfirmed_counts() == {}
+
+    await backend.sql(f"UPDATE store_unconfirmed SET unconfirmed = 7 WHERE store_id = {central}")
+    await backend.sql(f"DELETE FROM store_unconfirmed WHERE store_id = {north}")
+    assert await storage.reconcile_unconfirmed_counts() == {central: (7, 2), north: (0, 1)}
+    assert await storage.get_unconfirmed_counts_by_store() == {central: 2, north: 1}
+    assert await storage.reconcile_unconfirmed_counts() == {}
+
+
+async def test_confirm_flows(backend):
+    storage = backend.storage
+    central, north = await fill(storage)
+    assert await storage.get_confirm_stats() == ((6, 2, 4), [("Северный", 3, 1), ("Центральный", 3, 1)])
+
+    assert await storage.confirm_shifts_for_date(FIRST) == 1
+    assert await storage.get_unconfirmed_counts_by_store() == {central: 1, north: 2}
+    assert await storage.confirm_store_shifts(north) == 2
+    assert await storage.get_unconfirmed_counts_by_store() == {central: 1}
+    assert await storage.confirm_shifts_in_range(FIRST, THIRD) == 1
+    assert await storage.confirm_shifts_in_range(FIRST, THIRD) == 0
+    assert await storage.get_unconfirmed_counts_by_store() == {}
+    assert await storage.get_period_totals(FIRST, THIRD) == (6, 2550, 6, 2550)
+    assert await storage.reconcile_unconfirmed_counts() == {}
+
+    confirmed = await rollups(backend)
+    await storage.rebuild_rollups()
+    assert await rollups(backend) == confirmed
+
+
+async def test_delete_requests(backend):
+    storage = backend.storage
+    central, north = await fill(storage)
+    assert await storage.create_delete_request(FIRST, 1, "Иванов Иван", "employee", "3") == \
+        ('created', "Сидорова Анна")
+    assert await storage.create_delete_request(FIRST, 1, "Иванов Иван", "employee", "3") == ('exists', None)
+    assert await storage.create_delete_request(FIRST, 1, "Иванов Иван", "employee", "99") == ('not_found', None)
+    assert await storage.create_delete_request(FIRST, 1, "Иванов Иван", "employee", "1") == \
+        ('created', "Иванов Иван")
+    assert await storage.create_delete_request(FIRST, 1, "Иванов Иван", "store", str(north)) == \
+        ('created', "Северный")
+    requests = {row[4]: row[0] for row in await storage.get_delete_requests()}
+
+    # Магазин с сотрудниками удалить нельзя, запрос остается ожидающим
+    status, _, employees = await storage.approve_delete_request(requests["Северный"])
+    assert (status, employees) == ('store_in_use', 1)
+    status, _, _ = await storage.approve_delete_request(requests["Иванов Иван"])
+    assert status == 'super_admin'
+
+    status, request, _ = await storage.approve_delete_request(requests["Сидорова Анна"])
+    assert status == 'approved' and request[2] == "Сидорова Анна"
+    assert await storage.approve_delete_request(requests["Сидорова Анна"]) == ('not_found', None, 0)
+    assert await storage.get_user(3) is None
+    assert await storage.get_unconfirmed_counts_by_store() == {central: 2}
+    assert await storage.get_period_totals(FIRST, THIRD) == (3, 1170, 1, 540)
+    assert await storage.reconcile_unconfirmed_counts() == {}
+    remaining = await rollups(backend)
+    await storage.rebuild_rollups()
+    assert await rollups(backend) == remaining
+
+    # Теперь магазин пуст и удаляется по тому же запросу
+    status, _, _ = await storage.approve_delete_request(requests["Северный"])
+    assert status == 'approved'
+    assert [name for _, name, _ in await storage.get_stores()] == ["Центральный"]
+
+    assert await storage.reject_delete_request(requests["Иванов Иван"]) == ('employee', "Иванов Иван", 1)
+    assert await storage.reject_delete_request(requests["Иванов Иван"]) is None
+    statuses = {row[4]: row[5] for row in await storage.get_delete_requests()}
+    assert statuses == {"Сидорова Анна": 'approved', "Северный": 'approved', "Иванов Иван": 'rejected'}
+
+
+async def test_admin_requests(storage):
+    await seed(storage)
+    assert await storage.create_admin_request(FIRST, 2, "Петров Петр", "Кассир", "Центральный")
+    assert not await storage.create_admin_request(FIRST, 2, "Петров Петр", "Кассир", "Центральный")
+    assert await storage.create_admin_request(FIRST, 50, "Новиков Олег", "Старший кассир", "Южный")
+    assert await storage.create_admin_request(FIRST, 60, "Орлова Мария", "Кассир", "Центральный")
+    requests = {row[5]: row[0] for row in await storage.get_admin_requests()}
+
+    # Зарегистрированный сотрудник становится админом
+    assert await storage.approve_admin_request(requests[2], SECOND) == (2, "Петров Петр", "Кассир", "Центральный")
+    assert (await storage.get_user(2))[3] == 1
+
+    # Новый пользователь регистрируется, недостающие должность и магазин создаются
+    assert await storage.approve_admin_request(requests[50], SECOND) == \
+        (50, "Новиков Олег", "Старший кассир", "Южный")
+    assert await storage.get_user(50) == ("Новиков Олег", "Старший кассир", "Южный", 1, 0, 0)
+    assert await storage.approve_admin_request(requests[50], SECOND) is None
+
+    assert await storage.reject_admin_request(requests[60]) == (60, "Орлова Мария")
+    assert await storage.reject_admin_request(requests[60]) is None
+    assert await storage.get_user(60) is None
+    statuses = {row[5]: row[6] for row in await storage.get_admin_requests()}
+    assert statuses == {2: 'approved', 50: 'approved', 60: 'rejected'}
+
+
+async def test_notification_outbox(storage):
+    now = at(0, 12)
+    added = await storage.add_notifications([101, 102, 103], "Смена открыта", now, now + 60)
+    assert [chat_id for _, chat_id in added] == [101, 102, 103]
+    ids = [notification_id for notification_id, _ in added]
+
+    # Пока идет отправка, уведомления заняты
+    assert await storage.claim_notifications(now, now + 120, 10) == []
+    first = await storage.claim_notifications(now + 60, now + 120, 2)
+    rest = await storage.claim_notifications(now + 60, now + 120, 10)
+    assert len(first) == 2 and len(rest) == 1
+    assert sorted(first + rest) == [(i, chat_id, "Смена открыта", 0) for i, chat_id in added]
+    assert await storage.claim_notifications(now + 60, now + 120, 10) == []
+
+    await storage.defer_notification(ids[0], now + 300, "Timed out")
+    await storage.defer_notification(ids[1], None, "Forbidden: bot was blocked by the user")
+    assert await storage.delete_notifications([ids[2]]) == 1
+    assert await storage.claim_notifications(now + 299, now + 400, 10) == []
+    assert await storage.claim_notifications(now + 300, now + 400, 10) == [(ids[0], 101, "Смена открыта", 1)]
+    assert await storage.delete_notifications(ids) == 2
+
+
+async def test_concurrent_claims_do_not_overlap(storage):
+    now = at(0, 12)
+    await storage.add_notifications(list(range(1, 41)), "Отчет готов", now, now)
+    batches = await asyncio.gather(*(storage.claim_notifications(now, now + 60, 8) for _ in range(6)))
+    claimed = [row[0] for batch in batches for row in batch]
+    assert len(claimed) == len(set(claimed)) == 40
@@ -0,0 +1,34 @@
+"""Шаблоны строк отчетов."""
+import pytest
+
+from templates import Grouped, RowTemplate, join_limited
+
+
+def test_row_template_fields_prepare_and_format():
+    row = RowTemplate(
+        "date minutes name", "{{{date}}} {name!r:>8} {minutes:.1f} ч {label}\n",
+        minutes=lambda minutes: minutes / 60, label=lambda record: f"{record[2]}/{record[0]}",
+    )
+    record = ('2024-03-01', 90, 'Анна')
+    assert row(record) == "{2024-03-01}   'Анна' 1.5 ч Анна/2024-03-01\n"
+    assert row.render_all([record, ('2024-03-02', 30, 'Олег')]) == \
+        row(record) + "{2024-03-02}   'Олег' 0.5 ч Олег/2024-03-02\n"
+
+
+def test_row_template_rejects_unknown_and_nested_fields():
+    with pytest.raises(ValueError):
+        RowTemplate("date", "{date} {missing}")
+    with pytest.raises(ValueError):
+        RowTemplate("date width", "{date:>{width}}")
+
+
+def test_grouped_and_join_limited():
+    grouped = Grouped(
+        lambda record: record[0], RowTemplate("store name", "🏪 {store}\n"),
+        RowTemplate("store name", "  {name}\n"), gap="\n",
+    )
+    records = [("А", "Иван"), ("А", "Петр"), ("Б", "Анна")]
+    text = "🏪 А\n  Иван\n  Петр\n\n🏪 Б\n  Анна\n"
+    assert grouped.render_all(records) == text
+    assert ''.join(grouped(record, previous) for record, previous in zip(records, [None] + records)) == text
+    assert join_limited(["ab\n", "cd\n", "ef\n"], 7, more=lambda rest: f"+{rest}") == ("ab\n+2", 1)
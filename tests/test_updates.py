@@ -0,0 +1,103 @@
+"""Очереди пользователей и полосы SequencedUpdateProcessor."""
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from updates import LANE_BULK, LANE_INTERACTIVE, Lane, SequencedUpdateProcessor
+
+
+def message(user_id: int, text: str) -> Update:
+    user = User(user_id, f"user{user_id}", False)
+    return Update(user_id, message=Message(1, datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=user, text=text))
+
+
+def processor(bulk_workers: int) -> SequencedUpdateProcessor:
+    return SequencedUpdateProcessor(
+        classify=lambda update: LANE_BULK if update.message.text.startswith('bulk') else None,
+        lanes=[Lane(LANE_INTERACTIVE, 4), Lane(LANE_BULK, bulk_workers, ordered=False)],
+    )
+
+
+class Handlers:
+    """Обработчики, которые отмечают начало и ждут разрешения завершиться"""
+
+    def __init__(self):
+        self.started = []
+        self.release = {}
+
+    def handle(self, name: str):
+        self.release[name] = asyncio.Event()
+
+        async def run():
+            self.started.append(name)
+            await self.release[name].wait()
+
+        return run()
+
+    def submit(self, processor, user_id: int, name: str) -> asyncio.Task:
+        return asyncio.ensure_future(processor.do_process_update(message(user_id, name), self.handle(name)))
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def test_bulk_waiting_for_worker_does_not_block_user():
+    handlers = Handlers()
+    proc = processor(bulk_workers=1)
+    other = handlers.submit(proc, 2, 'bulk other')
+    await settle()
+
+    # Единственный исполнитель тяжелой полосы занят чужим отчетом
+    waiting = handlers.submit(proc, 1, 'bulk mine')
+    quick = handlers.submit(proc, 1, 'menu')
+    await settle()
+    assert handlers.started == ['bulk other', 'menu']
+
+    handlers.release['menu'].set()
+    await quick
+    handlers.release['bulk other'].set()
+    await other
+    await settle()
+    assert handlers.started[-1] == 'bulk mine'
+    handlers.release['bulk mine'].set()
+    await waiting
+
+
+async def test_bulk_updates_of_user_keep_order_without_holding_workers():
+    handlers = Handlers()
+    proc = processor(bulk_workers=2)
+    first = handlers.submit(proc, 1, 'bulk 1')
+    second = handlers.submit(proc, 1, 'bulk 2')
+    other = handlers.submit(proc, 2, 'bulk other')
+    await settle()
+    # Второй отчет ждет первый, не занимая второго исполнителя
+    assert handlers.started == ['bulk 1', 'bulk other']
+
+    handlers.release['bulk 1'].set()
+    await first
+    await settle()
+    assert handlers.started[-1] == 'bulk 2'
+    handlers.release['bulk 2'].set()
+    handlers.release['bulk other'].set()
+    await asyncio.gather(second, other)
+    assert not proc._queues
+
+
+async def test_bulk_update_waits_for_running_update_of_same_user():
+    handlers = Handlers()
+    proc = processor(bulk_workers=1)
+    quick = handlers.submit(proc, 1, 'menu')
+    await settle()
+    bulk = handlers.submit(proc, 1, 'bulk')
+    await settle()
+    assert handlers.started == ['menu']
+
+    handlers.release['menu'].set()
+    await quick
+    await settle()
+    assert handlers.started == ['menu', 'bulk']
+    handlers.release['bulk'].set()
+    await bulk
@@ -0,0 +1,254 @@
+"""Параллельная обработка обновлений Telegram с очередностью внутри пользователя.
+
+Обновления разных пользователей обрабатываются одновременно: выгрузка у
+администратора не задерживает отметки остальных сотрудников. Обновления
+одного пользователя выполняются строго по очереди, в порядке получения:
+шаги ConversationHandler (ключ разговора - чат и пользователь) и двойные
+нажатия кнопок не обгоняют друг друга.
+
+Обновления делятся на полосы со своими пулами исполнителей: срочные
+действия сотрудников (отметки, табель) и тяжелая работа администраторов
+(выгрузки, сводки, массовое подтверждение). Тяжелые обновления не занимают
+места срочных. В очередь полосы обновление встает только после очереди
+пользователя: ждущие своей очереди обновления не считаются в очереди
+полосы и не вызывают ее перегрузку. Перегрузка проверяется в этот же
+момент; полоса с пределом очереди тогда отклоняет обновление (срочная
+полоса - никогда).
+
+Срочное обновление ждет исполнителя, уже заняв очередь пользователя:
+исполнителей много, ожидание короткое. Тяжелое наоборот - сначала ждет
+исполнителя (очередь тяжелой полосы бывает долгой) и только с ним встает
+в очередь пользователя, чтобы не держать ее все это время. Цена - порядок:
+пока тяжелое обновление ждет исполнителя, следующие срочные обновления
+того же пользователя его обгоняют (нажал «Подтвердить все» и «Назад» -
+меню может открыться раньше результата). Тяжелые обновления одного
+пользователя по-прежнему идут по порядку между собой и не занимают
+исполнителей, пока ждут предыдущее. Шагами ConversationHandler тяжелые
+обновления быть не должны.
+
+Обработчики, фоновые задачи (jobs.py), исходящие запросы (outbound.py) и
+кэши (cache.py) работают в одном event loop. Их очереди, словари и
+счетчики меняются без await между проверкой и изменением, поэтому в этих
+модулях нет отдельных блокировок.
+
+Предела на чтение обновлений нет: Application (PTB 20.7) создает задачу
+на каждое полученное обновление. UPDATE_MAX_PENDING - предел обновлений
+внутри обработчика (семафор BaseUpdateProcessor.process_update). Сверх
+него обновления ждут в порядке получения еще до выбора полосы, поэтому
+при таком наплыве и отклонение тяжелых обновлений происходит с задержкой.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import Durations
+
+logger = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+
+# Исполнители срочной полосы
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+# Обновлений внутри обработчика (в очередях пользователей и полос); остальные ждут входа
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '1024'))
+# Исполнители тяжелой полосы и предел ее очереди (0 - без предела)
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '2'))
+BULK_MAX_QUEUE = int(os.getenv('BULK_MAX_QUEUE', '20'))
+
+
+def sequence_key(update: Any) -> Optional[Hashable]:
+    """Ключ очереди обновления: пользователь, без пользователя - чат; None - без очереди"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return 'user', update.effective_user.id
+    if update.effective_chat is not None:
+        return 'chat', update.effective_chat.id
+    return None
+
+
+class LaneMetrics:
+    """Счетчики полосы: обработанные и отклоненные обновления, очередь и ожидание"""
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.max_running = 0
+        self.max_queue = 0
+        # От получения обновления до начала обработки
+        self.wait = Durations()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения для логов"""
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'shed': self.shed,
+            'max_running': self.max_running,
+            'max_queue': self.max_queue,
+            **self.wait.snapshot('wait'),
+        }
+
+
+class Lane:
+    """Полоса обработки: пул из workers исполнителей и очередь к нему.
+
+    max_queue - сколько обновлений может ждать (None - без предела); сверх
+    него новые обновления отклоняются. ordered=False - обновление встает в
+    очередь пользователя, только получив исполнителя (тяжелая полоса).
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: Optional[int] = None, ordered: bool = True):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.ordered = ordered
+        self._slots = asyncio.Semaphore(self.workers)
+        # Принятые и еще не завершенные обновления; из них выполняются running
+        self.pending = 0
+        self.running = 0
+        self.metrics = LaneMetrics()
+
+    @property
+    def queued(self) -> int:
+        return self.pending - self.running
+
+    def overloaded(self) -> bool:
+        return self.max_queue is not None and self.queued >= self.max_queue
+
+    async def run(self, coroutine: Awaitable[Any], queued_at: float,
+                  turn: AsyncContextManager[Any] = nullcontext()):
+        """Выполнить обработку, когда освободится исполнитель и наступит очередь turn"""
+        async with self._slots:
+            self.running += 1
+            self.metrics.max_running = max(self.metrics.max_running, self.running)
+            try:
+                async with turn:
+                    self.metrics.wait.record(time.perf_counter() - queued_at)
+                    await coroutine
+            except Exception:
+                self.metrics.failed += 1
+                raise
+            finally:
+                self.running -= 1
+                self.metrics.processed += 1
+
+
+def default_lanes() -> List[Lane]:
+    """Срочная полоса без предела очереди и тяжелая с пределом из окружения"""
+    return [
+        Lane(LANE_INTERACTIVE, UPDATE_CONCURRENCY),
+        Lane(LANE_BULK, BULK_CONCURRENCY, BULK_MAX_QUEUE or None, ordered=False),
+    ]
+
+
+class SequencedUpdateProcessor(BaseUpdateProcessor):
+    """Обработчик обновлений для ApplicationBuilder.concurrent_updates.
+
+    classify(update) возвращает имя полосы (None - первая полоса);
+    on_shed(update) отвечает пользователю на отклоненное обновление.
+
+    Очередь пользователя - блокировка и число ждущих ее обновлений; запись
+    удаляется, когда очередь пустеет, поэтому память не растет с числом
+    пользователей.
+    """
+
+    def __init__(self, classify: Optional[Callable[[Any], Optional[str]]] = None,
+                 on_shed: Optional[Callable[[Any], Awaitable[Any]]] = None,
+                 lanes: Optional[Iterable[Lane]] = None, max_pending: int = UPDATE_MAX_PENDING):
+        lanes = list(lanes) if lanes is not None else default_lanes()
+        super().__init__(max(max_pending, sum(lane.workers for lane in lanes)))
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        self._default_lane = lanes[0]
+        self._classify = classify
+        self._on_shed = on_shed
+        # Ключ очереди -> [блокировка, число обновлений в очереди]
+        self._queues: Dict[Hashable, List[Any]] = {}
+        self.sequenced = 0
+        self.max_sequence = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._queues:
+            logger.info(f"Остановка с необработанными очередями пользователей: {len(self._queues)}")
+
+    def lane_of(self, update: Any) -> Lane:
+        """Полоса обновления; ошибка классификации не мешает обработке"""
+        if self._classify is None:
+            return self._default_lane
+        try:
+            name = self._classify(update)
+        except Exception as e:
+            logger.error(f"Ошибка при выборе полосы обновления: {e}")
+            return self._default_lane
+        return self.lanes.get(name, self._default_lane) if name else self._default_lane
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        lane = self.lane_of(update)
+        key = sequence_key(update)
+        queued_at = time.perf_counter()
+        if lane.ordered:
+            queue, turn = self._sequence(key), nullcontext()
+        else:
+            # Свои тяжелые обновления пользователь ждет без исполнителя,
+            # в общую очередь пользователя встает уже с исполнителем
+            queue, turn = self._sequence(None if key is None else (lane.name, key)), self._sequence(key)
+        async with queue:
+            # Очередь пользователя пройдена - теперь обновление встает в очередь полосы
+            shed = lane.overloaded()
+            if not shed:
+                lane.pending += 1
+                lane.metrics.max_queue = max(lane.metrics.max_queue, lane.queued)
+                try:
+                    await lane.run(coroutine, queued_at, turn)
+                finally:
+                    lane.pending -= 1
+
+        if shed:
+            # Отвечаем уже вне очереди пользователя, чтобы не задерживать его следующие обновления
+            lane.metrics.shed += 1
+            coroutine.close()
+            if self._on_shed is not None:
+                try:
+                    await self._on_shed(update)
+                except Exception as e:
+                    logger.error(f"Ошибка при ответе на отклоненное обновление: {e}")
+
+    @asynccontextmanager
+    async def _sequence(self, key: Optional[Hashable]) -> AsyncIterator[None]:
+        """Очередь обновлений пользователя (ключ None - без очереди)"""
+        if key is None:
+            yield
+            return
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = [asyncio.Lock(), 0]
+        queue[1] += 1
+        if queue[1] > 1:
+            self.sequenced += 1
+            self.max_sequence = max(self.max_sequence, queue[1])
+        try:
+            async with queue[0]:
+                yield
+        finally:
+            queue[1] -= 1
+            if not queue[1]:
+                del self._queues[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Счетчики полос и очередей пользователей для логов"""
+        return {
+            'sequenced': self.sequenced,
+            'max_sequence': self.max_sequence,
+            'lanes': {name: lane.metrics.snapshot() for name, lane in self.lanes.items()},
+        }